@@ -0,0 +1,479 @@
+import gc
+import multiprocessing
+import os
+import queue
+import random
+import re
+import threading
+
+import infinitedungeon as game
+from sound import Sound
+
+try:
+    import numpy as np
+except ImportError: # Only VectorDungeonEnv needs it
+    np = None
+
+# --- Headless Environment ---
+# A gym-style interface to the real game loop, for bots and reinforcement learning:
+#
+#     env = DungeonEnv()
+#     observation = env.reset(seed=42, player_class='Reaver')
+#     observation, reward, done, info = env.step('north')
+#
+# The game runs on a helper thread that waits at every prompt, so a step costs a thread
+# hand-off instead of a round trip through a subprocess pipe. Nothing is printed unless a
+# render_mode asks for it, dramatic pauses are switched off and no sound is played.
+#
+# VectorDungeonEnv steps many of these in lockstep and returns NumPy arrays (see below).
+
+# --- ENVIRONMENT CONSTANTS ---
+ROOM_REWARD = 100 # Same weights as the daily challenge score
+MONSTER_REWARD = 50
+PROMPT_KINDS = {'> ': 'main', 'Combat Action> ': 'combat', 'Shop Action> ': 'shop', 'Inn Action> ': 'inn'}
+EQUIPPABLE_ITEM_TYPES = ('weapon', 'shield', 'armor', 'equipment')
+USABLE_ITEM_TYPES = ('consumable', 'backpack')
+LEVER_NAME = re.compile(r"\*\*(\w+)\*\*") # Mechanism puzzles name their levers in bold
+# Columns of the observation arrays returned by VectorDungeonEnv, in order
+OBSERVATION_FEATURES = (
+    'hp', 'max_hp', 'level', 'xp', 'xp_to_next_level', 'gold', 'attack_power', 'defense',
+    'inventory_used', 'inventory_slots', 'keys', 'skills', 'room_number', 'exits', 'locked_exits',
+    'has_item', 'has_monster', 'has_npc', 'has_hazard', 'has_puzzle', 'has_shrine', 'is_inn',
+    'monster_hp', 'monsters_defeated',
+    'prompt_main', 'prompt_combat', 'prompt_shop', 'prompt_inn', 'prompt_text', 'prompt_done',
+)
+
+class HeadlessChannel:
+    """
+    The game thread's session channel. Output is kept only if asked for; each time
+    the game wants input, the prompt is handed to the environment and the thread
+    waits for the next command.
+    """
+    def __init__(self, seed, keep_text):
+        self.rng = random.Random(seed)
+        self.keep_text = keep_text
+        self.chunks = []
+        self.prompt = ""
+        self.commands = queue.Queue()
+        self.events = queue.Queue()
+        self.combat = None # Latest combat status, from the combat events
+
+    def write(self, text):
+        if self.keep_text:
+            self.chunks.append(text)
+        _, newline, tail = text.rpartition("\n")
+        self.prompt = tail if newline else self.prompt + tail
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def readline(self):
+        self.events.put(('prompt', self.prompt))
+        self.prompt = ""
+        command = self.commands.get()
+        if command is None:
+            return "" # EOF: the environment was closed or reset
+        return command + "\n"
+
+    def take_text(self):
+        text = "".join(self.chunks)
+        self.chunks = []
+        return text
+
+class CombatStatusRecorder:
+    """Combat renderer for the game thread: remembers the monster's HP for observations."""
+    def __init__(self, channel, renderer):
+        self.channel = channel
+        self.renderer = renderer
+
+    def render(self, event_type, kind, event):
+        if event_type in ('combat_start', 'status'):
+            self.channel.combat = {'monster': event['monster'], 'monster_hp': event['monster_hp']}
+        self.renderer.render(event_type, kind, event)
+
+def run_headless_game(channel, session, checkpoint=None):
+    """Game thread body: generates the first room (or goes back to a checkpoint) and plays game_loop until it returns."""
+    game.session_threads.channel = channel
+    game.set_combat_renderer(CombatStatusRecorder(channel, game.TextCombatRenderer() if channel.keep_text else game.NullCombatRenderer()))
+    try:
+        if checkpoint is None:
+            session.current_room = game.Room(session.player_level, session.player_quests, session=session)
+        else:
+            session.checkpoints.restore(session, checkpoint) # On this thread, so its RNG state lands in this channel's generator
+        channel.events.put(('done', game.game_loop(session)))
+    except EOFError:
+        channel.events.put(('done', 'closed'))
+    except Exception as e:
+        channel.events.put(('error', e))
+    finally:
+        game.session_threads.channel = None
+
+class DungeonEnv:
+    """
+    Headless, in-process game environment with reset() and step().
+    render_mode: None (silent), 'ansi' (the game's text is returned in info['text'])
+    or 'human' (the game's text is printed).
+    Dramatic pauses are set to 'zero' for the whole process.
+    """
+    def __init__(self, render_mode=None):
+        self.render_mode = render_mode
+        self.sound_manager = Sound(sound_enabled=False)
+        self.session = None
+        self.channel = None
+        self.thread = None
+        self.prompt = ""
+        self.outcome = None
+        game.route_session_threads()
+        game.set_pacing_mode('zero')
+
+    def reset(self, seed=None, player_class=None, player_name="Agent"):
+        """Starts a new game and returns the first observation."""
+        self.close()
+        character_classes = game.GAME_DATA.get('character_classes', {})
+        if player_class is None:
+            player_class = next(iter(character_classes))
+        elif player_class not in character_classes:
+            raise ValueError(f"Unknown class '{player_class}'. Options: {', '.join(character_classes)}.")
+
+        self.session = game.GameSession(player_name=player_name)
+        self.session.sound_manager = self.sound_manager
+        game.apply_character_class(self.session, player_class)
+        self.channel = HeadlessChannel(seed, keep_text=self.render_mode is not None)
+        self.outcome = None
+        self.thread = threading.Thread(target=run_headless_game, args=(self.channel, self.session), daemon=True)
+        self.thread.start()
+        self.wait_for_game()
+        self.take_text()
+        return self.observe()
+
+    def checkpoints(self):
+        """Labels of the game's recent room-entry checkpoints, newest first, as try_again() numbers them."""
+        return self.session.checkpoints.labels() if self.session else []
+
+    def try_again(self, checkpoint=0):
+        """
+        Puts the game back at one of its recent checkpoints (0 is the newest), during
+        or after a game, and returns the observation there. Replays a hard encounter
+        without starting over.
+        """
+        if not self.session or not 0 <= checkpoint < len(self.session.checkpoints):
+            raise ValueError("There is no such checkpoint to go back to.")
+        self.close()
+        self.channel = HeadlessChannel(None, keep_text=self.render_mode is not None)
+        self.outcome = None
+        self.thread = threading.Thread(target=run_headless_game, args=(self.channel, self.session, checkpoint), daemon=True)
+        self.thread.start()
+        self.wait_for_game()
+        self.take_text()
+        return self.observe()
+
+    def step(self, command):
+        """Sends one command. Returns (observation, reward, done, info)."""
+        if self.outcome is not None:
+            raise RuntimeError("The game is over. Call reset() to start a new one.")
+        score_before = self.score()
+        self.channel.commands.put(command)
+        self.wait_for_game()
+        reward = self.score() - score_before
+        info = {'prompt': self.prompt}
+        if self.outcome is not None:
+            info['outcome'] = self.outcome
+        text = self.take_text()
+        if self.render_mode == 'ansi':
+            info['text'] = text
+        return self.observe(), reward, self.outcome is not None, info
+
+    def close(self):
+        """Ends the current game, if any, and waits for its thread to finish."""
+        if self.thread is not None and self.thread.is_alive():
+            self.channel.commands.put(None)
+            self.thread.join()
+        self.thread = None
+
+    def wait_for_game(self):
+        """Blocks until the game thread is waiting at a prompt or has finished."""
+        event, value = self.channel.events.get()
+        if event == 'error':
+            raise value
+        if event == 'done':
+            self.outcome = value
+            self.prompt = ""
+        else:
+            self.prompt = value
+
+    def take_text(self):
+        text = self.channel.take_text()
+        if self.render_mode == 'human' and text:
+            print(text, end="")
+        return text
+
+    def score(self):
+        return self.session.rooms_travelled * ROOM_REWARD + self.session.monsters_defeated_this_run * MONSTER_REWARD
+
+    def observe(self):
+        """Returns the current room, player stats and legal actions as plain data."""
+        session = self.session
+        room = session.current_room
+        prompt_kind = PROMPT_KINDS.get(self.prompt, 'text') if self.outcome is None else 'done'
+        observation = {
+            'prompt': prompt_kind,
+            'room': {
+                'number': session.rooms_travelled,
+                'description': room.description,
+                'exits': list(room.exits),
+                'locked_exits': dict(room.locked_exits),
+                'item': room.item['name'] if room.item else None,
+                'monster': room.monster['name'] if room.monster else None,
+                'npc': room.npc['name'] if room.npc else None,
+                'hazard': room.hazard['name'] if room.hazard and not room.hazard.get('is_currently_hidden') else None,
+                'puzzle': room.puzzle['type'] if room.puzzle else None,
+                'shrine': room.shrine['name'] if room.shrine else None,
+                'is_inn': getattr(room, 'is_inn', False),
+            },
+            'player': {
+                'class': session.player_class,
+                'hp': session.player_hp,
+                'max_hp': session.max_hp,
+                'level': session.player_level,
+                'xp': session.player_xp,
+                'xp_to_next_level': session.xp_to_next_level,
+                'gold': session.player_gold,
+                'attack_power': session.player_attack_power,
+                'defense': game.calculate_total_defense(session.player_shield_value, session.equipped_armor_value, session.equipped_cloak, session.equipped_helmet),
+                'inventory': [item['name'] for item in session.player_inventory],
+                'inventory_slots': session.current_max_inventory_slots,
+                'keychain': [key['name'] for key in session.player_keychain],
+                'equipped_weapon': session.equipped_weapon['name'] if session.equipped_weapon else None,
+                'skills': list(session.player_unlocked_skills),
+            },
+            'combat': self.channel.combat if prompt_kind == 'combat' else None,
+            'monsters_defeated': session.monsters_defeated_this_run,
+            'legal_actions': self.legal_actions(prompt_kind),
+        }
+        return observation
+
+    def legal_actions(self, prompt_kind):
+        """
+        The common commands that make sense right now. Any other text the game
+        understands (answers to riddles, item numbers, ...) can be sent too.
+        """
+        session = self.session
+        room = session.current_room
+        usable = [f"use {item['name'].lower()}" for item in session.player_inventory if item.get('type') in USABLE_ITEM_TYPES]
+        if prompt_kind == 'combat':
+            return ["attack", "heal", "run"] + usable + [f"skill {skill.lower()}" for skill in session.player_unlocked_skills]
+        if prompt_kind == 'shop':
+            return ["buy", "sell", "exit"]
+        if prompt_kind == 'inn':
+            return ["rest", "talk", "inventory", "leave"]
+        if prompt_kind != 'main':
+            return []
+
+        actions = [direction for direction in room.exits if direction not in room.locked_exits]
+        actions += ["look", "inventory", "search"]
+        if room.monster:
+            actions.append("attack")
+        if room.item:
+            actions.append("get item")
+        if room.npc:
+            actions.append("talk")
+        if room.hazard and not room.hazard.get('is_currently_hidden') and room.hazard.get('disarmable') and not room.hazard.get('disarmed'):
+            actions.append("disarm")
+        if room.shrine and not room.shrine.get('used'):
+            actions.append(room.shrine.get('interaction_verb', 'pray'))
+        if room.puzzle and not room.puzzle.get('solved', True):
+            actions += puzzle_actions(room.puzzle, session.player_inventory)
+        for direction, key_type in room.locked_exits.items():
+            for key in session.player_keychain:
+                if key.get('key_type') == key_type:
+                    actions.append(f"unlock {direction} with {key['name'].lower()}")
+        actions += usable
+        actions += [f"equip {item['name'].lower()}" for item in session.player_inventory if item.get('type') in EQUIPPABLE_ITEM_TYPES]
+        return actions
+
+def puzzle_actions(puzzle, inventory):
+    """
+    The commands that try to solve an unsolved puzzle. Riddles are offered every
+    riddle answer in the game, so the right one is a choice rather than a giveaway.
+    """
+    kind = puzzle.get('type')
+    if kind == 'riddle':
+        return [f"answer {answer}" for answer in sorted({p['solution'].lower() for p in game.GAME_DATA.get('puzzles', []) if p.get('type') == 'riddle'})]
+    if kind == 'mechanism':
+        return [f"pull {lever.lower()}" for lever in LEVER_NAME.findall(puzzle.get('description', ''))]
+    if kind == 'pressure_plate':
+        return ["press"]
+    if kind == 'item_delivery':
+        return [f"give {item['name'].lower()} to {puzzle.get('target_name', 'statue').lower()}" for item in inventory]
+    return []
+
+def observation_features(observation):
+    """Flattens an observation dict into numbers, in OBSERVATION_FEATURES order."""
+    player = observation['player']
+    room = observation['room']
+    combat = observation['combat']
+    prompt = observation['prompt']
+    return [
+        player['hp'], player['max_hp'], player['level'], player['xp'], player['xp_to_next_level'],
+        player['gold'], player['attack_power'], player['defense'],
+        len(player['inventory']), player['inventory_slots'], len(player['keychain']), len(player['skills']),
+        room['number'], len(room['exits']), len(room['locked_exits']),
+        room['item'] is not None, room['monster'] is not None, room['npc'] is not None,
+        room['hazard'] is not None, room['puzzle'] is not None, room['shrine'] is not None, room['is_inn'],
+        combat['monster_hp'] if combat else 0, observation['monsters_defeated'],
+        prompt == 'main', prompt == 'combat', prompt == 'shop', prompt == 'inn', prompt == 'text', prompt == 'done',
+    ]
+
+class EnvBatch:
+    """
+    A group of DungeonEnvs stepped one after another, resetting each with its
+    next seed when its game ends. VectorDungeonEnv runs one per worker process.
+    """
+    def __init__(self, seeds, seed_stride, player_class):
+        self.envs = [DungeonEnv() for _ in seeds]
+        self.seeds = list(seeds)
+        self.seed_stride = seed_stride
+        self.player_class = player_class
+        self.observations = []
+
+    def reset_env(self, index):
+        return self.envs[index].reset(seed=self.seeds[index], player_class=self.player_class)
+
+    def reset(self):
+        self.observations = [self.reset_env(index) for index in range(len(self.envs))]
+        return self.observations
+
+    def step(self, actions):
+        """Takes one command (or index into that env's legal actions) per env. Returns a list of step results."""
+        results = []
+        for index, (env, action) in enumerate(zip(self.envs, actions)):
+            if isinstance(action, int):
+                legal_actions = self.observations[index]['legal_actions']
+                action = legal_actions[action] if 0 <= action < len(legal_actions) else ""
+            observation, reward, done, info = env.step(action)
+            if done:
+                info['final_observation'] = observation
+                if self.seeds[index] is not None:
+                    self.seeds[index] += self.seed_stride
+                observation = self.reset_env(index)
+            self.observations[index] = observation
+            results.append((observation, reward, done, info))
+        return results
+
+    def close(self):
+        for env in self.envs:
+            env.close()
+
+def worker_context():
+    """
+    Multiprocessing context for game workers. Where fork() exists, workers are forked
+    from a parent that has already parsed game_data.json and built the item, monster
+    and room tables, so they start at once and share those pages instead of each
+    importing and parsing their own copy. Elsewhere the platform default is used.
+    """
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+def freeze_shared_content():
+    """
+    Moves everything the parent has built so far into the garbage collector's permanent
+    generation right before forking, so collections in the workers never write to (and
+    copy) the shared pages. It stays frozen in the parent: it lives as long as the process.
+    """
+    gc.collect() # Fewer half-empty pages to share
+    gc.freeze()
+
+def run_batch_worker(connection, seeds, seed_stride, player_class):
+    """Worker process body: serves reset/step requests for one EnvBatch until told to close."""
+    batch = EnvBatch(seeds, seed_stride, player_class)
+    try:
+        while True:
+            request, payload = connection.recv()
+            if request == 'reset':
+                connection.send(batch.reset())
+            elif request == 'step':
+                connection.send(batch.step(payload))
+            else:
+                break
+    finally:
+        batch.close()
+        connection.close()
+
+class VectorDungeonEnv:
+    """
+    Steps num_envs independent games in lockstep.
+    step() takes one action per game (a command string, or an int indexing that
+    game's legal actions) and returns stacked NumPy arrays:
+    observations (num_envs, len(OBSERVATION_FEATURES)), rewards, dones, plus a list of infos.
+    Finished games are reset straight away; their last observation is in info['final_observation'].
+    Game i starts with seed + i and moves on by num_envs every time it is reset.
+    backend='process' spreads the games over num_workers processes (default: one per core),
+    forked from this one where possible so they share its game data.
+    """
+    def __init__(self, num_envs, seed=None, player_class=None, backend='serial', num_workers=None):
+        if np is None:
+            raise ImportError("VectorDungeonEnv needs NumPy (pip install numpy).")
+        self.num_envs = num_envs
+        self.backend = backend
+        self.observations = [] # The latest observation dicts, for legal_actions and anything not in the arrays
+        seeds = [None if seed is None else seed + index for index in range(num_envs)]
+        if backend == 'serial':
+            self.batches = [EnvBatch(seeds, num_envs, player_class)]
+        elif backend == 'process':
+            num_workers = min(num_workers or os.cpu_count() or 1, num_envs)
+            context = worker_context()
+            if context.get_start_method() == 'fork':
+                freeze_shared_content()
+            self.batches = []
+            for worker in range(num_workers):
+                parent_end, child_end = context.Pipe()
+                process = context.Process(target=run_batch_worker, args=(child_end, seeds[worker::num_workers], num_envs, player_class), daemon=True)
+                process.start()
+                child_end.close()
+                self.batches.append((parent_end, process))
+        else:
+            raise ValueError(f"Unknown backend '{backend}'. Options: serial, process.")
+
+    def gather(self, request, payloads):
+        """Sends a request to every batch and returns their results in game order."""
+        if self.backend == 'serial':
+            parts = [getattr(self.batches[0], request)(*payloads[0])]
+        else:
+            for (connection, _), payload in zip(self.batches, payloads):
+                connection.send((request, payload[0] if payload else None))
+            parts = [connection.recv() for connection, _ in self.batches]
+        # Worker w holds games w, w + num_workers, ... so interleave the parts back together
+        results = [None] * self.num_envs
+        for worker, part in enumerate(parts):
+            results[worker::len(parts)] = part
+        return results
+
+    def reset(self):
+        """Starts every game. Returns the observation array."""
+        self.observations = self.gather('reset', [()] * len(self.batches))
+        return self.stack(self.observations)
+
+    def step(self, actions):
+        actions = [action.item() if hasattr(action, 'item') else action for action in actions]
+        payloads = [(actions[worker::len(self.batches)],) for worker in range(len(self.batches))]
+        results = self.gather('step', payloads)
+        self.observations = [observation for observation, _, _, _ in results]
+        rewards = np.array([reward for _, reward, _, _ in results], dtype=np.float32)
+        dones = np.array([done for _, _, done, _ in results], dtype=bool)
+        infos = [info for _, _, _, info in results]
+        return self.stack(self.observations), rewards, dones, infos
+
+    def stack(self, observations):
+        return np.array([observation_features(observation) for observation in observations], dtype=np.float32)
+
+    def close(self):
+        if self.backend == 'serial':
+            self.batches[0].close()
+        else:
+            for connection, process in self.batches:
+                connection.send(('close', None))
+                process.join()
+                connection.close()
+        self.batches = []
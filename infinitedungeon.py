@@ -5,6 +5,24 @@ import sys
 import os
 import debug # Import debug module
 import copy
+import heapq
+import bisect
+import io
+import select
+import threading
+import queue
+import pickle
+import struct
+import zlib
+try:
+    import lzma
+except ImportError: # Some Python builds leave it out; saves then use zlib
+    lzma = None
+try:
+    import sqlite3
+except ImportError: # Likewise; only the 'sqlite' storage backend needs it
+    sqlite3 = None
+from collections import deque
 from datetime import datetime
 from sound import Sound
 
@@ -95,10 +113,24 @@ HORDES = GAME_DATA.get('hordes', [])
 if DEBUG: # Wrapped debug calls
     debug.debug_print(f"Loaded {len(HORDES)} hordes.")
 
+ENCHANTMENTS_BY_NAME = {enchantment['name']: enchantment for enchantment in GAME_DATA.get('enchantments', [])}
+if DEBUG: # Wrapped debug calls
+    debug.debug_print(f"Loaded {len(ENCHANTMENTS_BY_NAME)} enchantments.")
+
+STATUS_EFFECTS_BY_NAME = {status_effect['name']: status_effect for status_effect in GAME_DATA.get('status_effects', [])}
+if DEBUG: # Wrapped debug calls
+    debug.debug_print(f"Loaded {len(STATUS_EFFECTS_BY_NAME)} status effects.")
+
 COMBINATION_RECIPES = GAME_DATA.get('combination_recipes', [])
 if DEBUG: # Wrapped debug calls
     debug.debug_print(f"Loaded {len(COMBINATION_RECIPES)} combination recipes.")
 
+# Catalog entries a save refers to by name (plus whatever was changed) instead of storing them in full.
+# Copied now, before play can touch the originals; the first entry of each name wins.
+SAVE_CATALOG = {}
+for catalog_entry in ALL_ITEMS + NPCs + HAZARDS + MONSTERS + PUZZLES + SHRINES:
+    SAVE_CATALOG.setdefault(catalog_entry['name'], copy.deepcopy(catalog_entry))
+
 # Specific debug for item_spawn_weights to confirm it's loaded
 ITEM_SPAWN_WEIGHTS = GAME_DATA.get('item_spawn_weights', {})
 if DEBUG: # Wrapped debug calls
@@ -172,9 +204,6 @@ VENDOR_SPAWN_CHANCE = 0.05
 # --- INN SPAWN CHANCE ---
 INN_SPAWN_CHANCE = 0.04
 
-# --- SPECIAL EVENT TRACKER ---
-special_event_after_unlock = None
-
 # --- PUZZLE ROOM CONSTANTS ---
 PUZZLE_SPAWN_CHANCE = 0.10
 
@@ -183,6 +212,89 @@ SHRINE_SPAWN_CHANCE = 0.08
 
 # --- HORDE ROOM CONSTANTS ---
 HORDE_SPAWN_CHANCE = 0.05
+AUTO_RESOLVE_HORDES = False # Default for new sessions; toggled in-game with 'autohorde'
+
+# --- AUTO-BATTLE POLICY ---
+# Used to pick combat actions when a fight is resolved without prompting
+AUTO_BATTLE_POLICY = {
+    'heal_below': 0.3, # Heal when HP drops below this fraction of max HP
+    'potion': None, # Name of the healing item to drink first (None = best available)
+    'skills': [], # Rotation of skill names (or 'attack') to use in order; empty = always attack
+    'flee_below': 0.0, # Try to run when HP drops below this fraction of max HP
+    'stop_below': 0.3, # Auto-battle in a normal fight hands control back below this fraction (if it can't heal)
+    'max_rounds': 100 # Give up and try to run after this many rounds (e.g. neither side can do damage)
+}
+
+# --- PACING ---
+# Seconds of dramatic pause for each pacing mode. Piped (non-TTY) runs default to 'zero'.
+PACING_DELAYS = {'interactive': 1.0, 'fast': 0.25, 'zero': 0.0}
+PACING_MODE = 'interactive' if sys.stdin is not None and sys.stdin.isatty() else 'zero'
+
+# --- OUTPUT BUFFERING ---
+# 'turn' writes everything printed during a turn in one go before the next prompt,
+# 'line' writes each line as soon as it is printed.
+OUTPUT_FLUSH = 'turn'
+
+# --- COMMAND QUEUE ---
+# Prompts accept 'north; search; get item' and repeat counts like 'attack x5' or '3 east'.
+MAX_COMMAND_REPEAT = 100
+LOW_HP_INTERRUPT = 0.25 # Queued commands are dropped when HP falls below this fraction of max HP
+
+# --- STORAGE ---
+# 'files' keeps saves in SAVE_DIR and meta-progression and the leaderboard in their JSON files, each
+# read and rewritten whole. 'sqlite' keeps all three in one SQLite database in WAL mode, so several game
+# processes can share them safely and a save only writes the rows that changed. Pick with --storage=sqlite;
+# --export-json writes the JSON files back out from the database.
+STORAGE_BACKENDS = ('files', 'sqlite')
+STORAGE_BACKEND = 'files'
+STORAGE_DB_FILE = 'infinitedungeon.db'
+STORAGE_SCHEMA_VERSION = 2
+STORAGE_BUSY_TIMEOUT = 10 # Seconds a write waits for another process's transaction to finish
+META_PROGRESS_FILE = 'metaprogress.json'
+LEADERBOARD_FILE = 'leaderboard.json' # Every day in one file, as before partitions; still read for those days, and what --export-json writes
+
+# --- LEADERBOARD ---
+# Each day of the Daily Challenge is a partition of its own, holding its best LEADERBOARD_TOP_K entries
+# and how many runs got each score, which is all rank and percentile queries need. A run's score is
+# added in O(log n) and the whole day is never re-sorted or rewritten. Set LEADERBOARD_ARCHIVE to also
+# keep every entry.
+LEADERBOARD_DIR = 'leaderboard' # 'files' backend: a <day>.json per day, plus a <day>.jsonl archive
+LEADERBOARD_TOP_K = 100
+LEADERBOARD_ARCHIVE = False
+LEADERBOARD_PAGE_SIZE = 10
+
+# --- SAVE FILES ---
+# Each save slot is a base file (<slot>.sav, binary; see encode_save_state()) and a journal (<slot>.journal) in SAVE_DIR.
+# A save appends what changed to the journal; every SAVE_COMPACT_EVERY saves the base file is rewritten in full.
+SAVE_DIR = 'saves'
+SAVE_INDEX_FILE = 'index.json' # In SAVE_DIR: who is in each slot, so listing slots never opens a save
+SAVE_INDEX_FIELDS = ('player_name', 'player_class', 'player_level', 'rooms_travelled', 'run_seed')
+SINGLE_SAVE_SLOT = 'savegame' # The one save from before slots (the files below) loads as this slot
+SINGLE_SAVE_FILE = 'savegame.sav'
+SINGLE_SAVE_JOURNAL_FILE = 'savegame.journal'
+LEGACY_SAVE_FILE = 'savegame.json' # Read if there is no binary save; also what --export-save writes by default
+SAVE_COMPACT_EVERY = 50
+SAVE_MAGIC = b'IDSAVE'
+SAVE_FORMAT_VERSION = 3
+SAVE_COMPRESSION = 'zlib' # 'zlib', 'lzma' (smaller, slower) or 'none'
+
+# --- AUTOSAVE ---
+# Triggers only mark an autosave as due; it is taken at the next command prompt and written on a background thread.
+AUTOSAVE_TRIGGER_NAMES = ('rooms', 'inn', 'level_up', 'time')
+AUTOSAVE_TRIGGERS = AUTOSAVE_TRIGGER_NAMES # Pick with --autosave=rooms,inn,... or turn off with --autosave=off
+AUTOSAVE_EVERY_ROOMS = 10
+AUTOSAVE_INTERVAL = 300 # Seconds of play between timed autosaves
+AUTOSAVE_MIN_GAP = 15 # Seconds; triggers that fire sooner than this after an autosave wait and share one save
+
+# --- SUSPEND/RESUME ---
+# 'suspend' parks a live run as a compressed snapshot; it is resumed from the Load Game menu.
+SUSPEND_DIR = 'suspended'
+SNAPSHOT_VERSION = 2 # Version 1 pickled history rooms as SavedRoom objects; those still load where the class resolves
+SNAPSHOT_COMPRESSION = 1 # zlib level: snapshots are small, so speed matters more than the last few bytes
+
+# --- CHECKPOINTS ---
+# Every room entry leaves an in-memory checkpoint that 'Try Again' can go back to after a loss.
+CHECKPOINT_RING_SIZE = 10 # Checkpoints kept per run (0 turns them off)
 
 # --- CRAFTING STATION CONSTANTS ---
 CRAFTING_STATION_SPAWN_CHANCE = 0.05
@@ -195,56 +307,432 @@ SELL_PRICE_MULTIPLIER = 0.5
 
 # --- Helper Functions ---
 
-def apply_and_tick_effects(player_effects):
+def pause(beats=1.0):
     """
-    Applies active effects (buffs/curses) to player stats for the current turn
-    and ticks down their duration. Removes expired effects.
-    Returns a dictionary of total modifiers for the current turn.
+    Waits for `beats` pacing units (scaled by PACING_MODE) for atmosphere.
+    If the player has already typed their next command the pause ends early.
     """
-    stat_modifiers = {
-        'attack_power': 0,
-        'defense': 0,
-        'crit_chance': 0.0
-    }
+    delay = PACING_DELAYS[PACING_MODE] * beats
+    if delay <= 0:
+        return
+    sys.stdout.flush() # Show what led up to the pause before waiting
+    if os.name != 'nt': # select() only works on sockets on Windows
+        try:
+            select.select([sys.stdin], [], [], delay)
+            return
+        except (OSError, ValueError):
+            pass
+    time.sleep(delay)
 
-    # Iterate over a copy, as we may modify the list
-    for effect in list(player_effects):
-        stat = effect.get('stat')
-        modifier = effect.get('modifier')
+class TurnOutputBuffer:
+    """
+    Stands in for sys.stdout and collects everything printed during a turn.
+    input() flushes stdout before reading, so the whole turn reaches the
+    terminal in a single write right before the next prompt.
+    """
+    def __init__(self, stream, line_flush=False):
+        self.stream = stream
+        self.line_flush = line_flush
+        self.chunks = []
+
+    def write(self, text):
+        self.chunks.append(text)
+        if self.line_flush and '\n' in text:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self.chunks:
+            self.stream.write(''.join(self.chunks))
+            self.chunks.clear()
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name) # encoding, fileno, isatty, ...
+
+# --- SESSION THREADS ---
+# Several sessions can run on threads of one process (the text server, headless environments).
+# A thread that sets session_threads.channel reads, writes and rolls dice through that channel:
+# any object with write(text), flush(), readline() and an `rng` (a random.Random).
+session_threads = threading.local()
+_shared_random = random # The real module, for threads without a channel
+
+class ThreadRouter:
+    """
+    Stands in for sys.stdin and sys.stdout. Threads with a channel read and
+    write through it; every other thread gets the real stream.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+
+    def current(self):
+        return getattr(session_threads, 'channel', None) or self.stream
+
+    def write(self, text):
+        return self.current().write(text)
+
+    def flush(self):
+        self.current().flush()
+
+    def readline(self):
+        return self.current().readline()
+
+    def fileno(self):
+        # input() then reads through readline(), and pause() sleeps instead of select()ing a stream it can't see
+        raise io.UnsupportedOperation("session channels are not backed by a file descriptor")
+
+    def isatty(self):
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name) # encoding, errors, ...
+
+class ThreadRandom:
+    """Stands in for the random module so each session thread draws from its own generator."""
+    def __getattr__(self, name):
+        channel = getattr(session_threads, 'channel', None)
+        return getattr(channel.rng if channel else _shared_random, name)
+
+def route_session_threads():
+    """Routes input(), print() and random per thread. Safe to call more than once."""
+    global random
+    if not isinstance(sys.stdin, ThreadRouter):
+        sys.stdin = ThreadRouter(sys.stdin)
+    if not isinstance(sys.stdout, ThreadRouter):
+        sys.stdout = ThreadRouter(sys.stdout)
+    random = ThreadRandom()
+
+def expand_command_line(line):
+    """Splits a typed line on ';' and expands repeat counts ('attack x5', '3 east') into single steps."""
+    segments = line.split(';')
+    steps = []
+    for segment in segments:
+        words = segment.split()
+        if not words and len(segments) > 1:
+            continue # Ignore empty steps like the trailing one in 'north;'
+        count = 1
+        if len(words) > 1 and words[0].isdigit():
+            count, words = int(words[0]), words[1:]
+        elif len(words) > 1 and words[-1][:1] == 'x' and words[-1][1:].isdigit():
+            count, words = int(words[-1][1:]), words[:-1]
+        steps.extend([" ".join(words)] * min(count, MAX_COMMAND_REPEAT))
+    return steps
+
+def read_command(session, prompt):
+    """
+    Reads the next command for a prompt. Steps left over from a chained or
+    repeated command are served from the session's command queue (and echoed)
+    before the player is asked again.
+    """
+    if session.command_queue:
+        command = session.command_queue.popleft()
+        print(f"{prompt}{command}")
+        return command
+    steps = expand_command_line(input(prompt))
+    if not steps:
+        return ""
+    session.command_queue.extend(steps[1:])
+    return steps[0]
+
+def interrupt_commands(session, reason):
+    """Drops any queued commands, telling the player why."""
+    if session.command_queue:
+        print(f"({reason} - {len(session.command_queue)} queued command(s) cancelled.)")
+        session.command_queue.clear()
+
+def set_pacing_mode(mode):
+    """Switches the pacing mode. Returns False if the mode is unknown."""
+    global PACING_MODE
+    if mode not in PACING_DELAYS:
+        return False
+    PACING_MODE = mode
+    return True
+
+# --- COMBAT EVENTS ---
+# Combat reports what happens as typed events (event type + kind + fields) instead of printing.
+# The active renderer decides what to do with them: print the usual text, drop them, or log them.
+
+def _render_combat_start(event):
+    lines = ["=" * 40, "", f"--- Combat with {event['monster']} ---", f"Your HP: {event['player_hp']}/{event['max_hp']} | {event['monster']} HP: {event['monster_hp']}"]
+    if event['defense'] > 0:
+        lines.append(f"Your Total Defense: {event['defense']}")
+    return "\n".join(lines)
+
+def _render_combat_status(event):
+    lines = [f"Your HP: {event['player_hp']}/{event['max_hp']} | {event['monster']} HP: {event['monster_hp']}"]
+    if event['player_effects']:
+        lines.append(f"Your status: {', '.join(event['player_effects'])}")
+    if event['monster_effects']:
+        lines.append(f"{event['monster']}'s status: {', '.join(event['monster_effects'])}")
+    return "\n".join(lines)
+
+def _render_level_up(event):
+    lines = ["\n" + "#" * 50,
+             f"      CONGRATULATIONS! YOU REACHED LEVEL {event['level']}!              ",
+             "#" * 50,
+             f"Your Max HP increased from {event['old_max_hp']} to {event['max_hp']}!",
+             f"Your Attack Power increased to {event['attack_power']}!",
+             f"Your Critical Chance increased to {event['crit_chance']*100:.0f}%!"]
+    if event['skill_point_gained']:
+        lines.append(f"You have gained a skill point! You now have {event['skill_points']} skill point(s).")
+    lines.append("You feel fully revitalized!")
+    lines.append("#" * 50)
+    return "\n".join(lines)
+
+# Text for each (event type, kind): a format string over the event fields, or a function of the event
+COMBAT_EVENT_TEXT = {
+    ('combat_start', None): _render_combat_start,
+    ('status', None): _render_combat_status,
+    ('first_strike', None): "Thanks to your Amulet of Swiftness, you get the first strike!",
+    ('stunned', 'player'): "You are stunned and cannot act!",
+    ('stunned', 'monster'): "The {monster} is stunned and cannot act!",
+    ('attack', 'player'): "You strike the {monster} for {damage} damage!",
+    ('attack', 'monster'): "The {monster} retaliates, hitting you for {damage} damage! Your defense absorbed {absorbed} damage.",
+    ('crit', 'player'): "You deliver a **CRITICAL HIT** to the {monster} for {damage} damage!",
+    ('crit', 'monster'): "The {monster} lands a **CRITICAL HIT** on you for {damage} damage! Your defense absorbed {absorbed} damage.",
+    ('miss', 'player'): "You miss!",
+    ('miss', 'monster'): "The {monster} misses!",
+    ('effect_applied', 'player'): "You are now {effect}!",
+    ('effect_applied', 'monster'): "The {monster} is now {effect}!",
+    ('effect_cured', 'player'): "The {effect} has been cured.",
+    ('effect_tick', None): lambda event: event['message'].format(damage=event['damage']),
+    ('effect_expired', 'status'): "{message}",
+    ('effect_expired', 'buff'): "The effect of '{effect}' has worn off.",
+    ('enchantment', 'damage_boost'): "Your weapon's {enchantment} enchantment deals an extra {damage} damage!",
+    ('item_effect', 'hp_drain'): "Your {item} drains {amount} HP from you!",
+    ('item_effect', 'lifesteal'): "Your {item} drains {amount} HP from the enemy!",
+    ('item_effect', 'chain_lightning'): "A lightning bolt from your {item} strikes the enemy for an extra {damage} damage!",
+    ('item_effect', 'evade'): "You dodge the attack thanks to your {item}!",
+    ('item_effect', 'reflect'): "Your {item} reflects {damage} damage back at the enemy!",
+    ('skill', 'damage'): "You use {skill} and deal {damage} damage!",
+    ('skill', 'guaranteed_crit'): "You use {skill} for a guaranteed critical hit, dealing {damage} damage!",
+    ('skill', 'aoe_damage'): "You use {skill} and deal {damage} damage to all enemies!",
+    ('skill', 'heal'): "You use {skill} and heal for {amount} HP.",
+    ('skill', 'stun'): "You use {skill} and stun the {monster}!",
+    ('skill', 'stun_failed'): "You use {skill}, but it fails to stun the {monster}.",
+    ('skill', 'poison'): "You use {skill} and poison the {monster}!",
+    ('skill', 'freeze'): "You use {skill} and freeze the {monster} in place!",
+    ('skill', 'freeze_failed'): "You use {skill}, but the {monster} resists the freeze.",
+    ('skill', 'stat_buff'): "You use {skill} and feel stronger!",
+    ('skill', 'smite_undead'): "Your divine power smites the undead creature!",
+    ('skill', 'shield'): "You summon an Arcane Shield that will absorb up to {amount} damage.",
+    ('skill', 'dodge_buff'): "You use {skill} and feel much harder to hit.",
+    ('heal', 'item'): lambda event: f"You use {add_article(event['item'])} and restore {event['amount']} HP.",
+    ('heal', 'total'): "Your health is now {player_hp}/{max_hp} HP.",
+    ('flee', 'escaped'): "You manage to escape the fight!",
+    ('flee', 'blocked'): "You try to run, but the monster blocks your path!",
+    ('defeat', 'monster'): "The {monster} collapses, defeated!",
+    ('defeat', 'monster_first_strike'): "You defeated the {monster} before it could even act!",
+    ('defeat', 'player'): "The {monster} delivers a fatal blow...",
+    ('defeat', 'player_drained'): "You have been drained of your life force!",
+    ('defeat', 'player_item'): lambda event: f"You succumb to the effects of {add_article(event['item'])}...",
+    ('reward', 'gold_bonus'): "Your {item} doubles the gold dropped!",
+    ('reward', 'gold'): "You gained {amount} gold from defeating the {monster}!",
+    ('reward', 'xp'): "You gained {amount} experience points!",
+    ('drop', 'inventory'): lambda event: f"The monster dropped {add_article(event['item'])}! It has been added to your inventory.",
+    ('drop', 'floor'): lambda event: f"The monster dropped {add_article(event['item'])}, but your inventory is full! It has been placed on the floor.",
+    ('drop', 'lost'): lambda event: f"The monster dropped {add_article(event['item'])}, but your inventory is full and there's already an item on the floor! The dropped item is lost.",
+    ('drop', 'material'): "The monster dropped a {item}!",
+    ('drop', 'material_lost'): "The monster dropped a {item}, but your inventory is full!",
+    ('quest_progress', 'update'): "Quest Update: Defeated a monster! ({count}/{target}) for '{quest}'",
+    ('quest_progress', 'complete'): "QUEST COMPLETE: '{quest}'! Return to {giver} to claim your reward!",
+    ('level_up', None): _render_level_up,
+    ('auto_battle', 'engaged'): "Auto-battle engaged.",
+    ('auto_battle', 'action'): "Combat Action> {action} (auto)",
+    ('auto_battle', 'stopped'): "Your HP is low! Auto-battle hands control back to you.",
+}
+
+class TextCombatRenderer:
+    """Prints combat events as the usual game text."""
+
+    def render(self, event_type, kind, event):
+        text = COMBAT_EVENT_TEXT[(event_type, kind)]
+        print(text(event) if callable(text) else text.format(**event))
+
+class NullCombatRenderer:
+    """Drops combat events, for headless runs where nobody reads the text."""
+
+    def render(self, event_type, kind, event):
+        pass
+
+class JsonlCombatRenderer:
+    """Writes each combat event as a JSON object on its own line, e.g. for analytics."""
 
-        if stat in stat_modifiers and modifier is not None:
-            stat_modifiers[stat] += modifier
+    def __init__(self, stream):
+        self.stream = stream
 
-        effect['duration'] -= 1
+    def render(self, event_type, kind, event):
+        self.stream.write(json.dumps({'event': event_type, 'kind': kind, **event}) + "\n")
 
-        if effect['duration'] <= 0:
+combat_renderer = TextCombatRenderer() # Used by every thread that hasn't picked its own
+_thread_renderers = threading.local() # So one server session muting its horde battles doesn't mute the others
+
+def set_combat_renderer(renderer):
+    """
+    Sends combat events from the calling thread to a different renderer.
+    Returns the previous one so it can be restored.
+    """
+    previous_renderer = getattr(_thread_renderers, 'renderer', combat_renderer)
+    _thread_renderers.renderer = renderer
+    return previous_renderer
+
+def emit_combat_event(event_type, kind=None, **event):
+    """Reports a combat event to the active renderer."""
+    getattr(_thread_renderers, 'renderer', combat_renderer).render(event_type, kind, event)
+
+
+class EffectSchedule:
+    """
+    Turn-indexed schedule of the player's timed effects (buffs/curses).
+    Each effect is filed under the turn it expires on in a min-heap and the stat
+    modifier totals are kept up to date as effects come and go, so a tick only
+    touches the effects that are actually expiring. Appends and iterates like the
+    plain list it replaces.
+    """
+
+    def __init__(self, effects=None):
+        self.turn = 0
+        self.modifiers = {'attack_power': 0, 'defense': 0, 'crit_chance': 0.0}
+        self._expiries = [] # Heap of (expiry_turn, sequence, effect)
+        self._active = {} # sequence -> (effect, expiry_turn), in the order effects were gained
+        self._sequence = 0
+        for effect in effects or []:
+            self.append(effect)
+
+    def append(self, effect):
+        # An effect counts for its next 'duration' turns (at least one)
+        expiry_turn = self.turn + max(effect.get('duration') or 0, 1)
+        self._sequence += 1
+        self._active[self._sequence] = (effect, expiry_turn)
+        heapq.heappush(self._expiries, (expiry_turn, self._sequence, effect))
+        self._adjust_modifiers(effect, 1)
+
+    def _adjust_modifiers(self, effect, sign):
+        stat = effect.get('stat')
+        modifier = effect.get('modifier')
+        if stat in self.modifiers and modifier is not None:
+            self.modifiers[stat] += sign * modifier
+
+    def tick(self):
+        """Advances one turn. Returns the modifiers in force for this turn and drops effects that expire on it."""
+        self.turn += 1
+        turn_modifiers = dict(self.modifiers)
+        while self._expiries and self._expiries[0][0] <= self.turn:
+            _, sequence, effect = heapq.heappop(self._expiries)
+            del self._active[sequence]
+            self._adjust_modifiers(effect, -1)
             # Check for message key before trying to access it
             if 'message' in effect and effect['message']:
-                print(f"The effect of '{effect['message'].split('!')[0]}' has worn off.")
-            player_effects.remove(effect)
+                emit_combat_event('effect_expired', 'buff', effect=effect['message'].split('!')[0])
+        if not self._active:
+            # Start from clean totals so float modifiers don't drift over a long run
+            self.modifiers = {'attack_power': 0, 'defense': 0, 'crit_chance': 0.0}
+        return turn_modifiers
+
+    def remaining(self):
+        """Yields (effect, turns_remaining) for each active effect."""
+        for effect, expiry_turn in self._active.values():
+            yield effect, expiry_turn - self.turn
+
+    def to_list(self):
+        """Returns the active effects as plain dicts with up-to-date durations, for saving."""
+        return [dict(effect, duration=turns_remaining) for effect, turns_remaining in self.remaining()]
+
+    def __iter__(self):
+        return (effect for effect, _ in self._active.values())
+
+    def __len__(self):
+        return len(self._active)
+
 
-    return stat_modifiers
+class StatusEffectSchedule:
+    """
+    Status effects (Poison, Stun, Blindness, Curse) on one combatant, scheduled like
+    EffectSchedule. Damage-over-time effects are kept in their own table since they
+    fire every turn anyway, stuns are counted and stat debuffs are running totals.
+    Effects with a duration of 0 or less (e.g. Curse) never wear off.
+    """
+
+    def __init__(self):
+        self.turn = 0
+        self.modifiers = {} # stat -> total modifier, e.g. Blindness lowers 'accuracy'
+        self._expiries = [] # Heap of (expiry_turn, sequence)
+        self._active = {} # sequence -> effect, in the order effects were applied
+        self._dots = {} # sequence -> effect, for the 'dot' subset of _active
+        self._stuns = 0
+        self._sequence = 0
+
+    def append(self, effect):
+        if 'type' not in effect and effect.get('name') in STATUS_EFFECTS_BY_NAME:
+            # Weapon and monster entries only name the effect (plus a chance), so fill in its definition
+            effect = dict(copy.deepcopy(STATUS_EFFECTS_BY_NAME[effect['name']]), **effect)
+        self._sequence += 1
+        self._active[self._sequence] = effect
+        if effect['type'] == 'dot':
+            self._dots[self._sequence] = effect
+        elif effect['type'] == 'control' and effect['name'] == 'Stun':
+            self._stuns += 1
+        if 'effect' in effect:
+            stat = effect['effect']['stat']
+            self.modifiers[stat] = self.modifiers.get(stat, 0) + effect['effect']['modifier']
+        if effect['duration'] > 0:
+            heapq.heappush(self._expiries, (self.turn + effect['duration'], self._sequence))
+
+    def _discard(self, sequence):
+        effect = self._active.pop(sequence)
+        self._dots.pop(sequence, None)
+        if effect['type'] == 'control' and effect['name'] == 'Stun':
+            self._stuns -= 1
+        if 'effect' in effect:
+            self.modifiers[effect['effect']['stat']] -= effect['effect']['modifier']
+
+    def remove_named(self, name):
+        """Removes every active effect with the given name (e.g. when it is cured)."""
+        for sequence in [sequence for sequence, effect in self._active.items() if effect['name'] == name]:
+            self._discard(sequence)
+
+    def tick(self, character_hp):
+        """Advances one turn. Returns updated character_hp and whether the character is stunned this turn."""
+        self.turn += 1
+        expiring = set()
+        while self._expiries and self._expiries[0][0] <= self.turn:
+            sequence = heapq.heappop(self._expiries)[1]
+            if sequence in self._active: # Cured effects are left in the heap and skipped here
+                expiring.add(sequence)
+        is_stunned = self._stuns > 0
+        # Damage and wear-off messages come out in the order the effects were applied
+        for sequence in sorted(expiring.union(self._dots)):
+            effect = self._active[sequence]
+            if effect['type'] == 'dot':
+                damage = effect['damage']
+                character_hp -= damage
+                emit_combat_event('effect_tick', effect=effect['name'], damage=damage, message=effect['message_tick'])
+            if sequence in expiring:
+                emit_combat_event('effect_expired', 'status', effect=effect['name'], message=effect['message_wear_off'])
+                self._discard(sequence)
+        return character_hp, is_stunned
+
+    def __iter__(self):
+        return iter(self._active.values())
+
+    def __len__(self):
+        return len(self._active)
+
+
+def apply_and_tick_effects(player_effects):
+    """
+    Applies active effects (buffs/curses) to player stats for the current turn
+    and ticks down their duration. Removes expired effects.
+    Returns a dictionary of total modifiers for the current turn.
+    """
+    return player_effects.tick()
 
 def apply_and_tick_status_effects(effects, character_hp):
     """
     Applies active status effects to a character for the current turn, ticks down their duration, and removes expired effects.
     Returns updated character_hp and a boolean indicating if the character is stunned.
     """
-    is_stunned = False
-    for effect in list(effects):
-        if effect['type'] == 'dot':
-            damage = effect['damage']
-            character_hp -= damage
-            print(effect['message_tick'].format(damage=damage))
-        elif effect['type'] == 'control' and effect['name'] == 'Stun':
-            is_stunned = True
-        elif effect['type'] == 'persistent_debuff':
-            pass
-        effect['duration'] -= 1
-        if effect['duration'] == 0:
-            print(effect['message_wear_off'])
-            effects.remove(effect)
-    return character_hp, is_stunned
+    return effects.tick(character_hp)
 
 def add_article(word):
     """Adds 'a' or 'an' prefix to a word based on its starting letter."""
@@ -322,66 +810,54 @@ def calculate_xp_for_next_level(current_level):
     """Calculates the XP required for the next level."""
     return int(BASE_XP_TO_LEVEL_UP * (XP_SCALE_FACTOR ** (current_level - 1)))
 
-def level_up_player(player_hp, max_hp, player_level, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points):
+def level_up_player(session):
     """Applies level-up bonuses to player stats."""
-    player_level += 1
+    session.player_level += 1
     skill_point_gained = False
-    if player_level % 3 == 0 and player_level <= 15:
-        player_skill_points += 1
+    if session.player_level % 3 == 0 and session.player_level <= 15:
+        session.player_skill_points += 1
         skill_point_gained = True
 
-    old_max_hp = max_hp
-    max_hp += HP_GAIN_PER_LEVEL
-    player_hp = max_hp
+    old_max_hp = session.max_hp
+    session.max_hp += HP_GAIN_PER_LEVEL
+    session.player_hp = session.max_hp
 
-    player_attack_power += ATTACK_GAIN_PER_LEVEL
+    session.player_attack_power += ATTACK_GAIN_PER_LEVEL
 
     # Corrected critical hit chance increase on level-up
-    player_crit_chance = min(1.0, player_crit_chance + CRIT_CHANCE_GAIN_PER_LEVEL)
+    session.player_crit_chance = min(1.0, session.player_crit_chance + CRIT_CHANCE_GAIN_PER_LEVEL)
     # The multiplier is a constant, so it's not increased by level-up
     # player_crit_multiplier = BASE_PLAYER_CRIT_MULTIPLIER # This should stay constant or be based on items
 
-    print("\n" + "#" * 50)
-    print(f"      CONGRATULATIONS! YOU REACHED LEVEL {player_level}!              ")
-    print("#" * 50)
-    print(f"Your Max HP increased from {old_max_hp} to {max_hp}!")
-    print(f"Your Attack Power increased to {player_attack_power}!")
-    print(f"Your Critical Chance increased to {player_crit_chance*100:.0f}%!")
-    if skill_point_gained:
-        print(f"You have gained a skill point! You now have {player_skill_points} skill point(s).")
-    print(f"You feel fully revitalized!")
-    print("#" * 50)
+    emit_combat_event('level_up', level=session.player_level, old_max_hp=old_max_hp, max_hp=session.max_hp, attack_power=session.player_attack_power,
+                      crit_chance=session.player_crit_chance, skill_point_gained=skill_point_gained, skill_points=session.player_skill_points)
+    request_autosave(session, 'level_up')
 
-    return player_hp, max_hp, player_level, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points
-
-def check_for_level_up(player_xp, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points):
+def check_for_level_up(session):
     """Checks if the player has enough XP to level up and calls level_up_player."""
-    while player_xp >= xp_to_next_level:
-        player_xp -= xp_to_next_level
-
-        player_hp, max_hp, player_level, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points = \
-            level_up_player(player_hp, max_hp, player_level, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points)
+    while session.player_xp >= session.xp_to_next_level:
+        session.player_xp -= session.xp_to_next_level
 
-        xp_to_next_level = calculate_xp_for_next_level(player_level)
+        level_up_player(session)
 
-    return player_xp, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points
+        session.xp_to_next_level = calculate_xp_for_next_level(session.player_level)
 
 
-def handle_skill_tree(player_class, player_level, player_skill_points, player_unlocked_skills):
+def handle_skill_tree(session):
     """Displays the skill tree and allows the player to unlock skills."""
     character_classes = GAME_DATA.get('character_classes', {})
-    class_data = character_classes.get(player_class)
+    class_data = character_classes.get(session.player_class)
     if not class_data:
         print("Invalid class. Cannot display skill tree.")
-        return player_skill_points, player_unlocked_skills
+        return
 
     skill_tree = class_data['skill_tree']
     ascii_tree = class_data['ascii_tree']
     skill_map = {skill['id']: skill for skill in skill_tree}
 
     while True:
-        print(f"\n--- {player_class} Skill Tree ---")
-        print(f"You have {player_skill_points} skill point(s).")
+        print(f"\n--- {session.player_class} Skill Tree ---")
+        print(f"You have {session.player_skill_points} skill point(s).")
 
         # Display ASCII skill tree with status
         for line in ascii_tree:
@@ -390,13 +866,13 @@ def handle_skill_tree(player_class, player_level, player_skill_points, player_un
                 if placeholder in line:
                     skill_name = skill_data['name']
                     status = ""
-                    if skill_name in player_unlocked_skills:
+                    if skill_name in session.player_unlocked_skills:
                         status = "[Unlocked]"
-                    elif player_level >= skill_data['level_unlocked']:
+                    elif session.player_level >= skill_data['level_unlocked']:
                         is_unlockable = True
                         if 'dependencies' in skill_data:
                             for dep_id in skill_data['dependencies']:
-                                if skill_map.get(dep_id) and skill_map[dep_id]['name'] not in player_unlocked_skills:
+                                if skill_map.get(dep_id) and skill_map[dep_id]['name'] not in session.player_unlocked_skills:
                                     is_unlockable = False
                                     break
                         if is_unlockable:
@@ -443,35 +919,33 @@ def handle_skill_tree(player_class, player_level, player_skill_points, player_un
             input("Press Enter to continue...")
 
         elif command == 'unlock':
-            if player_skill_points <= 0:
+            if session.player_skill_points <= 0:
                 print("You have no skill points to spend.")
                 continue
 
-            if skill_to_act['name'] in player_unlocked_skills:
+            if skill_to_act['name'] in session.player_unlocked_skills:
                 print("You have already unlocked this skill.")
                 continue
 
-            if player_level < skill_to_act['level_unlocked']:
+            if session.player_level < skill_to_act['level_unlocked']:
                 print(f"You need to be level {skill_to_act['level_unlocked']} to unlock this skill.")
                 continue
 
             can_unlock = True
             if 'dependencies' in skill_to_act:
                 for dep_id in skill_to_act['dependencies']:
-                    if skill_map.get(dep_id) and skill_map[dep_id]['name'] not in player_unlocked_skills:
+                    if skill_map.get(dep_id) and skill_map[dep_id]['name'] not in session.player_unlocked_skills:
                         print(f"You must unlock '{skill_map[dep_id]['name']}' first.")
                         can_unlock = False
                         break
 
             if can_unlock:
-                player_skill_points -= 1
-                player_unlocked_skills.append(skill_to_act['name'])
+                session.player_skill_points -= 1
+                session.player_unlocked_skills.append(skill_to_act['name'])
                 print(f"You have unlocked '{skill_to_act['name']}'!")
         else:
             print("Invalid command.")
 
-    return player_skill_points, player_unlocked_skills
-
 
 def process_item_use(item_to_use, player_hp, max_hp, player_inventory, current_max_inventory_slots, in_combat=False):
     """
@@ -491,7 +965,10 @@ def process_item_use(item_to_use, player_hp, max_hp, player_inventory, current_m
             healing_amount = effect_value
             player_hp_before_heal = player_hp
             player_hp = min(max_hp, player_hp + healing_amount)
-            print(f"You use {add_article(item_to_use['name'])} and restore {player_hp - player_hp_before_heal} HP.")
+            if in_combat:
+                emit_combat_event('heal', 'item', item=item_to_use['name'], amount=player_hp - player_hp_before_heal)
+            else:
+                print(f"You use {add_article(item_to_use['name'])} and restore {player_hp - player_hp_before_heal} HP.")
             player_inventory.remove(item_to_use)
             action_consumed_turn = True
         elif effect_type == 'harm' and isinstance(effect_value, int):
@@ -572,30 +1049,83 @@ def process_item_use(item_to_use, player_hp, max_hp, player_inventory, current_m
     return player_hp, max_hp, current_max_inventory_slots, action_consumed_turn, stat_changes
 
 
-def handle_item_effects(effect_type, player_hp, damage, monster_hp, equipped_items):
+def _lifesteal_effect(item_name, percentage):
+    def effect(player_hp, damage, monster_hp):
+        lifesteal = int(damage * percentage)
+        player_hp += lifesteal
+        emit_combat_event('item_effect', 'lifesteal', item=item_name, amount=lifesteal)
+        return player_hp, damage, monster_hp
+    return effect
+
+def _chain_lightning_effect(item_name, chance, lightning_damage):
+    def effect(player_hp, damage, monster_hp):
+        if random.random() < chance:
+            monster_hp -= lightning_damage
+            emit_combat_event('item_effect', 'chain_lightning', item=item_name, damage=lightning_damage)
+        return player_hp, damage, monster_hp
+    return effect
+
+def _evade_effect(item_name, chance):
+    def effect(player_hp, damage, monster_hp):
+        if random.random() < chance:
+            damage = 0
+            emit_combat_event('item_effect', 'evade', item=item_name)
+        return player_hp, damage, monster_hp
+    return effect
+
+def _reflect_effect(item_name, chance, percentage):
+    def effect(player_hp, damage, monster_hp):
+        if random.random() < chance:
+            reflect_damage = int(damage * percentage)
+            monster_hp -= reflect_damage
+            emit_combat_event('item_effect', 'reflect', item=item_name, damage=reflect_damage)
+        return player_hp, damage, monster_hp
+    return effect
+
+
+def compile_item_effects(equipped_items):
     """
-    Handles unique item effects during combat.
+    Compiles the unique effects of the equipped items into flat lists of handlers per combat hook.
+    Items without effects contribute nothing, so a hit only runs the effects that actually exist.
     """
+    compiled = {
+        'on_deal_damage': [],
+        'on_take_damage': [],
+        'first_strike': False
+    }
     for item in equipped_items:
-        if item and "effects" in item:
-            effects = item["effects"]
-            if effect_type == "on_deal_damage":
-                if "lifesteal_percentage" in effects:
-                    lifesteal = int(damage * effects["lifesteal_percentage"])
-                    player_hp += lifesteal
-                    print(f"Your {item['name']} drains {lifesteal} HP from the enemy!")
-                if "chain_lightning_chance" in effects and random.random() < effects["chain_lightning_chance"]:
-                    monster_hp -= effects["chain_lightning_damage"]
-                    print(f"A lightning bolt from your {item['name']} strikes the enemy for an extra {effects['chain_lightning_damage']} damage!")
-            elif effect_type == "on_take_damage":
-                if "evade_chance" in effects and random.random() < effects["evade_chance"]:
-                    damage = 0
-                    print(f"You dodge the attack thanks to your {item['name']}!")
-                if "reflect_damage_chance" in effects and random.random() < effects["reflect_damage_chance"]:
-                    reflect_damage = int(damage * effects["reflect_damage_percentage"])
-                    monster_hp -= reflect_damage
-                    print(f"Your {item['name']} reflects {reflect_damage} damage back at the enemy!")
+        if not item or "effects" not in item:
+            continue
+        effects = item["effects"]
+        item_name = item['name']
+        if "lifesteal_percentage" in effects:
+            compiled['on_deal_damage'].append(_lifesteal_effect(item_name, effects["lifesteal_percentage"]))
+        if "chain_lightning_chance" in effects:
+            compiled['on_deal_damage'].append(_chain_lightning_effect(item_name, effects["chain_lightning_chance"], effects["chain_lightning_damage"]))
+        if "evade_chance" in effects:
+            compiled['on_take_damage'].append(_evade_effect(item_name, effects["evade_chance"]))
+        if "reflect_damage_chance" in effects:
+            compiled['on_take_damage'].append(_reflect_effect(item_name, effects["reflect_damage_chance"], effects["reflect_damage_percentage"]))
+        if effects.get('first_strike'):
+            compiled['first_strike'] = True
+    return compiled
+
+
+def get_enchantment(item):
+    """Returns the enchantment definition applied to an item, or None."""
+    if not item or not item.get('enchantment'):
+        return None
+    return ENCHANTMENTS_BY_NAME.get(item['enchantment'])
+
+
+def handle_item_effects(effect_type, player_hp, damage, monster_hp, compiled_effects):
+    """
+    Runs the compiled item effect handlers for a combat hook ('on_deal_damage' or 'on_take_damage').
+    """
+    for effect in compiled_effects[effect_type]:
+        player_hp, damage, monster_hp = effect(player_hp, damage, monster_hp)
     return player_hp, damage, monster_hp
+
 def display_room_content_summary(current_room, rooms_travelled, direction_history=None, seed=None):
     """
     Displays the room description and then any relevant hints or status information.
@@ -795,16 +1325,43 @@ def handle_equip_item(item_to_equip, player_shield_value, equipped_armor_value,
     return player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, equipped_misc_items, equipped_helmet
 
 
+def choose_auto_combat_action(policy, player_hp, max_hp, player_inventory, player_unlocked_skills, rounds_fought, can_stop=False):
+    """
+    Picks the next combat command according to an auto-battle policy.
+    Returns None if control should go back to the player (only when can_stop is True).
+    """
+    if rounds_fought >= policy.get('max_rounds', AUTO_BATTLE_POLICY['max_rounds']):
+        return "run"
+    if player_hp < max_hp * policy.get('flee_below', 0):
+        return "run"
+    if player_hp < max_hp * policy.get('heal_below', 0):
+        healing_items = [item for item in player_inventory if item.get('type') == 'consumable' and item.get('effect_type') == 'heal' and isinstance(item.get('effect_value'), int) and item['effect_value'] > 0]
+        preferred_potion = (policy.get('potion') or '').lower()
+        if any(item['name'].lower() == preferred_potion for item in healing_items):
+            return f"use {preferred_potion}"
+        if healing_items:
+            return "heal"
+    if can_stop and player_hp < max_hp * policy.get('stop_below', 0):
+        return None
+    unlocked_skills_lower = [skill_name.lower() for skill_name in player_unlocked_skills]
+    rotation = [action for action in policy.get('skills', []) if action.lower() == 'attack' or action.lower() in unlocked_skills_lower]
+    if rotation:
+        action = rotation[rounds_fought % len(rotation)].lower()
+        return "attack" if action == 'attack' else f"skill {action}"
+    return "attack"
+
+
 # MODIFIED: Added equipped_cloak and equipped_misc_items to parameters
-def handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, monster_data, player_shield_value, equipped_armor_value, equipped_cloak, player_inventory, current_max_inventory_slots, player_gold, equipped_weapon, player_xp, player_level, xp_to_next_level, player_quests, player_keychain, current_room, equipped_misc_items, player_effects, sound_manager, current_defense_bonus, current_crit_chance_bonus, equipped_helmet, player_class, player_unlocked_skills, player_skill_points):
-    player_status_effects = []
-    monster_status_effects = []
+def handle_combat(session, monster_data, current_defense_bonus, current_crit_chance_bonus, policy=None):
+    player_status_effects = StatusEffectSchedule()
+    monster_status_effects = StatusEffectSchedule()
     """
     Handles a simple turn-based combat encounter.
-    Returns the updated player_hp, max_hp, monster_data (None if defeated), gold_gained,
-    player_xp, player_level, xp_to_next_level, player_quests, and equipped items.
+    If a policy is given, the whole fight is played with choose_auto_combat_action instead of prompting.
+    The 'auto' command does the same for the rest of an interactive fight, until HP runs low.
+    Player state is updated on the session. Returns monster_data (None if defeated or
+    fled from), gold_gained and how the fight ended: 'won', 'fled' or 'lost'.
     """
-    print("=" * 40)
     monster_name = monster_data['name']
     monster_current_hp = monster_data['health']
     monster_base_damage = monster_data['damage']
@@ -818,56 +1375,67 @@ def handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, p
 
     # Defense values are now from the equipped item dictionaries
     # MODIFIED: Include equipped_cloak in total_player_defense calculation
-    total_player_defense = calculate_total_defense(player_shield_value, equipped_armor_value, equipped_cloak, equipped_helmet) + current_defense_bonus
-
-    for item in [equipped_armor_value, equipped_cloak, equipped_helmet, player_shield_value]:
-        if item and item.get('enchantment'):
-            enchantment_name = item['enchantment']
-            enchantment = next((e for e in GAME_DATA.get('enchantments', []) if e['name'] == enchantment_name), None)
-            if enchantment and 'defense_boost' in enchantment['effect']:
-                total_player_defense += enchantment['effect']['defense_boost']
-
-    for effect in player_status_effects:
-        if effect['name'] == 'Curse':
-            total_player_defense += effect['effect']['modifier']
-
-    monster_defense = monster_data.get('defense', 0)
-    for effect in monster_status_effects:
-        if effect['name'] == 'Curse':
-            monster_defense += effect['effect']['modifier']
-
-    sound_manager.stop_music()
-    sound_manager.play_music('combat_music')
-    print(f"\n--- Combat with {monster_name} ---")
-    print(f"Your HP: {player_hp}/{max_hp} | {monster_name} HP: {monster_current_hp}") # FIXED: Used max_hp here
-    if total_player_defense > 0:
-        print(f"Your Total Defense: {total_player_defense}")
-
-    first_strike = False
-    for item in equipped_misc_items:
-        if item.get('effects', {}).get('first_strike'):
-            first_strike = True
-            break
+    total_player_defense = calculate_total_defense(session.player_shield_value, session.equipped_armor_value, session.equipped_cloak, session.equipped_helmet) + current_defense_bonus
+
+    for item in [session.equipped_armor_value, session.equipped_cloak, session.equipped_helmet, session.player_shield_value]:
+        enchantment = get_enchantment(item)
+        if enchantment and 'defense_boost' in enchantment['effect']:
+            total_player_defense += enchantment['effect']['defense_boost']
+
+    # Resolve gear effects and the weapon enchantment once, instead of on every hit
+    item_effects = compile_item_effects([session.equipped_weapon, session.equipped_armor_value, session.equipped_cloak, session.equipped_helmet] + session.equipped_misc_items)
+    weapon_enchantment = get_enchantment(session.equipped_weapon)
+
+    total_player_defense += player_status_effects.modifiers.get('defense', 0)
 
-    if first_strike:
-        print("Thanks to your Amulet of Swiftness, you get the first strike!")
+    monster_defense = monster_data.get('defense', 0) + monster_status_effects.modifiers.get('defense', 0)
+
+    session.sound_manager.stop_music()
+    session.sound_manager.play_music('combat_music')
+    emit_combat_event('combat_start', monster=monster_name, player_hp=session.player_hp, max_hp=session.max_hp, monster_hp=monster_current_hp, defense=total_player_defense)
+    interrupt_commands(session, "Combat started")
+
+    if item_effects['first_strike']:
+        emit_combat_event('first_strike')
         # This is a simplified version of the player's turn for the first strike
-        base_damage = random.randint(player_attack_power - player_attack_variance, player_attack_power + player_attack_variance)
+        base_damage = random.randint(session.player_attack_power - session.player_attack_variance, session.player_attack_power + session.player_attack_variance)
         damage_dealt = max(0, base_damage - monster_defense)
         monster_current_hp -= damage_dealt
-        print(f"You strike the {monster_name} for {damage_dealt} damage!")
+        emit_combat_event('attack', 'player', monster=monster_name, damage=damage_dealt)
         if monster_current_hp <= 0:
-            print(f"You defeated the {monster_name} before it could even act!")
+            emit_combat_event('defeat', 'monster_first_strike', monster=monster_name)
             monster_data = None
 
-    while player_hp > 0 and monster_current_hp > 0:
-        player_hp, is_player_stunned = apply_and_tick_status_effects(player_status_effects, player_hp)
+    auto_policy = policy
+    rounds_fought = 0
+    while session.player_hp > 0 and monster_current_hp > 0:
+        if session.player_hp < session.max_hp * LOW_HP_INTERRUPT:
+            interrupt_commands(session, "Your health is low")
+        session.player_hp, is_player_stunned = apply_and_tick_status_effects(player_status_effects, session.player_hp)
         if is_player_stunned:
-            print("You are stunned and cannot act!")
+            emit_combat_event('stunned', 'player')
             action_taken = True
         else:
-            print("\nWhat do you do? (attack / skill / heal / run / use [item name] / inventory / help)")
-            combat_command_input = input("Combat Action> ").lower().strip()
+            if auto_policy is None: # Not while auto-battle is choosing
+                print("\nWhat do you do? (attack / skill / heal / run / use [item name] / auto / inventory / help)")
+            combat_command_input = None
+            while combat_command_input is None:
+                if auto_policy is not None:
+                    combat_command_input = choose_auto_combat_action(auto_policy, session.player_hp, session.max_hp, session.player_inventory, session.player_unlocked_skills, rounds_fought, can_stop=policy is None)
+                    rounds_fought += 1
+                    if combat_command_input is None:
+                        emit_combat_event('auto_battle', 'stopped')
+                        auto_policy = None
+                    else:
+                        emit_combat_event('auto_battle', 'action', action=combat_command_input)
+                else:
+                    combat_command_input = read_command(session, "Combat Action> ").lower().strip()
+                    if combat_command_input == "auto":
+                        # Fights on by AUTO_BATTLE_POLICY until the battle ends or HP runs low
+                        emit_combat_event('auto_battle', 'engaged')
+                        auto_policy = AUTO_BATTLE_POLICY
+                        rounds_fought = 0
+                        combat_command_input = None
             parts = combat_command_input.split()
 
             verb = "" # Initialize verb to an empty string
@@ -881,90 +1449,84 @@ def handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, p
             action_taken = False
 
             if verb == "attack":
-                if equipped_weapon and equipped_weapon.get('cursed') and equipped_weapon.get('curse_effect', {}).get('hp_drain'):
-                    drain_amount = equipped_weapon['curse_effect']['hp_drain']
-                    player_hp -= drain_amount
-                    print(f"Your {equipped_weapon['name']} drains {drain_amount} HP from you!")
-                    if player_hp <= 0:
-                        print("You have been drained of your life force!")
+                if session.equipped_weapon and session.equipped_weapon.get('cursed') and session.equipped_weapon.get('curse_effect', {}).get('hp_drain'):
+                    drain_amount = session.equipped_weapon['curse_effect']['hp_drain']
+                    session.player_hp -= drain_amount
+                    emit_combat_event('item_effect', 'hp_drain', item=session.equipped_weapon['name'], amount=drain_amount)
+                    if session.player_hp <= 0:
+                        emit_combat_event('defeat', 'player_drained')
                         break
-                base_damage = random.randint(player_attack_power - player_attack_variance, player_attack_power + player_attack_variance)
+                base_damage = random.randint(session.player_attack_power - session.player_attack_variance, session.player_attack_power + session.player_attack_variance)
 
                 is_crit = False
-                accuracy = 1.0
-                for effect in player_status_effects:
-                    if effect['name'] == 'Blindness':
-                        accuracy += effect['effect']['modifier']
+                accuracy = 1.0 + player_status_effects.modifiers.get('accuracy', 0)
 
                 if random.random() > accuracy:
-                    print("You miss!")
+                    emit_combat_event('miss', 'player', monster=monster_name)
                     damage_dealt = 0
-                elif random.random() < (player_crit_chance + current_crit_chance_bonus):
-                    damage_dealt = int(base_damage * player_crit_multiplier)
+                elif random.random() < (session.player_crit_chance + current_crit_chance_bonus):
+                    damage_dealt = int(base_damage * session.player_crit_multiplier)
                     is_crit = True
                 else:
                     damage_dealt = base_damage
 
                 damage_dealt = max(0, damage_dealt - monster_defense)
                 monster_current_hp -= damage_dealt
-                if is_crit:
-                    print(f"You deliver a **CRITICAL HIT** to the {monster_name} for {damage_dealt} damage!")
-                else:
-                    print(f"You strike the {monster_name} for {damage_dealt} damage!")
+                emit_combat_event('crit' if is_crit else 'attack', 'player', monster=monster_name, damage=damage_dealt)
 
-                if equipped_weapon and 'status_effects' in equipped_weapon:
-                    for effect in equipped_weapon['status_effects']:
+                if session.equipped_weapon and 'status_effects' in session.equipped_weapon:
+                    for effect in session.equipped_weapon['status_effects']:
                         if random.random() < effect['chance']:
                             monster_status_effects.append(copy.deepcopy(effect))
-                            print(f"The {monster_name} is now {effect['name']}!")
-
-                if equipped_weapon and equipped_weapon.get('enchantment'):
-                    enchantment_name = equipped_weapon['enchantment']
-                    enchantment = next((e for e in GAME_DATA.get('enchantments', []) if e['name'] == enchantment_name), None)
-                    if enchantment:
-                        if 'damage_boost' in enchantment['effect']:
-                            damage_dealt += enchantment['effect']['damage_boost']['value']
-                            print(f"Your weapon's {enchantment_name} enchantment deals an extra {enchantment['effect']['damage_boost']['value']} damage!")
-                        if 'status_effect' in enchantment['effect']:
-                            if random.random() < enchantment['effect']['status_effect']['chance']:
-                                monster_status_effects.append(copy.deepcopy(enchantment['effect']['status_effect']))
-                                print(f"The {monster_name} is now {enchantment['effect']['status_effect']['name']}!")
+                            emit_combat_event('effect_applied', 'monster', monster=monster_name, effect=effect['name'])
+
+                if weapon_enchantment:
+                    if 'damage_boost' in weapon_enchantment['effect']:
+                        damage_dealt += weapon_enchantment['effect']['damage_boost']['value']
+                        emit_combat_event('enchantment', 'damage_boost', enchantment=weapon_enchantment['name'], damage=weapon_enchantment['effect']['damage_boost']['value'])
+                    if 'status_effect' in weapon_enchantment['effect']:
+                        if random.random() < weapon_enchantment['effect']['status_effect']['chance']:
+                            monster_status_effects.append(copy.deepcopy(weapon_enchantment['effect']['status_effect']))
+                            emit_combat_event('effect_applied', 'monster', monster=monster_name, effect=weapon_enchantment['effect']['status_effect']['name'])
+
+                if damage_dealt > 0:
+                    session.player_hp, damage_dealt, monster_current_hp = handle_item_effects("on_deal_damage", session.player_hp, damage_dealt, monster_current_hp, item_effects)
 
                 action_taken = True
 
                 if monster_current_hp <= 0:
-                    print(f"The {monster_name} collapses, defeated!")
+                    emit_combat_event('defeat', 'monster', monster=monster_name)
                     gold_gained = random.randint(gold_drop_range[0], gold_drop_range[1])
-                    if equipped_helmet and equipped_helmet.get('cursed') and equipped_helmet.get('curse_effect', {}).get('gold_find'):
-                        gold_gained = int(gold_gained * equipped_helmet['curse_effect']['gold_find'])
-                        print(f"Your {equipped_helmet['name']} doubles the gold dropped!")
-                    print(f"You gained {gold_gained} gold from defeating the {monster_name}!")
+                    if session.equipped_helmet and session.equipped_helmet.get('cursed') and session.equipped_helmet.get('curse_effect', {}).get('gold_find'):
+                        gold_gained = int(gold_gained * session.equipped_helmet['curse_effect']['gold_find'])
+                        emit_combat_event('reward', 'gold_bonus', item=session.equipped_helmet['name'])
+                    emit_combat_event('reward', 'gold', monster=monster_name, amount=gold_gained)
 
-                    player_xp += monster_xp_reward
-                    print(f"You gained {monster_xp_reward} experience points!")
+                    session.player_xp += monster_xp_reward
+                    emit_combat_event('reward', 'xp', monster=monster_name, amount=monster_xp_reward)
 
                     item_drop_name = monster_data.get('item_drop')
                     if item_drop_name:
                         item_def = get_item_by_name(item_drop_name)
                         if item_def:
-                            if len(player_inventory) < current_max_inventory_slots:
-                                scaled_item = scale_item_for_player_level(item_def, player_level)
-                                player_inventory.append(scaled_item)
-                                print(f"The monster dropped {add_article(scaled_item['name'])}! It has been added to your inventory.")
+                            if len(session.player_inventory) < session.current_max_inventory_slots:
+                                scaled_item = scale_item_for_player_level(item_def, session.player_level)
+                                session.player_inventory.append(scaled_item)
+                                emit_combat_event('drop', 'inventory', monster=monster_name, item=scaled_item['name'])
                                 # NEW: Quick equip prompt
-                                if scaled_item.get('type') in ['weapon', 'shield', 'armor', 'equipment']:
+                                if scaled_item.get('type') in ['weapon', 'shield', 'armor', 'equipment'] and policy is None:
                                     quick_equip_choice = input(f"Do you want to quick equip the {scaled_item['name']}? (yes/no): ").lower().strip()
                                     if quick_equip_choice in ['yes', 'y']:
-                                        player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, equipped_misc_items, equipped_helmet = \
-                                            handle_equip_item(player_inventory[-1], player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, equipped_misc_items, player_level, equipped_helmet)
-                                        player_attack_power = recalculate_attack_power(player_level, equipped_weapon, equipped_misc_items, player_attack_bonus)
-                                        print(f"Your attack power is now {player_attack_power}.")
-                            elif current_room.item is None:
-                                scaled_item = scale_item_for_player_level(item_def, player_level)
-                                current_room.item = scaled_item
-                                print(f"The monster dropped {add_article(scaled_item['name'])}, but your inventory is full! It has been placed on the floor.")
+                                        session.player_shield_value, session.equipped_armor_value, session.equipped_cloak, session.equipped_weapon, session.equipped_misc_items, session.equipped_helmet = \
+                                            handle_equip_item(session.player_inventory[-1], session.player_shield_value, session.equipped_armor_value, session.equipped_cloak, session.equipped_weapon, session.equipped_misc_items, session.player_level, session.equipped_helmet)
+                                        session.player_attack_power = recalculate_attack_power(session.player_level, session.equipped_weapon, session.equipped_misc_items, session.player_attack_bonus)
+                                        print(f"Your attack power is now {session.player_attack_power}.")
+                            elif session.current_room.item is None:
+                                scaled_item = scale_item_for_player_level(item_def, session.player_level)
+                                session.current_room.item = scaled_item
+                                emit_combat_event('drop', 'floor', monster=monster_name, item=scaled_item['name'])
                             else:
-                                print(f"The monster dropped {add_article(item_def['name'])}, but your inventory is full and there's already an item on the floor! The dropped item is lost.")
+                                emit_combat_event('drop', 'lost', monster=monster_name, item=item_def['name'])
                         else:
                             if DEBUG:
                                 debug.debug_print(f"Monster drop item '{item_drop_name}' not found in game data.")
@@ -973,46 +1535,48 @@ def handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, p
                         crafting_materials = [item for item in ALL_ITEMS if item.get('type') == 'crafting_material']
                         if crafting_materials:
                             material_to_drop = random.choice(crafting_materials)
-                            if len(player_inventory) < current_max_inventory_slots:
-                                player_inventory.append(copy.deepcopy(material_to_drop))
-                                print(f"The monster dropped a {material_to_drop['name']}!")
+                            if len(session.player_inventory) < session.current_max_inventory_slots:
+                                session.player_inventory.append(copy.deepcopy(material_to_drop))
+                                emit_combat_event('drop', 'material', monster=monster_name, item=material_to_drop['name'])
                             else:
-                                print(f"The monster dropped a {material_to_drop['name']}, but your inventory is full!")
+                                emit_combat_event('drop', 'material_lost', monster=monster_name, item=material_to_drop['name'])
 
-                    for q_id, q_data in player_quests.items():
+                    for q_id, q_data in session.player_quests.items():
                         quest_def = get_quest_by_id(q_id)
                         if quest_def and q_data['status'] == 'active':
                             if (quest_def['type'] == 'defeat_any_monster') or \
                                (quest_def['type'] == 'defeat_monster' and quest_def['target_monster'].lower() == monster_name.lower()):
                                 if q_data['current_count'] < quest_def['target_count']:
                                     q_data['current_count'] += 1
-                                    print(f"Quest Update: Defeated a monster! ({q_data['current_count']}/{quest_def['target_count']}) for '{quest_def['name']}'")
+                                    emit_combat_event('quest_progress', 'update', quest=quest_def['name'], count=q_data['current_count'], target=quest_def['target_count'])
                                     if q_data['current_count'] >= quest_def['target_count']:
-                                        print(f"QUEST COMPLETE: '{quest_def['name']}'! Return to {quest_def['giver_npc_name']} to claim your reward!")
+                                        emit_combat_event('quest_progress', 'complete', quest=quest_def['name'], giver=quest_def['giver_npc_name'])
 
-                    player_xp, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points = \
-                        check_for_level_up(player_xp, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points)
+                    check_for_level_up(session)
 
                     monster_data = None
                     break
             elif verb == "skill":
-                if not player_unlocked_skills:
+                if not session.player_unlocked_skills:
                     print("You have not unlocked any skills yet.")
                     continue
 
-                print("\nAvailable skills:")
-                for skill_name in player_unlocked_skills:
-                    print(f"  - {skill_name}")
+                if len(parts) > 1:
+                    skill_choice = " ".join(parts[1:])
+                else:
+                    print("\nAvailable skills:")
+                    for skill_name in session.player_unlocked_skills:
+                        print(f"  - {skill_name}")
 
-                skill_choice = input("Enter the name of the skill you want to use, or 'back': ").strip()
-                if skill_choice.lower() == 'back':
-                    continue
+                    skill_choice = input("Enter the name of the skill you want to use, or 'back': ").strip()
+                    if skill_choice.lower() == 'back':
+                        continue
 
                 chosen_skill = None
-                for skill_name in player_unlocked_skills:
+                for skill_name in session.player_unlocked_skills:
                     if skill_name.lower() == skill_choice.lower():
                         character_classes = GAME_DATA.get('character_classes', {})
-                        class_data = character_classes.get(player_class)
+                        class_data = character_classes.get(session.player_class)
                         for skill_data in class_data['skill_tree']:
                             if skill_data['name'] == skill_name:
                                 chosen_skill = skill_data
@@ -1022,98 +1586,98 @@ def handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, p
                 if chosen_skill:
                     effect = chosen_skill['effect']
                     if effect['type'] == 'damage_boost':
-                        base_damage = random.randint(player_attack_power - player_attack_variance, player_attack_power + player_attack_variance)
+                        base_damage = random.randint(session.player_attack_power - session.player_attack_variance, session.player_attack_power + session.player_attack_variance)
                         damage_dealt = int(base_damage * effect['value'])
                         damage_dealt = max(0, damage_dealt - monster_defense)
                         monster_current_hp -= damage_dealt
-                        print(f"You use {chosen_skill['name']} and deal {damage_dealt} damage!")
+                        emit_combat_event('skill', 'damage', skill=chosen_skill['name'], monster=monster_name, damage=damage_dealt)
                     elif effect['type'] == 'guaranteed_crit':
-                        base_damage = random.randint(player_attack_power - player_attack_variance, player_attack_power + player_attack_variance)
-                        damage_dealt = int(base_damage * player_crit_multiplier)
+                        base_damage = random.randint(session.player_attack_power - session.player_attack_variance, session.player_attack_power + session.player_attack_variance)
+                        damage_dealt = int(base_damage * session.player_crit_multiplier)
                         damage_dealt = max(0, damage_dealt - monster_defense)
                         monster_current_hp -= damage_dealt
-                        print(f"You use {chosen_skill['name']} for a guaranteed critical hit, dealing {damage_dealt} damage!")
+                        emit_combat_event('skill', 'guaranteed_crit', skill=chosen_skill['name'], monster=monster_name, damage=damage_dealt)
                     elif effect['type'] == 'aoe_damage':
                         damage_dealt = effect['damage']
                         damage_dealt = max(0, damage_dealt - monster_defense)
                         monster_current_hp -= damage_dealt
-                        print(f"You use {chosen_skill['name']} and deal {damage_dealt} damage to all enemies!")
+                        emit_combat_event('skill', 'aoe_damage', skill=chosen_skill['name'], monster=monster_name, damage=damage_dealt)
                     elif effect['type'] == 'heal':
                         healing_amount = effect['value']
-                        player_hp = min(max_hp, player_hp + healing_amount)
-                        print(f"You use {chosen_skill['name']} and heal for {healing_amount} HP.")
+                        session.player_hp = min(session.max_hp, session.player_hp + healing_amount)
+                        emit_combat_event('skill', 'heal', skill=chosen_skill['name'], amount=healing_amount)
                     elif effect['type'] == 'stun':
                         if random.random() < effect['chance']:
                             monster_status_effects.append({"name": "Stun", "type": "control", "duration": 2}) # 2 turns because it ticks down once immediately
-                            print(f"You use {chosen_skill['name']} and stun the {monster_name}!")
+                            emit_combat_event('skill', 'stun', skill=chosen_skill['name'], monster=monster_name)
                         else:
-                            print(f"You use {chosen_skill['name']}, but it fails to stun the {monster_name}.")
+                            emit_combat_event('skill', 'stun_failed', skill=chosen_skill['name'], monster=monster_name)
                     elif effect['type'] == 'poison':
                         monster_status_effects.append({"name": "Poison", "type": "dot", "damage": effect['damage'], "duration": effect['duration'] + 1, "message_tick": "The monster takes {damage} from poison.", "message_wear_off": "The monster is no longer poisoned."})
-                        print(f"You use {chosen_skill['name']} and poison the {monster_name}!")
+                        emit_combat_event('skill', 'poison', skill=chosen_skill['name'], monster=monster_name)
                     elif effect['type'] == 'freeze':
                         if random.random() < effect['chance']:
                             monster_status_effects.append({"name": "Stun", "type": "control", "duration": 2})
-                            print(f"You use {chosen_skill['name']} and freeze the {monster_name} in place!")
+                            emit_combat_event('skill', 'freeze', skill=chosen_skill['name'], monster=monster_name)
                         else:
-                            print(f"You use {chosen_skill['name']}, but the {monster_name} resists the freeze.")
+                            emit_combat_event('skill', 'freeze_failed', skill=chosen_skill['name'], monster=monster_name)
                     elif effect['type'] == 'stat_buff':
-                        player_effects.append({"stat": effect['stat'], "modifier": effect['value'], "duration": effect['duration'] + 1, "message": f"You feel the power of {chosen_skill['name']}!"})
-                        print(f"You use {chosen_skill['name']} and feel stronger!")
+                        session.player_effects.append({"stat": effect['stat'], "modifier": effect['value'], "duration": effect['duration'] + 1, "message": f"You feel the power of {chosen_skill['name']}!"})
+                        emit_combat_event('skill', 'stat_buff', skill=chosen_skill['name'], stat=effect['stat'], amount=effect['value'])
                     elif effect['type'] == 'damage_modifier':
                         undead_monsters = ["skeletal warrior", "feral ghoul", "vampire spawn", "lich's apprentice", "ghostly apparition", "specter of despair", "minotaur skeleton"]
-                        base_damage = random.randint(player_attack_power - player_attack_variance, player_attack_power + player_attack_variance)
+                        base_damage = random.randint(session.player_attack_power - session.player_attack_variance, session.player_attack_power + session.player_attack_variance)
                         damage_dealt = base_damage
                         if monster_name.lower() in [m.lower() for m in undead_monsters]:
                             damage_dealt = int(base_damage * effect['multiplier'])
-                            print("Your divine power smites the undead creature!")
+                            emit_combat_event('skill', 'smite_undead', skill=chosen_skill['name'], monster=monster_name)
                         damage_dealt = max(0, damage_dealt - monster_defense)
                         monster_current_hp -= damage_dealt
-                        print(f"You use {chosen_skill['name']} and deal {damage_dealt} damage!")
+                        emit_combat_event('skill', 'damage', skill=chosen_skill['name'], monster=monster_name, damage=damage_dealt)
                     elif effect['type'] == 'shield':
-                        player_effects.append({"stat": "defense", "modifier": effect['value'], "duration": 1, "message": "An arcane shield surrounds you."})
-                        print(f"You summon an Arcane Shield that will absorb up to {effect['value']} damage.")
+                        session.player_effects.append({"stat": "defense", "modifier": effect['value'], "duration": 1, "message": "An arcane shield surrounds you."})
+                        emit_combat_event('skill', 'shield', skill=chosen_skill['name'], amount=effect['value'])
                     elif effect['type'] == 'dodge_buff':
-                        player_effects.append({"stat": "dodge_chance", "modifier": effect['value'], "duration": effect['duration'] + 1, "message": "You feel nimble and evasive."})
-                        print(f"You use {chosen_skill['name']} and feel much harder to hit.")
+                        session.player_effects.append({"stat": "dodge_chance", "modifier": effect['value'], "duration": effect['duration'] + 1, "message": "You feel nimble and evasive."})
+                        emit_combat_event('skill', 'dodge_buff', skill=chosen_skill['name'], amount=effect['value'])
                     action_taken = True
                 else:
                     print("Invalid skill name.")
                     continue
 
                 if monster_current_hp <= 0:
-                    print(f"The {monster_name} collapses, defeated!")
+                    emit_combat_event('defeat', 'monster', monster=monster_name)
                     gold_gained = random.randint(gold_drop_range[0], gold_drop_range[1])
-                    if equipped_helmet and equipped_helmet.get('cursed') and equipped_helmet.get('curse_effect', {}).get('gold_find'):
-                        gold_gained = int(gold_gained * equipped_helmet['curse_effect']['gold_find'])
-                        print(f"Your {equipped_helmet['name']} doubles the gold dropped!")
-                    print(f"You gained {gold_gained} gold from defeating the {monster_name}!")
+                    if session.equipped_helmet and session.equipped_helmet.get('cursed') and session.equipped_helmet.get('curse_effect', {}).get('gold_find'):
+                        gold_gained = int(gold_gained * session.equipped_helmet['curse_effect']['gold_find'])
+                        emit_combat_event('reward', 'gold_bonus', item=session.equipped_helmet['name'])
+                    emit_combat_event('reward', 'gold', monster=monster_name, amount=gold_gained)
 
-                    player_xp += monster_xp_reward
-                    print(f"You gained {monster_xp_reward} experience points!")
+                    session.player_xp += monster_xp_reward
+                    emit_combat_event('reward', 'xp', monster=monster_name, amount=monster_xp_reward)
 
                     item_drop_name = monster_data.get('item_drop')
                     if item_drop_name:
                         item_def = get_item_by_name(item_drop_name)
                         if item_def:
-                            if len(player_inventory) < current_max_inventory_slots:
-                                scaled_item = scale_item_for_player_level(item_def, player_level)
-                                player_inventory.append(scaled_item)
-                                print(f"The monster dropped {add_article(scaled_item['name'])}! It has been added to your inventory.")
+                            if len(session.player_inventory) < session.current_max_inventory_slots:
+                                scaled_item = scale_item_for_player_level(item_def, session.player_level)
+                                session.player_inventory.append(scaled_item)
+                                emit_combat_event('drop', 'inventory', monster=monster_name, item=scaled_item['name'])
                                 # NEW: Quick equip prompt
-                                if scaled_item.get('type') in ['weapon', 'shield', 'armor', 'equipment']:
+                                if scaled_item.get('type') in ['weapon', 'shield', 'armor', 'equipment'] and policy is None:
                                     quick_equip_choice = input(f"Do you want to quick equip the {scaled_item['name']}? (yes/no): ").lower().strip()
                                     if quick_equip_choice in ['yes', 'y']:
-                                        player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, equipped_misc_items, equipped_helmet = \
-                                            handle_equip_item(player_inventory[-1], player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, equipped_misc_items, player_level, equipped_helmet)
-                                        player_attack_power = recalculate_attack_power(player_level, equipped_weapon, equipped_misc_items, player_attack_bonus)
-                                        print(f"Your attack power is now {player_attack_power}.")
-                            elif current_room.item is None:
-                                scaled_item = scale_item_for_player_level(item_def, player_level)
-                                current_room.item = scaled_item
-                                print(f"The monster dropped {add_article(scaled_item['name'])}, but your inventory is full! It has been placed on the floor.")
+                                        session.player_shield_value, session.equipped_armor_value, session.equipped_cloak, session.equipped_weapon, session.equipped_misc_items, session.equipped_helmet = \
+                                            handle_equip_item(session.player_inventory[-1], session.player_shield_value, session.equipped_armor_value, session.equipped_cloak, session.equipped_weapon, session.equipped_misc_items, session.player_level, session.equipped_helmet)
+                                        session.player_attack_power = recalculate_attack_power(session.player_level, session.equipped_weapon, session.equipped_misc_items, session.player_attack_bonus)
+                                        print(f"Your attack power is now {session.player_attack_power}.")
+                            elif session.current_room.item is None:
+                                scaled_item = scale_item_for_player_level(item_def, session.player_level)
+                                session.current_room.item = scaled_item
+                                emit_combat_event('drop', 'floor', monster=monster_name, item=scaled_item['name'])
                             else:
-                                print(f"The monster dropped {add_article(item_def['name'])}, but your inventory is full and there's already an item on the floor! The dropped item is lost.")
+                                emit_combat_event('drop', 'lost', monster=monster_name, item=item_def['name'])
                         else:
                             if DEBUG:
                                 debug.debug_print(f"Monster drop item '{item_drop_name}' not found in game data.")
@@ -1122,25 +1686,24 @@ def handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, p
                         crafting_materials = [item for item in ALL_ITEMS if item.get('type') == 'crafting_material']
                         if crafting_materials:
                             material_to_drop = random.choice(crafting_materials)
-                            if len(player_inventory) < current_max_inventory_slots:
-                                player_inventory.append(copy.deepcopy(material_to_drop))
-                                print(f"The monster dropped a {material_to_drop['name']}!")
+                            if len(session.player_inventory) < session.current_max_inventory_slots:
+                                session.player_inventory.append(copy.deepcopy(material_to_drop))
+                                emit_combat_event('drop', 'material', monster=monster_name, item=material_to_drop['name'])
                             else:
-                                print(f"The monster dropped a {material_to_drop['name']}, but your inventory is full!")
+                                emit_combat_event('drop', 'material_lost', monster=monster_name, item=material_to_drop['name'])
 
-                    for q_id, q_data in player_quests.items():
+                    for q_id, q_data in session.player_quests.items():
                         quest_def = get_quest_by_id(q_id)
                         if quest_def and q_data['status'] == 'active':
                             if (quest_def['type'] == 'defeat_any_monster') or \
                                (quest_def['type'] == 'defeat_monster' and quest_def['target_monster'].lower() == monster_name.lower()):
                                 if q_data['current_count'] < quest_def['target_count']:
                                     q_data['current_count'] += 1
-                                    print(f"Quest Update: Defeated a monster! ({q_data['current_count']}/{quest_def['target_count']}) for '{quest_def['name']}'")
+                                    emit_combat_event('quest_progress', 'update', quest=quest_def['name'], count=q_data['current_count'], target=quest_def['target_count'])
                                     if q_data['current_count'] >= quest_def['target_count']:
-                                        print(f"QUEST COMPLETE: '{quest_def['name']}'! Return to {quest_def['giver_npc_name']} to claim your reward!")
+                                        emit_combat_event('quest_progress', 'complete', quest=quest_def['name'], giver=quest_def['giver_npc_name'])
 
-                    player_xp, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points = \
-                        check_for_level_up(player_xp, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points)
+                    check_for_level_up(session)
 
                     monster_data = None
                     break
@@ -1149,7 +1712,7 @@ def handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, p
                 # Find the best healing item in the inventory
                 best_healing_item = None
                 max_heal = 0
-                for item in player_inventory:
+                for item in session.player_inventory:
                     if item.get('type') == 'consumable' and item.get('effect_type') == 'heal':
                         heal_amount = item.get('effect_value', 0)
                         if heal_amount > max_heal:
@@ -1157,16 +1720,16 @@ def handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, p
                             best_healing_item = item
 
                 if best_healing_item:
-                    original_player_hp = player_hp
-                    player_hp, max_hp, current_max_inventory_slots, consumed_turn, _ = process_item_use(best_healing_item, player_hp, max_hp, player_inventory, current_max_inventory_slots, in_combat=True)
+                    original_player_hp = session.player_hp
+                    session.player_hp, session.max_hp, session.current_max_inventory_slots, consumed_turn, _ = process_item_use(best_healing_item, session.player_hp, session.max_hp, session.player_inventory, session.current_max_inventory_slots, in_combat=True)
                     action_taken = consumed_turn
 
-                    if player_hp <= 0:
-                        print(f"You succumb to the effects of {add_article(best_healing_item['name'])}...")
+                    if session.player_hp <= 0:
+                        emit_combat_event('defeat', 'player_item', item=best_healing_item['name'])
                         break
 
-                    if consumed_turn and player_hp != original_player_hp:
-                        print(f"Your health is now {player_hp}/{max_hp} HP.")
+                    if consumed_turn and session.player_hp != original_player_hp:
+                        emit_combat_event('heal', 'total', player_hp=session.player_hp, max_hp=session.max_hp)
 
                 else:
                     print("You don't have any healing items.")
@@ -1174,11 +1737,11 @@ def handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, p
             elif verb == "run":
                 run_chance = random.random()
                 if run_chance > 0.5:
-                    print("You manage to escape the fight!")
+                    emit_combat_event('flee', 'escaped', monster=monster_name)
                     monster_data = None
                     break
                 else:
-                    print("You try to run, but the monster blocks your path!")
+                    emit_combat_event('flee', 'blocked', monster=monster_name)
                     action_taken = True
 
             elif verb == "use":
@@ -1188,30 +1751,30 @@ def handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, p
 
                 item_to_use_name_input = " ".join(parts[1:])
                 item_found_in_inventory = None
-                for item_dict in player_inventory:
+                for item_dict in session.player_inventory:
                     if item_dict['name'].lower() == item_to_use_name_input:
                         item_found_in_inventory = item_dict
                         break
 
                 if item_found_in_inventory:
-                    original_player_hp = player_hp
-                    player_hp, max_hp, current_max_inventory_slots, consumed_turn, stat_changes = process_item_use(item_found_in_inventory, player_hp, max_hp, player_inventory, current_max_inventory_slots, in_combat=True)
+                    original_player_hp = session.player_hp
+                    session.player_hp, session.max_hp, session.current_max_inventory_slots, consumed_turn, stat_changes = process_item_use(item_found_in_inventory, session.player_hp, session.max_hp, session.player_inventory, session.current_max_inventory_slots, in_combat=True)
                     action_taken = consumed_turn
                     if 'remove_effect' in stat_changes:
                         effect_to_remove = stat_changes['remove_effect']
-                        player_status_effects = [effect for effect in player_status_effects if effect['name'] != effect_to_remove]
-                        print(f"The {effect_to_remove} has been cured.")
+                        player_status_effects.remove_named(effect_to_remove)
+                        emit_combat_event('effect_cured', 'player', effect=effect_to_remove)
                     if 'add_effect_to_monster' in stat_changes:
                         effect_to_add = stat_changes['add_effect_to_monster']
                         monster_status_effects.append(effect_to_add)
-                        print(f"The {monster_name} is now {effect_to_add['name']}!")
+                        emit_combat_event('effect_applied', 'monster', monster=monster_name, effect=effect_to_add['name'])
 
-                    if player_hp <= 0:
-                        print(f"You succumb to the effects of {add_article(item_found_in_inventory['name'])}...")
+                    if session.player_hp <= 0:
+                        emit_combat_event('defeat', 'player_item', item=item_found_in_inventory['name'])
                         break
 
-                    if consumed_turn and player_hp != original_player_hp:
-                        print(f"Your health is now {player_hp}/{max_hp} HP.")
+                    if consumed_turn and session.player_hp != original_player_hp:
+                        emit_combat_event('heal', 'total', player_hp=session.player_hp, max_hp=session.max_hp)
 
                 else:
                     print(f"You don't have {item_to_use_name_input} in your inventory.")
@@ -1219,18 +1782,18 @@ def handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, p
             elif verb.startswith("inv"): # Changed to use .startswith
                 # Use debug function for inventory data, but keep regular print for user-facing output
                 if DEBUG: # Wrapped debug calls
-                    debug.debug_player_data(player_inventory, player_keychain, current_max_inventory_slots, player_gold, "Inventory Check")
+                    debug.debug_player_data(session.player_inventory, session.player_keychain, session.current_max_inventory_slots, session.player_gold, "Inventory Check")
 
-                if not player_inventory and not player_keychain: # Check keychain too
+                if not session.player_inventory and not session.player_keychain: # Check keychain too
                     print("Your inventory is empty.")
                 else:
-                    print(f"Your Health: {player_hp}/{max_hp} HP.")
-                    print(f"Your Level: {player_level} (XP: {player_xp}/{xp_to_next_level})")
+                    print(f"Your Health: {session.player_hp}/{session.max_hp} HP.")
+                    print(f"Your Level: {session.player_level} (XP: {session.player_xp}/{session.xp_to_next_level})")
 
                     # Display regular inventory
-                    print(f"You are carrying ({len(player_inventory)}/{current_max_inventory_slots}):")
-                    if player_inventory:
-                        for item_dict in player_inventory:
+                    print(f"You are carrying ({len(session.player_inventory)}/{session.current_max_inventory_slots}):")
+                    if session.player_inventory:
+                        for item_dict in session.player_inventory:
                             display_str = f"    - {add_article(item_dict['name'])}"
                             item_type = item_dict.get('type')
                             if item_type == 'consumable':
@@ -1250,35 +1813,35 @@ def handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, p
                                     display_str += f" (Inflicts {item_dict.get('effect_value')})"
                             elif item_type == 'weapon':
                                 display_str += f" (Damage: {item_dict.get('damage', '?')})"
-                                if equipped_weapon and equipped_weapon['name'].lower() == item_dict['name'].lower():
+                                if session.equipped_weapon and session.equipped_weapon['name'].lower() == item_dict['name'].lower():
                                     display_str += " (EQUIPPED)"
                             elif item_type == 'armor':
                                 # MODIFIED: Check if it's armor or cloak
                                 item_subtype = item_dict.get('subtype')
                                 if item_subtype == 'body_armor':
                                     display_str += f" (Defense: {item_dict.get('defense', '?')})"
-                                    if equipped_armor_value and equipped_armor_value['name'].lower() == item_dict['name'].lower():
+                                    if session.equipped_armor_value and session.equipped_armor_value['name'].lower() == item_dict['name'].lower():
                                         display_str += " (EQUIPPED)"
                                 elif item_subtype == 'cloak':
                                     display_str += f" (Defense: {item_dict.get('defense', '?')})"
-                                    if equipped_cloak and equipped_cloak['name'].lower() == item_dict['name'].lower():
+                                    if session.equipped_cloak and session.equipped_cloak['name'].lower() == item_dict['name'].lower():
                                         display_str += " (EQUIPPED)"
                                 else: # fallback for generic 'armor' type without subtype
                                     display_str += f" (Defense: {item_dict.get('defense', '?')})"
-                                    if equipped_armor_value and equipped_armor_value['name'].lower() == item_dict['name'].lower():
+                                    if session.equipped_armor_value and session.equipped_armor_value['name'].lower() == item_dict['name'].lower():
                                         display_str += " (EQUIPPED)"
                             elif item_type == 'backpack':
                                 display_str += f" (+{item_dict.get('effect_value', '?')} Slots)"
                             elif item_type == 'shield':
                                 display_str += f" (Defense: {item_dict.get('defense', '?')})"
                                 # FIXED: Compare by name for equipped status
-                                if player_shield_value and player_shield_value['name'].lower() == item_dict['name'].lower():
+                                if session.player_shield_value and session.player_shield_value['name'].lower() == item_dict['name'].lower():
                                     display_str += " (EQUIPPED)"
                             elif item_type == 'winning_item':
                                 display_str += " (Legendary Artifact!)"
                             elif item_type == 'equipment':
                                 display_str += f" (Effect: {item_dict.get('effect_type', 'unknown')})"
-                                if item_dict in equipped_misc_items:
+                                if item_dict in session.equipped_misc_items:
                                     display_str += " (EQUIPPED)"
                             elif item_dict.get('description'):
                                 display_str += f" ({item_dict['description']})"
@@ -1288,23 +1851,23 @@ def handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, p
 
                     # Display keychain
                     print("Your Keychain:")
-                    if player_keychain:
-                        for item_dict in player_keychain:
+                    if session.player_keychain:
+                        for item_dict in session.player_keychain:
                             print(f"    - {add_article(item_dict['name'])} (Type: {item_dict.get('key_type', '?')} key)")
                     else:
                         print("    (Empty)")
 
-                    print(f"Your Gold: {player_gold}")
-                    print(f"Current Shield Defense: {player_shield_value.get('defense', 0) if player_shield_value else 0}") # Display value from item dict
-                    print(f"Current Armor Defense: {equipped_armor_value.get('defense', 0) if equipped_armor_value else 0}") # Display value from item dict
+                    print(f"Your Gold: {session.player_gold}")
+                    print(f"Current Shield Defense: {session.player_shield_value.get('defense', 0) if session.player_shield_value else 0}") # Display value from item dict
+                    print(f"Current Armor Defense: {session.equipped_armor_value.get('defense', 0) if session.equipped_armor_value else 0}") # Display value from item dict
                     # MODIFIED: Display cloak defense
-                    print(f"Current Cloak Defense: {equipped_cloak.get('defense', 0) if equipped_cloak else 0}")
+                    print(f"Current Cloak Defense: {session.equipped_cloak.get('defense', 0) if session.equipped_cloak else 0}")
                     # MODIFIED: Update total defense calculation in display
-                    print(f"Total Defense: {calculate_total_defense(player_shield_value, equipped_armor_value, equipped_cloak, equipped_helmet)}")
-                    print(f"Attack Power: {player_attack_power} (+/-{player_attack_variance})")
-                    print(f"Critical Chance: {player_crit_chance*100:.0f}% (x{player_crit_multiplier:.1f} Damage)")
-                    if equipped_weapon:
-                        print(f"Equipped Weapon: {equipped_weapon['name']} (Damage: {equipped_weapon.get('damage', '?')})")
+                    print(f"Total Defense: {calculate_total_defense(session.player_shield_value, session.equipped_armor_value, session.equipped_cloak, session.equipped_helmet)}")
+                    print(f"Attack Power: {session.player_attack_power} (+/-{session.player_attack_variance})")
+                    print(f"Critical Chance: {session.player_crit_chance*100:.0f}% (x{session.player_crit_multiplier:.1f} Damage)")
+                    if session.equipped_weapon:
+                        print(f"Equipped Weapon: {session.equipped_weapon['name']} (Damage: {session.equipped_weapon.get('damage', '?')})")
                     else:
                         print("Equipped Weapon: Fists (Damage: 5)")
                     continue
@@ -1314,57 +1877,55 @@ def handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, p
             if action_taken:
                 monster_current_hp, is_monster_stunned = apply_and_tick_status_effects(monster_status_effects, monster_current_hp)
                 if is_monster_stunned:
-                    print(f"The {monster_name} is stunned and cannot act!")
+                    emit_combat_event('stunned', 'monster', monster=monster_name)
                 else:
                     monster_actual_damage = random.randint(monster_base_damage - monster_damage_variance, monster_base_damage + monster_damage_variance)
                     monster_is_crit = False
-                    accuracy = 1.0
-                    for effect in monster_status_effects:
-                        if effect['name'] == 'Blindness':
-                            accuracy += effect['effect']['modifier']
+                    accuracy = 1.0 + monster_status_effects.modifiers.get('accuracy', 0)
 
                     if random.random() > accuracy:
-                        print(f"The {monster_name} misses!")
+                        emit_combat_event('miss', 'monster', monster=monster_name)
                         monster_actual_damage = 0
                     elif random.random() < monster_crit_chance:
                         monster_actual_damage = int(monster_actual_damage * monster_crit_multiplier)
                         monster_is_crit = True
 
-                    player_hp, monster_actual_damage, monster_current_hp = handle_item_effects("on_take_damage", player_hp, monster_actual_damage, monster_current_hp, [equipped_weapon, equipped_armor_value, equipped_cloak, equipped_helmet] + equipped_misc_items)
+                    session.player_hp, monster_actual_damage, monster_current_hp = handle_item_effects("on_take_damage", session.player_hp, monster_actual_damage, monster_current_hp, item_effects)
 
                     damage_after_defense = max(0, monster_actual_damage - total_player_defense)
-                    player_hp -= damage_after_defense
+                    session.player_hp -= damage_after_defense
 
-                    if monster_is_crit:
-                        print(f"The {monster_name} lands a **CRITICAL HIT** on you for {monster_actual_damage} damage! Your defense absorbed {monster_actual_damage - damage_after_defense} damage.")
-                    else:
-                        print(f"The {monster_name} retaliates, hitting you for {monster_actual_damage} damage! Your defense absorbed {monster_actual_damage - damage_after_defense} damage.")
+                    emit_combat_event('crit' if monster_is_crit else 'attack', 'monster', monster=monster_name, damage=monster_actual_damage, absorbed=monster_actual_damage - damage_after_defense)
 
                     if 'status_effects' in monster_data:
                         for effect in monster_data['status_effects']:
                             if random.random() < effect['chance']:
                                 player_status_effects.append(copy.deepcopy(effect))
-                                print(f"You are now {effect['name']}!")
+                                emit_combat_event('effect_applied', 'player', monster=monster_name, effect=effect['name'])
 
-                    if player_hp <= 0:
-                        print(f"The {monster_name} delivers a fatal blow...")
+                    if session.player_hp <= 0:
+                        emit_combat_event('defeat', 'player', monster=monster_name)
                         break
             else:
                 # This else block handles cases where the player command didn't consume a turn (e.g., 'inv' or 'help')
                 # We simply continue to the next player input without the monster taking a turn.
                 continue
 
-        if player_hp > 0 and monster_current_hp > 0:
-            print(f"Your HP: {player_hp}/{max_hp} | {monster_name} HP: {monster_current_hp}")
-            if player_status_effects:
-                print(f"Your status: {', '.join([effect['name'] for effect in player_status_effects])}")
-            if monster_status_effects:
-                print(f"{monster_name}'s status: {', '.join([effect['name'] for effect in monster_status_effects])}")
+        if session.player_hp > 0 and monster_current_hp > 0:
+            emit_combat_event('status', monster=monster_name, player_hp=session.player_hp, max_hp=session.max_hp, monster_hp=monster_current_hp,
+                              player_effects=[effect['name'] for effect in player_status_effects], monster_effects=[effect['name'] for effect in monster_status_effects])
+
+    if session.player_hp <= 0:
+        outcome = 'lost'
+    elif monster_current_hp <= 0:
+        outcome = 'won'
+    else:
+        outcome = 'fled'
 
-    sound_manager.stop_music()
-    sound_manager.play_music('ambient_music')
+    session.sound_manager.stop_music()
+    session.sound_manager.play_music('ambient_music')
     # MODIFIED: Added equipped_cloak, equipped_misc_items, and player_attack_bonus to returned values
-    return player_hp, max_hp, monster_data, gold_gained, player_xp, player_level, xp_to_next_level, player_quests, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, equipped_misc_items, player_skill_points
+    return monster_data, gold_gained, outcome
 
 def handle_gambler(player_gold, gambler_data):
     """
@@ -1414,9 +1975,9 @@ def handle_gambler(player_gold, gambler_data):
             gambler_roll = random.randint(1, 6) + random.randint(1, 6)
 
             print("The dice are rolling...")
-            time.sleep(1)
+            pause()
             print(f"You rolled a {player_roll}.")
-            time.sleep(0.5)
+            pause(0.5)
             print(f"The Gambler rolled a {gambler_roll}.")
 
             if player_roll > gambler_roll:
@@ -1434,8 +1995,14 @@ def handle_gambler(player_gold, gambler_data):
 
     return player_gold
 
-def handle_horde_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, player_shield_value, equipped_armor_value, equipped_cloak, player_inventory, current_max_inventory_slots, player_gold, equipped_weapon, player_xp, player_level, xp_to_next_level, player_quests, player_keychain, current_room, equipped_misc_items, player_effects, sound_manager, equipped_helmet, player_class, player_unlocked_skills, player_skill_points):
-    horde_data = current_room.horde_data
+def handle_horde_combat(session, auto_resolve=False):
+    """
+    Fights a horde as a series of battles. With auto_resolve, each battle is played out
+    with AUTO_BATTLE_POLICY and only a compact summary is printed. Running from a battle
+    runs from the horde, and only the battles won pay out their gold and XP.
+    Returns 'continue' or 'lose', and the number of monsters defeated.
+    """
+    horde_data = session.current_room.horde_data
     horde_name = horde_data['name']
     horde_monsters = horde_data['monsters']
     horde_size = random.randint(horde_data['size'][0], horde_data['size'][1])
@@ -1445,6 +2012,32 @@ def handle_horde_combat(player_hp, max_hp, player_attack_power, player_attack_bo
 
     total_gold_gained = 0
     total_xp_gained = 0
+    battles_fought = 0
+    outcome = None
+
+    if auto_resolve:
+        print("You let your instincts take over...")
+        combat_policy = AUTO_BATTLE_POLICY
+        combat_sound_manager = Sound(sound_enabled=False) # No music switching between the battles
+        session_sound_manager = session.sound_manager
+        starting_level = session.player_level
+        starting_item_ids = {id(item) for item in session.player_inventory}
+        starting_floor_item = session.current_room.item
+    else:
+        combat_policy = None
+
+    def print_battle_summary(battles_fought):
+        print(f"\n--- Horde Battles: {horde_name} ---")
+        print(f"Battles fought: {battles_fought}/{horde_size}")
+        print(f"HP remaining: {max(session.player_hp, 0)}/{session.max_hp}")
+        print(f"Gold from monsters: {total_gold_gained}")
+        print(f"XP from monsters: {total_xp_gained}")
+        drops = [item['name'] for item in session.player_inventory if id(item) not in starting_item_ids]
+        print(f"Drops: {', '.join(drops) if drops else 'None'}")
+        if session.current_room.item is not None and session.current_room.item is not starting_floor_item:
+            print(f"Left on the floor (inventory full): {session.current_room.item['name']}")
+        if session.player_level > starting_level:
+            print(f"Level up! You are now level {session.player_level}.")
 
     for i in range(horde_size):
         monster_name = random.choice(horde_monsters)
@@ -1453,51 +2046,69 @@ def handle_horde_combat(player_hp, max_hp, player_attack_power, player_attack_bo
             continue
 
         monster_data = dict(monster_def)
-        print(f"\n--- Horde Battle ({i+1}/{horde_size}) ---")
-
-        player_hp, max_hp, monster_data, gold_gained, player_xp, player_level, xp_to_next_level, player_quests, \
-        player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, equipped_misc_items, player_skill_points = \
-            handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, \
-                          monster_data, player_shield_value, equipped_armor_value, equipped_cloak, player_inventory, current_max_inventory_slots, \
-                          player_gold, equipped_weapon, player_xp, player_level, xp_to_next_level, player_quests, player_keychain, current_room, equipped_misc_items, player_effects, sound_manager, 0, 0, equipped_helmet, player_class, player_unlocked_skills, player_skill_points)
-
-        if player_hp <= 0:
-            return 'lose', player_hp, max_hp, player_gold, player_xp, player_level, xp_to_next_level, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, equipped_misc_items, monsters_defeated_in_horde, player_skill_points
+        if auto_resolve:
+            # The battle log of an auto-resolved horde is dropped in favour of the summary below
+            previous_renderer = set_combat_renderer(NullCombatRenderer())
+            session.sound_manager = combat_sound_manager
+        else:
+            print(f"\n--- Horde Battle ({i+1}/{horde_size}) ---")
 
-        if monster_data is None:
-            monsters_defeated_in_horde += 1
+        try:
+            monster_data, gold_gained, outcome = handle_combat(session, monster_data, 0, 0, policy=combat_policy)
+        finally:
+            if auto_resolve:
+                set_combat_renderer(previous_renderer)
+                session.sound_manager = session_sound_manager
+        battles_fought += 1
+
+        if outcome == 'lost':
+            if auto_resolve:
+                print_battle_summary(battles_fought)
+                print(f"You were overwhelmed by the {horde_name}...")
+            return 'lose', monsters_defeated_in_horde
+        if outcome == 'fled':
+            break # Running from one of them is running from the horde
+
+        monsters_defeated_in_horde += 1
         total_gold_gained += gold_gained
         total_xp_gained += monster_def.get('xp_reward', 0)
 
+    if auto_resolve:
+        print_battle_summary(battles_fought)
+
+    session.player_gold += total_gold_gained # Only for the battles won
+    session.player_xp += total_xp_gained
+
+    if outcome == 'fled':
+        print(f"\nYou fled from the {horde_name}, keeping the {total_gold_gained} gold and {total_xp_gained} XP from the battles you won.")
+        check_for_level_up(session)
+        return 'continue', monsters_defeated_in_horde
+
     print(f"\n--- Horde Defeated! ---")
     print(f"You defeated the {horde_name}!")
     print(f"Total Gold Gained: {total_gold_gained}")
     print(f"Total XP Gained: {total_xp_gained}")
 
-    player_gold += total_gold_gained
-    player_xp += total_xp_gained
-
-    player_xp, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points = \
-        check_for_level_up(player_xp, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points)
+    check_for_level_up(session)
 
     # Special reward for defeating the horde
     if random.random() < 0.5: # 50% chance of a special item
         item_def = get_item_by_name(random.choice([item['name'] for item in ALL_ITEMS if item.get('type') not in ['winning_item', 'key']]))
         if item_def:
-            if len(player_inventory) < current_max_inventory_slots:
-                scaled_item = scale_item_for_player_level(item_def, player_level)
-                player_inventory.append(scaled_item)
+            if len(session.player_inventory) < session.current_max_inventory_slots:
+                scaled_item = scale_item_for_player_level(item_def, session.player_level)
+                session.player_inventory.append(scaled_item)
                 print(f"You found a special item: {add_article(scaled_item['name'])}!")
             else:
                 print("You would have received a special item, but your inventory is full!")
 
-    return 'continue', player_hp, max_hp, player_gold, player_xp, player_level, xp_to_next_level, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, equipped_misc_items, monsters_defeated_in_horde, player_skill_points
+    return 'continue', monsters_defeated_in_horde
 
 # MODIFIED: Added equipped_cloak and equipped_misc_items to parameters
-def handle_shop(player_gold, player_inventory, current_max_inventory_slots, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, vendor_data, player_keychain, player_level, sound_manager, equipped_misc_items):
+def handle_shop(session, vendor_data):
     """
     Manages the shop interaction with a vendor NPC.
-    Returns updated player_gold, player_inventory, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, and equipped_misc_items.
+    Purchases and sales update the session's gold, inventory and equipment.
     """
     vendor_name = vendor_data['name']
     shop_stock_names = vendor_data.get('shop_stock', [])
@@ -1507,20 +2118,20 @@ def handle_shop(player_gold, player_inventory, current_max_inventory_slots, play
     for item_name in shop_stock_names:
         item_def = get_item_by_name(item_name.lower())
         if item_def and item_def.get('shop_price') is not None:
-            scaled_item = scale_item_for_player_level(item_def, player_level)
+            scaled_item = scale_item_for_player_level(item_def, session.player_level)
             shop_items.append(scaled_item)
 
-    sound_manager.stop_music()
-    sound_manager.play_music('vendor_music')
+    session.sound_manager.stop_music()
+    session.sound_manager.play_music('vendor_music')
     print(f"\n--- {vendor_name}'s Shop ---")
     print(random.choice(shop_dialogues))
 
     while True:
-        print(f"\nYour Gold: {player_gold}")
-        print(f"Your Inventory: ({len(player_inventory)}/{current_max_inventory_slots})")
+        print(f"\nYour Gold: {session.player_gold}")
+        print(f"Your Inventory: ({len(session.player_inventory)}/{session.current_max_inventory_slots})")
         print("Shop commands: buy / sell / exit")
 
-        shop_command_input = input("Shop Action> ").lower().strip()
+        shop_command_input = read_command(session, "Shop Action> ").lower().strip()
         parts = shop_command_input.split()
 
         if not parts:
@@ -1538,7 +2149,7 @@ def handle_shop(player_gold, player_inventory, current_max_inventory_slots, play
                     display_name = add_article(item_dict['name'])
                     print(f"    {i+1}. {display_name.capitalize()} ({item_dict.get('description', '')}) - {price} Gold")
 
-            buy_choice = input("Enter item number to buy, or 'back': ").lower().strip()
+            buy_choice = read_command(session, "Enter item number to buy, or 'back': ").lower().strip()
             if buy_choice == 'back':
                 continue
 
@@ -1550,19 +2161,19 @@ def handle_shop(player_gold, player_inventory, current_max_inventory_slots, play
 
                     if item_price is None:
                         print(f"That item ({item_to_buy['name']}) is not for sale.")
-                    elif player_gold >= item_price:
+                    elif session.player_gold >= item_price:
                         if item_to_buy.get('type') == 'key':
-                            player_keychain.append(copy.deepcopy(item_to_buy))
-                            player_gold -= item_price
+                            session.player_keychain.append(copy.deepcopy(item_to_buy))
+                            session.player_gold -= item_price
                             print(f"You bought {add_article(item_to_buy['name'])} for {item_price} gold! It's added to your keychain.")
                             print(random.choice(shop_dialogues))
                             # --- NEW DEBUG AFTER KEY BUY ---
                             if DEBUG: # Wrapped debug calls
-                                debug.debug_key_acquisition(player_keychain[-1], "shop buy")
+                                debug.debug_key_acquisition(session.player_keychain[-1], "shop buy")
                             # --- END NEW DEBUG ---
-                        elif len(player_inventory) < current_max_inventory_slots:
-                            player_gold -= item_price
-                            player_inventory.append(copy.deepcopy(item_to_buy))
+                        elif len(session.player_inventory) < session.current_max_inventory_slots:
+                            session.player_gold -= item_price
+                            session.player_inventory.append(copy.deepcopy(item_to_buy))
                             print(f"You bought {add_article(item_to_buy['name'])} for {item_price} gold!")
                             print(random.choice(shop_dialogues))
                         else:
@@ -1579,7 +2190,7 @@ def handle_shop(player_gold, player_inventory, current_max_inventory_slots, play
             sellable_items_main_inv = []
             sellable_items_keychain = []
 
-            for item_dict in player_inventory:
+            for item_dict in session.player_inventory:
                 # MODIFIED: Ensure winning items cannot be sold
                 if item_dict.get('shop_price') is not None and item_dict.get('type') != 'winning_item':
                     sellable_items_main_inv.append(item_dict)
@@ -1587,9 +2198,9 @@ def handle_shop(player_gold, player_inventory, current_max_inventory_slots, play
             # --- Populating Sellable Keychain using debug.py ---
             # This function just logs; the actual append logic is below within the 'if' condition
             if DEBUG: # Wrapped debug calls
-                debug.debug_keychain_populate(player_keychain, sellable_items_keychain) # Pass player_keychain
+                debug.debug_keychain_populate(session.player_keychain, sellable_items_keychain) # Pass player_keychain
 
-            for item_dict in player_keychain: # This loop performs the actual append
+            for item_dict in session.player_keychain: # This loop performs the actual append
                 if item_dict.get('shop_price') is not None and item_dict.get('type') != 'winning_item':
                     sellable_items_keychain.append(item_dict)
             # --- END Populating Sellable Keychain ---
@@ -1602,15 +2213,15 @@ def handle_shop(player_gold, player_inventory, current_max_inventory_slots, play
                 for i, item_dict in enumerate(sellable_items_main_inv):
                     sell_price = int(item_dict['shop_price'] * SELL_PRICE_MULTIPLIER)
                     display_str = f"    {i+1}. {add_article(item_dict['name'])}"
-                    if equipped_weapon is item_dict:
+                    if session.equipped_weapon is item_dict:
                         display_str += " (EQUIPPED)"
-                    elif equipped_armor_value is item_dict:
+                    elif session.equipped_armor_value is item_dict:
                         display_str += " (EQUIPPED BODY ARMOR)" # MODIFIED: clarify equipped type
-                    elif equipped_cloak is item_dict: # NEW: Check for equipped cloak
+                    elif session.equipped_cloak is item_dict: # NEW: Check for equipped cloak
                         display_str += " (EQUIPPED CLOAK)"
-                    elif player_shield_value is item_dict:
+                    elif session.player_shield_value is item_dict:
                         display_str += " (EQUIPPED SHIELD)" # MODIFIED: clarify equipped type
-                    elif item_dict in equipped_misc_items:
+                    elif item_dict in session.equipped_misc_items:
                         display_str += " (EQUIPPED)"
                     elif item_dict.get('type') == 'misc' and item_dict.get('shop_price') is not None:
                         display_str += f" ({item_dict.get('description', '')})"
@@ -1625,7 +2236,7 @@ def handle_shop(player_gold, player_inventory, current_max_inventory_slots, play
                     print(f"{display_str} - Sells for {sell_price} Gold")
 
 
-            sell_choice = input("Enter item number to sell, or 'back': ").lower().strip()
+            sell_choice = read_command(session, "Enter item number to sell, or 'back': ").lower().strip()
             if sell_choice == 'back':
                 continue
 
@@ -1636,34 +2247,34 @@ def handle_shop(player_gold, player_inventory, current_max_inventory_slots, play
                 if 0 <= item_num < len(sellable_items_main_inv):
                     item_to_sell = sellable_items_main_inv[item_num]
 
-                    if equipped_weapon is item_to_sell:
-                        equipped_weapon = None
+                    if session.equipped_weapon is item_to_sell:
+                        session.equipped_weapon = None
                         print(f"You unequip your {item_to_sell['name']}.")
-                    elif equipped_armor_value is item_to_sell:
-                        equipped_armor_value = None
+                    elif session.equipped_armor_value is item_to_sell:
+                        session.equipped_armor_value = None
                         print(f"You unequip your {item_to_sell['name']}.")
-                    elif equipped_cloak is item_to_sell: # NEW: Unequip cloak if selling
-                        equipped_cloak = None
+                    elif session.equipped_cloak is item_to_sell: # NEW: Unequip cloak if selling
+                        session.equipped_cloak = None
                         print(f"You unequip your {item_to_sell['name']}.")
-                    elif player_shield_value is item_to_sell:
-                        player_shield_value = None
+                    elif session.player_shield_value is item_to_sell:
+                        session.player_shield_value = None
                         print(f"You unequip your {item_to_sell['name']}.")
-                    elif item_to_sell in equipped_misc_items:
-                        equipped_misc_items.remove(item_to_sell)
+                    elif item_to_sell in session.equipped_misc_items:
+                        session.equipped_misc_items.remove(item_to_sell)
                         print(f"You unequip your {item_to_sell['name']}.")
 
-                    player_inventory.remove(item_to_sell)
+                    session.player_inventory.remove(item_to_sell)
 
                 elif keychain_start_index <= item_num < (keychain_start_index + len(sellable_items_keychain)):
                     item_to_sell = sellable_items_keychain[item_num - keychain_start_index]
-                    player_keychain.remove(item_to_sell)
+                    session.player_keychain.remove(item_to_sell)
                 else:
                     print("Invalid item number.")
                     continue
 
                 if item_to_sell:
                     sell_price = int(item_to_sell['shop_price'] * SELL_PRICE_MULTIPLIER)
-                    player_gold += sell_price
+                    session.player_gold += sell_price
                     print(f"You sold {add_article(item_to_sell['name'])} for {sell_price} gold!")
 
             else:
@@ -1671,22 +2282,22 @@ def handle_shop(player_gold, player_inventory, current_max_inventory_slots, play
 
         elif verb == "exit":
             print(random.choice(shop_dialogues))
-            sound_manager.stop_music()
-            sound_manager.play_music('ambient_music')
+            session.sound_manager.stop_music()
+            session.sound_manager.play_music('ambient_music')
             # MODIFIED: Added equipped_cloak and equipped_misc_items to returned values
-            return player_gold, player_inventory, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, player_keychain, equipped_misc_items
+            return
         else:
             print("Invalid shop command. Type 'buy', 'sell', or 'exit'.")
 
-def display_inventory_and_stats(player_hp, max_hp, player_level, player_xp, xp_to_next_level, player_inventory, current_max_inventory_slots, player_keychain, player_gold, player_shield_value, equipped_armor_value, equipped_cloak, equipped_helmet, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, equipped_weapon, equipped_misc_items, player_effects):
-    if not player_inventory and not player_keychain:
+def display_inventory_and_stats(session):
+    if not session.player_inventory and not session.player_keychain:
         print("Your inventory is empty.")
     else:
-        print(f"Your Health: {player_hp}/{max_hp} HP.")
-        print(f"Your Level: {player_level} (XP: {player_xp}/{xp_to_next_level})")
-        print(f"You are carrying ({len(player_inventory)}/{current_max_inventory_slots}):")
-        if player_inventory:
-            for item_dict in player_inventory:
+        print(f"Your Health: {session.player_hp}/{session.max_hp} HP.")
+        print(f"Your Level: {session.player_level} (XP: {session.player_xp}/{session.xp_to_next_level})")
+        print(f"You are carrying ({len(session.player_inventory)}/{session.current_max_inventory_slots}):")
+        if session.player_inventory:
+            for item_dict in session.player_inventory:
                 display_str = f"    - {add_article(item_dict['name'])}"
                 item_type = item_dict.get('type')
                 if item_type == 'consumable':
@@ -1696,57 +2307,57 @@ def display_inventory_and_stats(player_hp, max_hp, player_level, player_xp, xp_t
                         display_str += f" (Heals {effect_value} HP)"
                 elif item_type == 'weapon':
                     display_str += f" (Damage: {item_dict.get('damage', '?')})"
-                    if equipped_weapon and equipped_weapon['name'].lower() == item_dict['name'].lower():
+                    if session.equipped_weapon and session.equipped_weapon['name'].lower() == item_dict['name'].lower():
                         display_str += " (EQUIPPED)"
                 elif item_type == 'armor':
                     item_subtype = item_dict.get('subtype')
                     if item_subtype == 'body_armor':
                         display_str += f" (Defense: {item_dict.get('defense', '?')})"
-                        if equipped_armor_value and equipped_armor_value['name'].lower() == item_dict['name'].lower():
+                        if session.equipped_armor_value and session.equipped_armor_value['name'].lower() == item_dict['name'].lower():
                             display_str += " (EQUIPPED)"
                     elif item_subtype == 'cloak':
                         display_str += f" (Defense: {item_dict.get('defense', '?')})"
-                        if equipped_cloak and equipped_cloak['name'].lower() == item_dict['name'].lower():
+                        if session.equipped_cloak and session.equipped_cloak['name'].lower() == item_dict['name'].lower():
                             display_str += " (EQUIPPED)"
                 elif item_type == 'backpack':
                     display_str += f" (+{item_dict.get('effect_value', '?')} Slots)"
                 elif item_type == 'shield':
                     display_str += f" (Defense: {item_dict.get('defense', '?')})"
-                    if player_shield_value and player_shield_value['name'].lower() == item_dict['name'].lower():
+                    if session.player_shield_value and session.player_shield_value['name'].lower() == item_dict['name'].lower():
                         display_str += " (EQUIPPED)"
                 elif item_type == 'equipment':
                     display_str += f" (Effect: {item_dict.get('effect_type', 'unknown')})"
-                    if item_dict in equipped_misc_items:
+                    if item_dict in session.equipped_misc_items:
                         display_str += " (EQUIPPED)"
                 print(display_str)
         else:
             print("    (Empty)")
 
         print("Your Keychain:")
-        if player_keychain:
-            for item_dict in player_keychain:
+        if session.player_keychain:
+            for item_dict in session.player_keychain:
                 print(f"    - {add_article(item_dict['name'])} (Type: {item_dict.get('key_type', '?')} key)")
         else:
             print("    (Empty)")
 
-        print(f"Your Gold: {player_gold}")
-        print(f"Total Defense: {calculate_total_defense(player_shield_value, equipped_armor_value, equipped_cloak, equipped_helmet)}")
-        print(f"Attack Power: {player_attack_power} (+/-{player_attack_variance})")
-        print(f"Critical Chance: {player_crit_chance*100:.0f}% (x{player_crit_multiplier:.1f} Damage)")
-        if equipped_weapon:
-            print(f"Equipped Weapon: {equipped_weapon['name']} (Damage: {equipped_weapon.get('damage', '?')})")
+        print(f"Your Gold: {session.player_gold}")
+        print(f"Total Defense: {calculate_total_defense(session.player_shield_value, session.equipped_armor_value, session.equipped_cloak, session.equipped_helmet)}")
+        print(f"Attack Power: {session.player_attack_power} (+/-{session.player_attack_variance})")
+        print(f"Critical Chance: {session.player_crit_chance*100:.0f}% (x{session.player_crit_multiplier:.1f} Damage)")
+        if session.equipped_weapon:
+            print(f"Equipped Weapon: {session.equipped_weapon['name']} (Damage: {session.equipped_weapon.get('damage', '?')})")
         else:
             print("Equipped Weapon: Fists (Damage: 5)")
-        if player_effects:
+        if session.player_effects:
             print("\n--- Active Effects ---")
-            for effect in player_effects:
-                print(f"  - {effect['message'].split('!')[0]} ({effect['duration']} turns remaining)")
+            for effect, turns_remaining in session.player_effects.remaining():
+                print(f"  - {effect['message'].split('!')[0]} ({turns_remaining} turns remaining)")
             print("----------------------")
 
-def handle_hideout(stash, player_inventory, current_max_inventory_slots, player_hp, max_hp, player_level, player_xp, xp_to_next_level, player_keychain, player_gold, player_shield_value, equipped_armor_value, equipped_cloak, equipped_helmet, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, equipped_weapon, equipped_misc_items, player_effects):
+def handle_hideout(session):
     """
     Manages the player's personal hideout.
-    Returns the updated stash and player_inventory.
+    Items move between the session's stash and inventory.
     """
     print("\n--- Your Personal Hideout ---")
     print("A quiet, personal space. You can stash items here.")
@@ -1762,44 +2373,44 @@ def handle_hideout(stash, player_inventory, current_max_inventory_slots, player_
         verb = parts[0]
 
         if verb.startswith("inv"):
-            display_inventory_and_stats(player_hp, max_hp, player_level, player_xp, xp_to_next_level, player_inventory, current_max_inventory_slots, player_keychain, player_gold, player_shield_value, equipped_armor_value, equipped_cloak, equipped_helmet, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, equipped_weapon, equipped_misc_items, player_effects)
+            display_inventory_and_stats(session)
         elif verb == "stash":
             item_to_stash_name = " ".join(parts[1:])
             item_to_stash = None
-            for item in player_inventory:
+            for item in session.player_inventory:
                 if item['name'].lower() == item_to_stash_name.lower():
                     item_to_stash = item
                     break
 
             if item_to_stash:
-                player_inventory.remove(item_to_stash)
-                stash.append(item_to_stash)
+                session.player_inventory.remove(item_to_stash)
+                session.stash.append(item_to_stash)
                 print(f"You stashed the {item_to_stash['name']}.")
             else:
                 print("You don't have that item.")
         elif verb == "unstash":
             item_to_unstash_name = " ".join(parts[1:])
             item_to_unstash = None
-            for item in stash:
+            for item in session.stash:
                 if item['name'].lower() == item_to_unstash_name.lower():
                     item_to_unstash = item
                     break
 
             if item_to_unstash:
-                if len(player_inventory) < current_max_inventory_slots:
-                    stash.remove(item_to_unstash)
-                    player_inventory.append(item_to_unstash)
+                if len(session.player_inventory) < session.current_max_inventory_slots:
+                    session.stash.remove(item_to_unstash)
+                    session.player_inventory.append(item_to_unstash)
                     print(f"You unstashed the {item_to_unstash['name']}.")
                 else:
                     print("Your inventory is full.")
             else:
                 print("You don't have that item in your stash.")
         elif verb == "view":
-            if not stash:
+            if not session.stash:
                 print("Your stash is empty.")
             else:
                 print("\n--- Your Stash ---")
-                for item_dict in stash:
+                for item_dict in session.stash:
                     display_str = f"    - {add_article(item_dict['name'])}"
                     item_type = item_dict.get('type')
                     if item_type == 'consumable':
@@ -1821,27 +2432,26 @@ def handle_hideout(stash, player_inventory, current_max_inventory_slots, player_
                 print("--------------------")
         elif verb == "leave":
             print("You leave your hideout.")
-            return stash, player_inventory
+            return
         else:
             print("Invalid hideout command.")
 
-def handle_inn(player_hp, max_hp, player_quests, player_level, player_inventory, current_max_inventory_slots, player_gold, player_xp, xp_to_next_level, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_keychain, sound_manager, stash, has_hideout_key, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, player_reputation, equipped_misc_items, player_effects, equipped_helmet):
+def handle_inn(session):
     """
     Manages the inn interaction, allowing the player to rest and talk to quest givers.
-    Returns updated player state.
     """
-    sound_manager.stop_music()
-    sound_manager.play_music('inn_music')
+    session.sound_manager.stop_music()
+    session.sound_manager.play_music('inn_music')
     print("\n--- The Hearth and Home Inn ---")
     print("You find yourself in a cozy, bustling inn. A warm fire crackles in the hearth.")
 
     while True:
-        print(f"\nYour HP: {player_hp}/{max_hp}")
-        if has_hideout_key:
+        print(f"\nYour HP: {session.player_hp}/{session.max_hp}")
+        if session.has_hideout_key:
             print("Inn commands: rest / talk / enter hideout / inv / leave")
         else:
             print("Inn commands: rest / talk / inv / leave")
-        inn_command_input = input("Inn Action> ").lower().strip()
+        inn_command_input = read_command(session, "Inn Action> ").lower().strip()
         parts = inn_command_input.split()
 
         if not parts:
@@ -1850,14 +2460,14 @@ def handle_inn(player_hp, max_hp, player_quests, player_level, player_inventory,
         verb = parts[0]
 
         if verb == "rest":
-            if player_hp < max_hp:
-                player_hp = max_hp
+            if session.player_hp < session.max_hp:
+                session.player_hp = session.max_hp
                 print("\nYou rest by the fire, feeling your wounds mend and your spirit lift. You are fully healed.")
             else:
                 print("\nYou are already at full health and feeling great.")
 
         elif verb.startswith("inv"): # New block for inventory
-            display_inventory_and_stats(player_hp, max_hp, player_level, player_xp, xp_to_next_level, player_inventory, current_max_inventory_slots, player_keychain, player_gold, player_shield_value, equipped_armor_value, equipped_cloak, equipped_helmet, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, equipped_weapon, equipped_misc_items, player_effects)
+            display_inventory_and_stats(session)
         elif verb == "talk":
             quest_givers = [n for n in NPCs if n.get('type') == 'quest_giver' or n.get('name') == 'Key Vendor']
             if not quest_givers:
@@ -1874,44 +2484,42 @@ def handle_inn(player_hp, max_hp, player_quests, player_level, player_inventory,
                 chosen_npc = next((n for n in quest_givers if n['name'].lower() == npc_name_to_talk.lower()), None)
 
                 if chosen_npc and chosen_npc['name'] == 'Key Vendor':
-                    player_gold, player_inventory, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, player_keychain, equipped_misc_items = \
-                        handle_shop(player_gold, player_inventory, current_max_inventory_slots, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, chosen_npc, player_keychain, player_level, sound_manager, [])
-                    if any(item.get('key_type') == 'hideout' for item in player_keychain):
-                        has_hideout_key = True
+                    handle_shop(session, chosen_npc)
+                    if any(item.get('key_type') == 'hideout' for item in session.player_keychain):
+                        session.has_hideout_key = True
                 elif chosen_npc:
-                    player_quests, player_reputation, player_inventory, player_gold, player_xp, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_level = \
-                        interact_with_quest_giver(chosen_npc, player_quests, player_reputation, player_level, player_inventory, current_max_inventory_slots, player_gold, player_xp, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_keychain, sound_manager)
+                    interact_with_quest_giver(session, chosen_npc)
                 else:
                     print(f"You don't see anyone named '{npc_name_to_talk}' here.")
 
         elif verb == "enter" and "hideout" in parts:
-            if has_hideout_key:
-                stash, player_inventory = handle_hideout(stash, player_inventory, current_max_inventory_slots, player_hp, max_hp, player_level, player_xp, xp_to_next_level, player_keychain, player_gold, player_shield_value, equipped_armor_value, equipped_cloak, equipped_helmet, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, equipped_weapon, equipped_misc_items, player_effects)
+            if session.has_hideout_key:
+                handle_hideout(session)
             else:
                 print("You don't have a key to a hideout.")
 
         elif verb == "leave":
             print("You step out of the inn, back into the dungeon's gloom.")
-            sound_manager.stop_music()
-            sound_manager.play_music('ambient_music')
-            return player_hp, max_hp, player_quests, player_inventory, player_gold, player_xp, xp_to_next_level, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_level, player_keychain, stash, has_hideout_key
+            session.sound_manager.stop_music()
+            session.sound_manager.play_music('ambient_music')
+            request_autosave(session, 'inn')
+            return
 
         else:
             print("Invalid inn command. Type 'rest', 'talk', or 'leave'.")
 
-    sound_manager.stop_music()
-    sound_manager.play_music('ambient_music')
-    return player_hp, max_hp, player_quests, player_inventory, player_gold, player_xp, xp_to_next_level, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_level, player_keychain, stash, has_hideout_key
+    session.sound_manager.stop_music()
+    session.sound_manager.play_music('ambient_music')
 
 
-def interact_with_quest_giver(npc, player_quests, player_reputation, player_level, player_inventory, current_max_inventory_slots, player_gold, player_xp, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_keychain, sound_manager):
+def interact_with_quest_giver(session, npc):
     """Handles all interaction logic with a quest-giving NPC."""
     print(f"\nYou approach {npc['name']}.")
 
     # Reputation-based dialogue
     faction_id = npc.get('faction')
-    if faction_id and faction_id in player_reputation:
-        reputation_level = player_reputation[faction_id]
+    if faction_id and faction_id in session.player_reputation:
+        reputation_level = session.player_reputation[faction_id]
         if reputation_level > 50:
             for dialogue in npc.get('dialogue_reputation', []):
                 if dialogue['reputation_level'] == 'friendly':
@@ -1932,28 +2540,28 @@ def interact_with_quest_giver(npc, player_quests, player_reputation, player_leve
 
     npc_quest_id = npc.get('current_quest_id')
     if not npc_quest_id:
-        return player_quests, player_reputation, player_inventory, player_gold, player_xp, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_keychain, player_level
+        return
 
-    quest_status = get_player_quest_status(player_quests, npc_quest_id)
+    quest_status = get_player_quest_status(session.player_quests, npc_quest_id)
     quest_def = get_quest_by_id(npc_quest_id)
 
     if quest_status == 'not_started' and quest_def:
-        if player_level >= quest_def.get('required_level', 1) and (not quest_def.get('prerequisite_quest') or get_player_quest_status(player_quests, quest_def.get('prerequisite_quest')) == 'completed'):
+        if session.player_level >= quest_def.get('required_level', 1) and (not quest_def.get('prerequisite_quest') or get_player_quest_status(session.player_quests, quest_def.get('prerequisite_quest')) == 'completed'):
             dialogue = quest_def.get('dialogue_offer', "I have a task for you.").format(target_count=quest_def.get('target_count', 0))
             print(f"{npc['name']}: '{dialogue}'")
             accept = input("Accept quest? (yes/no): ").lower().strip()
             if accept in ['yes', 'y']:
                 if quest_def['type'] == 'find_npc':
-                    player_quests[npc_quest_id] = {'status': 'active', 'found_npc': False}
+                    session.player_quests[npc_quest_id] = {'status': 'active', 'found_npc': False}
                 else:
-                    player_quests[npc_quest_id] = {'status': 'active', 'current_count': 0}
+                    session.player_quests[npc_quest_id] = {'status': 'active', 'current_count': 0}
                 print(f"You accept the quest: '{quest_def['name']}'!")
         else:
             print(f"{npc['name']}: '{quest_def.get('dialogue_unavailable', 'I have no task for you.')}'")
     elif quest_status == 'active' and quest_def:
         if quest_def['type'] in ['defeat_any_monster', 'defeat_monster', 'fetch_item']:
             dialogue = quest_def.get('dialogue_active', "How goes the quest?").format(
-                current_count=player_quests[npc_quest_id].get('current_count', 0),
+                current_count=session.player_quests[npc_quest_id].get('current_count', 0),
                 target_count=quest_def.get('target_count', 0)
             )
         else:
@@ -1962,7 +2570,7 @@ def interact_with_quest_giver(npc, player_quests, player_reputation, player_leve
     elif quest_status == 'complete_ready' and quest_def:
         if quest_def['type'] in ['defeat_any_monster', 'defeat_monster', 'fetch_item']:
             dialogue = quest_def.get('dialogue_complete_ready', "You've done it!").format(
-                current_count=player_quests[npc_quest_id].get('current_count', 0),
+                current_count=session.player_quests[npc_quest_id].get('current_count', 0),
                 target_count=quest_def.get('target_count', 0)
             )
         else:
@@ -1970,169 +2578,913 @@ def interact_with_quest_giver(npc, player_quests, player_reputation, player_leve
         print(f"{npc['name']}: '{dialogue}'")
         turn_in = input("Turn in quest? (yes/no): ").lower().strip()
         if turn_in in ['yes', 'y']:
-            if quest_def['type'] == 'fetch_item' and not has_player_enough_items(player_inventory, quest_def['target_item'], quest_def['target_count']):
+            if quest_def['type'] == 'fetch_item' and not has_player_enough_items(session.player_inventory, quest_def['target_item'], quest_def['target_count']):
                 print("You don't have the required items!")
             else:
                 if quest_def['type'] == 'fetch_item':
-                    remove_items_from_inventory(player_inventory, quest_def['target_item'], quest_def['target_count'])
+                    remove_items_from_inventory(session.player_inventory, quest_def['target_item'], quest_def['target_count'])
                     print(f"You hand over {quest_def['target_count']} {quest_def['target_item']}(s).")
 
-                player_gold += quest_def.get('reward_gold', 0)
-                player_xp += quest_def.get('reward_xp', 0)
+                session.player_gold += quest_def.get('reward_gold', 0)
+                session.player_xp += quest_def.get('reward_xp', 0)
                 print(f"Quest complete! You receive {quest_def.get('reward_gold', 0)} gold and {quest_def.get('reward_xp', 0)} XP.")
 
                 reward_item_name = quest_def.get('reward_item')
                 if reward_item_name:
                     item_def = get_item_by_name(reward_item_name)
                     if item_def:
-                        if len(player_inventory) < current_max_inventory_slots:
-                            player_inventory.append(copy.deepcopy(item_def))
+                        if len(session.player_inventory) < session.current_max_inventory_slots:
+                            session.player_inventory.append(copy.deepcopy(item_def))
                             print(f"You also receive {add_article(item_def['name'])}!")
                         else:
                             print(f"You would have received an item, but your inventory is full!")
 
-                player_quests[npc_quest_id]['status'] = 'completed'
+                session.player_quests[npc_quest_id]['status'] = 'completed'
 
                 # Update reputation
                 if 'rewards' in quest_def:
                     if 'reputation_gain' in quest_def['rewards']:
                         faction_id = quest_def['rewards']['reputation_gain']['faction']
                         amount = quest_def['rewards']['reputation_gain']['amount']
-                        update_reputation(player_reputation, faction_id, amount)
+                        update_reputation(session.player_reputation, faction_id, amount)
                     if 'reputation_loss' in quest_def['rewards']:
                         faction_id = quest_def['rewards']['reputation_loss']['faction']
                         amount = quest_def['rewards']['reputation_loss']['amount']
-                        update_reputation(player_reputation, faction_id, -amount)
+                        update_reputation(session.player_reputation, faction_id, -amount)
 
-                player_xp, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points = \
-                    check_for_level_up(player_xp, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points)
+                check_for_level_up(session)
     elif quest_status == 'completed' and quest_def:
         print(f"{npc['name']}: '{quest_def.get('dialogue_complete_turn_in', 'Thank you for your help.')}'")
 
-    return player_quests, player_reputation, player_inventory, player_gold, player_xp, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_level
-
 # MODIFIED: Added equipped_cloak to parameters and save state
-def save_game(player_hp, max_hp, player_inventory, current_room, current_max_inventory_slots, player_gold, player_shield_value, equipped_armor_value, equipped_cloak, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, equipped_weapon, player_xp, player_level, xp_to_next_level, player_quests, player_reputation, player_name, rooms_travelled, player_keychain, equipped_misc_items, player_effects, room_history, direction_history, stash, player_class, player_skill_points, player_unlocked_skills, equipped_helmet, has_hideout_key):
-    """Saves the current game state to 'savegame.json'."""
-    game_state = {
-        'player_hp': player_hp,
-        'max_hp': max_hp,
-        'player_inventory': player_inventory,
-        'current_max_inventory_slots': current_max_inventory_slots,
-        'player_gold': player_gold,
-        'player_shield_value': player_shield_value, # Now stores item dict or None
-        'equipped_armor_value': equipped_armor_value, # Now stores item dict or None
-        'equipped_cloak': equipped_cloak, # NEW: Save equipped cloak
-        'player_attack_power': player_attack_power,
-        'player_attack_bonus': player_attack_bonus, # NEW: Save permanent attack bonus
-        'player_attack_variance': player_attack_variance,
-        'player_crit_chance': player_crit_chance,
-        'player_crit_multiplier': player_crit_multiplier,
-        'equipped_weapon': equipped_weapon,
-        'player_xp': player_xp,
-        'player_level': player_level,
-        'xp_to_next_level': xp_to_next_level,
-        'player_quests': player_quests,
-        'player_reputation': player_reputation,
-        'player_name': player_name,
-        'rooms_travelled': rooms_travelled,
-        'player_keychain': player_keychain, # Added to save state
-        'equipped_misc_items': equipped_misc_items,
-        'stash': stash,
-        'player_effects': player_effects,
-        'player_class': player_class,
-        'player_skill_points': player_skill_points,
-        'player_unlocked_skills': player_unlocked_skills,
-        'equipped_helmet': equipped_helmet,
-        'has_hideout_key': has_hideout_key,
-        'special_event_after_unlock': special_event_after_unlock,
-        'room_history_data': [
-            {
-                'description': room.description,
-                'exits': list(room.exits.keys()),
-                'locked_exits': room.locked_exits,
-                'item': room.item,
-                'npc': room.npc,
-                'hazard': room.hazard,
-                'monster': room.monster,
-                'puzzle': room.puzzle,
-                'shrine': room.shrine,
-                'winning_item_just_spawned': room.winning_item_just_spawned,
-                'boss_monster_spawned': room.boss_monster_spawned,
-                'awaiting_winning_item_pickup': room.awaiting_winning_item_pickup,
-                'is_inn': getattr(room, 'is_inn', False)
-            } for room in room_history
-        ],
-        'direction_history': direction_history,
-        'current_room': {
-            'description': current_room.description,
-            'exits': list(current_room.exits.keys()),
-            'locked_exits': current_room.locked_exits,
-            'item': current_room.item, # Save the item on the floor
-            'npc': current_room.npc,
-            'hazard': current_room.hazard,
-            'monster': current_room.monster,
-            'puzzle': current_room.puzzle,
-            'shrine': current_room.shrine,
-            'winning_item_just_spawned': current_room.winning_item_just_spawned, # Save this flag
-            'boss_monster_spawned': current_room.boss_monster_spawned, # Save this flag
-            'awaiting_winning_item_pickup': current_room.awaiting_winning_item_pickup, # Save this flag
-            'is_inn': getattr(current_room, 'is_inn', False)
-        }
+# --- Save Format ---
+# A binary save is SAVE_MAGIC, a format version byte and a compression byte, followed by the
+# SAVE_SECTIONS, each compressed on its own, and a footer: each section's length and CRC-32, the
+# number of sections and a CRC-32 of the header and footer. Checking a save is then just checksums,
+# with nothing decompressed or decoded. Together the sections hold the payload: a run of chunks,
+# each its length, the strings it uses for the first time and one tagged value, ended by a zero
+# length. There is a chunk for each section's fields, then each room of the history in a chunk of
+# its own (in the world section), so saves are written a room at a time and loads can leave rooms
+# undecoded until they are needed. Strings are stored once and referred to by their index in the
+# whole save. A dict named like a catalog entry (an item, monster, NPC, ...) is stored as that name
+# plus only the fields that differ.
+# Format 2 saves were one compressed payload with the whole state in its first chunk, and format 1
+# saves one string table and one value; both still load, unchecked.
+SAVE_COMPRESSION_CODES = {'none': 0, 'zlib': 1, 'lzma': 2}
+SAVE_SECTIONS = ('player', 'quests', 'world')
+SAVE_QUEST_FIELDS = ('player_quests', 'player_reputation')
+SAVE_WORLD_FIELDS = ('current_room', 'room_history_data', 'direction_history', 'rooms_travelled', 'rooms_generated', 'run_seed', 'special_event_after_unlock')
+_TAG_NONE, _TAG_FALSE, _TAG_TRUE, _TAG_INT, _TAG_FLOAT, _TAG_STR, _TAG_LIST, _TAG_DICT, _TAG_CATALOG = range(9)
+
+def _write_varint(out, number):
+    while number > 0x7f:
+        out.append((number & 0x7f) | 0x80)
+        number >>= 7
+    out.append(number)
+
+def _same_value(a, b):
+    """Like ==, but True is not 1 and dict key order counts, so a catalog field only counts as unchanged if it would load back identical."""
+    if type(a) is not type(b):
+        return False
+    if type(a) is dict:
+        return list(a) == list(b) and all(_same_value(a[key], b[key]) for key in a)
+    if type(a) is list:
+        return len(a) == len(b) and all(map(_same_value, a, b))
+    return a == b
+
+def _copy_plain(value):
+    """Deep-copies JSON-shaped data (dicts, lists and scalars) much faster than copy.deepcopy."""
+    if type(value) is dict:
+        return {key: _copy_plain(item) for key, item in value.items()}
+    if type(value) is list:
+        return [_copy_plain(item) for item in value]
+    return value
+
+def _save_key(key):
+    return key if type(key) is str else json.dumps(key) # Non-string keys become strings, as in JSON
+
+class SaveEncoder:
+    """Builds the chunks of a binary save's payload: the strings new to each chunk and its tagged value."""
+    def __init__(self):
+        self.strings = {}
+        self.new_strings = []
+        self.out = bytearray()
+
+    def string(self, text):
+        index = self.strings.get(text)
+        if index is None:
+            index = self.strings[text] = len(self.strings)
+            self.new_strings.append(text)
+        _write_varint(self.out, index)
+
+    def chunk(self, value):
+        """Encodes one value as a chunk, length first."""
+        self.out = bytearray()
+        self.new_strings = []
+        self.value(value)
+        body = bytearray()
+        _write_varint(body, len(self.new_strings))
+        for text in self.new_strings:
+            encoded = text.encode('utf-8')
+            _write_varint(body, len(encoded))
+            body += encoded
+        body += self.out
+        chunk = bytearray()
+        _write_varint(chunk, len(body))
+        return chunk + body
+
+    def value(self, value):
+        out = self.out
+        value_type = type(value)
+        if value is None:
+            out.append(_TAG_NONE)
+        elif value is False:
+            out.append(_TAG_FALSE)
+        elif value is True:
+            out.append(_TAG_TRUE)
+        elif value_type is str:
+            out.append(_TAG_STR)
+            self.string(value)
+        elif value_type is int:
+            out.append(_TAG_INT)
+            _write_varint(out, value << 1 if value >= 0 else (-value << 1) - 1) # Zigzag, so small negatives stay short
+        elif value_type is float:
+            out.append(_TAG_FLOAT)
+            out += struct.pack('<d', value)
+        elif value_type is dict:
+            entry = SAVE_CATALOG.get(value.get('name')) if type(value.get('name')) is str else None
+            if entry is None or not self.catalog_value(value, entry):
+                out.append(_TAG_DICT)
+                _write_varint(out, len(value))
+                for key, item in value.items():
+                    self.string(_save_key(key))
+                    self.value(item)
+        elif value_type in (list, tuple):
+            out.append(_TAG_LIST)
+            _write_varint(out, len(value))
+            for item in value:
+                self.value(item)
+        else:
+            raise TypeError(f"Object of type {value_type.__name__} can't be saved")
+
+    def catalog_value(self, value, entry):
+        """Writes a dict as its catalog entry plus changes. Returns False if loading wouldn't give back the same key order."""
+        changed = [(key, item) for key, item in value.items() if key not in entry or not _same_value(item, entry[key])]
+        removed = [key for key in entry if key not in value]
+        if list(value) != [key for key in entry if key in value] + [key for key, _ in changed if key not in entry]:
+            return False
+        out = self.out
+        out.append(_TAG_CATALOG)
+        self.string(value['name'])
+        _write_varint(out, len(changed))
+        for key, item in changed:
+            self.string(_save_key(key))
+            self.value(item)
+        _write_varint(out, len(removed))
+        for key in removed:
+            self.string(key)
+        return True
+
+def save_section(key):
+    """Returns which of the SAVE_SECTIONS a game state field is saved in."""
+    return 'quests' if key in SAVE_QUEST_FIELDS else 'world' if key in SAVE_WORLD_FIELDS else 'player'
+
+def _save_section_chunks(encoder, game_state, section):
+    """Yields the encoded chunks of one section of a save, a batch at a time."""
+    chunks = [encoder.chunk({key: value for key, value in game_state.items() if key != 'room_history_data' and save_section(key) == section})]
+    if section == 'world':
+        for room in game_state.get('room_history_data', []):
+            chunks.append(encoder.chunk(room.record() if isinstance(room, SavedRoom) else room))
+            if len(chunks) >= 256: # Hand the compressor a batch at a time; it's slow to call per room
+                yield b"".join(chunks)
+                chunks = []
+        chunks.append(b"\x00")
+    yield b"".join(chunks)
+
+def encode_save_chunks(game_state, compression=SAVE_COMPRESSION):
+    """
+    Encodes a game state dict as a binary save, yielding it a piece at a time so
+    it can be written out as it is encoded. Rooms in its room history may be
+    SavedRooms, which are encoded from what their save holds.
+    """
+    if compression == 'lzma' and lzma is None:
+        compression = 'zlib'
+    header = SAVE_MAGIC + bytes((SAVE_FORMAT_VERSION, SAVE_COMPRESSION_CODES[compression]))
+    yield header
+    encoder = SaveEncoder()
+    footer = bytearray()
+    for section in SAVE_SECTIONS:
+        compressor = zlib.compressobj() if compression == 'zlib' else lzma.LZMACompressor() if compression == 'lzma' else None
+        length = checksum = 0
+        for data in _save_section_chunks(encoder, game_state, section):
+            for piece in ((compressor.compress(data),) if compressor else (data,)):
+                length += len(piece)
+                checksum = zlib.crc32(piece, checksum)
+                yield piece
+        if compressor:
+            piece = compressor.flush()
+            length += len(piece)
+            checksum = zlib.crc32(piece, checksum)
+            yield piece
+        footer += struct.pack('<II', length, checksum)
+    footer.append(len(SAVE_SECTIONS))
+    yield bytes(footer) + struct.pack('<I', zlib.crc32(footer, zlib.crc32(header)))
+
+def encode_save_state(game_state, compression=SAVE_COMPRESSION):
+    """Encodes a game state dict as a binary save."""
+    return b"".join(encode_save_chunks(game_state, compression))
+
+def _save_payload_reader(view):
+    """
+    Returns functions that read a save payload straight out of a memoryview, each
+    taking the position to read from and returning what it read and the position
+    after it: read_varint, read_strings (which adds to the payload's string table)
+    and read_value. read_value can be called from any thread.
+    """
+    position = 0
+    lock = threading.Lock()
+
+    def varint():
+        nonlocal position
+        result = shift = 0
+        while True:
+            byte = view[position]
+            position += 1
+            result |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    strings = []
+
+    def string():
+        nonlocal position
+        index = view[position]
+        if index < 0x80: # Most indexes fit in one byte
+            position += 1
+            return strings[index]
+        return strings[varint()]
+
+    def value():
+        nonlocal position
+        tag = view[position]
+        position += 1
+        if tag == _TAG_STR:
+            return string()
+        if tag == _TAG_DICT:
+            return {string(): value() for _ in range(varint())}
+        if tag == _TAG_INT:
+            number = varint()
+            return -((number + 1) >> 1) if number & 1 else number >> 1
+        if tag == _TAG_CATALOG:
+            name = string()
+            entry = SAVE_CATALOG.get(name)
+            if entry is None:
+                raise ValueError(f"save refers to '{name}', which is not in the game data")
+            changed = {string(): value() for _ in range(varint())}
+            removed = {string() for _ in range(varint())}
+            result = {}
+            for key, item in entry.items():
+                if key in changed:
+                    result[key] = changed.pop(key)
+                elif key not in removed:
+                    result[key] = _copy_plain(item) if type(item) in (dict, list) else item
+            result.update(changed) # Fields the catalog entry doesn't have
+            return result
+        if tag == _TAG_LIST:
+            return [value() for _ in range(varint())]
+        if tag == _TAG_NONE:
+            return None
+        if tag == _TAG_TRUE:
+            return True
+        if tag == _TAG_FALSE:
+            return False
+        if tag == _TAG_FLOAT:
+            number = struct.unpack_from('<d', view, position)[0]
+            position += 8
+            return number
+        raise ValueError(f"unknown value tag {tag} in save")
+
+    def read_varint(start):
+        nonlocal position
+        position = start
+        return varint(), position
+
+    def read_strings(start):
+        nonlocal position
+        position = start
+        for _ in range(varint()):
+            length = varint()
+            strings.append(str(view[position:position + length], 'utf-8'))
+            position += length
+        return len(strings), position
+
+    def read_value(start):
+        nonlocal position
+        with lock: # Rooms are decoded by the game and by the save writer
+            position = start
+            return value(), position
+
+    return read_varint, read_strings, read_value
+
+def _decode_save_payload(view, version):
+    """Decodes a save payload. Rooms of the history are left as SavedRooms, to be decoded when needed (except in format 1 saves)."""
+    read_varint, read_strings, read_value = _save_payload_reader(view)
+    if version < 2:
+        return read_value(read_strings(0)[1])[0]
+    state_chunks = 1 if version == 2 else len(SAVE_SECTIONS)
+    chunk_positions = []
+    length, position = read_varint(0)
+    while length:
+        chunk_positions.append(read_strings(position)[1])
+        length, position = read_varint(position + length)
+    if len(chunk_positions) < state_chunks or position != len(view):
+        raise ValueError("save doesn't end where its chunks do")
+    game_state = {}
+    for position in chunk_positions[:state_chunks]:
+        game_state.update(read_value(position)[0])
+    run_seed = game_state.get('run_seed')
+    game_state['room_history_data'] = [SavedRoom(read_value=read_value, position=position, run_seed=run_seed) for position in chunk_positions[state_chunks:]]
+    return game_state
+
+def check_save_sections(view):
+    """
+    Checks a format 3 save against its footer's checksums without decompressing
+    anything. Returns the sections (memoryviews, in SAVE_SECTIONS order) and a
+    dict of what is wrong, by section (or 'footer'); the sections are None if
+    the footer can't be trusted.
+    """
+    header_size = len(SAVE_MAGIC) + 2
+    count = len(SAVE_SECTIONS)
+    footer_size = 8 * count + 5
+    if len(view) < header_size + footer_size or view[-5] != count:
+        return None, {'footer': "is missing (was the save cut short?)"}
+    footer = view[-footer_size:-4]
+    if struct.unpack_from('<I', view, len(view) - 4)[0] != zlib.crc32(footer, zlib.crc32(view[:header_size])):
+        return None, {'footer': "fails its checksum"}
+    sections, problems = [], {}
+    position = header_size
+    for i, name in enumerate(SAVE_SECTIONS):
+        length, checksum = struct.unpack_from('<II', footer, 8 * i)
+        section = view[position:position + length]
+        position += length
+        if len(section) != length:
+            problems[name] = "is cut short"
+        elif zlib.crc32(section) != checksum:
+            problems[name] = "fails its checksum"
+        sections.append(section)
+    if position != len(view) - footer_size:
+        problems['footer'] = "doesn't match the file's size"
+    return sections, problems
+
+def _decompress_save(data, compression):
+    if compression == SAVE_COMPRESSION_CODES['zlib']:
+        return zlib.decompress(data)
+    if compression == SAVE_COMPRESSION_CODES['lzma']:
+        if lzma is None:
+            raise ValueError("save is lzma-compressed, but this Python has no lzma module")
+        return lzma.decompress(data)
+    if compression != SAVE_COMPRESSION_CODES['none']:
+        raise ValueError(f"unknown save compression {compression}")
+    return data
+
+def decode_save_state(data):
+    """
+    Decodes a binary save (bytes or any buffer) back into a game state dict.
+    Raises ValueError if it isn't a valid save, naming the damaged sections of
+    one that fails its checksums.
+    """
+    view = memoryview(data)
+    header_size = len(SAVE_MAGIC) + 2
+    if len(view) < header_size or view[:len(SAVE_MAGIC)] != SAVE_MAGIC:
+        raise ValueError("not an Infinite Dungeon save file")
+    version, compression = view[len(SAVE_MAGIC)], view[len(SAVE_MAGIC) + 1]
+    if version > SAVE_FORMAT_VERSION:
+        raise ValueError(f"save format {version} is newer than this game understands")
+    read_errors = (IndexError, struct.error, zlib.error) + ((lzma.LZMAError,) if lzma else ())
+    if version >= 3:
+        sections, problems = check_save_sections(view)
+        if problems:
+            raise ValueError("; ".join(f"{name} {problem}" for name, problem in problems.items()))
+    try:
+        if version >= 3:
+            payload = b"".join(_decompress_save(section, compression) for section in sections)
+        else:
+            payload = _decompress_save(view[header_size:], compression)
+        return _decode_save_payload(memoryview(payload), version)
+    except read_errors as e:
+        raise ValueError(f"undecodable data: {e}") from e
+
+def room_save_data(room):
+    """Returns the saved form of a room."""
+    return {
+        'description': room.description,
+        'exits': list(room.exits.keys()),
+        'locked_exits': room.locked_exits,
+        'item': room.item, # Save the item on the floor
+        'npc': room.npc,
+        'hazard': room.hazard,
+        'monster': room.monster,
+        'puzzle': room.puzzle,
+        'shrine': room.shrine,
+        'winning_item_just_spawned': room.winning_item_just_spawned, # Save this flag
+        'boss_monster_spawned': room.boss_monster_spawned, # Save this flag
+        'awaiting_winning_item_pickup': room.awaiting_winning_item_pickup, # Save this flag
+        'is_inn': getattr(room, 'is_inn', False)
+    }
+
+def regenerate_room(run_seed, regen):
+    """Generates a room of a seeded run again from its generation inputs."""
+    room = Room(regen[1], {}, load_from_save=True)
+    generate_seeded_room(room, run_seed, regen, {}) # Quests only steer which quest giver appears; a different one is saved as a change
+    return room
+
+def room_save_record(session, room):
+    """
+    Returns what a save stores for a room. A room of a seeded run is stored as its
+    generation inputs plus the fields that differ from regenerating it (defeated
+    monsters, taken items, solved puzzles, used shrines, disarmed traps, unlocked
+    exits); other rooms are stored whole.
+    """
+    if isinstance(room, SavedRoom):
+        return room.record() # Not entered since it was loaded, so still as saved
+    data = room_save_data(room)
+    regen = getattr(room, 'regen', None)
+    if regen is None or session.run_seed is None:
+        return data
+    generated = room_save_data(regenerate_room(session.run_seed, regen))
+    return {'regen': regen, 'changes': {key: value for key, value in data.items() if value != generated[key]}}
+
+def expand_room_record(room_data, run_seed):
+    """Turns a room stored by room_save_record back into its whole saved form."""
+    if 'changes' not in room_data:
+        return room_data
+    data = room_save_data(regenerate_room(run_seed, room_data['regen']))
+    data.update(room_data['changes'])
+    data['regen'] = room_data['regen']
+    return data
+
+def room_from_save_data(room_data):
+    """Builds a Room from its whole saved form (see room_save_data)."""
+    room = Room(1, {}, load_from_save=True)
+    room.description = room_data['description']
+    room.exits = {direction: True for direction in room_data['exits']}
+    room.locked_exits = room_data['locked_exits']
+    room.item = room_data.get('item') # Load the item on the floor
+    room.npc = room_data.get('npc')
+    room.hazard = room_data.get('hazard')
+    room.monster = room_data.get('monster')
+    room.puzzle = room_data.get('puzzle')
+    room.shrine = room_data.get('shrine')
+    room.winning_item_just_spawned = room_data.get('winning_item_just_spawned', False) # Load flag
+    room.boss_monster_spawned = room_data.get('boss_monster_spawned', False) # Load flag
+    room.awaiting_winning_item_pickup = room_data.get('awaiting_winning_item_pickup', False) # Load flag
+    room.is_inn = room_data.get('is_inn', False)
+    room.regen = room_data.get('regen')
+    return room
+
+class SavedRoom:
+    """
+    A room of the history as its save holds it: the record itself, or where to
+    decode it from in the loaded save. Loading leaves history rooms like this, so
+    resuming a long run doesn't build every room; one becomes a Room when the
+    player walks back into it (or the map draws it).
+    """
+    __slots__ = ('data', 'read_value', 'position', 'run_seed')
+
+    def __init__(self, data=None, read_value=None, position=0, run_seed=None):
+        self.data = data
+        self.read_value = read_value
+        self.position = position
+        self.run_seed = run_seed
+
+    def record(self):
+        """The room's save record (see room_save_record). Decoded afresh each time, so it isn't kept in memory."""
+        return self.data if self.read_value is None else self.read_value(self.position)[0]
+
+    def saved_data(self):
+        """The room's whole saved form (see room_save_data), regenerating what a delta record leaves out."""
+        return expand_room_record(_copy_plain(self.record()), self.run_seed)
+
+    def materialize(self):
+        return room_from_save_data(self.saved_data())
+
+def session_save_fields(session):
+    """Returns everything saved about the player, i.e. the save minus the rooms."""
+    return {
+        'player_hp': session.player_hp,
+        'max_hp': session.max_hp,
+        'player_inventory': session.player_inventory,
+        'current_max_inventory_slots': session.current_max_inventory_slots,
+        'player_gold': session.player_gold,
+        'player_shield_value': session.player_shield_value, # Now stores item dict or None
+        'equipped_armor_value': session.equipped_armor_value, # Now stores item dict or None
+        'equipped_cloak': session.equipped_cloak, # NEW: Save equipped cloak
+        'player_attack_power': session.player_attack_power,
+        'player_attack_bonus': session.player_attack_bonus, # NEW: Save permanent attack bonus
+        'player_attack_variance': session.player_attack_variance,
+        'player_crit_chance': session.player_crit_chance,
+        'player_crit_multiplier': session.player_crit_multiplier,
+        'equipped_weapon': session.equipped_weapon,
+        'player_xp': session.player_xp,
+        'player_level': session.player_level,
+        'xp_to_next_level': session.xp_to_next_level,
+        'player_quests': session.player_quests,
+        'player_reputation': session.player_reputation,
+        'player_name': session.player_name,
+        'rooms_travelled': session.rooms_travelled,
+        'player_keychain': session.player_keychain, # Added to save state
+        'equipped_misc_items': session.equipped_misc_items,
+        'stash': session.stash,
+        'player_effects': session.player_effects.to_list(),
+        'player_class': session.player_class,
+        'player_skill_points': session.player_skill_points,
+        'player_unlocked_skills': session.player_unlocked_skills,
+        'equipped_helmet': session.equipped_helmet,
+        'has_hideout_key': session.has_hideout_key,
+        'special_event_after_unlock': session.special_event_after_unlock,
+        'run_seed': session.run_seed,
+        'rooms_generated': session.rooms_generated,
     }
+
+def write_file_atomically(path, data):
+    """
+    Writes a file (from bytes, or an iterable of byte strings written as they come)
+    through a temporary one that is fsync'd and then renamed over it, so a crash
+    leaves either the old file or the new one.
+    """
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            for piece in (data,) if isinstance(data, (bytes, bytearray)) else data:
+                f.write(piece)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def file_safe_name(name):
+    """Turns a player or slot name into a file name: lower case letters, digits, '-' and '_'."""
+    return "".join(c for c in name.lower() if c.isalnum() or c in "-_") or "adventurer"
+
+def save_slot_files(slot):
+    """Returns the base file and journal file of a save slot."""
+    return os.path.join(SAVE_DIR, slot + ".sav"), os.path.join(SAVE_DIR, slot + ".journal")
+
+def read_save_index():
+    """Returns the save index: slot name -> the SAVE_INDEX_FIELDS and 'saved_at' of its latest save."""
+    with open(os.path.join(SAVE_DIR, SAVE_INDEX_FILE), 'r') as f:
+        return json.load(f)
+
+def update_save_index(slot, summary):
+    """Records a slot's latest save in the index. Only the save writer calls this, so updates never interleave."""
+    try:
+        index = read_save_index()
+    except (FileNotFoundError, ValueError):
+        index = rebuild_save_index()
+    index[slot] = summary
+    write_file_atomically(os.path.join(SAVE_DIR, SAVE_INDEX_FILE), json.dumps(index, indent=1).encode('utf-8'))
+
+def rebuild_save_index():
+    """Works the index out again by reading every slot's save, for when the index file is missing or damaged."""
+    index = {}
+    try:
+        file_names = os.listdir(SAVE_DIR)
+    except FileNotFoundError:
+        return index
+    for file_name in file_names:
+        if not file_name.endswith(".sav"):
+            continue
+        slot = file_name[:-len(".sav")]
+        try:
+            game_state, _ = read_save_files(slot)
+        except (IOError, ValueError):
+            continue
+        index[slot] = dict({key: game_state.get(key) for key in SAVE_INDEX_FIELDS}, saved_at=os.path.getmtime(os.path.join(SAVE_DIR, file_name)))
+    return index
+
+def list_save_slots():
+    """
+    Returns (slot, summary) for every save slot, most recently saved first, from
+    the index alone (or the sessions table). The single save from before slots is
+    listed with summary None.
+    """
+    if STORAGE_BACKEND == 'sqlite':
+        return list_save_slot_rows()
+    return list_save_slot_files()
+
+def list_save_slot_files():
+    """list_save_slots() for the 'files' backend."""
     try:
-        with open('savegame.json', 'w') as f:
-            json.dump(game_state, f, indent=4)
+        index = read_save_index()
+    except (FileNotFoundError, ValueError):
+        index = rebuild_save_index()
+        if index:
+            write_file_atomically(os.path.join(SAVE_DIR, SAVE_INDEX_FILE), json.dumps(index, indent=1).encode('utf-8'))
+    slots = sorted(index.items(), key=lambda entry: entry[1].get('saved_at') or 0, reverse=True)
+    if SINGLE_SAVE_SLOT not in index and (os.path.exists(SINGLE_SAVE_FILE) or os.path.exists(LEGACY_SAVE_FILE)):
+        slots.append((SINGLE_SAVE_SLOT, None))
+    return slots
+
+def describe_save_slot(slot, summary):
+    """One line about a save slot for the load menu."""
+    if summary is None:
+        return f"{slot}: saved before save slots"
+    text = f"{slot}: {summary.get('player_name')} the {summary.get('player_class') or 'Adventurer'}, level {summary.get('player_level')}, room {summary.get('rooms_travelled')}"
+    if isinstance(summary.get('run_seed'), str): # Seeded runs and daily challenges; normal runs are seeded by the clock
+        text += f", seed '{summary['run_seed']}'"
+    if summary.get('saved_at'):
+        text += f", saved {datetime.fromtimestamp(summary['saved_at']).strftime('%Y-%m-%d %H:%M')}"
+    return text
+
+def write_save_state(game_state, slot):
+    """Writes a whole game state as a slot's binary save and starts a new, empty journal after it."""
+    save_file, journal_file = save_slot_files(slot)
+    os.makedirs(SAVE_DIR, exist_ok=True)
+    write_file_atomically(save_file, encode_save_chunks(game_state)) # Streamed: the whole save is never in memory at once
+    with open(journal_file, 'w'): # Entries left in it name the old base, so a crash before this is harmless
+        pass
+
+def save_journal_line(record):
+    """Returns a journal line for an entry: its CRC-32 in hex, then the entry as JSON."""
+    text = json.dumps(record)
+    return f"{zlib.crc32(text.encode('utf-8')):08x} {text}\n"
+
+def save_journal_line_intact(line):
+    """Checks a journal line against its checksum, without parsing it. Lines from before checksums are only checked by parsing."""
+    if line.startswith("{"):
+        try:
+            json.loads(line)
+            return True
+        except json.JSONDecodeError:
+            return False
+    checksum, _, text = line.partition(" ")
+    return text.endswith("\n") and checksum == f"{zlib.crc32(text[:-1].encode('utf-8')):08x}"
+
+def append_save_journal_line(record, slot):
+    """Appends one entry to a slot's journal and waits for it to reach the disk. A torn last line is ignored on load."""
+    line = save_journal_line(record)
+    with open(save_slot_files(slot)[1], 'a') as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+def start_save_journal(session, save_id, records=0, room_records=None):
+    """Remembers what the session's save slot now holds, so the next save only has to write what changed."""
+    session.save_journal = {
+        'slot': session.save_slot,
+        'save_id': save_id,
+        'records': records,
+        'fields': {key: json.dumps(value) for key, value in session_save_fields(session).items()},
+        'rooms': list(session.room_history),
+        'room_records': room_records or [None] * len(session.room_history), # What the save holds for each of them, once worked out
+        'rooms_kept': len(session.room_history), # Rooms at the bottom of the history that no move has taken back out since
+    }
+
+def saved_rooms_unchanged(session):
+    """Returns how many rooms at the bottom of the history are as the save files hold them."""
+    journal = session.save_journal
+    saved_rooms, room_history = journal['rooms'], session.room_history
+    kept = min(journal['rooms_kept'], len(room_history))
+    while kept and saved_rooms[kept - 1] is not room_history[kept - 1]:
+        kept -= 1 # The history was replaced under us
+    return kept
+
+def take_save_base(session):
+    """Takes the whole game as a new save base and starts a new journal after it."""
+    cached_records = session.save_journal['room_records'][:saved_rooms_unchanged(session)] if session.save_journal else []
+    room_records = [
+        record if record is not None else room if isinstance(room, SavedRoom) else _copy_plain(room_save_record(session, room))
+        for record, room in zip(cached_records + [None] * (len(session.room_history) - len(cached_records)), session.room_history)
+    ]
+    game_state = _copy_plain(session_save_fields(session))
+    game_state['room_history_data'] = room_records
+    game_state['direction_history'] = list(session.direction_history)
+    game_state['current_room'] = _copy_plain(room_save_record(session, session.current_room))
+    game_state['save_id'] = os.urandom(8).hex() # Journal entries name the base they follow (not drawn from the game's dice)
+    start_save_journal(session, game_state['save_id'], room_records=list(room_records))
+    return game_state
+
+def take_save_journal_record(session):
+    """
+    Takes one journal entry with what changed since the last save: the player
+    fields that differ, the rooms added to the history (from the deepest point the
+    player walked back to) and the current room. Rooms can only change while they
+    are the current room, so the ones below that point are left alone and the
+    entry's size doesn't grow with the length of the run.
+    """
+    journal = session.save_journal
+    room_history = session.room_history
+    history_from = saved_rooms_unchanged(session)
+    fields = {key: json.dumps(value) for key, value in session_save_fields(session).items()}
+    room_records = [_copy_plain(room_save_record(session, room)) for room in room_history[history_from:]]
+    record = {
+        'save_id': journal['save_id'],
+        'fields': {key: json.loads(encoded) for key, encoded in fields.items() if journal['fields'].get(key) != encoded},
+        'history_from': history_from,
+        'rooms': room_records,
+        'directions': session.direction_history[history_from:],
+        'current_room': _copy_plain(room_save_record(session, session.current_room)),
+    }
+    journal['fields'] = fields
+    journal['rooms'][history_from:] = room_history[history_from:]
+    journal['room_records'][history_from:] = room_records
+    journal['rooms_kept'] = len(room_history)
+    journal['records'] += 1
+    return record
+
+def take_save(session):
+    """
+    Takes what the next save to the session's slot has to write, as plain data of
+    its own that the game can go on changing under. Usually that is a journal entry
+    with what changed; every SAVE_COMPACT_EVERY saves (and on the first save to a
+    slot) it is the whole game, to be written as a new base. Returns a job for the
+    save writer.
+    """
+    if session.save_slot is None:
+        session.save_slot = file_safe_name(session.player_name)
+    journal = session.save_journal
+    summary = dict({key: getattr(session, key) for key in SAVE_INDEX_FIELDS}, saved_at=time.time())
+    if journal is None or journal.get('failed') or journal['slot'] != session.save_slot or len(session.direction_history) != len(session.room_history):
+        needs_base = True
+    elif STORAGE_BACKEND == 'sqlite':
+        needs_base = stored_save_id(session.save_slot) != journal['save_id'] # Rows are replaced in place, so there is no journal to compact
+    else:
+        needs_base = journal['records'] >= SAVE_COMPACT_EVERY or not os.path.exists(save_slot_files(session.save_slot)[0])
+    if needs_base:
+        data = take_save_base(session)
+        return {'kind': 'base', 'data': data, 'slot': session.save_slot, 'summary': summary, 'journal': session.save_journal}
+    return {'kind': 'journal', 'data': take_save_journal_record(session), 'slot': session.save_slot, 'summary': summary, 'journal': journal}
+
+class SaveWriter:
+    """
+    Writes saves on a background thread, one at a time and in the order they were
+    taken, so the game only waits on the disk when it asks to.
+    """
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, job):
+        """Queues a job from take_save(). Its 'done' event is set once it is written, with any failure in 'error'."""
+        job['error'] = None
+        job['done'] = threading.Event()
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='save-writer', daemon=True)
+                self.thread.start()
+        self.jobs.put(job)
+        return job
+
+    def idle(self):
+        return self.jobs.unfinished_tasks == 0
+
+    def wait(self):
+        """Blocks until everything queued so far is written."""
+        self.jobs.join()
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if STORAGE_BACKEND == 'sqlite':
+                    write_save_job_rows(job)
+                elif job['kind'] == 'base':
+                    write_save_state(job['data'], job['slot'])
+                    update_save_index(job['slot'], job['summary'])
+                else:
+                    append_save_journal_line(job['data'], job['slot'])
+                    update_save_index(job['slot'], job['summary'])
+            except (IOError, TypeError, ValueError) + STORAGE_ERRORS as e:
+                job['error'] = e
+                job['journal']['failed'] = True # The files no longer hold what the session thinks, so the next save rewrites the base
+            finally:
+                job['done'].set()
+                self.jobs.task_done()
+
+save_writer = SaveWriter()
+
+def save_game(session, slot=None):
+    """Saves the current game (to `slot`, which then becomes the session's slot) and reports how it went. See take_save() for what gets written."""
+    if slot:
+        session.save_slot = file_safe_name(slot)
+    job = save_writer.submit(take_save(session))
+    job['done'].wait()
+    if job['error'] is None:
         print("Game saved successfully!")
-    except IOError:
-        print("Error: Could not save game. Check file permissions.")
-    except TypeError as e:
-        print(f"Error: Could not save game due to data type issue: {e}")
+    elif isinstance(job['error'], TypeError):
+        print(f"Error: Could not save game due to data type issue: {job['error']}")
         print("Ensure all game state data is JSON serializable.")
+    else:
+        print("Error: Could not save game. Check file permissions.")
 
-# MODIFIED: Added equipped_cloak to returned and loaded state
-def load_game():
-    """Loads the game state from 'savegame.json' and returns it."""
-    global special_event_after_unlock
+def set_autosave_triggers(option):
+    """Sets AUTOSAVE_TRIGGERS from a comma-separated list, or 'off'. Returns False (changing nothing) for an unknown trigger."""
+    global AUTOSAVE_TRIGGERS
+    triggers = () if option == 'off' else tuple(name.strip() for name in option.split(",") if name.strip())
+    if any(name not in AUTOSAVE_TRIGGER_NAMES for name in triggers):
+        return False
+    AUTOSAVE_TRIGGERS = triggers
+    return True
+
+def enable_autosave(session):
+    """Starts autosaving a session on the AUTOSAVE_TRIGGERS, if any are set."""
+    if AUTOSAVE_TRIGGERS:
+        session.autosave = {'due': False, 'rooms_at': session.rooms_travelled, 'saved_at': time.monotonic(), 'job': None}
+
+def request_autosave(session, trigger):
+    """Marks an autosave as due if `trigger` is one of the AUTOSAVE_TRIGGERS. It is taken at the next command prompt."""
+    if session.autosave is not None and trigger in AUTOSAVE_TRIGGERS:
+        session.autosave['due'] = True
+
+def autosave_if_due(session):
+    """
+    Called at the command prompt. Takes an autosave if a trigger has fired, at most
+    one per AUTOSAVE_MIN_GAP and only once the last one is written, so a burst of
+    triggers makes a single save. The writing happens on the save writer's thread.
+    """
+    autosave = session.autosave
+    if autosave is None:
+        return
+    last_job = autosave['job']
+    if last_job is not None and last_job['done'].is_set():
+        if last_job['error'] is not None:
+            print(f"Warning: Autosave failed: {last_job['error']}")
+        autosave['job'] = None
+    now = time.monotonic()
+    if 'rooms' in AUTOSAVE_TRIGGERS and abs(session.rooms_travelled - autosave['rooms_at']) >= AUTOSAVE_EVERY_ROOMS:
+        autosave['due'] = True
+    if 'time' in AUTOSAVE_TRIGGERS and now - autosave['saved_at'] >= AUTOSAVE_INTERVAL:
+        autosave['due'] = True
+    if not autosave['due'] or now - autosave['saved_at'] < AUTOSAVE_MIN_GAP or not save_writer.idle():
+        return
+    autosave.update(due=False, rooms_at=session.rooms_travelled, saved_at=now, job=save_writer.submit(take_save(session)))
+    if DEBUG: # Wrapped debug calls
+        debug.debug_print(f"Autosave taken at room {session.rooms_travelled}.")
+
+def read_save_state(slot):
+    """
+    Reads a slot's save. Returns the game state, with its room history as
+    SavedRooms, and the number of journal entries replayed on top of its base
+    (None if the journal stops at a damaged entry: anything appended after it
+    would never be read, so the next save has to write a fresh base).
+    """
+    if STORAGE_BACKEND == 'sqlite':
+        return read_save_rows(slot), 0
+    return read_save_files(slot)
+
+def read_save_files(slot):
+    """read_save_state() for the 'files' backend. Reads a slot's save file and replays the journal entries saved after it."""
+    save_file, journal_file = save_slot_files(slot)
+    if slot == SINGLE_SAVE_SLOT and not os.path.exists(save_file):
+        save_file, journal_file = SINGLE_SAVE_FILE, SINGLE_SAVE_JOURNAL_FILE # Saved before slots
     try:
-        with open('savegame.json', 'r') as f:
+        with open(save_file, 'rb') as f:
+            game_state = decode_save_state(f.read())
+    except FileNotFoundError:
+        if slot != SINGLE_SAVE_SLOT:
+            raise
+        with open(LEGACY_SAVE_FILE, 'r') as f: # Saved before the binary format
             game_state = json.load(f)
+    try:
+        with open(journal_file, 'r') as f:
+            journal_lines = f.readlines()
+    except FileNotFoundError:
+        journal_lines = []
+    room_history_data = game_state.setdefault('room_history_data', [])
+    direction_history = game_state.setdefault('direction_history', [])
+    journal_records = len(journal_lines)
+    for number, line in enumerate(journal_lines, 1):
+        if not save_journal_line_intact(line):
+            if number < len(journal_lines): # Not just the last save cut short by a crash
+                print(f"Warning: Entry {number} of {len(journal_lines)} in the save's journal is corrupted; loading the save as it was before it. Your next save rewrites it in full.")
+            journal_records = None
+            break # Everything before it stands
+        record = json.loads(line if line.startswith("{") else line.partition(" ")[2])
+        if record.get('save_id') != game_state.get('save_id'):
+            continue # Left over from an older base
+        game_state.update(record['fields'])
+        room_history_data[record['history_from']:] = record['rooms']
+        direction_history[record['history_from']:] = record['directions']
+        game_state['current_room'] = record['current_room']
+    run_seed = game_state.get('run_seed')
+    game_state['room_history_data'] = [room if isinstance(room, SavedRoom) else SavedRoom(room, run_seed=run_seed) for room in room_history_data]
+    if 'current_room' in game_state:
+        game_state['current_room'] = expand_room_record(game_state['current_room'], run_seed)
+    return game_state, journal_records
+
+# MODIFIED: Added equipped_cloak to returned and loaded state
+def load_game(slot=SINGLE_SAVE_SLOT):
+    """Loads a save slot (base file and journal) and returns it as a GameSession (None if there is no usable save)."""
+    try:
+        game_state, journal_records = read_save_state(slot)
 
-        special_event_after_unlock = game_state.get('special_event_after_unlock')
-
-        loaded_room = Room(game_state.get('player_level', 1), game_state.get('player_quests', {}), load_from_save=True)
-        loaded_room.description = game_state['current_room']['description']
-        loaded_room.exits = {direction: True for direction in game_state['current_room']['exits']}
-        loaded_room.locked_exits = game_state['current_room']['locked_exits']
-        loaded_room.item = game_state['current_room'].get('item') # Load the item on the floor
-        loaded_room.npc = game_state['current_room'].get('npc')
-        loaded_room.hazard = game_state['current_room'].get('hazard')
-        loaded_room.monster = game_state['current_room'].get('monster')
-        loaded_room.puzzle = game_state['current_room'].get('puzzle')
-        loaded_room.shrine = game_state['current_room'].get('shrine')
-        loaded_room.winning_item_just_spawned = game_state['current_room'].get('winning_item_just_spawned', False) # Load flag
-        loaded_room.boss_monster_spawned = game_state['current_room'].get('boss_monster_spawned', False) # Load flag
-        loaded_room.awaiting_winning_item_pickup = game_state['current_room'].get('awaiting_winning_item_pickup', False) # Load flag
-        loaded_room.is_inn = game_state['current_room'].get('is_inn', False)
-
-        room_history_loaded = []
-        player_level_for_room_load = game_state.get('player_level', 1)
-        for room_data in game_state.get('room_history_data', []):
-            room = Room(player_level_for_room_load, player_quests={}, load_from_save=True)
-            room.description = room_data['description']
-            room.exits = {direction: True for direction in room_data['exits']}
-            room.locked_exits = room_data['locked_exits']
-            room.item = room_data.get('item')
-            room.npc = room_data.get('npc')
-            room.hazard = room_data.get('hazard')
-            room.monster = room_data.get('monster')
-            room.puzzle = room_data.get('puzzle')
-            room.shrine = room_data.get('shrine')
-            room.winning_item_just_spawned = room_data.get('winning_item_just_spawned', False)
-            room.boss_monster_spawned = room_data.get('boss_monster_spawned', False)
-            room.awaiting_winning_item_pickup = room_data.get('awaiting_winning_item_pickup', False)
-            room.is_inn = room_data.get('is_inn', False)
-            room_history_loaded.append(room)
+        loaded_room = room_from_save_data(game_state['current_room'])
+        room_history_loaded = game_state.get('room_history_data', []) # Left as SavedRooms until they're entered again
 
         direction_history_loaded = game_state.get('direction_history', [])
 
@@ -2170,79 +3522,848 @@ def load_game():
             equipped_cloak_loaded = equipped_cloak_from_save
 
 
-        # Deepcopy inventory and keychain to prevent reference issues from save file
-        player_inventory_loaded = [copy.deepcopy(item) for item in game_state['player_inventory']]
-        player_keychain_loaded = [copy.deepcopy(key) for key in game_state.get('player_keychain', [])]
-
-
-        return game_state['player_hp'], game_state.get('max_hp', 100), player_inventory_loaded, loaded_room, \
-               game_state['current_max_inventory_slots'], game_state['player_gold'], \
-               player_shield_value_loaded, equipped_armor_value_loaded, equipped_cloak_loaded, \
-               game_state.get('player_attack_power', BASE_PLAYER_ATTACK_POWER), \
-               game_state.get('player_attack_bonus', 0), \
-               game_state.get('player_attack_variance', BASE_PLAYER_ATTACK_VARIANCE), \
-               game_state.get('player_crit_chance', BASE_PLAYER_CRIT_CHANCE), \
-               game_state.get('player_crit_multiplier', BASE_PLAYER_CRIT_MULTIPLIER), \
-               equipped_weapon_from_save, \
-               game_state.get('player_xp', 0), \
-               game_state.get('player_level', 1), \
-               game_state.get('xp_to_next_level', calculate_xp_for_next_level(game_state.get('player_level', 1))), \
-               game_state.get('player_quests', {}), \
-               game_state.get('player_reputation', {}), \
-               game_state.get('player_name', 'Adventurer'), \
-               game_state.get('rooms_travelled', 0), \
-               player_keychain_loaded, \
-               game_state.get('equipped_misc_items', []), \
-               game_state.get('player_effects', []), \
-               room_history_loaded, direction_history_loaded, \
-               game_state.get('stash', []), \
-               game_state.get('player_class', None), \
-                game_state.get('player_skill_points', 0), \
-                game_state.get('player_unlocked_skills', []), \
-                game_state.get('equipped_helmet', None), \
-                game_state.get('has_hideout_key', False)
+        # The save was decoded into fresh objects, so nothing here is shared with the game data
+        player_inventory_loaded = game_state['player_inventory']
+        player_keychain_loaded = game_state.get('player_keychain', [])
+
+
+        session = GameSession(game_state.get('player_name', 'Adventurer'), game_state.get('player_class', None), game_state.get('max_hp', 100))
+        session.player_hp = game_state['player_hp']
+        session.player_inventory = player_inventory_loaded
+        session.current_room = loaded_room
+        session.current_max_inventory_slots = game_state['current_max_inventory_slots']
+        session.player_gold = game_state['player_gold']
+        session.player_shield_value = player_shield_value_loaded
+        session.equipped_armor_value = equipped_armor_value_loaded
+        session.equipped_cloak = equipped_cloak_loaded
+        session.player_attack_power = game_state.get('player_attack_power', BASE_PLAYER_ATTACK_POWER)
+        session.player_attack_bonus = game_state.get('player_attack_bonus', 0)
+        session.player_attack_variance = game_state.get('player_attack_variance', BASE_PLAYER_ATTACK_VARIANCE)
+        session.player_crit_chance = game_state.get('player_crit_chance', BASE_PLAYER_CRIT_CHANCE)
+        session.player_crit_multiplier = game_state.get('player_crit_multiplier', BASE_PLAYER_CRIT_MULTIPLIER)
+        session.equipped_weapon = equipped_weapon_from_save
+        session.player_xp = game_state.get('player_xp', 0)
+        session.player_level = game_state.get('player_level', 1)
+        session.xp_to_next_level = game_state.get('xp_to_next_level', calculate_xp_for_next_level(session.player_level))
+        session.player_quests = game_state.get('player_quests', {})
+        session.player_reputation = game_state.get('player_reputation', {})
+        session.rooms_travelled = game_state.get('rooms_travelled', 0)
+        session.player_keychain = player_keychain_loaded
+        session.equipped_misc_items = game_state.get('equipped_misc_items', [])
+        session.player_effects = EffectSchedule(game_state.get('player_effects', []))
+        session.room_history = room_history_loaded
+        session.direction_history = direction_history_loaded
+        session.stash = game_state.get('stash', [])
+        session.player_skill_points = game_state.get('player_skill_points', 0)
+        session.player_unlocked_skills = game_state.get('player_unlocked_skills', [])
+        session.equipped_helmet = game_state.get('equipped_helmet', None)
+        session.has_hideout_key = game_state.get('has_hideout_key', False)
+        session.special_event_after_unlock = game_state.get('special_event_after_unlock')
+        session.run_seed = game_state.get('run_seed')
+        session.rooms_generated = game_state.get('rooms_generated', 0)
+        session.save_slot = slot
+        if game_state.get('save_id'):
+            start_save_journal(session, game_state['save_id'], journal_records or 0)
+            if journal_records is None:
+                session.save_journal['failed'] = True # Saves appended after a damaged entry would never load
+        return session
 
     except FileNotFoundError:
         print("\nNo saved game found. Starting a new adventure.")
-        # MODIFIED: Added None for equipped_cloak and player_attack_bonus in return tuple
-        return None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None
-    except json.JSONDecodeError:
-        print("\nError: Corrupted save file. Starting a new adventure.")
-        # MODIFIED: Added None for equipped_cloak and player_attack_bonus in return tuple
-        return None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None, None
+        return None
+    except ValueError as e: # Includes json.JSONDecodeError and saves failing their checksums
+        print(f"\nError: Corrupted save file ({e}). Starting a new adventure.")
+        return None
+    except (KeyError, TypeError, AttributeError) as e: # Reads fine, but isn't shaped like a save (e.g. edited by hand)
+        print(f"\nError: Corrupted save file ({type(e).__name__}: {e}). Starting a new adventure.")
+        return None
+    except STORAGE_ERRORS as e:
+        print(f"\nError: Could not read the save database ({e}). Starting a new adventure.")
+        return None
+
+def export_save_json(path=LEGACY_SAVE_FILE, slot=SINGLE_SAVE_SLOT):
+    """Writes a slot's save (with its journal applied) as a plain JSON save."""
+    game_state, _ = read_save_state(slot)
+    game_state['room_history_data'] = [room.saved_data() for room in game_state['room_history_data']]
+    with open(path, 'w') as f:
+        json.dump(game_state, f, indent=4)
+
+def import_save_json(path=LEGACY_SAVE_FILE, slot=None):
+    """Makes a JSON save a save slot in the binary format (by default the slot named after its player). Returns the slot."""
+    with open(path, 'r') as f:
+        game_state = json.load(f)
+    slot = file_safe_name(slot or game_state.get('player_name', 'Adventurer'))
+    game_state['save_id'] = os.urandom(8).hex()
+    summary = dict({key: game_state.get(key) for key in SAVE_INDEX_FIELDS}, saved_at=time.time())
+    if STORAGE_BACKEND == 'sqlite':
+        write_save_job_rows({'kind': 'base', 'data': game_state, 'slot': slot, 'summary': summary})
+    else:
+        write_save_state(game_state, slot)
+        update_save_index(slot, summary)
+    return slot
+
+def verify_save_file(save_file, journal_file=None):
+    """
+    Checks a binary save (and its journal) for corruption from the checksums alone,
+    without decoding anything. Returns the save's format version and a dict of what
+    is wrong, by section ('journal' for the journal). Formats before 3 have no
+    checksums, so only their journals are checked.
+    """
+    with open(save_file, 'rb') as f:
+        view = memoryview(f.read())
+    if len(view) < len(SAVE_MAGIC) + 2 or view[:len(SAVE_MAGIC)] != SAVE_MAGIC:
+        return None, {'file': "isn't an Infinite Dungeon save"}
+    version = view[len(SAVE_MAGIC)]
+    if version > SAVE_FORMAT_VERSION:
+        return version, {'file': f"is format {version}, newer than this game understands"}
+    problems = check_save_sections(view)[1] if version >= 3 else {}
+    try:
+        with open(journal_file or os.devnull, 'r') as f:
+            journal_lines = f.readlines()
+    except FileNotFoundError:
+        journal_lines = []
+    damaged = [number for number, line in enumerate(journal_lines, 1) if not save_journal_line_intact(line)]
+    if damaged and damaged != [len(journal_lines)]: # A torn last entry is just a save cut short by a crash
+        problems['journal'] = f"entries {', '.join(map(str, damaged))} of {len(journal_lines)} fail their checksums"
+    return version, problems
+
+def verify_saves(path=None):
+    """
+    Checks every save in a directory (by default every save slot, and the save
+    from before slots), or a single save file, printing a line for each. Returns
+    how many are corrupted.
+    """
+    if path is None and STORAGE_BACKEND == 'sqlite':
+        results = [(name, None, problems) for name, problems in verify_save_rows()]
+    else:
+        if path is None:
+            save_files = [os.path.join(SAVE_DIR, name) for name in sorted(os.listdir(SAVE_DIR)) if name.endswith(".sav")] if os.path.isdir(SAVE_DIR) else []
+            save_files += [SINGLE_SAVE_FILE] if os.path.exists(SINGLE_SAVE_FILE) else []
+        elif os.path.isdir(path):
+            save_files = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".sav")]
+        else:
+            save_files = [path]
+        results = []
+        for save_file in save_files:
+            try:
+                version, problems = verify_save_file(save_file, os.path.splitext(save_file)[0] + ".journal")
+            except IOError as e:
+                version, problems = None, {'file': f"can't be read ({e.strerror or e})"}
+            results.append((save_file, version, problems))
+    corrupted = 0
+    for name, version, problems in results:
+        if problems:
+            corrupted += 1
+            print(f"{name}: CORRUPTED (" + "; ".join(f"{section} {problem}" for section, problem in problems.items()) + ")")
+        elif version is not None and version < 3:
+            print(f"{name}: ok (format {version}, no checksums)")
+        else:
+            print(f"{name}: ok")
+    print(f"Checked {len(results)} saves: {corrupted} corrupted.")
+    return corrupted
+
+
+# --- SQLite Storage ---
+# The 'sqlite' backend's tables: sessions (a row per save slot, with the player and the current
+# room), rooms (a slot's room history, a row per room, so a save only rewrites the rooms from where
+# the player last walked back to), meta and meta_upgrades (meta-progression), and scores and
+# score_counts (the Daily Challenge leaderboard; see LEADERBOARD_TOP_K). All the SQL here takes its values as ? parameters, so sqlite3 prepares
+# each statement once per connection and reuses it.
+STORAGE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS sessions (slot TEXT PRIMARY KEY, save_id TEXT NOT NULL, player_name TEXT, player_class TEXT,"
+    " player_level INTEGER, rooms_travelled INTEGER, run_seed, saved_at REAL, state TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS sessions_by_saved_at ON sessions (saved_at)",
+    "CREATE TABLE IF NOT EXISTS rooms (slot TEXT NOT NULL, position INTEGER NOT NULL, direction TEXT, record TEXT,"
+    " PRIMARY KEY (slot, position)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS meta_upgrades (name TEXT PRIMARY KEY, level INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS scores (id INTEGER PRIMARY KEY, day TEXT NOT NULL, name TEXT NOT NULL, score INTEGER NOT NULL, recorded_at REAL)",
+    "CREATE INDEX IF NOT EXISTS scores_by_day ON scores (day, score DESC)",
+    "CREATE TABLE IF NOT EXISTS score_counts (day TEXT NOT NULL, score INTEGER NOT NULL, count INTEGER NOT NULL,"
+    " PRIMARY KEY (day, score)) WITHOUT ROWID",
+)
+STORAGE_ERRORS = (sqlite3.Error,) if sqlite3 else ()
+storage_threads = threading.local() # A connection per thread; sqlite3 connections can't be shared between them
+
+def set_storage_backend(name):
+    """Sets STORAGE_BACKEND. Returns False (changing nothing) for an unknown backend, or for 'sqlite' without the sqlite3 module."""
+    global STORAGE_BACKEND
+    if name not in STORAGE_BACKENDS or (name == 'sqlite' and sqlite3 is None):
+        return False
+    STORAGE_BACKEND = name
+    return True
+
+def storage_db():
+    """Returns this thread's connection to the storage database, creating the database on first use."""
+    db = getattr(storage_threads, 'db', None)
+    if db is None:
+        db = sqlite3.connect(STORAGE_DB_FILE, timeout=STORAGE_BUSY_TIMEOUT, isolation_level=None) # Transactions are begun explicitly below
+        db.execute("PRAGMA journal_mode=WAL") # Readers don't wait for writers, and commits append instead of rewriting pages
+        if db.execute("PRAGMA user_version").fetchone()[0] < STORAGE_SCHEMA_VERSION:
+            create_storage(db)
+        storage_threads.db = db
+    return db
+
+def create_storage(db):
+    """
+    Creates the tables and copies in what the JSON files and save slots hold, or
+    brings a database from an older version of the game up to date. Only the
+    first process to get here does it.
+    """
+    with db:
+        db.execute("BEGIN IMMEDIATE")
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        if version >= STORAGE_SCHEMA_VERSION:
+            return # Another process beat us to it
+        for statement in STORAGE_SCHEMA:
+            db.execute(statement)
+        if version:
+            if version < 2: # Scores from before score_counts
+                db.execute("INSERT INTO score_counts (day, score, count) SELECT day, score, COUNT(*) FROM scores GROUP BY day, score")
+            db.execute(f"PRAGMA user_version = {STORAGE_SCHEMA_VERSION}")
+            return
+        write_meta_rows(db, read_meta_progress_file())
+        for day in list_leaderboard_days():
+            partition = read_leaderboard_partition(day)
+            db.executemany("INSERT INTO scores (day, name, score) VALUES (?, ?, ?)", [(day, entry['name'], entry['score']) for entry in partition.top])
+            db.executemany("INSERT INTO score_counts (day, score, count) VALUES (?, ?, ?)", [(day, score, count) for score, count in partition.counts.items()])
+        for slot, summary in list_save_slot_files():
+            try:
+                game_state, _ = read_save_files(slot)
+            except (IOError, ValueError):
+                continue
+            game_state.setdefault('save_id', os.urandom(8).hex())
+            write_save_rows(db, game_state, slot, summary or dict({key: game_state.get(key) for key in SAVE_INDEX_FIELDS}, saved_at=time.time()))
+        db.execute(f"PRAGMA user_version = {STORAGE_SCHEMA_VERSION}")
+
+def _read_room_row(record):
+    """A SavedRoom's read_value for a room read from the rooms table: its position is the row's JSON."""
+    return json.loads(record), None
+
+def room_row(room):
+    """Returns the rooms table's record for a room of a game state's history."""
+    if isinstance(room, SavedRoom):
+        if room.read_value is _read_room_row:
+            return room.position # Never decoded since it was read, so it goes back as it came
+        room = room.record()
+    return json.dumps(room, separators=(',', ':'))
+
+def write_session_row(db, state, slot, summary):
+    db.execute(
+        f"INSERT OR REPLACE INTO sessions (slot, save_id, {', '.join(SAVE_INDEX_FIELDS)}, saved_at, state) VALUES (?, ?, {'?, ' * len(SAVE_INDEX_FIELDS)}?, ?)",
+        (slot, state['save_id'], *(summary.get(key) for key in SAVE_INDEX_FIELDS), summary.get('saved_at'), json.dumps(state, separators=(',', ':'))))
+
+def write_save_rows(db, game_state, slot, summary):
+    """Replaces a slot's rows with a whole game state (see take_save_base). Runs in the caller's transaction."""
+    state = {key: value for key, value in game_state.items() if key not in ('room_history_data', 'direction_history')}
+    rooms = game_state.get('room_history_data', [])
+    directions = game_state.get('direction_history', [])
+    db.execute("DELETE FROM rooms WHERE slot = ?", (slot,))
+    write_session_row(db, state, slot, summary)
+    db.executemany("INSERT INTO rooms (slot, position, direction, record) VALUES (?, ?, ?, ?)", (
+        (slot, position, directions[position] if position < len(directions) else None, room_row(rooms[position]) if position < len(rooms) else None)
+        for position in range(max(len(rooms), len(directions)))))
+
+def write_save_record_rows(db, record, slot, summary):
+    """Applies a journal entry (see take_save_journal_record) to a slot's rows. Runs in the caller's transaction."""
+    row = db.execute("SELECT state FROM sessions WHERE slot = ? AND save_id = ?", (slot, record['save_id'])).fetchone()
+    if row is None:
+        raise ValueError(f"save slot '{slot}' was replaced by another save")
+    state = json.loads(row[0])
+    state.update(record['fields'])
+    state['current_room'] = record['current_room']
+    write_session_row(db, state, slot, summary)
+    history_from = record['history_from']
+    db.execute("DELETE FROM rooms WHERE slot = ? AND position >= ?", (slot, history_from))
+    db.executemany("INSERT INTO rooms (slot, position, direction, record) VALUES (?, ?, ?, ?)", (
+        (slot, history_from + offset, direction, room_row(room))
+        for offset, (direction, room) in enumerate(zip(record['directions'], record['rooms']))))
+
+def write_save_job_rows(job):
+    """Writes a save writer job in one transaction, so no other process ever reads half a save."""
+    db = storage_db()
+    with db:
+        db.execute("BEGIN IMMEDIATE")
+        if job['kind'] == 'base':
+            write_save_rows(db, job['data'], job['slot'], job['summary'])
+        else:
+            write_save_record_rows(db, job['data'], job['slot'], job['summary'])
+
+def read_save_rows(slot):
+    """read_save_state() for the 'sqlite' backend. Rooms are read as their JSON and decoded when they're needed."""
+    db = storage_db()
+    with db:
+        db.execute("BEGIN") # The session and its rooms as of one moment, even if another process is saving the slot
+        row = db.execute("SELECT state FROM sessions WHERE slot = ?", (slot,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"no save in slot '{slot}'")
+        rooms = db.execute("SELECT direction, record FROM rooms WHERE slot = ? ORDER BY position", (slot,)).fetchall()
+    game_state = json.loads(row[0])
+    run_seed = game_state.get('run_seed')
+    game_state['direction_history'] = [direction for direction, _ in rooms if direction is not None]
+    game_state['room_history_data'] = [SavedRoom(read_value=_read_room_row, position=record, run_seed=run_seed) for _, record in rooms if record is not None]
+    if 'current_room' in game_state:
+        game_state['current_room'] = expand_room_record(game_state['current_room'], run_seed)
+    return game_state
+
+def stored_save_id(slot):
+    """Returns the save_id of the save in a slot of the database, or None."""
+    row = storage_db().execute("SELECT save_id FROM sessions WHERE slot = ?", (slot,)).fetchone()
+    return row[0] if row else None
+
+def list_save_slot_rows():
+    """list_save_slots() for the 'sqlite' backend."""
+    rows = storage_db().execute(f"SELECT slot, {', '.join(SAVE_INDEX_FIELDS)}, saved_at FROM sessions ORDER BY saved_at DESC")
+    return [(row[0], dict(zip(SAVE_INDEX_FIELDS + ('saved_at',), row[1:]))) for row in rows]
+
+def read_meta_rows(db):
+    meta_progress = default_meta_progress()
+    for name, value in db.execute("SELECT name, value FROM meta"):
+        meta_progress[name] = value
+    for name, level in db.execute("SELECT name, level FROM meta_upgrades"):
+        meta_progress['upgrades'][name] = level
+    return meta_progress
+
+def write_meta_rows(db, meta_progress):
+    db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('soul_shards', ?)", (meta_progress['soul_shards'],))
+    db.executemany("INSERT OR REPLACE INTO meta_upgrades (name, level) VALUES (?, ?)", meta_progress['upgrades'].items())
+
+def verify_save_rows():
+    """
+    The 'sqlite' backend's side of verify_saves(): SQLite's own quick check of the
+    database, then whether each slot's rows are whole JSON. Returns (name, problems) pairs.
+    """
+    db = storage_db()
+    results = []
+    check = [row[0] for row in db.execute("PRAGMA quick_check")]
+    if check != ['ok']:
+        results.append((STORAGE_DB_FILE, {'database': "fails SQLite's quick check: " + "; ".join(check)}))
+    for slot, state_valid, invalid_rooms in db.execute(
+            "SELECT slot, json_valid(state), (SELECT COUNT(*) FROM rooms WHERE rooms.slot = sessions.slot AND NOT json_valid(record)) FROM sessions ORDER BY slot"):
+        problems = {}
+        if not state_valid:
+            problems['session'] = "row isn't valid JSON"
+        if invalid_rooms:
+            problems['world'] = f"has {invalid_rooms} room rows that aren't valid JSON"
+        results.append((slot, problems))
+    return results
+
+def export_storage_json():
+    """Writes the database's meta-progression and leaderboard out as the JSON files the 'files' backend uses."""
+    db = storage_db()
+    leaderboard = {}
+    for day, name, score in db.execute("SELECT day, name, score FROM scores ORDER BY day, score DESC, id"):
+        leaderboard.setdefault(day, []).append({"name": name, "score": score})
+    with open(META_PROGRESS_FILE, 'w') as f:
+        json.dump(read_meta_rows(db), f, indent=4)
+    with open(LEADERBOARD_FILE, 'w') as f:
+        json.dump(leaderboard, f, indent=4)
+
+
+# --- Suspend/Resume Functions ---
+def snapshot_session(session):
+    """
+    Packs a running session (player, world, effects, quest progress, any pending
+    special event and the RNG state) into a compact binary blob. Rooms and the
+    effect schedule are stored as plain data, so any process running the game can
+    restore it, whether it was started as a script or imported by the server.
+    """
+    state = {name: getattr(session, name) for name in GameSession.__slots__ if name not in ('sound_manager', 'command_queue', 'save_journal', 'autosave', 'checkpoints')}
+    state['current_room'] = vars(session.current_room)
+    state['room_history'] = [(True, room.record()) if isinstance(room, SavedRoom) else (False, vars(room)) for room in session.room_history]
+    state['player_effects'] = vars(session.player_effects)
+    payload = (SNAPSHOT_VERSION, state, random.getstate())
+    return zlib.compress(pickle.dumps(payload, pickle.HIGHEST_PROTOCOL), SNAPSHOT_COMPRESSION)
+
+def _restore_instance(cls, attributes):
+    instance = cls.__new__(cls)
+    instance.__dict__.update(attributes)
+    return instance
+
+def restore_session(blob):
+    """
+    Rebuilds a session from snapshot_session() and puts the RNG back where it was,
+    so the run carries on exactly as if it had never stopped. Only restore
+    snapshots this game wrote.
+    """
+    version, state, rng_state = pickle.loads(zlib.decompress(blob))
+    if version not in (1, SNAPSHOT_VERSION):
+        raise ValueError(f"unsupported snapshot version {version}")
+    if version == 1:
+        state['room_history'] = [(True, room.record()) if isinstance(room, SavedRoom) else (False, room) for room in state['room_history']]
+    session = GameSession()
+    for name, value in state.items():
+        setattr(session, name, value)
+    session.current_room = _restore_instance(Room, state['current_room'])
+    session.room_history = [SavedRoom(room, run_seed=session.run_seed) if is_saved else _restore_instance(Room, room) for is_saved, room in state['room_history']]
+    session.player_effects = _restore_instance(EffectSchedule, state['player_effects'])
+    random.setstate(rng_state)
+    return session
+
+def suspended_session_path(player_name, resume_code=None):
+    code = f".{file_safe_name(resume_code)}" if resume_code else ""
+    return os.path.join(SUSPEND_DIR, file_safe_name(player_name) + code + ".snap")
+
+def park_session(session):
+    """Writes a session's snapshot to the suspend directory under the player's name (and resume code, if it has one). Returns the file path."""
+    os.makedirs(SUSPEND_DIR, exist_ok=True)
+    path = suspended_session_path(session.player_name, session.resume_code)
+    write_file_atomically(path, snapshot_session(session)) # Never leaves a half-written snapshot behind
+    return path
+
+def unpark_session(player_name, resume_code=None):
+    """Restores a parked session and removes its snapshot. Returns None if there is no usable one under that name (and code)."""
+    path = suspended_session_path(player_name, resume_code)
+    claimed_path = f"{path}.{os.getpid()}.{threading.get_ident()}.claimed"
+    try:
+        os.rename(path, claimed_path) # Claim it first, so two players can't both resume the same run
+    except FileNotFoundError:
+        return None
+    try:
+        with open(claimed_path, 'rb') as f:
+            session = restore_session(f.read())
+    except Exception as e: # Unpickling can fail with almost any error; none of them should cost the player their run
+        print(f"\nError: Could not resume the suspended run ({type(e).__name__}: {e}). It has been left where it was.")
+        if not os.path.exists(path): # Unless the same name has parked a new run since
+            os.rename(claimed_path, path)
+        return None
+    os.remove(claimed_path)
+    return session
+
+def list_suspended_sessions():
+    """Returns the names parked runs are filed under, as typed to resume them. Runs parked with a resume code are left out."""
+    try:
+        file_names = os.listdir(SUSPEND_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(name[:-len(".snap")] for name in file_names if name.endswith(".snap") and name.count(".") == 1)
+
+# --- Checkpoint Functions ---
+class CheckpointRing:
+    """
+    A session's last few room entries, kept in memory so 'Try Again' can put the
+    player straight back at one of them. Checkpoints share what hasn't changed: a
+    field equal to the previous checkpoint's is that checkpoint's object, and the
+    room and direction histories are chains of (entry, below) links that every
+    later checkpoint builds on, so each costs about its room plus what changed.
+    """
+    def __init__(self, size=None):
+        self.checkpoints = deque(maxlen=CHECKPOINT_RING_SIZE if size is None else size)
+        self.rooms = [] # (room, link) for the bottom of session.room_history, as the chain holds it
+        self.directions = [] # (direction, link) for the bottom of session.direction_history
+        self.rooms_kept = 0 # Entries at the bottom of the histories that no move has taken back out since
+        self.directions_kept = 0
+
+    def __len__(self):
+        return len(self.checkpoints)
+
+    def history_popped(self, session):
+        """Called when a move takes a room back out of the history: it can change again once it is the current room."""
+        self.rooms_kept = min(self.rooms_kept, len(session.room_history))
+        self.directions_kept = min(self.directions_kept, len(session.direction_history))
+
+    def take(self, session):
+        """Checkpoints the session as it enters its current room."""
+        if not self.checkpoints.maxlen:
+            return
+        del self.rooms[self.rooms_kept:], self.directions[self.directions_kept:]
+        link = self.rooms[-1][1] if self.rooms else None
+        for room in session.room_history[len(self.rooms):]:
+            # History rooms don't change until a move takes them back out, so one copy serves every checkpoint above it
+            record = room if isinstance(room, SavedRoom) else _copy_plain(dict(room_save_data(room), regen=getattr(room, 'regen', None)))
+            link = (record, link)
+            self.rooms.append((room, link))
+        directions_link = self.directions[-1][1] if self.directions else None
+        for direction in session.direction_history[len(self.directions):]:
+            directions_link = (direction, directions_link)
+            self.directions.append((direction, directions_link))
+        self.rooms_kept, self.directions_kept = len(self.rooms), len(self.directions)
+
+        previous = self.checkpoints[-1]['fields'] if self.checkpoints else {}
+        fields = session_save_fields(session)
+        for name, value in fields.items():
+            fields[name] = previous[name] if name in previous and _same_value(previous[name], value) else _copy_plain(value)
+        heading = f", heading {session.direction_history[-1]}" if session.direction_history else ""
+        self.checkpoints.append({
+            'label': f"Room #{session.rooms_travelled}{heading}: {session.player_hp}/{session.max_hp} HP, {session.player_gold} gold",
+            'fields': fields,
+            'monsters_defeated_this_run': session.monsters_defeated_this_run,
+            'current_room': _copy_plain(vars(session.current_room)),
+            'rooms': link,
+            'directions': directions_link,
+            'random_state': random.getstate(),
+        })
+
+    def labels(self):
+        """Describes the checkpoints, newest first, in the order restore() numbers them."""
+        return [checkpoint['label'] for checkpoint in reversed(self.checkpoints)]
+
+    def restore(self, session, index=0):
+        """
+        Puts the session back exactly as it was at a checkpoint (0 is the newest) and
+        drops the checkpoints after it. Its room-entry events play out again when
+        game_loop next runs, which checkpoints it afresh.
+        """
+        checkpoint = self.checkpoints[-1 - index]
+        for _ in range(index + 1):
+            self.checkpoints.pop()
+
+        rooms = _unwind_chain(checkpoint['rooms'])
+        shared = 0 # History rooms both the session and the checkpoint still have can stay as they are
+        while shared < min(self.rooms_kept, len(rooms)) and self.rooms[shared][1] is rooms[shared]:
+            shared += 1
+        session.room_history = [room for room, _ in self.rooms[:shared]]
+        for link in rooms[shared:]:
+            session.room_history.append(link[0] if isinstance(link[0], SavedRoom) else SavedRoom(link[0], run_seed=checkpoint['fields']['run_seed']))
+        self.rooms = list(zip(session.room_history, rooms))
+        directions = _unwind_chain(checkpoint['directions'])
+        session.direction_history = [link[0] for link in directions]
+        self.directions = list(zip(session.direction_history, directions))
+        self.rooms_kept, self.directions_kept = len(self.rooms), len(self.directions)
+        if session.save_journal: # The save slot still matches only the rooms the restore kept
+            session.save_journal['rooms_kept'] = min(session.save_journal['rooms_kept'], shared)
+
+        for name, value in checkpoint['fields'].items():
+            setattr(session, name, _copy_plain(value))
+        session.player_effects = EffectSchedule(session.player_effects)
+        session.monsters_defeated_this_run = checkpoint['monsters_defeated_this_run']
+        session.current_room = _restore_instance(Room, _copy_plain(checkpoint['current_room']))
+        session.command_queue.clear()
+        random.setstate(checkpoint['random_state'])
+        log_event(f"Player {session.player_name} went back to a checkpoint: {checkpoint['label']}.")
+        return checkpoint
+
+def _unwind_chain(link):
+    """Returns the links of a checkpoint chain from the bottom up."""
+    links = []
+    while link is not None:
+        links.append(link)
+        link = link[1]
+    links.reverse()
+    return links
 
 
 # --- Meta-Progression Functions ---
-def load_meta_progress():
-    """Loads the meta-progression data from 'metaprogress.json'."""
+def default_meta_progress():
+    return {
+        "soul_shards": 0,
+        "upgrades": {
+            "max_hp": 0
+        }
+    }
+
+def read_meta_progress_file():
+    """Reads the meta-progression data from META_PROGRESS_FILE."""
     try:
-        with open('metaprogress.json', 'r') as f:
+        with open(META_PROGRESS_FILE, 'r') as f:
             meta_progress = json.load(f)
     except (FileNotFoundError, json.JSONDecodeError):
-        meta_progress = {
-            "soul_shards": 0,
-            "upgrades": {
-                "max_hp": 0
-            }
-        }
+        meta_progress = default_meta_progress()
     return meta_progress
 
+def load_meta_progress():
+    """Loads the meta-progression data from 'metaprogress.json' (or the storage database)."""
+    if STORAGE_BACKEND == 'sqlite':
+        try:
+            return read_meta_rows(storage_db())
+        except STORAGE_ERRORS as e:
+            print(f"Error: Could not read meta-progression ({e}).")
+            return default_meta_progress()
+    return read_meta_progress_file()
+
 def save_meta_progress(meta_progress):
-    """Saves the meta-progression data to 'metaprogress.json'."""
+    """Saves the meta-progression data to 'metaprogress.json' (or the storage database)."""
+    try:
+        if STORAGE_BACKEND == 'sqlite':
+            db = storage_db()
+            with db:
+                db.execute("BEGIN IMMEDIATE")
+                write_meta_rows(db, meta_progress)
+        else:
+            with open(META_PROGRESS_FILE, 'w') as f:
+                json.dump(meta_progress, f, indent=4)
+        print("Meta-progression saved.")
+    except (IOError,) + STORAGE_ERRORS:
+        print("Error: Could not save meta-progression. Check file permissions.")
+
+def add_soul_shards(meta_progress, amount):
+    """
+    Adds soul shards to the meta-progression and saves it. With the 'sqlite'
+    backend the addition is made in the database, so shards other processes have
+    added in the meantime are kept, and `meta_progress` is brought up to date.
+    """
+    if STORAGE_BACKEND != 'sqlite':
+        meta_progress['soul_shards'] += amount
+        save_meta_progress(meta_progress)
+        return
     try:
-        with open('metaprogress.json', 'w') as f:
-            json.dump(meta_progress, f, indent=4)
+        db = storage_db()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("INSERT INTO meta (name, value) VALUES ('soul_shards', ?) ON CONFLICT (name) DO UPDATE SET value = value + excluded.value", (amount,))
+            meta_progress.update(read_meta_rows(db))
         print("Meta-progression saved.")
-    except IOError:
+    except STORAGE_ERRORS:
         print("Error: Could not save meta-progression. Check file permissions.")
 
+def meta_upgrade_cost(meta_progress, upgrade):
+    return 50 * (meta_progress['upgrades'].get(upgrade, 0) + 1)
+
+def buy_meta_upgrade(meta_progress, upgrade):
+    """
+    Buys the next level of a meta upgrade with soul shards and saves it. Returns
+    False if there aren't enough shards. With the 'sqlite' backend the balance and
+    price are checked against the database, inside the transaction that spends them.
+    """
+    if STORAGE_BACKEND != 'sqlite':
+        cost = meta_upgrade_cost(meta_progress, upgrade)
+        if meta_progress['soul_shards'] < cost:
+            return False
+        meta_progress['soul_shards'] -= cost
+        meta_progress['upgrades'][upgrade] = meta_progress['upgrades'].get(upgrade, 0) + 1
+        save_meta_progress(meta_progress)
+        return True
+    try:
+        db = storage_db()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            meta_progress.update(read_meta_rows(db))
+            cost = meta_upgrade_cost(meta_progress, upgrade)
+            if meta_progress['soul_shards'] < cost:
+                return False
+            meta_progress['soul_shards'] -= cost
+            meta_progress['upgrades'][upgrade] = meta_progress['upgrades'].get(upgrade, 0) + 1
+            write_meta_rows(db, meta_progress)
+        print("Meta-progression saved.")
+        return True
+    except STORAGE_ERRORS:
+        print("Error: Could not save meta-progression. Check file permissions.")
+        return False
+
+# --- Leaderboard Functions ---
+class LeaderboardPartition:
+    """
+    One day of the Daily Challenge leaderboard for the 'files' backend: its best
+    LEADERBOARD_TOP_K entries, kept in order, and how many runs got each score.
+    """
+    def __init__(self, top=None, counts=None):
+        self.top = top or [] # {"name", "score"}, best first; equal scores in the order they were set
+        self.counts = {int(score): count for score, count in (counts or {}).items()}
+        self.scores = sorted(self.counts) # The distinct scores, lowest first
+        self.total = sum(self.counts.values())
+
+    def add(self, name, score):
+        if score not in self.counts:
+            bisect.insort(self.scores, score)
+        self.counts[score] = self.counts.get(score, 0) + 1
+        self.total += 1
+        if len(self.top) < LEADERBOARD_TOP_K or score > self.top[-1]['score']:
+            bisect.insort_right(self.top, {"name": name, "score": score}, key=lambda entry: -entry['score'])
+            del self.top[LEADERBOARD_TOP_K:]
+
+    def standing(self, score):
+        higher = sum(self.counts[other] for other in self.scores[bisect.bisect_right(self.scores, score):])
+        return daily_standing(higher, self.counts.get(score, 0), self.total)
+
+    def to_dict(self):
+        return {"top": self.top, "counts": {str(score): count for score, count in self.counts.items()}}
+
+def daily_standing(higher, equal, total):
+    """
+    Where a score stands in a day of `total` runs, `higher` of them better and
+    `equal` of them the same: its rank (1 is best; ties share the best rank) and
+    the percentage of the day's runs it beat.
+    """
+    return {'rank': higher + 1, 'total': total, 'percentile': 100 * (total - higher - equal) / total if total else 0.0}
+
+def read_leaderboard_file():
+    """Reads the Daily Challenge leaderboard from LEADERBOARD_FILE: day -> entries, best first."""
+    try:
+        with open(LEADERBOARD_FILE, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def leaderboard_partition_file(day):
+    return os.path.join(LEADERBOARD_DIR, file_safe_name(day) + ".json")
+
+def list_leaderboard_days():
+    """Returns every day the 'files' backend has scores for."""
+    try:
+        days = {file_name[:-len(".json")] for file_name in os.listdir(LEADERBOARD_DIR) if file_name.endswith(".json")}
+    except FileNotFoundError:
+        days = set()
+    return sorted(days | set(read_leaderboard_file()))
+
+def read_leaderboard_partition(day):
+    """Reads one day of the 'files' backend's leaderboard, from LEADERBOARD_FILE if the day is from before partitions."""
+    try:
+        with open(leaderboard_partition_file(day), 'r') as f:
+            data = json.load(f)
+        return LeaderboardPartition(data['top'], data['counts'])
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        partition = LeaderboardPartition()
+        for entry in read_leaderboard_file().get(day, []):
+            partition.add(entry['name'], entry['score'])
+        return partition
+
+def record_daily_score(day, name, score):
+    """Adds a Daily Challenge score to its day and returns where it stands (see daily_standing), or None if the leaderboard is unavailable."""
+    if STORAGE_BACKEND == 'sqlite':
+        try:
+            db = storage_db()
+            with db:
+                db.execute("BEGIN IMMEDIATE")
+                db.execute("INSERT INTO scores (day, name, score, recorded_at) VALUES (?, ?, ?, ?)", (day, name, score, time.time()))
+                db.execute("INSERT INTO score_counts (day, score, count) VALUES (?, ?, 1) ON CONFLICT (day, score) DO UPDATE SET count = count + 1", (day, score))
+                if not LEADERBOARD_ARCHIVE: # Drop whoever fell out of the top K; the counts still remember their score
+                    db.execute("DELETE FROM scores WHERE id IN (SELECT id FROM scores WHERE day = ? ORDER BY score DESC, id LIMIT -1 OFFSET ?)", (day, LEADERBOARD_TOP_K))
+                return daily_score_standing(day, score)
+        except STORAGE_ERRORS:
+            print("Error: Could not record your score; the leaderboard is unavailable right now.")
+            return None
+
+    partition = read_leaderboard_partition(day)
+    partition.add(name, score)
+    os.makedirs(LEADERBOARD_DIR, exist_ok=True)
+    write_file_atomically(leaderboard_partition_file(day), json.dumps(partition.to_dict()).encode('utf-8'))
+    if LEADERBOARD_ARCHIVE:
+        with open(leaderboard_partition_file(day) + "l", 'a') as f:
+            f.write(json.dumps({"name": name, "score": score, "recorded_at": time.time()}) + "\n")
+    return partition.standing(score)
+
+def daily_score_standing(day, score):
+    """Returns where a score would stand among a day's Daily Challenge runs (see daily_standing), or None if the leaderboard is unavailable."""
+    if STORAGE_BACKEND == 'sqlite':
+        try:
+            higher, equal, total = storage_db().execute(
+                "SELECT COALESCE(SUM(CASE WHEN score > ? THEN count END), 0), COALESCE(SUM(CASE WHEN score = ? THEN count END), 0),"
+                " COALESCE(SUM(count), 0) FROM score_counts WHERE day = ?", (score, score, day)).fetchone()
+        except STORAGE_ERRORS:
+            return None
+        return daily_standing(higher, equal, total)
+    return read_leaderboard_partition(day).standing(score)
+
+def daily_leaderboard_page(day, page):
+    """
+    Returns one page (LEADERBOARD_PAGE_SIZE entries, from page 0) of a day's
+    leaderboard, and whether there is another after it. The entries are None if
+    the leaderboard is unavailable.
+    """
+    start = page * LEADERBOARD_PAGE_SIZE
+    if STORAGE_BACKEND == 'sqlite':
+        try:
+            rows = storage_db().execute("SELECT name, score FROM scores WHERE day = ? ORDER BY score DESC, id LIMIT ? OFFSET ?",
+                                        (day, LEADERBOARD_PAGE_SIZE + 1, start)).fetchall()
+        except STORAGE_ERRORS:
+            return None, False
+        entries = [{"name": name, "score": score} for name, score in rows]
+    else:
+        entries = read_leaderboard_partition(day).top[start:start + LEADERBOARD_PAGE_SIZE + 1]
+    return entries[:LEADERBOARD_PAGE_SIZE], len(entries) > LEADERBOARD_PAGE_SIZE
+
+def show_daily_leaderboard(day, standing=None):
+    """Prints a day's leaderboard a page at a time, and where the player's run stands in it."""
+    print("\n--- Daily Challenge Leaderboard ---")
+    page = 0
+    while True:
+        entries, more = daily_leaderboard_page(day, page)
+        if entries is None:
+            print("The leaderboard is unavailable right now.")
+            input("\nPress Enter to continue...")
+            return
+        for i, entry in enumerate(entries, page * LEADERBOARD_PAGE_SIZE + 1):
+            print(f"{i}. {entry['name']} - {entry['score']}")
+        if standing and page == 0:
+            print(f"Your run placed #{standing['rank']} of {standing['total']}" + (f", better than {standing['percentile']:.0f}% of today's runs." if standing['total'] > 1 else "."))
+        if not more:
+            input("\nPress Enter to continue...")
+            return
+        if input("\nPress Enter to continue, or 'n' for the next page: ").strip().lower() != 'n':
+            return
+        page += 1
 
 # --- Classes ---
 
+class GameSession:
+    """
+    Everything one run of the game needs: the player, what they have equipped,
+    the dungeon they are in, and the services (sound, command queue) they use.
+    Game functions take the session and update it in place instead of passing
+    the state around as long parameter lists and return tuples.
+    """
+    __slots__ = (
+        # Player
+        'player_name', 'player_class', 'player_hp', 'max_hp', 'player_xp', 'player_level', 'xp_to_next_level',
+        'player_skill_points', 'player_unlocked_skills', 'player_attack_power', 'player_attack_bonus',
+        'player_attack_variance', 'player_crit_chance', 'player_crit_multiplier', 'player_gold',
+        'player_inventory', 'current_max_inventory_slots', 'player_keychain', 'player_quests',
+        'player_reputation', 'player_effects', 'stash', 'has_hideout_key',
+        # Equipment
+        'equipped_weapon', 'player_shield_value', 'equipped_armor_value', 'equipped_cloak', 'equipped_helmet',
+        'equipped_misc_items',
+        # World
+        'current_room', 'rooms_travelled', 'room_history', 'direction_history', 'monsters_defeated_this_run',
+        'special_event_after_unlock', 'seed', 'run_seed', 'rooms_generated',
+        # Services
+        'sound_manager', 'auto_resolve_hordes', 'command_queue', 'save_slot', 'save_journal', 'autosave', 'checkpoints',
+        'resume_code',
+    )
+
+    def __init__(self, player_name="Adventurer", player_class=None, max_hp=100, seed=None):
+        self.player_name = player_name
+        self.player_class = player_class
+        self.player_hp = max_hp
+        self.max_hp = max_hp
+        self.player_xp = 0
+        self.player_level = 1
+        self.xp_to_next_level = calculate_xp_for_next_level(1)
+        self.player_skill_points = 0
+        self.player_unlocked_skills = []
+        self.player_attack_power = BASE_PLAYER_ATTACK_POWER
+        self.player_attack_bonus = 0
+        self.player_attack_variance = BASE_PLAYER_ATTACK_VARIANCE
+        self.player_crit_chance = BASE_PLAYER_CRIT_CHANCE
+        self.player_crit_multiplier = BASE_PLAYER_CRIT_MULTIPLIER
+        self.player_gold = 500
+        self.player_inventory = []
+        self.current_max_inventory_slots = 5
+        self.player_keychain = []
+        self.player_quests = {}
+        self.player_reputation = {}
+        self.player_effects = EffectSchedule()
+        self.stash = []
+        self.has_hideout_key = False
+
+        self.equipped_weapon = None
+        self.player_shield_value = None
+        self.equipped_armor_value = None
+        self.equipped_cloak = None
+        self.equipped_helmet = None
+        self.equipped_misc_items = []
+
+        self.current_room = None
+        self.rooms_travelled = 1
+        self.room_history = []
+        self.direction_history = []
+        self.monsters_defeated_this_run = 0
+        self.special_event_after_unlock = None
+        self.seed = seed # Only shown on screen (daily challenges); the RNG is seeded separately
+        self.run_seed = None # When set, each room is generated from this and its index (see generate_seeded_room)
+        self.rooms_generated = 0
+
+        self.sound_manager = sound_manager # The shared one by default; servers give each session its own
+        self.auto_resolve_hordes = AUTO_RESOLVE_HORDES
+        self.command_queue = deque()
+        self.save_slot = None # Named after the player on the first save, unless 'save [slot]' picks another
+        self.save_journal = None # What the save slot holds for this session, once it has saved
+        self.autosave = None # Trigger state, once enable_autosave() is called
+        self.checkpoints = CheckpointRing()
+        self.resume_code = getattr(getattr(session_threads, 'channel', None), 'resume_code', None) # Servers give each connection one; runs it parks need it to resume
+
 class Room:
     """Represents a single, randomly generated room in the dungeon."""
-    def __init__(self, player_current_level, player_quests, load_from_save=False, entry_direction=None):
-        global special_event_after_unlock
+    def __init__(self, player_current_level, player_quests, load_from_save=False, entry_direction=None, session=None):
         # --- INITIALIZE ALL ATTRIBUTES ---
         self.description = ""
         self.exits = {}
@@ -2259,17 +4380,38 @@ class Room:
         self.is_inn = False
         self.is_horde_room = False
         self.horde_data = None
+        self.regen = None # [index, player level, entry direction, special event] for rooms of a seeded run
 
         if load_from_save:
             return # Stop here for loaded rooms, attributes will be overwritten
 
         # --- GENERATE NEW ROOM ---
+        # A special event queued by unlocking a door replaces the next room of that session
+        special_event_after_unlock = session.special_event_after_unlock if session else None
+        if special_event_after_unlock:
+            session.special_event_after_unlock = None
+        if session is not None and session.run_seed is not None:
+            # Each room of a seeded run is drawn from its own seed, so a save can regenerate it instead of storing it
+            self.regen = [session.rooms_generated, player_current_level, entry_direction, special_event_after_unlock]
+            session.rooms_generated += 1
+            generate_seeded_room(self, session.run_seed, self.regen, player_quests)
+        else:
+            self.generate(player_current_level, player_quests, entry_direction, special_event_after_unlock)
+
+        if self.winning_item_just_spawned:
+            print("\n" + "=" * 40)
+            print("A powerful aura emanates from something nearby...")
+            print(f"You sense a legendary artifact is close! You see {add_article(self.item['name'])} on the floor.")
+            print("=" * 40)
+
+    def generate(self, player_current_level, player_quests, entry_direction=None, special_event_after_unlock=None):
+        """Fills in a new room's contents, drawing from the random module."""
         if special_event_after_unlock:
             monster_name_to_spawn = special_event_after_unlock.get('monster_name')
             found_monster_def = next((m for m in MONSTERS if m['name'] == monster_name_to_spawn), None)
 
             if found_monster_def:
-                self.monster = dict(found_monster_def)
+                self.monster = copy.deepcopy(found_monster_def)
                 self.description = f"You enter a chamber that feels strangely significant. A powerful {self.monster['name']} stands guard here."
                 self.exits = {"south": True}  # Default exit to go back
                 self.locked_exits = {}
@@ -2281,12 +4423,10 @@ class Room:
                 self.winning_item_just_spawned = False
                 self.boss_monster_spawned = False
                 self.awaiting_winning_item_pickup = False
-                special_event_after_unlock = None
                 return
             else:
                 if DEBUG:
                     debug.debug_print(f"Special monster '{monster_name_to_spawn}' not found. Generating normal room.")
-                special_event_after_unlock = None
 
         # --- Weighted Room Generation ---
         special_room_options = {
@@ -2329,7 +4469,7 @@ class Room:
         elif chosen_room_type == 'vendor':
             vendor_npc_def = next((n for n in NPCs if n.get('type') == 'vendor'), None)
             if vendor_npc_def:
-                self.npc = dict(vendor_npc_def)
+                self.npc = copy.deepcopy(vendor_npc_def)
                 self.npc['talked_to'] = False
         elif chosen_room_type == 'shrine':
             self.shrine = copy.deepcopy(random.choice(SHRINES))
@@ -2337,7 +4477,7 @@ class Room:
         elif chosen_room_type == 'puzzle':
             eligible_puzzles = [p for p in PUZZLES if not (p.get('type') == 'item_delivery' and p.get('reward_type') == 'exit')]
             if eligible_puzzles:
-                self.puzzle = dict(random.choice(eligible_puzzles))
+                self.puzzle = copy.deepcopy(random.choice(eligible_puzzles))
                 self.puzzle['solved'] = False
         elif chosen_room_type == 'quest_giver':
             all_quest_givers = [n for n in NPCs if n.get('type') == 'quest_giver']
@@ -2361,18 +4501,14 @@ class Room:
                         continue
                 available_quest_givers.append(npc)
             if available_quest_givers:
-                self.npc = dict(random.choice(available_quest_givers))
+                self.npc = copy.deepcopy(random.choice(available_quest_givers))
                 self.npc['talked_to'] = False
         elif chosen_room_type == 'winning_item':
             winning_item_candidates = [item for item in ALL_ITEMS if item.get('type') == 'winning_item']
             if winning_item_candidates:
-                self.item = random.choice(winning_item_candidates)
+                self.item = copy.deepcopy(random.choice(winning_item_candidates))
                 self.winning_item_just_spawned = True
                 self.awaiting_winning_item_pickup = True
-                print("\n" + "=" * 40)
-                print("A powerful aura emanates from something nearby...")
-                print(f"You sense a legendary artifact is close! You see {add_article(self.item['name'])} on the floor.")
-                print("=" * 40)
 
         # --- Generate Standard Room Description if not set by a special type ---
         if not self.description:
@@ -2430,18 +4566,18 @@ class Room:
                 if possible_items_with_weights:
                     items, weights = zip(*possible_items_with_weights)
                     chosen_item = random.choices(items, weights=weights, k=1)[0]
-                    self.item = scale_item_for_player_level(chosen_item, player_current_level)
+                    self.item = copy.deepcopy(scale_item_for_player_level(chosen_item, player_current_level))
 
             elif secondary_content_roll < npc_spawn_threshold:
                 # Non-special NPC generation logic...
                 eligible_npcs = [n for n in NPCs if n.get('type') not in ['vendor', 'quest_giver']]
                 if eligible_npcs:
-                    self.npc = dict(random.choice(eligible_npcs))
+                    self.npc = copy.deepcopy(random.choice(eligible_npcs))
                     self.npc['talked_to'] = False
 
             elif secondary_content_roll < hazard_spawn_threshold:
                 if HAZARDS:
-                    self.hazard = random.choice(HAZARDS)
+                    self.hazard = copy.deepcopy(random.choice(HAZARDS))
                     if self.hazard.get('hidden'):
                         self.hazard['is_currently_hidden'] = True
                     self.hazard['disarmed'] = False
@@ -2457,7 +4593,7 @@ class Room:
                                 eligible_monsters.append(monster_def)
                                 monster_weights.append(weight)
                     if eligible_monsters:
-                        self.monster = dict(random.choices(eligible_monsters, weights=monster_weights, k=1)[0])
+                        self.monster = copy.deepcopy(random.choices(eligible_monsters, weights=monster_weights, k=1)[0])
 
     def show_description(self, direction_history=None):
         """Prints the full description of the room."""
@@ -2579,6 +4715,8 @@ def display_map(room_history, direction_history, current_room):
         grid_x = (room_x - min_x) * 2
 
         room_obj = coords.get((room_x, room_y))
+        if isinstance(room_obj, SavedRoom):
+            room_obj = room_obj.materialize()
         icon = map_legend['default']
         if room_obj:
             if getattr(room_obj, 'is_inn', False):
@@ -2629,18 +4767,164 @@ def display_map(room_history, direction_history, current_room):
     print("--------------\n")
 
 
+# --- Command Registry ---
+# Per-command latency, keyed by canonical verb: [calls, total seconds, worst seconds].
+# Handlers that prompt for more input include the time spent waiting on the player.
+COMMAND_STATS = {}
+
+class CommandTrie:
+    """A prefix trie over command words, used to expand unambiguous abbreviations."""
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, word, verb):
+        node = self.root
+        for char in word:
+            node = node.setdefault(char, {})
+            node.setdefault(None, set()).add(verb)
+
+    def prefixes(self):
+        """Yields (prefix, verb) for every prefix that only one verb can complete."""
+        stack = [("", self.root)]
+        while stack:
+            prefix, node = stack.pop()
+            for char, child in node.items():
+                if char is None:
+                    continue
+                verbs = child[None]
+                if len(verbs) == 1:
+                    yield prefix + char, next(iter(verbs))
+                stack.append((prefix + char, child))
+
+class CommandRegistry:
+    """
+    Maps verbs and their aliases to the words that reach them.
+    Every word the player may type (full verb, alias, or unambiguous prefix) is
+    flattened into a single routing table, so dispatch costs one dict lookup no
+    matter how many commands are registered. Only verbs registered with
+    prefixes=True can be abbreviated; the rest need their name or an alias, so a
+    slip of the keyboard never toggles or spends anything. The table is built
+    once, on the first lookup after a change; each game_loop binds the verbs to
+    its own handlers with bind().
+    """
+    def __init__(self):
+        self.trie = CommandTrie()
+        self.words = {}
+        self.prefixed = set()
+        self.routes = None
+
+    def register(self, verb, aliases=(), prefixes=False):
+        for word in (verb, *aliases):
+            self.trie.insert(word, verb)
+            self.words[word] = verb
+        if prefixes:
+            self.prefixed.add(verb)
+        self.routes = None # Rebuilt on the next lookup
+
+    def lookup(self, word):
+        """Returns the verb a typed word stands for, or None."""
+        if self.routes is None:
+            # Unambiguous prefixes first (among all verbs, so 'equi' stays ambiguous), exact words and aliases win.
+            self.routes = {prefix: verb for prefix, verb in self.trie.prefixes() if verb in self.prefixed}
+            self.routes.update(self.words)
+        return self.routes.get(word)
+
+    def bind(self, handlers, default_handler):
+        return CommandTable(self, handlers, default_handler)
+
+class CommandTable:
+    """A CommandRegistry with its verbs bound to handler functions, timing each command it dispatches."""
+    def __init__(self, registry, handlers, default_handler):
+        self.registry = registry
+        self.entries = {verb: (verb, handler, COMMAND_STATS.setdefault(verb, [0, 0.0, 0.0])) for verb, handler in handlers.items()}
+        self.default_handler = default_handler
+        self.default_stats = COMMAND_STATS.setdefault('unknown', [0, 0.0, 0.0])
+
+    def lookup(self, word):
+        """Returns (verb, handler, stats) for a typed word. Unknown words keep their spelling."""
+        return self.entries.get(self.registry.lookup(word)) or (word, self.default_handler, self.default_stats)
+
+    def dispatch(self, handler, stats):
+        started = time.perf_counter()
+        result = handler()
+        elapsed = time.perf_counter() - started
+        stats[0] += 1
+        stats[1] += elapsed
+        if elapsed > stats[2]:
+            stats[2] = elapsed
+        return result
+
+# The main prompt's commands. Handlers are bound to them in game_loop.
+# Movement and read-only commands can be abbreviated; the others need their name or an alias.
+GAME_COMMANDS = CommandRegistry()
+GAME_COMMANDS.register("/debug")
+GAME_COMMANDS.register("/timings")
+GAME_COMMANDS.register("quit")
+GAME_COMMANDS.register("help", prefixes=True)
+GAME_COMMANDS.register("skill")
+GAME_COMMANDS.register("craft")
+GAME_COMMANDS.register("enchant")
+GAME_COMMANDS.register("look", prefixes=True)
+GAME_COMMANDS.register("inventory", aliases=["i"], prefixes=True)
+GAME_COMMANDS.register("equipped", prefixes=True)
+GAME_COMMANDS.register("misc", prefixes=True)
+GAME_COMMANDS.register("go", prefixes=True)
+GAME_COMMANDS.register("north", aliases=["n"], prefixes=True)
+GAME_COMMANDS.register("south", aliases=["s"], prefixes=True)
+GAME_COMMANDS.register("east", aliases=["e"], prefixes=True)
+GAME_COMMANDS.register("west", aliases=["w"], prefixes=True)
+GAME_COMMANDS.register("get")
+GAME_COMMANDS.register("drop")
+GAME_COMMANDS.register("use")
+GAME_COMMANDS.register("equip", aliases=["quip"])
+GAME_COMMANDS.register("unequip")
+GAME_COMMANDS.register("attack")
+GAME_COMMANDS.register("combine")
+GAME_COMMANDS.register("unlock")
+GAME_COMMANDS.register("talk")
+GAME_COMMANDS.register("rest")
+GAME_COMMANDS.register("quests", prefixes=True)
+GAME_COMMANDS.register("answer")
+GAME_COMMANDS.register("press")
+GAME_COMMANDS.register("pull")
+GAME_COMMANDS.register("give")
+GAME_COMMANDS.register("save")
+GAME_COMMANDS.register("suspend")
+GAME_COMMANDS.register("ohvendor")
+GAME_COMMANDS.register("ohinn")
+GAME_COMMANDS.register("search")
+GAME_COMMANDS.register("disarm")
+GAME_COMMANDS.register("map", prefixes=True)
+GAME_COMMANDS.register("autohorde")
+GAME_COMMANDS.register("pace")
+GAME_COMMANDS.register("credits", prefixes=True)
+GAME_COMMANDS.register("pray")
+GAME_COMMANDS.register("drink")
+
+def print_command_stats():
+    """Prints the per-command latency table gathered by the command registry."""
+    print("\n--- Command Timings ---")
+    for verb, (calls, total, worst) in sorted(COMMAND_STATS.items(), key=lambda kv: kv[1][1], reverse=True):
+        if calls:
+            print(f"{verb:<12} calls: {calls:<5} avg: {total / calls * 1000:8.3f}ms  worst: {worst * 1000:8.3f}ms")
+    print("-----------------------")
+
+
 # --- Game Loop Function ---
 # MODIFIED: Added equipped_cloak to parameters
-def game_loop(player_hp, max_hp, player_inventory, current_room, current_max_inventory_slots, player_gold, player_shield_value, equipped_armor_value, equipped_cloak, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, equipped_weapon, player_xp, player_level, xp_to_next_level, player_quests, player_reputation, player_name, rooms_travelled, player_keychain, equipped_misc_items, player_effects, room_history,direction_history, sound_manager, equipped_helmet, player_class, player_skill_points, player_unlocked_skills, monsters_defeated_this_run, stash, has_hideout_key, seed=None):
+def game_loop(session, resumed=False):
     """
     This function contains the main game loop logic for active gameplay.
-    It returns a string indicating the game outcome: 'continue_adventure', 'lose', 'quit', or 'return_to_menu'.
+    It returns a string indicating the game outcome: 'continue_adventure', 'lose', 'quit', 'return_to_menu' or 'suspended'.
+    A resumed session skips the room-entry events it already went through before it was suspended.
     """
-    global DEBUG, special_event_after_unlock
+    session.command_queue.clear() # Nothing queued before a death or a reload carries over
+    if not resumed:
+        session.checkpoints.take(session) # Before the room's entry events, so going back to it plays them again
     current_defense_bonus = 0
     current_crit_chance_bonus = 0.0
     # Helper function to process puzzle rewards
-    def process_puzzle_rewards(puzzle, player_inventory, current_max_inventory_slots, player_keychain, player_xp, player_gold, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points):
+    def process_puzzle_rewards(puzzle):
         rewards_data = puzzle.get('rewards', {})
         reward_given = False
 
@@ -2649,10 +4933,10 @@ def game_loop(player_hp, max_hp, player_inventory, current_room, current_max_inv
             reward_given = True
             xp_reward = rewards_data['xp_gold'].get('xp', 0)
             gold_reward = rewards_data['xp_gold'].get('gold', 0)
-            player_xp += xp_reward
-            player_gold += gold_reward
+            session.player_xp += xp_reward
+            session.player_gold += gold_reward
             print(f"You gained {xp_reward} XP and {gold_reward} gold!")
-            player_xp, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points =                 check_for_level_up(player_xp, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points)
+            check_for_level_up(session)
 
         # Handle Item Rewards
         if 'items' in rewards_data:
@@ -2664,16 +4948,16 @@ def game_loop(player_hp, max_hp, player_inventory, current_room, current_max_inv
                     if item_def:
                         reward_given = True
                         if item_def.get('type') == 'key':
-                            player_keychain.append(copy.deepcopy(item_def))
+                            session.player_keychain.append(copy.deepcopy(item_def))
                             print(f"A hidden mechanism whirs, and {add_article(item_def['name'])} appears, added to your keychain!")
-                        elif len(player_inventory) < current_max_inventory_slots:
-                            scaled_item = scale_item_for_player_level(item_def, player_level)
-                            player_inventory.append(scaled_item)
+                        elif len(session.player_inventory) < session.current_max_inventory_slots:
+                            scaled_item = scale_item_for_player_level(item_def, session.player_level)
+                            session.player_inventory.append(scaled_item)
                             print(f"A hidden compartment opens, revealing {add_article(scaled_item['name'])}!")
                         else:
-                            scaled_item = scale_item_for_player_level(item_def, player_level)
+                            scaled_item = scale_item_for_player_level(item_def, session.player_level)
                             print(f"A hidden compartment opens, revealing {add_article(scaled_item['name'])}, but your inventory is full! It remains here.")
-                            current_room.item = scaled_item
+                            session.current_room.item = scaled_item
                     else:
                         print(f"Warning: Reward item '{item_name}' not found in game data.")
 
@@ -2686,1719 +4970,1593 @@ def game_loop(player_hp, max_hp, player_inventory, current_room, current_max_inv
                 item_def = get_item_by_name(reward_data)
                 if item_def:
                     if item_def.get('type') == 'key':
-                        player_keychain.append(copy.deepcopy(item_def))
+                        session.player_keychain.append(copy.deepcopy(item_def))
                         print(f"A hidden mechanism whirs, and {add_article(item_def['name'])} appears, added to your keychain!")
-                    elif len(player_inventory) < current_max_inventory_slots:
-                        scaled_item = scale_item_for_player_level(item_def, player_level)
-                        player_inventory.append(scaled_item)
+                    elif len(session.player_inventory) < session.current_max_inventory_slots:
+                        scaled_item = scale_item_for_player_level(item_def, session.player_level)
+                        session.player_inventory.append(scaled_item)
                         print(f"A hidden compartment opens, revealing {add_article(scaled_item['name'])}!")
                     else:
-                        scaled_item = scale_item_for_player_level(item_def, player_level)
+                        scaled_item = scale_item_for_player_level(item_def, session.player_level)
                         print(f"A hidden compartment opens, revealing {add_article(scaled_item['name'])}, but your inventory is full! It remains here.")
-                        current_room.item = scaled_item
+                        session.current_room.item = scaled_item
                 else:
                     print(f"Warning: Reward item '{reward_data}' not found in game data.")
         
         # Handle Exit Reward as a special case if no other rewards were given
         if not reward_given and 'exit' in rewards_data:
             direction_to_open = rewards_data['exit'].get('direction')
-            if direction_to_open and direction_to_open not in current_room.exits:
-                current_room.exits[direction_to_open] = True
-                if direction_to_open in current_room.locked_exits:
-                    del current_room.locked_exits[direction_to_open]
+            if direction_to_open and direction_to_open not in session.current_room.exits:
+                session.current_room.exits[direction_to_open] = True
+                if direction_to_open in session.current_room.locked_exits:
+                    del session.current_room.locked_exits[direction_to_open]
                     print(f"The previously locked {direction_to_open} exit is now open!")
                 else:
                     print(f"A new path to the {direction_to_open} has opened!")
             else:
                 print(f"The path to the {direction_to_open} was already open.")
 
-        return player_inventory, current_max_inventory_slots, player_keychain, player_xp, player_gold, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points
+    display_room_content_summary(session.current_room, session.rooms_travelled, session.direction_history, session.seed)
 
-    display_room_content_summary(current_room, rooms_travelled, direction_history, seed)
-
-    if hasattr(current_room, 'crafting_station'):
-        print(f"You are in a room with a {current_room.crafting_station}.")
+    if hasattr(session.current_room, 'crafting_station'):
+        print(f"You are in a room with a {session.current_room.crafting_station}.")
         print("You can use the 'craft' or 'enchant' commands here.")
 
     # --- Initial player state dump for the session ---
     if DEBUG: # Wrapped debug calls
-        debug.debug_player_data(player_inventory, player_keychain, current_max_inventory_slots, player_gold, "Player State at Room Entry")
+        debug.debug_player_data(session.player_inventory, session.player_keychain, session.current_max_inventory_slots, session.player_gold, "Player State at Room Entry")
     # --- End initial player state dump ---
 
 
-    if current_room.is_horde_room:
-        game_result, player_hp, max_hp, player_gold, player_xp, player_level, xp_to_next_level, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, equipped_misc_items, monsters_defeated_in_horde, player_skill_points = \
-            handle_horde_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, player_shield_value, equipped_armor_value, equipped_cloak, player_inventory, current_max_inventory_slots, player_gold, equipped_weapon, player_xp, player_level, xp_to_next_level, player_quests, player_keychain, current_room, equipped_misc_items, player_effects, sound_manager, equipped_helmet, player_class, player_unlocked_skills, player_skill_points)
-        monsters_defeated_this_run += monsters_defeated_in_horde
+    if session.current_room.is_horde_room and not resumed:
+        game_result, monsters_defeated_in_horde = handle_horde_combat(session, auto_resolve=session.auto_resolve_hordes)
+        session.monsters_defeated_this_run += monsters_defeated_in_horde
         if game_result == 'lose':
-            return 'lose', monsters_defeated_this_run, rooms_travelled
+            return 'lose'
     # Handle immediate hazard upon entering room
-    if current_room.hazard and not current_room.hazard.get('is_currently_hidden', False):
-        print(current_room.hazard['effect_message'].format(damage=current_room.hazard['damage']))
+    if session.current_room.hazard and not session.current_room.hazard.get('is_currently_hidden', False) and not resumed:
+        print(session.current_room.hazard['effect_message'].format(damage=session.current_room.hazard['damage']))
         # MODIFIED: Include equipped_cloak in total defense calculation for hazards
-        total_initial_defense = (player_shield_value.get('defense', 0) if player_shield_value else 0) + \
-                               (equipped_armor_value.get('defense', 0) if equipped_armor_value else 0) + \
-                               (equipped_cloak.get('defense', 0) if equipped_cloak else 0)
-        actual_hazard_damage = max(0, current_room.hazard['damage'] - total_initial_defense)
-        player_hp -= actual_hazard_damage
-        print(f"Your health is now {player_hp}/{max_hp} HP.")
+        total_initial_defense = (session.player_shield_value.get('defense', 0) if session.player_shield_value else 0) + \
+                               (session.equipped_armor_value.get('defense', 0) if session.equipped_armor_value else 0) + \
+                               (session.equipped_cloak.get('defense', 0) if session.equipped_cloak else 0)
+        actual_hazard_damage = max(0, session.current_room.hazard['damage'] - total_initial_defense)
+        session.player_hp -= actual_hazard_damage
+        print(f"Your health is now {session.player_hp}/{session.max_hp} HP.")
         if total_initial_defense > 0:
-            print(f"Your total defense absorbed {current_room.hazard['damage'] - actual_hazard_damage} damage.")
-        if player_hp <= 0:
+            print(f"Your total defense absorbed {session.current_room.hazard['damage'] - actual_hazard_damage} damage.")
+        if session.player_hp <= 0:
             print("\n" + "=" * 40)
             print("Your health has fallen to zero! You collapse.")
             print("        G A M E    O V E R            ")
             print("=" * 40)
             if DEBUG: # Wrapped debug calls
                 debug.close_debug_log() # Close log on game over
-            return 'lose', monsters_defeated_this_run, rooms_travelled # Game over, return 'lose'
+            return 'lose' # Game over, return 'lose'
 
     # Winning item pre-combat interaction
     # If a winning item spawned AND the boss hasn't spawned yet, prompt player to pick it up.
-    if current_room.item and current_room.item['name'] in WINNING_ITEMS and not current_room.boss_monster_spawned:
-        print(f"\nBefore you can act, you feel an immense power radiating from the {current_room.item['name']}!")
-        if len(player_inventory) >= current_max_inventory_slots:
-            print(f"Your inventory is full! You cannot pick up the {current_room.item['name']}.")
+    if resumed:
+        pass # The pickup state was restored along with the room
+    elif session.current_room.item and session.current_room.item['name'] in WINNING_ITEMS and not session.current_room.boss_monster_spawned:
+        print(f"\nBefore you can act, you feel an immense power radiating from the {session.current_room.item['name']}!")
+        if len(session.player_inventory) >= session.current_max_inventory_slots:
+            print(f"Your inventory is full! You cannot pick up the {session.current_room.item['name']}.")
             print("You must drop an item to make space. The guardian's presence is unsettling...")
         else:
             print("You must pick it up to proceed. (Type 'get item')")
         # Set awaiting_winning_item_pickup flag to indicate this state
-        current_room.awaiting_winning_item_pickup = True
+        session.current_room.awaiting_winning_item_pickup = True
     else:
-        current_room.awaiting_winning_item_pickup = False # Reset flag if not in this state
+        session.current_room.awaiting_winning_item_pickup = False # Reset flag if not in this state
 
     # Handle regular monster combat (if present and not a winning item guardian)
-    if current_room.monster and not current_room.monster.get('is_boss_guardian', False): # For regular monsters
-        monster_was_defeated = current_room.monster is not None
-        player_hp, max_hp, current_room.monster, gold_gained, player_xp, player_level, xp_to_next_level, player_quests, \
-                player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, equipped_misc_items, player_skill_points = \
-            handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, \
-                          current_room.monster, player_shield_value, equipped_armor_value, equipped_cloak, player_inventory, current_max_inventory_slots, \
-                                  player_gold, equipped_weapon, player_xp, player_level, xp_to_next_level, player_quests, player_keychain, current_room, equipped_misc_items, player_effects, sound_manager, current_defense_bonus, current_crit_chance_bonus, equipped_helmet, player_class, player_unlocked_skills, player_skill_points)
-        player_gold += gold_gained
-        if player_hp <= 0:
+    if session.current_room.monster and not session.current_room.monster.get('is_boss_guardian', False) and not resumed: # For regular monsters
+        monster_was_defeated = session.current_room.monster is not None
+        session.current_room.monster, gold_gained, _ = handle_combat(session, session.current_room.monster, current_defense_bonus, current_crit_chance_bonus)
+        session.player_gold += gold_gained
+        if session.player_hp <= 0:
             print("\n" + "=" * 40)
             print("Your health has fallen to zero! You collapse.")
             print("        G A M E    O V E R            ")
             print("=" * 40)
             if DEBUG: # Wrapped debug calls
                 debug.close_debug_log() # Close log on game over
-            return 'lose', monsters_defeated_this_run, rooms_travelled
-        if monster_was_defeated and current_room.monster is None:
-            current_room.monster = None
-            monsters_defeated_this_run += 1
+            return 'lose'
+        if monster_was_defeated and session.current_room.monster is None:
+            session.current_room.monster = None
+            session.monsters_defeated_this_run += 1
             print(f"\nThe monster is defeated. The room is now safe.")
-            display_room_content_summary(current_room, rooms_travelled)
-
-
-    while True:
-        # --- BUFF AND CURSE SYSTEM ---
-        # A turn passes each time the player enters a command.
-        # Apply effects and get modifiers for this turn.
-        effect_modifiers = apply_and_tick_effects(player_effects)
-
-        # Recalculate base stats + permanent bonuses
-        base_attack_power = recalculate_attack_power(player_level, equipped_weapon, equipped_misc_items, player_attack_bonus)
-
-        # Apply temporary modifiers from effects to get final stats for this turn
-        current_attack_power = base_attack_power + effect_modifiers.get('attack_power', 0)
-        current_defense_bonus = effect_modifiers.get('defense', 0)
-        current_crit_chance_bonus = effect_modifiers.get('crit_chance', 0.0)
-
-        # Update the player's power for this turn (used for display and combat)
-        player_attack_power = current_attack_power
-
-        command_input = input("> ").lower().strip()
-        parts = command_input.split()
-
-        verb = ""
-        direction = None # Initialize direction variable
-
-        # Determine the verb and potential direction
-        if not parts:
-            pass # Empty input, will be caught by the "else" for invalid command.
-                     # If we wanted to add a default like "look" for empty general input, it would go here.
-        elif parts[0] in ["north", "south", "east", "west"]: # NEW: Allow just direction
-            verb = parts[0] # Direction IS the verb
-            direction = parts[0]
+            display_room_content_summary(session.current_room, session.rooms_travelled)
+
+    # --- Command Handlers ---
+    # Each handler returns None to keep playing, or the game outcome to end the loop.
+    def cmd_debug():
+        global DEBUG
+        DEBUG = not DEBUG
+        if DEBUG:
+            debug.initialize_debug_log(True)
+            print("Debug mode ON.")
         else:
-            verb = parts[0] # Regular command
-            if len(parts) > 1 and parts[0] == "go" and parts[1] in ["north", "south", "east", "west"]:
-                direction = parts[1] # "go [direction]"
-            elif verb in ["go"] and len(parts) == 1:
-                print("Where do you want to go? (e.g., 'go north' or just 'north')")
-                continue
-
-        # --- Process Commands ---
-
-        if verb == "/debug":
-            DEBUG = not DEBUG
-            if DEBUG:
-                debug.initialize_debug_log(True)
-                print("Debug mode ON.")
+            debug.close_debug_log()
+            print("Debug mode OFF.")
+
+    def cmd_timings():
+        print_command_stats()
+
+    def cmd_quit():
+        print("Thanks for playing!")
+        if DEBUG: # Wrapped debug calls
+            debug.close_debug_log() # Close log before quitting
+        return 'quit'
+
+    def cmd_help():
+        print("\nAvailable commands:")
+        print("    go [north, south, east, west] - Move to a new room.")
+        print("    [north, south, east, west]    - Move directly (e.g., 'north').") # NEW: Updated help text
+        print("    [cmd]; [cmd] / [cmd] x3       - Chain commands, or repeat one (e.g., 'north; search', '3 east').")
+        print("    map                           - Display the dungeon map.")
+        print("    autohorde                     - Toggle auto-resolving horde fights.")
+        print("    pace [interactive/fast/zero]  - Set how long dramatic pauses last.")
+        print("    get [item name OR 'item']     - Pick up an item (e.g., 'get rusty key' or 'get item').")
+        print("    drop [item name]              - Drop an item from your inventory or keychain.")
+        print("    use [item name]               - Use any consumable from your inventory (e.g., 'use healing potion').")
+        print("    equip/quip [item name]        - Equip a weapon, shield, or armor.")
+        print("    unequip [item name]           - Unequip an item.")
+        # NEW: Add 'equipped' to general help
+        print("    equipped                      - View your currently equipped items.")
+        print("    misc                          - View your currently equipped miscellaneous items.")
+        print("    attack                        - Attack a monster in the room.")
+        print("    skill                         - Open the skill tree to view and unlock skills.")
+        print("    craft                         - Craft items at a crafting station.")
+        print("    enchant                       - Enchant items at a crafting station.")
+        print("    combine                       - Combine items (e.g., 'combine healing potion').")
+        print("    talk [person]                 - Attempt to talk to an NPC. In an inn, lists people to talk to.")
+        print("    rest                          - Rest at an inn to restore health.")
+        print("    quests                        - View your active quests.")
+        print("    answer [your guess]           - Answer a riddle in a puzzle room.")
+        print("    pull [lever name/color]       - Interact with a lever in a puzzle room.")
+        print("    press                         - Press a pressure plate.")
+        print("    give [item] to [target]       - Give an item to a statue/NPC in a puzzle room.")
+        print("    unlock [direction] with [key name] - Unlock a locked exit.")
+        print("    look                          - See the room description again.")
+        print("    search                        - Search the room for hidden traps.")
+        print("    disarm [trap name]            - Attempt to disarm a detected trap.")
+        print("    inventory                     - Check your items and inventory space.")
+        print("    save                          - Save your current game progress.")
+        print("    suspend                       - Park this run and resume it later from Load Game.")
+        print("    ohinn                         - Teleport to a mystical inn.")
+        print("    credits                       - Show game credits.")
+        print("    quit                          - Exit the game.")
+        print("-" * 50)
+
+    def cmd_skill():
+        handle_skill_tree(session)
+
+    def cmd_craft():
+        if hasattr(session.current_room, 'crafting_station'):
+            crafting_recipes = GAME_DATA.get('crafting_recipes', [])
+            if not crafting_recipes:
+                print("There are no crafting recipes available.")
             else:
-                debug.close_debug_log()
-                print("Debug mode OFF.")
-            continue
-
-        if verb == "quit":
-            print("Thanks for playing!")
-            if DEBUG: # Wrapped debug calls
-                debug.close_debug_log() # Close log before quitting
-            return 'quit', monsters_defeated_this_run, rooms_travelled
-
-        elif verb == "help":
-            print("\nAvailable commands:")
-            print("    go [north, south, east, west] - Move to a new room.")
-            print("    [north, south, east, west]    - Move directly (e.g., 'north').") # NEW: Updated help text
-            print("    map                           - Display the dungeon map.")
-            print("    get [item name OR 'item']     - Pick up an item (e.g., 'get rusty key' or 'get item').")
-            print("    drop [item name]              - Drop an item from your inventory or keychain.")
-            print("    use [item name]               - Use any consumable from your inventory (e.g., 'use healing potion').")
-            print("    equip/quip [item name]        - Equip a weapon, shield, or armor.")
-            print("    unequip [item name]           - Unequip an item.")
-            # NEW: Add 'equipped' to general help
-            print("    equipped                      - View your currently equipped items.")
-            print("    misc                          - View your currently equipped miscellaneous items.")
-            print("    attack                        - Attack a monster in the room.")
-            print("    skill                         - Open the skill tree to view and unlock skills.")
-            print("    craft                         - Craft items at a crafting station.")
-            print("    enchant                       - Enchant items at a crafting station.")
-            print("    combine                       - Combine items (e.g., 'combine healing potion').")
-            print("    talk [person]                 - Attempt to talk to an NPC. In an inn, lists people to talk to.")
-            print("    rest                          - Rest at an inn to restore health.")
-            print("    quests                        - View your active quests.")
-            print("    answer [your guess]           - Answer a riddle in a puzzle room.")
-            print("    pull [lever name/color]       - Interact with a lever in a puzzle room.")
-            print("    press                         - Press a pressure plate.")
-            print("    give [item] to [target]       - Give an item to a statue/NPC in a puzzle room.")
-            print("    unlock [direction] with [key name] - Unlock a locked exit.")
-            print("    look                          - See the room description again.")
-            print("    search                        - Search the room for hidden traps.")
-            print("    disarm [trap name]            - Attempt to disarm a detected trap.")
-            print("    inventory                     - Check your items and inventory space.")
-            print("    save                          - Save your current game progress.")
-            print("    ohinn                         - Teleport to a mystical inn.")
-            print("    credits                       - Show game credits.")
-            print("    quit                          - Exit the game.")
-            print("-" * 50)
-
-        elif verb == "skill":
-            player_skill_points, player_unlocked_skills = handle_skill_tree(player_class, player_level, player_skill_points, player_unlocked_skills)
-
-        elif verb == "craft":
-            if hasattr(current_room, 'crafting_station'):
-                crafting_recipes = GAME_DATA.get('crafting_recipes', [])
-                if not crafting_recipes:
-                    print("There are no crafting recipes available.")
-                else:
-                    print("Available crafting recipes:")
-                    for i, recipe in enumerate(crafting_recipes):
-                        ingredients = ", ".join([f"{ingredient['quantity']}x {ingredient['name']}" for ingredient in recipe['ingredients']])
-                        print(f"  {i+1}. {recipe['name']} (Requires: {ingredients})")
-
-                    choice = input("Enter the number of the item you want to craft, or 'back': ").strip()
-                    if choice.lower() == 'back':
-                        continue
+                print("Available crafting recipes:")
+                for i, recipe in enumerate(crafting_recipes):
+                    ingredients = ", ".join([f"{ingredient['quantity']}x {ingredient['name']}" for ingredient in recipe['ingredients']])
+                    print(f"  {i+1}. {recipe['name']} (Requires: {ingredients})")
+
+                choice = input("Enter the number of the item you want to craft, or 'back': ").strip()
+                if choice.lower() == 'back':
+                    return
+
+                try:
+                    recipe_index = int(choice) - 1
+                    if 0 <= recipe_index < len(crafting_recipes):
+                        selected_recipe = crafting_recipes[recipe_index]
+                        can_craft = True
+                        for ingredient in selected_recipe['ingredients']:
+                            if not has_player_enough_items(session.player_inventory, ingredient['name'], ingredient['quantity']):
+                                can_craft = False
+                                print(f"You don't have enough {ingredient['name']}.")
+                                break
 
-                    try:
-                        recipe_index = int(choice) - 1
-                        if 0 <= recipe_index < len(crafting_recipes):
-                            selected_recipe = crafting_recipes[recipe_index]
-                            can_craft = True
+                        if can_craft:
                             for ingredient in selected_recipe['ingredients']:
-                                if not has_player_enough_items(player_inventory, ingredient['name'], ingredient['quantity']):
-                                    can_craft = False
-                                    print(f"You don't have enough {ingredient['name']}.")
-                                    break
+                                remove_items_from_inventory(session.player_inventory, ingredient['name'], ingredient['quantity'])
 
-                            if can_craft:
-                                for ingredient in selected_recipe['ingredients']:
-                                    remove_items_from_inventory(player_inventory, ingredient['name'], ingredient['quantity'])
+                            result_item = get_item_by_name(selected_recipe['result'])
+                            if result_item:
+                                session.player_inventory.append(copy.deepcopy(result_item))
+                                print(f"You successfully crafted a {result_item['name']}!")
+                            else:
+                                print("Crafting failed: result item not found.")
+                    else:
+                        print("Invalid recipe number.")
+                except ValueError:
+                    print("Invalid input.")
+        else:
+            print("You can't craft items here.")
 
-                                result_item = get_item_by_name(selected_recipe['result'])
-                                if result_item:
-                                    player_inventory.append(copy.deepcopy(result_item))
-                                    print(f"You successfully crafted a {result_item['name']}!")
-                                else:
-                                    print("Crafting failed: result item not found.")
-                        else:
-                            print("Invalid recipe number.")
-                    except ValueError:
-                        print("Invalid input.")
+    def cmd_enchant():
+        if hasattr(session.current_room, 'crafting_station'):
+            enchantments = GAME_DATA.get('enchantments', [])
+            if not enchantments:
+                print("There are no enchantments available.")
             else:
-                print("You can't craft items here.")
-
-        elif verb == "enchant":
-            if hasattr(current_room, 'crafting_station'):
-                enchantments = GAME_DATA.get('enchantments', [])
-                if not enchantments:
-                    print("There are no enchantments available.")
-                else:
-                    print("Available enchantments:")
-                    for i, enchantment in enumerate(enchantments):
-                        print(f"  {i+1}. {enchantment['name']} (for {enchantment['type']}) - Cost: {enchantment['cost']} gold")
-
-                    choice = input("Enter the number of the enchantment you want to apply, or 'back': ").strip()
-                    if choice.lower() == 'back':
-                        continue
-
-                    try:
-                        enchantment_index = int(choice) - 1
-                        if 0 <= enchantment_index < len(enchantments):
-                            selected_enchantment = enchantments[enchantment_index]
-
-                            if player_gold < selected_enchantment['cost']:
-                                print("You don't have enough gold to apply this enchantment.")
-                                continue
-
-                            item_to_enchant_name = input(f"Enter the name of the {selected_enchantment['type']} to enchant: ").strip()
-                            item_to_enchant = None
-                            for item in player_inventory:
-                                if item['name'].lower() == item_to_enchant_name.lower() and item.get('type') == selected_enchantment.get('type'):
-                                    item_to_enchant = item
-                                    break
+                print("Available enchantments:")
+                for i, enchantment in enumerate(enchantments):
+                    print(f"  {i+1}. {enchantment['name']} (for {enchantment['type']}) - Cost: {enchantment['cost']} gold")
+
+                choice = input("Enter the number of the enchantment you want to apply, or 'back': ").strip()
+                if choice.lower() == 'back':
+                    return
+
+                try:
+                    enchantment_index = int(choice) - 1
+                    if 0 <= enchantment_index < len(enchantments):
+                        selected_enchantment = enchantments[enchantment_index]
+
+                        if session.player_gold < selected_enchantment['cost']:
+                            print("You don't have enough gold to apply this enchantment.")
+                            return
+
+                        item_to_enchant_name = input(f"Enter the name of the {selected_enchantment['type']} to enchant: ").strip()
+                        item_to_enchant = None
+                        for item in session.player_inventory:
+                            if item['name'].lower() == item_to_enchant_name.lower() and item.get('type') == selected_enchantment.get('type'):
+                                item_to_enchant = item
+                                break
 
-                            if item_to_enchant:
-                                player_gold -= selected_enchantment['cost']
-                                item_to_enchant['enchantment'] = selected_enchantment['name']
-                                print(f"You successfully enchanted the {item_to_enchant['name']} with {selected_enchantment['name']} for {selected_enchantment['cost']} gold!")
-                            else:
-                                print(f"You don't have that item or it's not a {selected_enchantment['type']}.")
+                        if item_to_enchant:
+                            session.player_gold -= selected_enchantment['cost']
+                            item_to_enchant['enchantment'] = selected_enchantment['name']
+                            print(f"You successfully enchanted the {item_to_enchant['name']} with {selected_enchantment['name']} for {selected_enchantment['cost']} gold!")
                         else:
-                            print("Invalid enchantment number.")
-                    except ValueError:
-                        print("Invalid input.")
+                            print(f"You don't have that item or it's not a {selected_enchantment['type']}.")
+                    else:
+                        print("Invalid enchantment number.")
+                except ValueError:
+                    print("Invalid input.")
+        else:
+            print("You can't enchant items here.")
+
+    def cmd_look():
+        display_room_content_summary(session.current_room, session.rooms_travelled, session.direction_history, session.seed)
+        # You might want to add debug.debug_player_data() here too for context
+
+    def cmd_inventory():
+        display_inventory_and_stats(session)
+
+    # NEW COMMAND: 'equipped'
+    def cmd_equipped():
+        print("\n--- Currently Equipped Items ---")
+        print(f"Weapon: {session.equipped_weapon['name']} (Damage: {session.equipped_weapon.get('damage', '?')})" if session.equipped_weapon else "Weapon: Fists (Damage: 5)")
+        print(f"Shield: {session.player_shield_value['name']} (Defense: {session.player_shield_value.get('defense', '?')})" if session.player_shield_value else "Shield: None")
+        print(f"Body Armor: {session.equipped_armor_value['name']} (Defense: {session.equipped_armor_value.get('defense', '?')})" if session.equipped_armor_value else "Body Armor: None")
+        print(f"Cloak: {session.equipped_cloak['name']} (Defense: {session.equipped_cloak.get('defense', '?')})" if session.equipped_cloak else "Cloak: None")
+        if session.equipped_misc_items:
+            print("Miscellaneous:")
+            for item in session.equipped_misc_items:
+                print(f"  - {item['name']}")
+        print(f"Total Defense: {(session.player_shield_value.get('defense', 0) if session.player_shield_value else 0) + (session.equipped_armor_value.get('defense', 0) if session.equipped_armor_value else 0) + (session.equipped_cloak.get('defense', 0) if session.equipped_cloak else 0)}")
+        print("----------------------------------")
+
+    def cmd_misc():
+        if not session.equipped_misc_items:
+            print("You have no miscellaneous items equipped.")
+        else:
+            print("\n--- Equipped Miscellaneous Items ---")
+            for item in session.equipped_misc_items:
+                print(f"  - {item['name']} (Effect: {item.get('effect_type', 'unknown')})")
+            print("------------------------------------")
+
+    # NEW/MODIFIED: Consolidated 'go' and direct directional commands
+    def cmd_go():
+        nonlocal actual_hazard_damage, gold_gained
+        if session.current_room.hazard and session.current_room.hazard.get('is_currently_hidden') and not session.current_room.hazard.get('disarmed'):
+            print(f"You stumble into a hidden {session.current_room.hazard['name']}!")
+            session.current_room.hazard['is_currently_hidden'] = False
+            # Trigger the trap
+            session.player_hp -= session.current_room.hazard['damage']
+            print(session.current_room.hazard['effect_message'].format(damage=session.current_room.hazard['damage']))
+            print(f"Your health is now {session.player_hp}/{session.max_hp} HP.")
+            if session.player_hp <= 0:
+                return 'lose'
+            return
+
+        if session.current_room.monster:
+            if session.current_room.monster.get('is_boss_guardian', False) and session.current_room.boss_monster_spawned:
+                print(f"You can't leave! The powerful {session.current_room.monster['name']} blocks your escape!")
             else:
-                print("You can't enchant items here.")
-
-        elif verb == "look":
-            display_room_content_summary(current_room, rooms_travelled, direction_history, seed)
-            # You might want to add debug.debug_player_data() here too for context
+                print(f"You can't leave while the {session.current_room.monster['name']} is still here!")
+            return
 
-        elif verb.startswith("inv"): # Changed to use .startswith
-            display_inventory_and_stats(player_hp, max_hp, player_level, player_xp, xp_to_next_level, player_inventory, current_max_inventory_slots, player_keychain, player_gold, player_shield_value, equipped_armor_value, equipped_cloak, equipped_helmet, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, equipped_weapon, equipped_misc_items, player_effects)
-            continue
-        # NEW COMMAND: 'equipped'
-        elif verb == "equipped":
-            print("\n--- Currently Equipped Items ---")
-            print(f"Weapon: {equipped_weapon['name']} (Damage: {equipped_weapon.get('damage', '?')})" if equipped_weapon else "Weapon: Fists (Damage: 5)")
-            print(f"Shield: {player_shield_value['name']} (Defense: {player_shield_value.get('defense', '?')})" if player_shield_value else "Shield: None")
-            print(f"Body Armor: {equipped_armor_value['name']} (Defense: {equipped_armor_value.get('defense', '?')})" if equipped_armor_value else "Body Armor: None")
-            print(f"Cloak: {equipped_cloak['name']} (Defense: {equipped_cloak.get('defense', '?')})" if equipped_cloak else "Cloak: None")
-            if equipped_misc_items:
-                print("Miscellaneous:")
-                for item in equipped_misc_items:
-                    print(f"  - {item['name']}")
-            print(f"Total Defense: {(player_shield_value.get('defense', 0) if player_shield_value else 0) + (equipped_armor_value.get('defense', 0) if equipped_armor_value else 0) + (equipped_cloak.get('defense', 0) if equipped_cloak else 0)}")
-            print("----------------------------------")
-            continue
+        if session.current_room.awaiting_winning_item_pickup:
+            print(f"You must first pick up {add_article(session.current_room.item['name'])}!")
+            return
 
-        elif verb == "misc":
-            if not equipped_misc_items:
-                print("You have no miscellaneous items equipped.")
-            else:
-                print("\n--- Equipped Miscellaneous Items ---")
-                for item in equipped_misc_items:
-                    print(f"  - {item['name']} (Effect: {item.get('effect_type', 'unknown')})")
-                print("------------------------------------")
-            continue
+        if session.current_room.puzzle and not session.current_room.puzzle.get('solved', True):
+            if session.current_room.puzzle.get('rewards', {}).get('exit', {}).get('direction') not in session.current_room.exits:
+                print(f"The way is blocked by the puzzle! You must solve it first.")
+                return
 
-        # NEW/MODIFIED: Consolidated 'go' and direct directional commands
-        elif verb in ["go", "north", "south", "east", "west"]:
-            if current_room.hazard and current_room.hazard.get('is_currently_hidden') and not current_room.hazard.get('disarmed'):
-                print(f"You stumble into a hidden {current_room.hazard['name']}!")
-                current_room.hazard['is_currently_hidden'] = False
-                # Trigger the trap
-                player_hp -= current_room.hazard['damage']
-                print(current_room.hazard['effect_message'].format(damage=current_room.hazard['damage']))
-                print(f"Your health is now {player_hp}/{max_hp} HP.")
-                if player_hp <= 0:
-                    return 'lose', monsters_defeated_this_run, rooms_travelled
-                continue
+        # The direction was resolved along with the verb, so 'go n' works like 'n'
+        if direction is None:
+            # This case should ideally not be hit with the prior checks,
+            # but as a fallback, if "go" was typed without a direction.
+            print("Where do you want to go? (e.g., 'go north' or just 'north')")
+            return
 
-            if current_room.monster:
-                if current_room.monster.get('is_boss_guardian', False) and current_room.boss_monster_spawned:
-                    print(f"You can't leave! The powerful {current_room.monster['name']} blocks your escape!")
+        opposites = {'north': 'south', 'south': 'north', 'east': 'west', 'west': 'east'}
+        is_back_move = False
+        if session.direction_history and direction == opposites.get(session.direction_history[-1]):
+            is_back_move = True
+
+        if is_back_move:
+            print(f"You travel back {direction}...")
+            pause()
+            session.current_room = session.room_history.pop()
+            if isinstance(session.current_room, SavedRoom): # Not entered since the game was loaded
+                session.current_room = session.current_room.materialize()
+            session.direction_history.pop()
+            if session.save_journal: # The room can change now, so the next save has to write it again
+                session.save_journal['rooms_kept'] = min(session.save_journal['rooms_kept'], len(session.room_history))
+            session.checkpoints.history_popped(session)
+            session.rooms_travelled -= 1
+            session.sound_manager.stop_music()
+            if getattr(session.current_room, 'is_inn', False):
+                session.sound_manager.play_music('inn_music')
+            else:
+                session.sound_manager.play_music('ambient_music')
+            log_event(f"Player {session.player_name} returned to Room #{session.rooms_travelled}.")
+            display_room_content_summary(session.current_room, session.rooms_travelled, session.direction_history, session.seed)
+            return
+
+        elif direction in session.current_room.exits:
+            print(f"You travel {direction}...")
+            pause()
+
+            session.room_history.append(session.current_room)
+            session.direction_history.append(direction)
+
+            session.sound_manager.stop_music()
+            session.current_room = Room(session.player_level, session.player_quests, entry_direction=direction, session=session)
+            # --- NEW: Handle if the new room is an inn ---
+            while getattr(session.current_room, 'is_inn', False):
+                handle_inn(session)
+
+                print("You leave the inn to continue your journey.")
+                session.current_room = Room(session.player_level, session.player_quests, session=session) # Generate a new room
+            # --- END NEW ---
+            session.sound_manager.play_music('ambient_music') # Always play ambient after moving, as inn handles its own music.
+            session.rooms_travelled += 1
+            session.checkpoints.take(session)
+            log_event(f"Player {session.player_name} entered Room #{session.rooms_travelled} travelling {direction}. Description: {session.current_room.description}")
+
+            display_room_content_summary(session.current_room, session.rooms_travelled, session.direction_history, session.seed)
+
+            # Handle immediate hazard upon entering new room
+            if session.current_room.hazard:
+                print(session.current_room.hazard['effect_message'].format(damage=session.current_room.hazard['damage']))
+                # MODIFIED: Include equipped_cloak in total defense for hazards in new room
+                total_room_defense = (session.player_shield_value.get('defense', 0) if session.player_shield_value else 0) + \
+                                     (session.equipped_armor_value.get('defense', 0) if session.equipped_armor_value else 0) + \
+                                     (session.equipped_cloak.get('defense', 0) if session.equipped_cloak else 0)
+                actual_hazard_damage = max(0, session.current_room.hazard['damage'] - total_room_defense)
+                session.player_hp -= actual_hazard_damage
+                print(f"Your health is now {session.player_hp}/{session.max_hp} HP.")
+                if total_room_defense > 0:
+                    print(f"Your total defense absorbed {session.current_room.hazard['damage'] - actual_hazard_damage} damage.")
+                if session.player_hp <= 0:
+                    print("\n" + "=" * 40)
+                    print("Your health has fallen to zero! You collapse.")
+                    print("        G A M E    O V E R            ")
+                    print("=" * 40)
+                    if DEBUG: # Wrapped debug calls
+                        debug.close_debug_log() # Close log on game over
+                    return 'lose'
+
+            # If winning item just spawned, set flag for pickup
+            if session.current_room.item and session.current_room.item['name'] in WINNING_ITEMS and session.current_room.winning_item_just_spawned:
+                print(f"\nAn intense aura fills the room, emanating from {add_article(session.current_room.item['name'])}!")
+                if len(session.player_inventory) >= session.current_max_inventory_slots:
+                    print(f"Your inventory is full! You cannot pick up the {session.current_room.item['name']}.")
+                    print("You must drop an item to make space. The guardian's presence is unsettling...")
                 else:
-                    print(f"You can't leave while the {current_room.monster['name']} is still here!")
-                continue
-
-            if current_room.awaiting_winning_item_pickup:
-                print(f"You must first pick up {add_article(current_room.item['name'])}!")
-                continue
+                    print("You must pick it up to proceed. (Type 'get item')")
+                session.current_room.awaiting_winning_item_pickup = True
+            # Handle regular monsters that just spawned (not winning item guardians)
+            elif session.current_room.monster and not session.current_room.monster.get('is_boss_guardian', False):
+                session.current_room.monster, gold_gained, _ = handle_combat(session, session.current_room.monster, current_defense_bonus, current_crit_chance_bonus)
+                session.player_gold += gold_gained
+                if session.player_hp <= 0:
+                    print("\n" + "=" * 40)
+                    print("Your health has fallen to zero! You collapse.")
+                    print("        G A M E    O V E R            ")
+                    print("=" * 40)
+                    if DEBUG: # Wrapped debug calls
+                        debug.close_debug_log() # Close log on game over
+                    return 'lose' # Game over, return 'lose'
+                if session.current_room.monster is None:
+                    print(f"\nThe monster is defeated. The room is now safe.")
+                    display_room_content_summary(session.current_room, session.rooms_travelled, session.direction_history, session.seed)
 
-            if current_room.puzzle and not current_room.puzzle.get('solved', True):
-                if current_room.puzzle.get('rewards', {}).get('exit', {}).get('direction') not in current_room.exits:
-                    print(f"The way is blocked by the puzzle! You must solve it first.")
-                    continue
 
-            # Determine the actual direction from input
-            if verb in ["north", "south", "east", "west"]:
-                direction = verb # Player typed just the direction
-            elif verb == "go" and len(parts) >= 2:
-                direction = parts[1] # Player typed "go [direction]"
+        elif direction in session.current_room.locked_exits:
+            print(f"The {direction} exit is locked. You need to unlock it first.")
+        else:
+            print("You can't go that way.")
+
+    def cmd_get():
+        nonlocal gold_gained
+        item_to_get_name_input = None
+        # If command is just "get" or "get item", try to get the current room's item
+        if len(parts) == 1 or (len(parts) == 2 and parts[1] == "item"):
+            if session.current_room.item:
+                item_to_get_name_input = session.current_room.item['name'].lower()
             else:
-                # This case should ideally not be hit with the prior checks,
-                # but as a fallback, if "go" was typed without a direction.
-                print("Where do you want to go? (e.g., 'go north' or just 'north')")
-                continue
+                print("There's no item here to pick up.")
+                return
+        elif len(parts) >= 2:
+            item_to_get_name_input = " ".join(parts[1:])
+        else:
+            print("What do you want to get? (e.g., 'get rusty key' or 'get item')")
+            return
+
+        # Check if the item they're trying to get is actually on the floor
+        if session.current_room.item and item_to_get_name_input == session.current_room.item['name'].lower():
+            # Prevent picking up item if there's a non-boss monster (regular items)
+            if session.current_room.monster and not session.current_room.monster.get('is_boss_guardian', False):
+                print(f"You can't just pick up {add_article(session.current_room.item['name'])}! It's guarded by the {session.current_room.monster['name']}!")
+                return
 
-            opposites = {'north': 'south', 'south': 'north', 'east': 'west', 'west': 'east'}
-            is_back_move = False
-            if direction_history and direction == opposites.get(direction_history[-1]):
-                is_back_move = True
-
-            if is_back_move:
-                print(f"You travel back {direction}...")
-                time.sleep(1)
-                current_room = room_history.pop()
-                direction_history.pop()
-                rooms_travelled -= 1
-                sound_manager.stop_music()
-                if getattr(current_room, 'is_inn', False):
-                    sound_manager.play_music('inn_music')
-                else:
-                    sound_manager.play_music('ambient_music')
-                log_event(f"Player {player_name} returned to Room #{rooms_travelled}.")
-                display_room_content_summary(current_room, rooms_travelled, direction_history, seed)
-                continue
+            # Handle winning item pickup FIRST, then spawn the boss
+            if session.current_room.item['name'] in WINNING_ITEMS:
+                if len(session.player_inventory) >= session.current_max_inventory_slots:
+                    print(f"Your inventory is full! You can't carry {add_article(session.current_room.item['name'])}. Drop something first.")
+                    return
+                if session.current_room.boss_monster_spawned: # If boss already spawned, it means player ran away
+                    print(f"The {session.current_room.monster['name']} is blocking your way to the {session.current_room.item['name']}!")
+                    return
+
+                # Player picks up the winning item
+                print(f"You reach out and grasp {add_article(session.current_room.item['name'])}! A surge of raw power courses through you.")
+                session.player_inventory.append(copy.deepcopy(session.current_room.item))
+                session.current_room.item = None # Item is picked up
+                session.current_room.winning_item_just_spawned = False # No longer just spawned
+                session.current_room.awaiting_winning_item_pickup = False # No longer awaiting pickup
+
+                print("\n" + "=" * 40)
+                print(f"You acquired the {session.player_inventory[-1]['name']}!")
+                print("But the dungeon trembles! Its true guardian senses its loss and appears!")
+                print("=" * 40)
 
-            elif direction in current_room.exits:
-                print(f"You travel {direction}...")
-                time.sleep(1)
-
-                room_history.append(current_room)
-                direction_history.append(direction)
-
-                sound_manager.stop_music()
-                current_room = Room(player_level, player_quests, entry_direction=direction)
-                # --- NEW: Handle if the new room is an inn ---
-                while getattr(current_room, 'is_inn', False):
-                    player_hp, max_hp, player_quests, player_inventory, player_gold, player_xp, xp_to_next_level, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_level, player_keychain, stash, has_hideout_key = \
-                        handle_inn(player_hp, max_hp, player_quests, player_level, player_inventory, current_max_inventory_slots, player_gold, player_xp, xp_to_next_level, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_keychain, sound_manager, stash, has_hideout_key, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, player_reputation, equipped_misc_items, player_effects, equipped_helmet)
-
-                    print("You leave the inn to continue your journey.")
-                    current_room = Room(player_level, player_quests) # Generate a new room
-                # --- END NEW ---
-                sound_manager.play_music('ambient_music') # Always play ambient after moving, as inn handles its own music.
-                rooms_travelled += 1
-                log_event(f"Player {player_name} entered Room #{rooms_travelled} travelling {direction}. Description: {current_room.description}")
-
-                display_room_content_summary(current_room, rooms_travelled, direction_history, seed)
-
-                # Handle immediate hazard upon entering new room
-                if current_room.hazard:
-                    print(current_room.hazard['effect_message'].format(damage=current_room.hazard['damage']))
-                    # MODIFIED: Include equipped_cloak in total defense for hazards in new room
-                    total_room_defense = (player_shield_value.get('defense', 0) if player_shield_value else 0) + \
-                                         (equipped_armor_value.get('defense', 0) if equipped_armor_value else 0) + \
-                                         (equipped_cloak.get('defense', 0) if equipped_cloak else 0)
-                    actual_hazard_damage = max(0, current_room.hazard['damage'] - total_room_defense)
-                    player_hp -= actual_hazard_damage
-                    print(f"Your health is now {player_hp}/{max_hp} HP.")
-                    if total_room_defense > 0:
-                        print(f"Your total defense absorbed {current_room.hazard['damage'] - actual_hazard_damage} damage.")
-                    if player_hp <= 0:
+                # Now, spawn the boss monster dynamically
+                potential_boss_monsters = []
+                max_eligible_level = 0
+                for monster_def in MONSTERS:
+                    monster_level = monster_def.get('level', 1)
+                    level_difference = monster_level - session.player_level
+                    if level_difference >= 0 and level_difference <= MONSTER_SPAWN_LEVEL_MAX_OFFSET:
+                        potential_boss_monsters.append(monster_def)
+                        if monster_level > max_eligible_level:
+                            max_eligible_level = monster_level
+
+                hardest_monsters = [m for m in potential_boss_monsters if m.get('level', 1) == max_eligible_level]
+
+                if hardest_monsters:
+                    session.current_room.monster = dict(random.choice(hardest_monsters))
+                    session.current_room.monster['is_boss_guardian'] = True
+                    session.current_room.boss_monster_spawned = True # Mark that boss has now officially spawned
+                    print(f"A fierce {session.current_room.monster['name']} manifests, enraged by your theft!")
+                    # Immediately initiate combat with the boss
+                    session.current_room.monster, gold_gained, _ = handle_combat(session, session.current_room.monster, current_defense_bonus, current_crit_chance_bonus)
+                    session.player_gold += gold_gained
+                    if session.player_hp <= 0:
                         print("\n" + "=" * 40)
                         print("Your health has fallen to zero! You collapse.")
                         print("        G A M E    O V E R            ")
                         print("=" * 40)
                         if DEBUG: # Wrapped debug calls
                             debug.close_debug_log() # Close log on game over
-                        return 'lose', monsters_defeated_this_run, rooms_travelled
-
-                # If winning item just spawned, set flag for pickup
-                if current_room.item and current_room.item['name'] in WINNING_ITEMS and current_room.winning_item_just_spawned:
-                    print(f"\nAn intense aura fills the room, emanating from {add_article(current_room.item['name'])}!")
-                    if len(player_inventory) >= current_max_inventory_slots:
-                        print(f"Your inventory is full! You cannot pick up the {current_room.item['name']}.")
-                        print("You must drop an item to make space. The guardian's presence is unsettling...")
-                    else:
-                        print("You must pick it up to proceed. (Type 'get item')")
-                    current_room.awaiting_winning_item_pickup = True
-                # Handle regular monsters that just spawned (not winning item guardians)
-                elif current_room.monster and not current_room.monster.get('is_boss_guardian', False):
-                    player_hp, max_hp, current_room.monster, gold_gained, player_xp, player_level, xp_to_next_level, player_quests, \
-                    player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, equipped_misc_items, player_skill_points = \
-                        handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, \
-                                      current_room.monster, player_shield_value, equipped_armor_value, equipped_cloak, player_inventory, current_max_inventory_slots, \
-                                      player_gold, equipped_weapon, player_xp, player_level, xp_to_next_level, player_quests, player_keychain, current_room, equipped_misc_items, player_effects, sound_manager, current_defense_bonus, current_crit_chance_bonus, equipped_helmet, player_class, player_unlocked_skills, player_skill_points)
-                    player_gold += gold_gained
-                    if player_hp <= 0:
+                        return 'lose' # End the game here
+                    if session.current_room.monster is None: # Boss defeated
+                        print(f"\nHaving defeated the guardian, you feel a sense of profound achievement!")
                         print("\n" + "=" * 40)
-                        print("Your health has fallen to zero! You collapse.")
-                        print("        G A M E    O V E R            ")
+                        print(f"You have conquered this dungeon's greatest challenge! The dungeon continues, but you are now a true legend.")
+                        print("Press ENTER to continue your adventure, or type 'exit' to return to the main menu.")
                         print("=" * 40)
-                        if DEBUG: # Wrapped debug calls
-                            debug.close_debug_log() # Close log on game over
-                        return 'lose' # Game over, return 'lose'
-                    if current_room.monster is None:
-                        print(f"\nThe monster is defeated. The room is now safe.")
-                        display_room_content_summary(current_room, rooms_travelled, direction_history, seed)
-
-
-            elif direction in current_room.locked_exits:
-                print(f"The {direction} exit is locked. You need to unlock it first.")
-            else:
-                print("You can't go that way.")
-
-        elif verb == "get":
-            item_to_get_name_input = None
-            # If command is just "get" or "get item", try to get the current room's item
-            if len(parts) == 1 or (len(parts) == 2 and parts[1] == "item"):
-                if current_room.item:
-                    item_to_get_name_input = current_room.item['name'].lower()
-                else:
-                    print("There's no item here to pick up.")
-                    continue
-            elif len(parts) >= 2:
-                item_to_get_name_input = " ".join(parts[1:])
-            else:
-                print("What do you want to get? (e.g., 'get rusty key' or 'get item')")
-                continue
-
-            # Check if the item they're trying to get is actually on the floor
-            if current_room.item and item_to_get_name_input == current_room.item['name'].lower():
-                # Prevent picking up item if there's a non-boss monster (regular items)
-                if current_room.monster and not current_room.monster.get('is_boss_guardian', False):
-                    print(f"You can't just pick up {add_article(current_room.item['name'])}! It's guarded by the {current_room.monster['name']}!")
-                    continue
-
-                # Handle winning item pickup FIRST, then spawn the boss
-                if current_room.item['name'] in WINNING_ITEMS:
-                    if len(player_inventory) >= current_max_inventory_slots:
-                        print(f"Your inventory is full! You can't carry {add_article(current_room.item['name'])}. Drop something first.")
-                        continue
-                    if current_room.boss_monster_spawned: # If boss already spawned, it means player ran away
-                        print(f"The {current_room.monster['name']} is blocking your way to the {current_room.item['name']}!")
-                        continue
-
-                    # Player picks up the winning item
-                    print(f"You reach out and grasp {add_article(current_room.item['name'])}! A surge of raw power courses through you.")
-                    player_inventory.append(copy.deepcopy(current_room.item))
-                    current_room.item = None # Item is picked up
-                    current_room.winning_item_just_spawned = False # No longer just spawned
-                    current_room.awaiting_winning_item_pickup = False # No longer awaiting pickup
-
-                    print("\n" + "=" * 40)
-                    print(f"You acquired the {player_inventory[-1]['name']}!")
-                    print("But the dungeon trembles! Its true guardian senses its loss and appears!")
-                    print("=" * 40)
+                        # Remove the winning item from the room so it doesn't try to spawn another boss later
+                        session.current_room.item = None
+                        # Reset flags for winning item spawn for future rooms
+                        session.current_room.winning_item_just_spawned = False
+                        session.current_room.boss_monster_spawned = False
 
-                    # Now, spawn the boss monster dynamically
-                    potential_boss_monsters = []
-                    max_eligible_level = 0
-                    for monster_def in MONSTERS:
-                        monster_level = monster_def.get('level', 1)
-                        level_difference = monster_level - player_level
-                        if level_difference >= 0 and level_difference <= MONSTER_SPAWN_LEVEL_MAX_OFFSET:
-                            potential_boss_monsters.append(monster_def)
-                            if monster_level > max_eligible_level:
-                                max_eligible_level = monster_level
-
-                    hardest_monsters = [m for m in potential_boss_monsters if m.get('level', 1) == max_eligible_level]
-
-                    if hardest_monsters:
-                        current_room.monster = dict(random.choice(hardest_monsters))
-                        current_room.monster['is_boss_guardian'] = True
-                        current_room.boss_monster_spawned = True # Mark that boss has now officially spawned
-                        print(f"A fierce {current_room.monster['name']} manifests, enraged by your theft!")
-                        # Immediately initiate combat with the boss
-                        player_hp, max_hp, current_room.monster, gold_gained, player_xp, player_level, xp_to_next_level, player_quests, \
-                        player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, equipped_misc_items, player_skill_points = \
-                            handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, \
-                                          current_room.monster, player_shield_value, equipped_armor_value, equipped_cloak, player_inventory, current_max_inventory_slots, \
-                                      player_gold, equipped_weapon, player_xp, player_level, xp_to_next_level, player_quests, player_keychain, current_room, equipped_misc_items, player_effects, sound_manager, current_defense_bonus, current_crit_chance_bonus, equipped_helmet, player_class, player_unlocked_skills, player_skill_points)
-                        player_gold += gold_gained
-                        if player_hp <= 0:
-                            print("\n" + "=" * 40)
-                            print("Your health has fallen to zero! You collapse.")
-                            print("        G A M E    O V E R            ")
-                            print("=" * 40)
-                            if DEBUG: # Wrapped debug calls
-                                debug.close_debug_log() # Close log on game over
-                            return 'lose' # End the game here
-                        if current_room.monster is None: # Boss defeated
-                            print(f"\nHaving defeated the guardian, you feel a sense of profound achievement!")
-                            print("\n" + "=" * 40)
-                            print(f"You have conquered this dungeon's greatest challenge! The dungeon continues, but you are now a true legend.")
-                            print("Press ENTER to continue your adventure, or type 'exit' to return to the main menu.")
-                            print("=" * 40)
-                            # Remove the winning item from the room so it doesn't try to spawn another boss later
-                            current_room.item = None
-                            # Reset flags for winning item spawn for future rooms
-                            current_room.winning_item_just_spawned = False
-                            current_room.boss_monster_spawned = False
-
-                            # NEW: Prompt for choice after winning
-                            choice = input("> ").lower().strip()
-                            if choice == 'exit':
-                                return 'return_to_menu' # New return type to signal going back to main menu
-                            else:
-                                return 'continue_adventure' # Default for pressing Enter or anything else
-                        else: # Player ran from boss
-                            print(f"\nThe {current_room.monster['name']} still stalks this room, guarding your escape route.")
-                    else:
-                        print("You claimed the item, but no guardian appeared. (This is unexpected!)")
-                        print("\n" + "=" * 40)
-                        print(f"You found {player_inventory[-1]['name']}! You are truly lucky!")
-                        print("The dungeon feels calmer, but still stretches endlessly before you.")
-                        print("=" * 40)
-                        current_room.item = None
-                        current_room.winning_item_just_spawned = False
-                        current_room.boss_monster_spawned = False
-                        # NEW: Prompt for choice even if no boss for winning item (shouldn't happen with correct spawn logic)
-                        print("Press ENTER to continue your adventure, or type 'exit' to return to the main menu.")
+                        # NEW: Prompt for choice after winning
                         choice = input("> ").lower().strip()
                         if choice == 'exit':
-                            return 'return_to_menu'
+                            return 'return_to_menu' # New return type to signal going back to main menu
                         else:
-                            return 'continue_adventure'
-
-                # --- Keychain Integration: Keys go to keychain, others to inventory ---
-                elif current_room.item.get('type') == 'key':
-                    key_just_picked_up = current_room.item # Store a reference to the item
-                    print(f"You pick up {add_article(key_just_picked_up['name'])} and attach it to your keychain.")
-                    player_keychain.append(copy.deepcopy(key_just_picked_up)) # Add key to keychain
-                    current_room.item = None # Item is picked up from the room
-                    # --- NEW DEBUG AFTER KEY PICKUP ---
-                    if DEBUG: # Wrapped debug calls
-                        debug.debug_key_acquisition(player_keychain[-1], "room pickup")
-                    # --- END NEW DEBUG ---
-                # Regular item pickup logic (if not a winning item or key)
+                            return 'continue_adventure' # Default for pressing Enter or anything else
+                    else: # Player ran from boss
+                        print(f"\nThe {session.current_room.monster['name']} still stalks this room, guarding your escape route.")
                 else:
-                    if len(player_inventory) >= current_max_inventory_slots:
-                        print(f"Your inventory is full! You can't carry {add_article(current_room.item['name'])}.")
-                        print(f"You must drop an item before picking up another. (Current: {len(player_inventory)}/{current_max_inventory_slots})")
-                        continue
-
-                    print(f"You pick up {add_article(current_room.item['name'])}.")
-                    player_inventory.append(copy.deepcopy(current_room.item))
-
-                    for q_id, q_data in player_quests.items():
-                        quest_def = get_quest_by_id(q_id)
-                        if quest_def and q_data['status'] == 'active' and quest_def['type'] == 'fetch_item' and quest_def['target_item'].lower() == item_to_get_name_input.lower():
-                            if q_data['current_count'] < quest_def['target_count']:
-                                q_data['current_count'] += 1
-                                print(f"Quest Update: Picked up a {item_to_get_name_input}! ({q_data['current_count']}/{quest_def['target_count']})")
-                                if q_data['current_count'] >= quest_def['target_count']:
-                                    print(f"QUEST COMPLETE: '{quest_def['name']}'! Return to {quest_def['giver_npc_name']} to claim your reward!")
-
-                    current_room.item = None # Item is picked up from the room
+                    print("You claimed the item, but no guardian appeared. (This is unexpected!)")
+                    print("\n" + "=" * 40)
+                    print(f"You found {session.player_inventory[-1]['name']}! You are truly lucky!")
+                    print("The dungeon feels calmer, but still stretches endlessly before you.")
+                    print("=" * 40)
+                    session.current_room.item = None
+                    session.current_room.winning_item_just_spawned = False
+                    session.current_room.boss_monster_spawned = False
+                    # NEW: Prompt for choice even if no boss for winning item (shouldn't happen with correct spawn logic)
+                    print("Press ENTER to continue your adventure, or type 'exit' to return to the main menu.")
+                    choice = input("> ").lower().strip()
+                    if choice == 'exit':
+                        return 'return_to_menu'
+                    else:
+                        return 'continue_adventure'
+
+            # --- Keychain Integration: Keys go to keychain, others to inventory ---
+            elif session.current_room.item.get('type') == 'key':
+                key_just_picked_up = session.current_room.item # Store a reference to the item
+                print(f"You pick up {add_article(key_just_picked_up['name'])} and attach it to your keychain.")
+                session.player_keychain.append(copy.deepcopy(key_just_picked_up)) # Add key to keychain
+                session.current_room.item = None # Item is picked up from the room
+                # --- NEW DEBUG AFTER KEY PICKUP ---
+                if DEBUG: # Wrapped debug calls
+                    debug.debug_key_acquisition(session.player_keychain[-1], "room pickup")
+                # --- END NEW DEBUG ---
+            # Regular item pickup logic (if not a winning item or key)
             else:
-                print("That item is not here.")
-
-
-        elif verb == "drop":
-            if len(parts) < 2:
-                print("What do you want to drop? (e.g., 'drop rusty key')")
-                continue
+                if len(session.player_inventory) >= session.current_max_inventory_slots:
+                    print(f"Your inventory is full! You can't carry {add_article(session.current_room.item['name'])}.")
+                    print(f"You must drop an item before picking up another. (Current: {len(session.player_inventory)}/{session.current_max_inventory_slots})")
+                    return
 
-            item_to_drop_name_input = " ".join(parts[1:])
-            item_found_in_inventory = None
-            item_found_in_keychain = None # For keychain
+                print(f"You pick up {add_article(session.current_room.item['name'])}.")
+                session.player_inventory.append(copy.deepcopy(session.current_room.item))
 
-            # First, check player's main inventory
-            for item_dict in player_inventory:
+                for q_id, q_data in session.player_quests.items():
+                    quest_def = get_quest_by_id(q_id)
+                    if quest_def and q_data['status'] == 'active' and quest_def['type'] == 'fetch_item' and quest_def['target_item'].lower() == item_to_get_name_input.lower():
+                        if q_data['current_count'] < quest_def['target_count']:
+                            q_data['current_count'] += 1
+                            print(f"Quest Update: Picked up a {item_to_get_name_input}! ({q_data['current_count']}/{quest_def['target_count']})")
+                            if q_data['current_count'] >= quest_def['target_count']:
+                                print(f"QUEST COMPLETE: '{quest_def['name']}'! Return to {quest_def['giver_npc_name']} to claim your reward!")
+
+                session.current_room.item = None # Item is picked up from the room
+        else:
+            print("That item is not here.")
+
+    def cmd_drop():
+        if len(parts) < 2:
+            print("What do you want to drop? (e.g., 'drop rusty key')")
+            return
+
+        item_to_drop_name_input = " ".join(parts[1:])
+        item_found_in_inventory = None
+        item_found_in_keychain = None # For keychain
+
+        # First, check player's main inventory
+        for item_dict in session.player_inventory:
+            if item_dict['name'].lower() == item_to_drop_name_input:
+                item_found_in_inventory = item_dict
+                break
+
+        # If not in main inventory, check keychain
+        if not item_found_in_inventory:
+            for item_dict in session.player_keychain:
                 if item_dict['name'].lower() == item_to_drop_name_input:
-                    item_found_in_inventory = item_dict
+                    item_found_in_keychain = item_dict
                     break
 
-            # If not in main inventory, check keychain
-            if not item_found_in_inventory:
-                for item_dict in player_keychain:
-                    if item_dict['name'].lower() == item_to_drop_name_input:
-                        item_found_in_keychain = item_dict
-                        break
-
-            if item_found_in_inventory:
-                if item_found_in_inventory['name'] in WINNING_ITEMS:
-                    print("You cannot drop a legendary artifact! It's too important.")
-                    continue
+        if item_found_in_inventory:
+            if item_found_in_inventory['name'] in WINNING_ITEMS:
+                print("You cannot drop a legendary artifact! It's too important.")
+                return
 
-                if current_room.item is not None:
-                    print(f"You can't drop {add_article(item_found_in_inventory['name'])}. There's already {add_article(current_room.item['name'])} on the floor.")
-                    continue
+            if session.current_room.item is not None:
+                print(f"You can't drop {add_article(item_found_in_inventory['name'])}. There's already {add_article(session.current_room.item['name'])} on the floor.")
+                return
 
-                is_quest_item = False
-                for q_id, q_data in player_quests.items():
-                    quest_def = get_quest_by_id(q_id)
-                    if quest_def and q_data['status'] == 'active' and quest_def['type'] == 'fetch_item' and quest_def['target_item'].lower() == item_to_drop_name_input.lower():
-                        if q_data['current_count'] > 0:
-                            print(f"Warning: You are dropping a '{item_to_drop_name_input}' which is a quest item for '{quest_def['name']}'. Your quest progress will decrease.")
-                            q_data['current_count'] -= 1
-                            if q_data['current_count'] < quest_def['target_count']:
-                                print(f"Quest Update: Your progress for '{quest_def['name']}' is now {q_data['current_count']}/{quest_def['target_count']}.")
-                            is_quest_item = True
-                            break
-
-                # Unequip the specific item if it's currently equipped by object identity
-                if equipped_weapon is item_found_in_inventory:
-                    equipped_weapon = None
-                    print(f"You unequip and drop {add_article(item_found_in_inventory['name'])}. You are now wielding your fists.")
-                elif equipped_armor_value is item_found_in_inventory:
-                    equipped_armor_value = None
-                    print(f"You unequip and drop {add_article(item_found_in_inventory['name'])}. Your body armor defense is now 0.") # MODIFIED: clarify
-                elif equipped_cloak is item_found_in_inventory: # NEW: Unequip cloak if dropping
-                    equipped_cloak = None
-                    print(f"You unequip and drop {add_article(item_found_in_inventory['name'])}. Your cloak defense is now 0.")
-                elif item_found_in_inventory in equipped_misc_items:
-                    equipped_misc_items.remove(item_found_in_inventory)
-                    print(f"You unequip and drop {add_article(item_found_in_inventory['name'])}.")
-                elif player_shield_value is item_found_in_inventory:
-                    player_shield_value = None
-                    print(f"You unequip and drop {add_article(item_found_in_inventory['name'])}. Your shield defense is now 0.")
-                else:
-                    if not is_quest_item: # Avoid double message if already warned about quest item
-                        print(f"You drop {add_article(item_found_in_inventory['name'])}.")
-
-                player_inventory.remove(item_found_in_inventory)
-                current_room.item = item_found_in_inventory # Item returns to the room floor
-                display_room_content_summary(current_room, rooms_travelled, direction_history, seed)
-            elif item_found_in_keychain: # Item is in keychain
-                if current_room.item is not None:
-                    print(f"You can't drop {add_article(item_found_in_keychain['name'])}. There's already {add_article(current_room.item['name'])} on the floor.")
-                    continue
+            is_quest_item = False
+            for q_id, q_data in session.player_quests.items():
+                quest_def = get_quest_by_id(q_id)
+                if quest_def and q_data['status'] == 'active' and quest_def['type'] == 'fetch_item' and quest_def['target_item'].lower() == item_to_drop_name_input.lower():
+                    if q_data['current_count'] > 0:
+                        print(f"Warning: You are dropping a '{item_to_drop_name_input}' which is a quest item for '{quest_def['name']}'. Your quest progress will decrease.")
+                        q_data['current_count'] -= 1
+                        if q_data['current_count'] < quest_def['target_count']:
+                            print(f"Quest Update: Your progress for '{quest_def['name']}' is now {q_data['current_count']}/{quest_def['target_count']}.")
+                        is_quest_item = True
+                        break
 
-                print(f"You drop {add_article(item_found_in_keychain['name'])} from your keychain.")
-                player_keychain.remove(item_found_in_keychain)
-                current_room.item = item_found_in_keychain # Key returns to the room floor
-                display_room_content_summary(current_room, rooms_travelled, direction_history, seed)
+            # Unequip the specific item if it's currently equipped by object identity
+            if session.equipped_weapon is item_found_in_inventory:
+                session.equipped_weapon = None
+                print(f"You unequip and drop {add_article(item_found_in_inventory['name'])}. You are now wielding your fists.")
+            elif session.equipped_armor_value is item_found_in_inventory:
+                session.equipped_armor_value = None
+                print(f"You unequip and drop {add_article(item_found_in_inventory['name'])}. Your body armor defense is now 0.") # MODIFIED: clarify
+            elif session.equipped_cloak is item_found_in_inventory: # NEW: Unequip cloak if dropping
+                session.equipped_cloak = None
+                print(f"You unequip and drop {add_article(item_found_in_inventory['name'])}. Your cloak defense is now 0.")
+            elif item_found_in_inventory in session.equipped_misc_items:
+                session.equipped_misc_items.remove(item_found_in_inventory)
+                print(f"You unequip and drop {add_article(item_found_in_inventory['name'])}.")
+            elif session.player_shield_value is item_found_in_inventory:
+                session.player_shield_value = None
+                print(f"You unequip and drop {add_article(item_found_in_inventory['name'])}. Your shield defense is now 0.")
             else:
-                print(f"You don't have {item_to_drop_name_input} in your inventory or keychain.")
-
-
-        elif verb == "use":
-            if len(parts) < 2:
-                print("What do you want to use? (e.g., 'use healing potion')")
-                continue
+                if not is_quest_item: # Avoid double message if already warned about quest item
+                    print(f"You drop {add_article(item_found_in_inventory['name'])}.")
+
+            session.player_inventory.remove(item_found_in_inventory)
+            session.current_room.item = item_found_in_inventory # Item returns to the room floor
+            display_room_content_summary(session.current_room, session.rooms_travelled, session.direction_history, session.seed)
+        elif item_found_in_keychain: # Item is in keychain
+            if session.current_room.item is not None:
+                print(f"You can't drop {add_article(item_found_in_keychain['name'])}. There's already {add_article(session.current_room.item['name'])} on the floor.")
+                return
 
-            item_to_use_name_input = " ".join(parts[1:])
-            item_found_in_inventory = None
-            for item_dict in player_inventory:
-                if item_dict['name'].lower() == item_to_use_name_input:
-                    item_found_in_inventory = item_dict
-                    break
+            print(f"You drop {add_article(item_found_in_keychain['name'])} from your keychain.")
+            session.player_keychain.remove(item_found_in_keychain)
+            session.current_room.item = item_found_in_keychain # Key returns to the room floor
+            display_room_content_summary(session.current_room, session.rooms_travelled, session.direction_history, session.seed)
+        else:
+            print(f"You don't have {item_to_drop_name_input} in your inventory or keychain.")
+
+    def cmd_use():
+        if len(parts) < 2:
+            print("What do you want to use? (e.g., 'use healing potion')")
+            return
+
+        item_to_use_name_input = " ".join(parts[1:])
+        item_found_in_inventory = None
+        for item_dict in session.player_inventory:
+            if item_dict['name'].lower() == item_to_use_name_input:
+                item_found_in_inventory = item_dict
+                break
+
+        if item_found_in_inventory:
+            original_player_hp = session.player_hp
+            session.player_hp, session.max_hp, session.current_max_inventory_slots, consumed_turn, stat_changes = process_item_use(item_found_in_inventory, session.player_hp, session.max_hp, session.player_inventory, session.current_max_inventory_slots, in_combat=False)
+
+            if stat_changes:
+                if 'attack_power' in stat_changes:
+                    session.player_attack_bonus += stat_changes['attack_power']
+                    print(f"Your base attack power has permanently increased by {stat_changes['attack_power']}!")
+                elif 'max_hp' in stat_changes:
+                    hp_increase = stat_changes['max_hp']
+                    session.max_hp += hp_increase
+                    session.player_hp += hp_increase
+                    print(f"Your maximum HP has permanently increased by {hp_increase}!")
+
+            if session.player_hp <= 0:
+                print("\n" + "=" * 40)
+                print("Your health has fallen to zero! You collapse.")
+                print("        G A M E    O V E R            ")
+                print("=" * 40)
+                if DEBUG: # Wrapped debug calls
+                    debug.close_debug_log() # Close log on game over
+                return 'lose'
 
-            if item_found_in_inventory:
-                original_player_hp = player_hp
-                player_hp, max_hp, current_max_inventory_slots, consumed_turn, stat_changes = process_item_use(item_found_in_inventory, player_hp, max_hp, player_inventory, current_max_inventory_slots, in_combat=False)
-
-                if stat_changes:
-                    if 'attack_power' in stat_changes:
-                        player_attack_bonus += stat_changes['attack_power']
-                        print(f"Your base attack power has permanently increased by {stat_changes['attack_power']}!")
-                    elif 'max_hp' in stat_changes:
-                        hp_increase = stat_changes['max_hp']
-                        max_hp += hp_increase
-                        player_hp += hp_increase
-                        print(f"Your maximum HP has permanently increased by {hp_increase}!")
-
-                if player_hp <= 0:
-                    print("\n" + "=" * 40)
-                    print("Your health has fallen to zero! You collapse.")
-                    print("        G A M E    O V E R            ")
-                    print("=" * 40)
-                    if DEBUG: # Wrapped debug calls
-                        debug.close_debug_log() # Close log on game over
-                    return 'lose', monsters_defeated_this_run, rooms_travelled
+            if session.player_hp != original_player_hp:
+                print(f"Your health is now {session.player_hp}/{session.max_hp} HP.")
+        else:
+            print(f"You don't have {item_to_use_name_input} in your inventory.")
+
+    def cmd_equip():
+        if len(parts) < 2:
+            print("What do you want to equip? (e.g., 'equip wooden sword' or 'quip chainmail')")
+            return
+
+        item_to_equip_name_input = " ".join(parts[1:])
+        item_found_in_inventory = None
+        # Find the *specific instance* of the item to equip
+        for item_dict in session.player_inventory:
+            if item_dict['name'].lower() == item_to_equip_name_input and \
+               item_dict.get('type') in ['shield', 'armor', 'weapon', 'equipment']:
+                item_found_in_inventory = item_dict
+                break
+
+        if item_found_in_inventory:
+            session.player_shield_value, session.equipped_armor_value, session.equipped_cloak, session.equipped_weapon, session.equipped_misc_items, session.equipped_helmet = \
+                handle_equip_item(item_found_in_inventory, session.player_shield_value, session.equipped_armor_value, session.equipped_cloak, session.equipped_weapon, session.equipped_misc_items, session.player_level, session.equipped_helmet)
+            session.player_attack_power = recalculate_attack_power(session.player_level, session.equipped_weapon, session.equipped_misc_items, session.player_attack_bonus)
+            print(f"Your attack power is now {session.player_attack_power}.")
+        else:
+            print(f"You don't have {item_to_equip_name_input} in your inventory, or it's not an equipable item (weapon, shield, or armor).")
 
-                if player_hp != original_player_hp:
-                    print(f"Your health is now {player_hp}/{max_hp} HP.")
-            else:
-                print(f"You don't have {item_to_use_name_input} in your inventory.")
+    def cmd_unequip():
+        if len(parts) < 2:
+            print("What do you want to unequip? (e.g., 'unequip wooden sword')")
+            return
 
-        elif verb in ["equip", "quip"]:
-            if len(parts) < 2:
-                print("What do you want to equip? (e.g., 'equip wooden sword' or 'quip chainmail')")
-                continue
+        item_to_unequip_name_input = " ".join(parts[1:])
 
-            item_to_equip_name_input = " ".join(parts[1:])
-            item_found_in_inventory = None
-            # Find the *specific instance* of the item to equip
-            for item_dict in player_inventory:
-                if item_dict['name'].lower() == item_to_equip_name_input and \
-                   item_dict.get('type') in ['shield', 'armor', 'weapon', 'equipment']:
-                    item_found_in_inventory = item_dict
-                    break
+        item_unequipped = False
 
-            if item_found_in_inventory:
-                player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, equipped_misc_items, equipped_helmet = \
-                    handle_equip_item(item_found_in_inventory, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, equipped_misc_items, player_level, equipped_helmet)
-                player_attack_power = recalculate_attack_power(player_level, equipped_weapon, equipped_misc_items, player_attack_bonus)
-                print(f"Your attack power is now {player_attack_power}.")
+        # Check weapon
+        if session.equipped_weapon and session.equipped_weapon['name'].lower() == item_to_unequip_name_input:
+            if session.equipped_weapon.get('cursed'):
+                print(f"Your {session.equipped_weapon['name']} is cursed! You cannot unequip it.")
             else:
-                print(f"You don't have {item_to_equip_name_input} in your inventory, or it's not an equipable item (weapon, shield, or armor).")
-
-
-        elif verb == "unequip":
-            if len(parts) < 2:
-                print("What do you want to unequip? (e.g., 'unequip wooden sword')")
-                continue
-
-            item_to_unequip_name_input = " ".join(parts[1:])
-
-            item_unequipped = False
-
-            # Check weapon
-            if equipped_weapon and equipped_weapon['name'].lower() == item_to_unequip_name_input:
-                if equipped_weapon.get('cursed'):
-                    print(f"Your {equipped_weapon['name']} is cursed! You cannot unequip it.")
-                else:
-                    print(f"You unequip your {equipped_weapon['name']}.")
-                    equipped_weapon = None
-                item_unequipped = True
-
-            # Check shield
-            elif player_shield_value and player_shield_value['name'].lower() == item_to_unequip_name_input:
-                if player_shield_value.get('cursed'):
-                    print(f"Your {player_shield_value['name']} is cursed! You cannot unequip it.")
-                else:
-                    print(f"You unequip your {player_shield_value['name']}.")
-                    player_shield_value = None
-                item_unequipped = True
-
-            # Check body armor
-            elif equipped_armor_value and equipped_armor_value['name'].lower() == item_to_unequip_name_input:
-                if equipped_armor_value.get('cursed'):
-                    print(f"Your {equipped_armor_value['name']} is cursed! You cannot unequip it.")
-                else:
-                    print(f"You unequip your {equipped_armor_value['name']}.")
-                    equipped_armor_value = None
-                item_unequipped = True
-
-            # Check cloak
-            elif equipped_cloak and equipped_cloak['name'].lower() == item_to_unequip_name_input:
-                if equipped_cloak.get('cursed'):
-                    print(f"Your {equipped_cloak['name']} is cursed! You cannot unequip it.")
-                else:
-                    print(f"You unequip your {equipped_cloak['name']}.")
-                    equipped_cloak = None
-                item_unequipped = True
-
-            # Check helmet
-            elif equipped_helmet and equipped_helmet['name'].lower() == item_to_unequip_name_input:
-                if equipped_helmet.get('cursed'):
-                    print(f"Your {equipped_helmet['name']} is cursed! You cannot unequip it.")
-                else:
-                    print(f"You unequip your {equipped_helmet['name']}.")
-                    equipped_helmet = None
-                item_unequipped = True
-
+                print(f"You unequip your {session.equipped_weapon['name']}.")
+                session.equipped_weapon = None
+            item_unequipped = True
+
+        # Check shield
+        elif session.player_shield_value and session.player_shield_value['name'].lower() == item_to_unequip_name_input:
+            if session.player_shield_value.get('cursed'):
+                print(f"Your {session.player_shield_value['name']} is cursed! You cannot unequip it.")
             else:
-                for item in equipped_misc_items:
-                    if item['name'].lower() == item_to_unequip_name_input:
-                        if item.get('cursed'):
-                            print(f"Your {item['name']} is cursed! You cannot unequip it.")
-                        else:
-                            print(f"You unequip your {item['name']}.")
-                            equipped_misc_items.remove(item)
-                        item_unequipped = True
-                        break
+                print(f"You unequip your {session.player_shield_value['name']}.")
+                session.player_shield_value = None
+            item_unequipped = True
+
+        # Check body armor
+        elif session.equipped_armor_value and session.equipped_armor_value['name'].lower() == item_to_unequip_name_input:
+            if session.equipped_armor_value.get('cursed'):
+                print(f"Your {session.equipped_armor_value['name']} is cursed! You cannot unequip it.")
+            else:
+                print(f"You unequip your {session.equipped_armor_value['name']}.")
+                session.equipped_armor_value = None
+            item_unequipped = True
+
+        # Check cloak
+        elif session.equipped_cloak and session.equipped_cloak['name'].lower() == item_to_unequip_name_input:
+            if session.equipped_cloak.get('cursed'):
+                print(f"Your {session.equipped_cloak['name']} is cursed! You cannot unequip it.")
+            else:
+                print(f"You unequip your {session.equipped_cloak['name']}.")
+                session.equipped_cloak = None
+            item_unequipped = True
+
+        # Check helmet
+        elif session.equipped_helmet and session.equipped_helmet['name'].lower() == item_to_unequip_name_input:
+            if session.equipped_helmet.get('cursed'):
+                print(f"Your {session.equipped_helmet['name']} is cursed! You cannot unequip it.")
+            else:
+                print(f"You unequip your {session.equipped_helmet['name']}.")
+                session.equipped_helmet = None
+            item_unequipped = True
+
+        else:
+            for item in session.equipped_misc_items:
+                if item['name'].lower() == item_to_unequip_name_input:
+                    if item.get('cursed'):
+                        print(f"Your {item['name']} is cursed! You cannot unequip it.")
+                    else:
+                        print(f"You unequip your {item['name']}.")
+                        session.equipped_misc_items.remove(item)
+                    item_unequipped = True
+                    break
 
-            if not item_unequipped:
-                print(f"You don't have '{item_to_unequip_name_input}' equipped.")
+        if not item_unequipped:
+            print(f"You don't have '{item_to_unequip_name_input}' equipped.")
 
-        elif verb == "attack":
-            # If a winning item just spawned and hasn't been picked up, prevent attacking a non-existent boss
-            if current_room.awaiting_winning_item_pickup:
-                print(f"You must first pick up {add_article(current_room.item['name'])}!")
-                continue
+    def cmd_attack():
+        nonlocal gold_gained
+        # If a winning item just spawned and hasn't been picked up, prevent attacking a non-existent boss
+        if session.current_room.awaiting_winning_item_pickup:
+            print(f"You must first pick up {add_article(session.current_room.item['name'])}!")
+            return
 
-            if current_room.monster:
-                player_hp, max_hp, current_room.monster, gold_gained, player_xp, player_level, xp_to_next_level, player_quests, \
-                player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, equipped_misc_items, player_skill_points = \
-                    handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, \
-                                  current_room.monster, player_shield_value, equipped_armor_value, equipped_cloak, player_inventory, current_max_inventory_slots, \
-                                  player_gold, equipped_weapon, player_xp, player_level, xp_to_next_level, player_quests, player_keychain, current_room, equipped_misc_items, player_effects, sound_manager, current_defense_bonus, current_crit_chance_bonus, equipped_helmet, player_class, player_unlocked_skills, player_skill_points)
-                player_gold += gold_gained
-                if player_hp <= 0:
+        if session.current_room.monster:
+            session.current_room.monster, gold_gained, _ = handle_combat(session, session.current_room.monster, current_defense_bonus, current_crit_chance_bonus)
+            session.player_gold += gold_gained
+            if session.player_hp <= 0:
+                print("\n" + "=" * 40)
+                print("Your health has fallen to zero! You collapse.")
+                print("        G A M E    O V E R            ")
+                print("=" * 40)
+                if DEBUG: # Wrapped debug calls
+                    debug.close_debug_log() # Close log on game over
+                return 'lose' # Game over, return 'lose'
+            if session.current_room.monster is None:
+                # If the monster was a boss guardian, the game is won, but continues
+                if session.current_room.boss_monster_spawned and any(item['name'] in WINNING_ITEMS for item in session.player_inventory):
+                    print(f"\nHaving defeated the guardian, you feel a sense of profound achievement!")
                     print("\n" + "=" * 40)
-                    print("Your health has fallen to zero! You collapse.")
-                    print("        G A M E    O V E R            ")
+                    print(f"You have conquered this dungeon's greatest challenge! The dungeon continues, but you are now a true legend.")
+                    print("Press ENTER to continue your adventure, or type 'exit' to return to the main menu.")
                     print("=" * 40)
-                    if DEBUG: # Wrapped debug calls
-                        debug.close_debug_log() # Close log on game over
-                    return 'lose' # Game over, return 'lose'
-                if current_room.monster is None:
-                    # If the monster was a boss guardian, the game is won, but continues
-                    if current_room.boss_monster_spawned and any(item['name'] in WINNING_ITEMS for item in player_inventory):
-                        print(f"\nHaving defeated the guardian, you feel a sense of profound achievement!")
-                        print("\n" + "=" * 40)
-                        print(f"You have conquered this dungeon's greatest challenge! The dungeon continues, but you are now a true legend.")
-                        print("Press ENTER to continue your adventure, or type 'exit' to return to the main menu.")
-                        print("=" * 40)
-                        # Remove the winning item from the room so it doesn't try to spawn another boss later
-                        current_room.item = None
-                        # Reset flags for winning item spawn for future rooms
-                        current_room.winning_item_just_spawned = False
-                        current_room.boss_monster_spawned = False
-
-                        # NEW: Prompt for choice after winning
-                        choice = input("> ").lower().strip()
-                        if choice == 'exit':
-                            return 'return_to_menu' # New return type to signal going back to main menu
-                        else:
-                            return 'continue_adventure' # Default for pressing Enter or anything else
+                    # Remove the winning item from the room so it doesn't try to spawn another boss later
+                    session.current_room.item = None
+                    # Reset flags for winning item spawn for future rooms
+                    session.current_room.winning_item_just_spawned = False
+                    session.current_room.boss_monster_spawned = False
+
+                    # NEW: Prompt for choice after winning
+                    choice = input("> ").lower().strip()
+                    if choice == 'exit':
+                        return 'return_to_menu' # New return type to signal going back to main menu
                     else:
-                        print(f"\nThe monster is defeated. The room is now safe.")
-                        display_room_content_summary(current_room, rooms_travelled, direction_history, seed)
-            else:
-                print("There's nothing to attack here.")
-
-        elif verb == "combine":
-            if current_room.monster:
-                print(f"You can't combine items while the {current_room.monster['name']} is still here!")
-                continue
-
-            if len(parts) == 1:
-                print("Available combinations:")
-                for recipe in COMBINATION_RECIPES:
-                    ingredients = ", ".join([f"{ingredient['quantity']}x {ingredient['name']}" for ingredient in recipe['ingredients']])
-                    print(f"  - {recipe['result']} (requires: {ingredients})")
-                print("Usage: combine [item name]")
-                continue
+                        return 'continue_adventure' # Default for pressing Enter or anything else
+                else:
+                    print(f"\nThe monster is defeated. The room is now safe.")
+                    display_room_content_summary(session.current_room, session.rooms_travelled, session.direction_history, session.seed)
+        else:
+            print("There's nothing to attack here.")
 
-            item_to_combine_name_input = " ".join(parts[1:])
+    def cmd_combine():
+        if session.current_room.monster:
+            print(f"You can't combine items while the {session.current_room.monster['name']} is still here!")
+            return
 
-            recipe_found = None
+        if len(parts) == 1:
+            print("Available combinations:")
             for recipe in COMBINATION_RECIPES:
-                if recipe['result'].lower() == item_to_combine_name_input.lower():
-                    recipe_found = recipe
-                    break
-
-            if not recipe_found:
-                print(f"You don't know how to combine {add_article(item_to_combine_name_input)}.")
-                continue
-
-            can_combine = True
-            for ingredient in recipe_found['ingredients']:
-                if not has_player_enough_items(player_inventory, ingredient['name'], ingredient['quantity']):
-                    can_combine = False
-                    print(f"You don't have enough {ingredient['name']}.")
-                    break
+                ingredients = ", ".join([f"{ingredient['quantity']}x {ingredient['name']}" for ingredient in recipe['ingredients']])
+                print(f"  - {recipe['result']} (requires: {ingredients})")
+            print("Usage: combine [item name]")
+            return
+
+        item_to_combine_name_input = " ".join(parts[1:])
+
+        recipe_found = None
+        for recipe in COMBINATION_RECIPES:
+            if recipe['result'].lower() == item_to_combine_name_input.lower():
+                recipe_found = recipe
+                break
+
+        if not recipe_found:
+            print(f"You don't know how to combine {add_article(item_to_combine_name_input)}.")
+            return
+
+        can_combine = True
+        for ingredient in recipe_found['ingredients']:
+            if not has_player_enough_items(session.player_inventory, ingredient['name'], ingredient['quantity']):
+                can_combine = False
+                print(f"You don't have enough {ingredient['name']}.")
+                break
+
+        if can_combine:
+            # Check for inventory space
+            if len(session.player_inventory) - sum(ing['quantity'] for ing in recipe_found['ingredients']) + 1 > session.current_max_inventory_slots:
+                print("Your inventory is too full to combine these items.")
+            else:
+                for ingredient in recipe_found['ingredients']:
+                    remove_items_from_inventory(session.player_inventory, ingredient['name'], ingredient['quantity'])
 
-            if can_combine:
-                # Check for inventory space
-                if len(player_inventory) - sum(ing['quantity'] for ing in recipe_found['ingredients']) + 1 > current_max_inventory_slots:
-                    print("Your inventory is too full to combine these items.")
+                result_item = get_item_by_name(recipe_found['result'])
+                if result_item:
+                    session.player_inventory.append(copy.deepcopy(result_item))
+                    print(f"You successfully combined the items to create {add_article(result_item['name'])}!")
                 else:
-                    for ingredient in recipe_found['ingredients']:
-                        remove_items_from_inventory(player_inventory, ingredient['name'], ingredient['quantity'])
+                    print(f"Combination failed: result item '{recipe_found['result']}' not found.")
 
-                    result_item = get_item_by_name(recipe_found['result'])
-                    if result_item:
-                        player_inventory.append(copy.deepcopy(result_item))
-                        print(f"You successfully combined the items to create {add_article(result_item['name'])}!")
-                    else:
-                        print(f"Combination failed: result item '{recipe_found['result']}' not found.")
+    def cmd_unlock():
+        if len(parts) < 4 or parts[2] != "with":
+            print("Unlock what? Usage: 'unlock [direction] with [key name]'")
+            return
 
-        elif verb == "unlock":
-            if len(parts) < 4 or parts[2] != "with":
-                print("Unlock what? Usage: 'unlock [direction] with [key name]'")
-                continue
+        if session.current_room.monster:
+            print(f"You can't do that while the {session.current_room.monster['name']} is still here!")
+            return
 
-            if current_room.monster:
-                print(f"You can't do that while the {current_room.monster['name']} is still here!")
-                continue
+        direction_to_unlock = parts[1]
+        key_name_input = " ".join(parts[3:])
 
-            direction_to_unlock = parts[1]
-            key_name_input = " ".join(parts[3:])
+        if direction_to_unlock not in session.current_room.locked_exits:
+            print(f"The {direction_to_unlock} exit is not locked, or it doesn't exist.")
+            return
 
-            if direction_to_unlock not in current_room.locked_exits:
-                print(f"The {direction_to_unlock} exit is not locked, or it doesn't exist.")
-                continue
+        required_key_type = session.current_room.locked_exits[direction_to_unlock]
 
-            required_key_type = current_room.locked_exits[direction_to_unlock]
+        has_correct_key = False
+        found_key_item = None # Can be from keychain or inventory
 
-            has_correct_key = False
-            found_key_item = None # Can be from keychain or inventory
+        for inv_item_dict in session.player_keychain: # Check keychain first
+            if (inv_item_dict.get('type') == 'key' and
+                inv_item_dict.get('key_type') == required_key_type and
+                inv_item_dict['name'].lower() == key_name_input):
+                has_correct_key = True
+                found_key_item = inv_item_dict
+                break
 
-            for inv_item_dict in player_keychain: # Check keychain first
+        # If not found in keychain, check main inventory for keys (legacy or dropped)
+        if not has_correct_key:
+            for inv_item_dict in session.player_inventory:
                 if (inv_item_dict.get('type') == 'key' and
                     inv_item_dict.get('key_type') == required_key_type and
                     inv_item_dict['name'].lower() == key_name_input):
                     has_correct_key = True
                     found_key_item = inv_item_dict
                     break
+                elif inv_item_dict['name'].lower() == key_name_input and inv_item_dict.get('type') == 'key':
+                    print(f"You have '{add_article(inv_item_dict['name'])}', but it's not the correct type for this lock. It requires a '{required_key_type}' key.")
+                    break # Found a wrong key, stop searching
+
+        if has_correct_key and found_key_item:
+            print(f"You use {add_article(found_key_item['name'])} to unlock the {direction_to_unlock} exit.")
+            # Remove from appropriate location
+            if found_key_item in session.player_keychain:
+                session.player_keychain.remove(found_key_item) # Keys are typically consumed
+            elif found_key_item in session.player_inventory: # For keys still in main inventory
+                session.player_inventory.remove(found_key_item)
+
+            key_type_used = found_key_item.get('key_type')
+            key_unlock_events = GAME_DATA.get('key_unlock_events', {})
+            if key_type_used and key_type_used in key_unlock_events:
+                session.special_event_after_unlock = key_unlock_events[key_type_used]
+                print("You feel a strange presence shift behind the newly unlocked door...")
+
+            session.current_room.exits[direction_to_unlock] = True
+            del session.current_room.locked_exits[direction_to_unlock]
+            display_room_content_summary(session.current_room, session.rooms_travelled, session.direction_history, session.seed)
+        else:
+            if not has_correct_key and not found_key_item:
+                print(f"You don't have '{key_name_input}' in your inventory or keychain.")
 
-            # If not found in keychain, check main inventory for keys (legacy or dropped)
-            if not has_correct_key:
-                for inv_item_dict in player_inventory:
-                    if (inv_item_dict.get('type') == 'key' and
-                        inv_item_dict.get('key_type') == required_key_type and
-                        inv_item_dict['name'].lower() == key_name_input):
-                        has_correct_key = True
-                        found_key_item = inv_item_dict
-                        break
-                    elif inv_item_dict['name'].lower() == key_name_input and inv_item_dict.get('type') == 'key':
-                        print(f"You have '{add_article(inv_item_dict['name'])}', but it's not the correct type for this lock. It requires a '{required_key_type}' key.")
-                        break # Found a wrong key, stop searching
-
-            if has_correct_key and found_key_item:
-                print(f"You use {add_article(found_key_item['name'])} to unlock the {direction_to_unlock} exit.")
-                # Remove from appropriate location
-                if found_key_item in player_keychain:
-                    player_keychain.remove(found_key_item) # Keys are typically consumed
-                elif found_key_item in player_inventory: # For keys still in main inventory
-                    player_inventory.remove(found_key_item)
-
-                key_type_used = found_key_item.get('key_type')
-                key_unlock_events = GAME_DATA.get('key_unlock_events', {})
-                if key_type_used and key_type_used in key_unlock_events:
-                    special_event_after_unlock = key_unlock_events[key_type_used]
-                    print("You feel a strange presence shift behind the newly unlocked door...")
-
-                current_room.exits[direction_to_unlock] = True
-                del current_room.locked_exits[direction_to_unlock]
-                display_room_content_summary(current_room, rooms_travelled, direction_history, seed)
-            else:
-                if not has_correct_key and not found_key_item:
-                    print(f"You don't have '{key_name_input}' in your inventory or keychain.")
-
-        # --- UPDATED `talk` COMMAND BLOCK ---
-        elif verb == "talk":
-            if current_room.monster:
-                print(f"You can't talk while the {current_room.monster['name']} is still here!")
-                continue
-
-            if hasattr(current_room, 'is_inn') and current_room.is_inn:
-                quest_givers = [n for n in NPCs if n.get('type') == 'quest_giver']
-                if not quest_givers:
-                    print("The inn is quiet today; no one seems to have any quests.")
-                    continue
+    # --- UPDATED `talk` COMMAND BLOCK ---
+    def cmd_talk():
+        if session.current_room.monster:
+            print(f"You can't talk while the {session.current_room.monster['name']} is still here!")
+            return
 
-                if len(parts) == 1:
-                    print("\nPeople in the inn:")
-                    for npc in quest_givers:
-                        print(f"  - {npc['name']}")
-                    print("\n(To talk to someone, type 'talk [name]')")
-                else:
-                    npc_name_to_talk = " ".join(parts[1:])
-                    chosen_npc = next((n for n in quest_givers if n['name'].lower() == npc_name_to_talk.lower()), None)
-                    if chosen_npc:
-                        player_quests, player_inventory, player_gold, player_xp, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_level = \
-                            interact_with_quest_giver(chosen_npc, player_quests, player_level, player_inventory, current_max_inventory_slots, player_gold, player_xp, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_keychain, sound_manager)
-                    else:
-                        print(f"You don't see anyone named '{npc_name_to_talk}' here.")
-                continue
+        if hasattr(session.current_room, 'is_inn') and session.current_room.is_inn:
+            quest_givers = [n for n in NPCs if n.get('type') == 'quest_giver']
+            if not quest_givers:
+                print("The inn is quiet today; no one seems to have any quests.")
+                return
 
-            if current_room.npc:
-                if current_room.npc.get('type') == 'quest_giver':
-                    player_quests, player_reputation, player_inventory, player_gold, player_xp, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_level = \
-                        interact_with_quest_giver(current_room.npc, player_quests, player_reputation, player_level, player_inventory, current_max_inventory_slots, player_gold, player_xp, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_keychain, sound_manager)
-                else:
-                    # Existing non-quest-giver talk logic
-                    print(f"You approach {current_room.npc['name']}.")
-                    if current_room.npc.get('dialogues'):
-                        print(f"{current_room.npc['name']}: '{random.choice(current_room.npc['dialogues'])}'")
-                    else:
-                        print(f"{current_room.npc['name']} stares blankly.")
-                    current_room.npc['talked_to'] = True
-                    # Check if this NPC is a target for a 'find_npc' quest
-                    for q_id, q_data in player_quests.items():
-                        quest_def = get_quest_by_id(q_id)
-                        if quest_def and q_data['status'] == 'active' and quest_def['type'] == 'find_npc':
-                            if quest_def['target_npc_name'].lower() == current_room.npc['name'].lower():
-                                player_quests[q_id]['found_npc'] = True
-                                print(f"Quest Update: You have found {current_room.npc['name']} for the quest '{quest_def['name']}'!")
-                                print(f"Return to {quest_def['giver_npc_name']} to complete the quest.")
-                    if current_room.npc.get('type') == 'vendor':
-                        player_gold, player_inventory, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, player_keychain, equipped_misc_items = \
-                            handle_shop(player_gold, player_inventory, current_max_inventory_slots, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, current_room.npc, player_keychain, player_level, sound_manager, equipped_misc_items)
-                    elif current_room.npc.get('type') == 'gambler':
-                        player_gold = handle_gambler(player_gold, current_room.npc)
+            if len(parts) == 1:
+                print("\nPeople in the inn:")
+                for npc in quest_givers:
+                    print(f"  - {npc['name']}")
+                print("\n(To talk to someone, type 'talk [name]')")
             else:
-                print("There's no one here to talk to.")
-
-        elif verb == "rest":
-            if hasattr(current_room, 'is_inn') and current_room.is_inn:
-                if player_hp < max_hp:
-                    player_hp = max_hp
-                    print("\nYou rest by the fire, feeling your wounds mend and your spirit lift. You are fully healed.")
+                npc_name_to_talk = " ".join(parts[1:])
+                chosen_npc = next((n for n in quest_givers if n['name'].lower() == npc_name_to_talk.lower()), None)
+                if chosen_npc:
+                    interact_with_quest_giver(session, chosen_npc)
                 else:
-                    print("\nYou are already at full health and feeling great.")
-            else:
-                print("You can only rest at an inn.")
+                    print(f"You don't see anyone named '{npc_name_to_talk}' here.")
+            return
 
-        elif verb == "quests":
-            if not player_quests:
-                print("You currently have no active quests.")
+        if session.current_room.npc:
+            if session.current_room.npc.get('type') == 'quest_giver':
+                interact_with_quest_giver(session, session.current_room.npc)
             else:
-                print("\n------------------------------------")
-                print("\n-------- Your Active Quests --------")
-                print("\n------------------------------------")
-                has_active_quest = False
-                for q_id, q_data in player_quests.items():
+                # Existing non-quest-giver talk logic
+                print(f"You approach {session.current_room.npc['name']}.")
+                if session.current_room.npc.get('dialogues'):
+                    print(f"{session.current_room.npc['name']}: '{random.choice(session.current_room.npc['dialogues'])}'")
+                else:
+                    print(f"{session.current_room.npc['name']} stares blankly.")
+                session.current_room.npc['talked_to'] = True
+                # Check if this NPC is a target for a 'find_npc' quest
+                for q_id, q_data in session.player_quests.items():
                     quest_def = get_quest_by_id(q_id)
-                    if not quest_def or q_data['status'] == 'completed':
-                        continue
+                    if quest_def and q_data['status'] == 'active' and quest_def['type'] == 'find_npc':
+                        if quest_def['target_npc_name'].lower() == session.current_room.npc['name'].lower():
+                            session.player_quests[q_id]['found_npc'] = True
+                            print(f"Quest Update: You have found {session.current_room.npc['name']} for the quest '{quest_def['name']}'!")
+                            print(f"Return to {quest_def['giver_npc_name']} to complete the quest.")
+                if session.current_room.npc.get('type') == 'vendor':
+                    handle_shop(session, session.current_room.npc)
+                elif session.current_room.npc.get('type') == 'gambler':
+                    session.player_gold = handle_gambler(session.player_gold, session.current_room.npc)
+        else:
+            print("There's no one here to talk to.")
 
-                    has_active_quest = True
-                    status = get_player_quest_status(player_quests, q_id)
+    def cmd_rest():
+        if hasattr(session.current_room, 'is_inn') and session.current_room.is_inn:
+            if session.player_hp < session.max_hp:
+                session.player_hp = session.max_hp
+                print("\nYou rest by the fire, feeling your wounds mend and your spirit lift. You are fully healed.")
+            else:
+                print("\nYou are already at full health and feeling great.")
+        else:
+            print("You can only rest at an inn.")
 
-                    progress_info = ""
-                    if quest_def['type'] in ['defeat_any_monster', 'defeat_monster', 'fetch_item']:
-                        # Check if progress tracking is possible
-                        if 'current_count' in q_data and 'target_count' in quest_def:
-                            if quest_def['type'] == 'fetch_item':
-                                progress_info = f" (Collected: {q_data['current_count']}/{quest_def['target_count']} {quest_def.get('target_item','')}s)"
-                            else:
-                                progress_info = f" (Defeated: {q_data['current_count']}/{quest_def['target_count']} enemies)"
+    def cmd_quests():
+        if not session.player_quests:
+            print("You currently have no active quests.")
+        else:
+            print("\n------------------------------------")
+            print("\n-------- Your Active Quests --------")
+            print("\n------------------------------------")
+            has_active_quest = False
+            for q_id, q_data in session.player_quests.items():
+                quest_def = get_quest_by_id(q_id)
+                if not quest_def or q_data['status'] == 'completed':
+                    continue
 
-                    print(f"- {quest_def['name']} [{status.upper()}]{progress_info}")
-                    print(f"  Description: {quest_def.get('description', 'No description provided.')}")
+                has_active_quest = True
+                status = get_player_quest_status(session.player_quests, q_id)
 
-                    if status == 'active':
-                        # Check if the quest dialogue can be formatted with counts
-                        if 'current_count' in q_data and 'target_count' in quest_def:
-                            dialogue_line = quest_def.get('dialogue_active', 'Continue quest').format(current_count=q_data['current_count'], target_count=quest_def['target_count'])
+                progress_info = ""
+                if quest_def['type'] in ['defeat_any_monster', 'defeat_monster', 'fetch_item']:
+                    # Check if progress tracking is possible
+                    if 'current_count' in q_data and 'target_count' in quest_def:
+                        if quest_def['type'] == 'fetch_item':
+                            progress_info = f" (Collected: {q_data['current_count']}/{quest_def['target_count']} {quest_def.get('target_item','')}s)"
                         else:
-                            # Fallback for quests without countable progress (e.g., find_npc)
-                            dialogue_line = quest_def.get('dialogue_active', 'Continue quest')
-                        print(f"  Goal: {dialogue_line}")
-                    elif status == 'complete_ready':
-                        print(f"  Goal: Return to {quest_def['giver_npc_name']} to turn in!")
-
-                if not has_active_quest:
-                    print("You currently have no active quests.")
-                print("------------------------------------")
-
-        elif verb == "answer":
-            if current_room.monster:
-                print(f"You can't concentrate on riddles while the {current_room.monster['name']} is still here!")
-                continue
-            if not current_room.puzzle or current_room.puzzle.get('solved', True) or current_room.puzzle['type'] != 'riddle':
-                print("There's no riddle here to answer.")
-                continue
+                            progress_info = f" (Defeated: {q_data['current_count']}/{quest_def['target_count']} enemies)"
 
-            if len(parts) < 2:
-                print("What is your answer?")
-                continue
+                print(f"- {quest_def['name']} [{status.upper()}]{progress_info}")
+                print(f"  Description: {quest_def.get('description', 'No description provided.')}")
 
-            player_answer = " ".join(parts[1:]).lower().strip()
-            correct_answer = current_room.puzzle['solution'].lower().strip()
+                if status == 'active':
+                    # Check if the quest dialogue can be formatted with counts
+                    if 'current_count' in q_data and 'target_count' in quest_def:
+                        dialogue_line = quest_def.get('dialogue_active', 'Continue quest').format(current_count=q_data['current_count'], target_count=quest_def['target_count'])
+                    else:
+                        # Fallback for quests without countable progress (e.g., find_npc)
+                        dialogue_line = quest_def.get('dialogue_active', 'Continue quest')
+                    print(f"  Goal: {dialogue_line}")
+                elif status == 'complete_ready':
+                    print(f"  Goal: Return to {quest_def['giver_npc_name']} to turn in!")
 
-            if player_answer == correct_answer:
-                print(f"'{player_answer.capitalize()}!' A resonant voice echoes, 'Correct!'")
-                print(f"The ancient guardian rumbles and slowly recedes into the wall, opening the way.")
-                current_room.puzzle['solved'] = True
-                
-                # NEW: Call the new reward handler function
-                player_inventory, current_max_inventory_slots, player_keychain, player_xp, player_gold, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points = process_puzzle_rewards(
-                    current_room.puzzle, player_inventory, current_max_inventory_slots, player_keychain, player_xp, player_gold, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points
-                )
+            if not has_active_quest:
+                print("You currently have no active quests.")
+            print("------------------------------------")
 
-                display_room_content_summary(current_room, rooms_travelled, direction_history, seed)
-            else:
-                print(f"'{player_answer.capitalize()}!' The voice sighs, 'Incorrect.'")
-                fail_penalty = current_room.puzzle.get('fail_penalty')
-                if fail_penalty:
-                    if fail_penalty['type'] == 'damage':
-                        damage_taken = fail_penalty['value']
-                        # MODIFIED: Include equipped_cloak in total defense calculation for puzzle damage
-                        total_defense = (player_shield_value.get('defense', 0) if player_shield_value else 0) + \
-                                        (equipped_armor_value.get('defense', 0) if equipped_armor_value else 0) + \
-                                        (equipped_cloak.get('defense', 0) if equipped_cloak else 0)
-                        actual_damage = max(0, damage_taken - total_defense)
-                        player_hp -= actual_damage
-                        print(fail_penalty['message'].format(value=damage_taken, actual_damage=actual_damage))
-                        if total_defense > 0:
-                            print(f"Your total defense absorbed {damage_taken - actual_damage} damage.")
-                        print(f"Your health is now {player_hp}/{max_hp} HP.")
-                        if player_hp <= 0:
-                            print("\n" + "=" * 50)
-                            print("Your health has fallen to zero! You collapse.")
-                            print("        G A M E    O V E R            ")
-                            print("=" * 50)
-                            if DEBUG: # Wrapped debug calls
-                                debug.close_debug_log() # Close log on game over
-                            return 'lose', monsters_defeated_this_run, rooms_travelled
-                    elif fail_penalty['type'] == 'monster_spawn':
-                        # Make sure to strip and lower the monster name from JSON for with lookup
-                        monster_name_from_penalty = fail_penalty['monster_name'].lower().strip()
-                        monster_def = next((m for m in MONSTERS if m['name'].lower().strip() == monster_name_from_penalty), None)
-                        if monster_def:
-                            current_room.monster = dict(monster_def)
-                            print(fail_penalty['message'])
-                            player_hp, max_hp, current_room.monster, gold_gained, player_xp, player_level, xp_to_next_level, player_quests, \
-                            player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, equipped_misc_items, player_skill_points = \
-                                handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, \
-                                              current_room.monster, player_shield_value, equipped_armor_value, equipped_cloak, player_inventory, current_max_inventory_slots, \
-                                              player_gold, equipped_weapon, player_xp, player_level, xp_to_next_level, player_quests, player_keychain, current_room, equipped_misc_items, player_effects, sound_manager, 0, 0, equipped_helmet, player_class, player_unlocked_skills, player_skill_points)
-                            player_gold += gold_gained
-                            if player_hp <= 0:
-                                print("\n" + "=" * 40)
-                                print("Your health has fallen to zero! You collapse.")
-                                print("        G A M E    O V E R            ")
-                                print("=" * 40)
-                                if DEBUG: # Wrapped debug calls
-                                    debug.close_debug_log() # Close log on game over
-                                return 'lose' # Game over, return 'lose'
-                            if current_room.monster is None:
-                                display_room_content_summary(current_room, rooms_travelled, direction_history)
-                        else:
-                            print(f"A monster was supposed to spawn ('{fail_penalty['monster_name']}'), but its definition was not found. Please check game_data.json.") # More specific message
-                    elif fail_penalty['type'] == 'flavor':
-                        print(fail_penalty['message'])
-                else:
-                    print("Nothing seems to happen.")
+    def cmd_answer():
+        nonlocal gold_gained
+        if session.current_room.monster:
+            print(f"You can't concentrate on riddles while the {session.current_room.monster['name']} is still here!")
+            return
+        if not session.current_room.puzzle or session.current_room.puzzle.get('solved', True) or session.current_room.puzzle['type'] != 'riddle':
+            print("There's no riddle here to answer.")
+            return
 
-        elif verb == "press":
-            if current_room.monster:
-                print(f"You can't focus on puzzles while the {current_room.monster['name']} is still here!")
-                continue
-            if not current_room.puzzle or current_room.puzzle.get('solved', True) or current_room.puzzle['type'] != 'pressure_plate':
-                print("There's nothing here to press.")
-                continue
+        if len(parts) < 2:
+            print("What is your answer?")
+            return
 
-            solution_items = current_room.puzzle.get('solution_items', [])
-            item_in_inventory = None
-            for item in player_inventory:
-                if item.get('type') in solution_items:
-                    item_in_inventory = item
-                    break
+        player_answer = " ".join(parts[1:]).lower().strip()
+        correct_answer = session.current_room.puzzle['solution'].lower().strip()
 
-            if item_in_inventory:
-                print(f"You press the {item_in_inventory['name']} onto the pressure plate. With a grinding sound, something happens!")
-                current_room.puzzle['solved'] = True
+        if player_answer == correct_answer:
+            print(f"'{player_answer.capitalize()}!' A resonant voice echoes, 'Correct!'")
+            print(f"The ancient guardian rumbles and slowly recedes into the wall, opening the way.")
+            session.current_room.puzzle['solved'] = True
 
-                # Call the reward handler function
-                player_inventory, current_max_inventory_slots, player_keychain, player_xp, player_gold, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points = process_puzzle_rewards(
-                    current_room.puzzle, player_inventory, current_max_inventory_slots, player_keychain, player_xp, player_gold, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points
-                )
+            # NEW: Call the new reward handler function
+            process_puzzle_rewards(session.current_room.puzzle)
 
-                display_room_content_summary(current_room, rooms_travelled, direction_history, seed)
-            else:
-                print(f"You try to press the plate, but nothing happens. The inscription reads: 'Only a warrior's blade may pass.'")
-                fail_penalty = current_room.puzzle.get('fail_penalty')
-                if fail_penalty and fail_penalty['type'] == 'flavor':
+            display_room_content_summary(session.current_room, session.rooms_travelled, session.direction_history, session.seed)
+        else:
+            print(f"'{player_answer.capitalize()}!' The voice sighs, 'Incorrect.'")
+            fail_penalty = session.current_room.puzzle.get('fail_penalty')
+            if fail_penalty:
+                if fail_penalty['type'] == 'damage':
+                    damage_taken = fail_penalty['value']
+                    # MODIFIED: Include equipped_cloak in total defense calculation for puzzle damage
+                    total_defense = (session.player_shield_value.get('defense', 0) if session.player_shield_value else 0) + \
+                                    (session.equipped_armor_value.get('defense', 0) if session.equipped_armor_value else 0) + \
+                                    (session.equipped_cloak.get('defense', 0) if session.equipped_cloak else 0)
+                    actual_damage = max(0, damage_taken - total_defense)
+                    session.player_hp -= actual_damage
+                    print(fail_penalty['message'].format(value=damage_taken, actual_damage=actual_damage))
+                    if total_defense > 0:
+                        print(f"Your total defense absorbed {damage_taken - actual_damage} damage.")
+                    print(f"Your health is now {session.player_hp}/{session.max_hp} HP.")
+                    if session.player_hp <= 0:
+                        print("\n" + "=" * 50)
+                        print("Your health has fallen to zero! You collapse.")
+                        print("        G A M E    O V E R            ")
+                        print("=" * 50)
+                        if DEBUG: # Wrapped debug calls
+                            debug.close_debug_log() # Close log on game over
+                        return 'lose'
+                elif fail_penalty['type'] == 'monster_spawn':
+                    # Make sure to strip and lower the monster name from JSON for with lookup
+                    monster_name_from_penalty = fail_penalty['monster_name'].lower().strip()
+                    monster_def = next((m for m in MONSTERS if m['name'].lower().strip() == monster_name_from_penalty), None)
+                    if monster_def:
+                        session.current_room.monster = dict(monster_def)
+                        print(fail_penalty['message'])
+                        session.current_room.monster, gold_gained, _ = handle_combat(session, session.current_room.monster, 0, 0)
+                        session.player_gold += gold_gained
+                        if session.player_hp <= 0:
+                            print("\n" + "=" * 40)
+                            print("Your health has fallen to zero! You collapse.")
+                            print("        G A M E    O V E R            ")
+                            print("=" * 40)
+                            if DEBUG: # Wrapped debug calls
+                                debug.close_debug_log() # Close log on game over
+                            return 'lose' # Game over, return 'lose'
+                        if session.current_room.monster is None:
+                            display_room_content_summary(session.current_room, session.rooms_travelled, session.direction_history)
+                    else:
+                        print(f"A monster was supposed to spawn ('{fail_penalty['monster_name']}'), but its definition was not found. Please check game_data.json.") # More specific message
+                elif fail_penalty['type'] == 'flavor':
                     print(fail_penalty['message'])
-        elif verb == "pull":
-            if current_room.monster:
-                print(f"You can't mess with levers while the {current_room.monster['name']} is still here!")
-                continue
-            if not current_room.puzzle or current_room.puzzle.get('solved', True) or current_room.puzzle['type'] != 'mechanism':
-                print("There's no lever here to pull.")
-                continue
-
-            if len(parts) < 2:
-                print("Which lever do you want to pull? (e.g., 'pull gold')")
-                continue
-
-            lever_choice = " ".join(parts[1:]).lower().strip()
-            correct_lever = current_room.puzzle['solution'].lower().strip()
-
-            if lever_choice == correct_lever:
-                print(f"You pull the {lever_choice} lever. With a grinding sound, something happens!")
-                current_room.puzzle['solved'] = True
-
-                # NEW: Call the new reward handler function
-                player_inventory, current_max_inventory_slots, player_keychain, player_xp, player_gold, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points = process_puzzle_rewards(
-                    current_room.puzzle, player_inventory, current_max_inventory_slots, player_keychain, player_xp, player_gold, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points
-                )
-
-                display_room_content_summary(current_room, rooms_travelled, direction_history)
             else:
-                print(f"You pull the {lever_choice} lever. A loud clank echoes, but nothing else happens.")
-                fail_penalty = current_room.puzzle.get('fail_penalty')
-                if fail_penalty:
-                    if fail_penalty['type'] == 'damage':
-                        damage_taken = fail_penalty['value']
-                        # MODIFIED: Include equipped_cloak in total defense for puzzle damage
-                        total_defense = (player_shield_value.get('defense', 0) if player_shield_value else 0) + \
-                                        (equipped_armor_value.get('defense', 0) if equipped_armor_value else 0) + \
-                                        (equipped_cloak.get('defense', 0) if equipped_cloak else 0)
-                        actual_damage = max(0, damage_taken - total_defense)
-                        player_hp -= actual_damage
-                        print(fail_penalty['message'].format(value=damage_taken, actual_damage=actual_damage))
-                        if total_defense > 0:
-                            print(f"Your total defense absorbed {damage_taken - actual_damage} damage.")
-                        print(f"Your health is now {player_hp}/{max_hp} HP.")
-                        if player_hp <= 0:
-                            print("\n" + "=" * 50)
+                print("Nothing seems to happen.")
+
+    def cmd_press():
+        if session.current_room.monster:
+            print(f"You can't focus on puzzles while the {session.current_room.monster['name']} is still here!")
+            return
+        if not session.current_room.puzzle or session.current_room.puzzle.get('solved', True) or session.current_room.puzzle['type'] != 'pressure_plate':
+            print("There's nothing here to press.")
+            return
+
+        solution_items = session.current_room.puzzle.get('solution_items', [])
+        item_in_inventory = None
+        for item in session.player_inventory:
+            if item.get('type') in solution_items:
+                item_in_inventory = item
+                break
+
+        if item_in_inventory:
+            print(f"You press the {item_in_inventory['name']} onto the pressure plate. With a grinding sound, something happens!")
+            session.current_room.puzzle['solved'] = True
+
+            # Call the reward handler function
+            process_puzzle_rewards(session.current_room.puzzle)
+
+            display_room_content_summary(session.current_room, session.rooms_travelled, session.direction_history, session.seed)
+        else:
+            print(f"You try to press the plate, but nothing happens. The inscription reads: 'Only a warrior's blade may pass.'")
+            fail_penalty = session.current_room.puzzle.get('fail_penalty')
+            if fail_penalty and fail_penalty['type'] == 'flavor':
+                print(fail_penalty['message'])
+
+    def cmd_pull():
+        nonlocal gold_gained
+        if session.current_room.monster:
+            print(f"You can't mess with levers while the {session.current_room.monster['name']} is still here!")
+            return
+        if not session.current_room.puzzle or session.current_room.puzzle.get('solved', True) or session.current_room.puzzle['type'] != 'mechanism':
+            print("There's no lever here to pull.")
+            return
+
+        if len(parts) < 2:
+            print("Which lever do you want to pull? (e.g., 'pull gold')")
+            return
+
+        lever_choice = " ".join(parts[1:]).lower().strip()
+        correct_lever = session.current_room.puzzle['solution'].lower().strip()
+
+        if lever_choice == correct_lever:
+            print(f"You pull the {lever_choice} lever. With a grinding sound, something happens!")
+            session.current_room.puzzle['solved'] = True
+
+            # NEW: Call the new reward handler function
+            process_puzzle_rewards(session.current_room.puzzle)
+
+            display_room_content_summary(session.current_room, session.rooms_travelled, session.direction_history)
+        else:
+            print(f"You pull the {lever_choice} lever. A loud clank echoes, but nothing else happens.")
+            fail_penalty = session.current_room.puzzle.get('fail_penalty')
+            if fail_penalty:
+                if fail_penalty['type'] == 'damage':
+                    damage_taken = fail_penalty['value']
+                    # MODIFIED: Include equipped_cloak in total defense for puzzle damage
+                    total_defense = (session.player_shield_value.get('defense', 0) if session.player_shield_value else 0) + \
+                                    (session.equipped_armor_value.get('defense', 0) if session.equipped_armor_value else 0) + \
+                                    (session.equipped_cloak.get('defense', 0) if session.equipped_cloak else 0)
+                    actual_damage = max(0, damage_taken - total_defense)
+                    session.player_hp -= actual_damage
+                    print(fail_penalty['message'].format(value=damage_taken, actual_damage=actual_damage))
+                    if total_defense > 0:
+                        print(f"Your total defense absorbed {damage_taken - actual_damage} damage.")
+                    print(f"Your health is now {session.player_hp}/{session.max_hp} HP.")
+                    if session.player_hp <= 0:
+                        print("\n" + "=" * 50)
+                        print("Your health has fallen to zero! You collapse.")
+                        print("        G A M E    O V E R            ")
+                        print("=" * 50)
+                        if DEBUG: # Wrapped debug calls
+                            debug.close_debug_log() # Close log on game over
+                        return 'lose'
+                elif fail_penalty['type'] == 'monster_spawn':
+                    # Make sure to strip and lower the monster name from JSON for robust lookup
+                    monster_name_from_penalty = fail_penalty['monster_name'].lower().strip()
+                    monster_def = next((m for m in MONSTERS if m['name'].lower().strip() == monster_name_from_penalty), None)
+                    if monster_def:
+                        session.current_room.monster = dict(monster_def)
+                        print(fail_penalty['message'])
+                        session.current_room.monster, gold_gained, _ = handle_combat(session, session.current_room.monster, 0, 0)
+                        session.player_gold += gold_gained
+                        if session.player_hp <= 0:
+                            print("\n" + "=" * 40)
                             print("Your health has fallen to zero! You collapse.")
                             print("        G A M E    O V E R            ")
-                            print("=" * 50)
+                            print("=" * 40)
                             if DEBUG: # Wrapped debug calls
                                 debug.close_debug_log() # Close log on game over
-                            return 'lose', monsters_defeated_this_run, rooms_travelled
-                    elif fail_penalty['type'] == 'monster_spawn':
-                        # Make sure to strip and lower the monster name from JSON for robust lookup
-                        monster_name_from_penalty = fail_penalty['monster_name'].lower().strip()
-                        monster_def = next((m for m in MONSTERS if m['name'].lower().strip() == monster_name_from_penalty), None)
-                        if monster_def:
-                            current_room.monster = dict(monster_def)
-                            print(fail_penalty['message'])
-                            player_hp, max_hp, current_room.monster, gold_gained, player_xp, player_level, xp_to_next_level, player_quests, \
-                            player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, equipped_misc_items, player_skill_points = \
-                                handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, \
-                                              current_room.monster, player_shield_value, equipped_armor_value, equipped_cloak, player_inventory, current_max_inventory_slots, \
-                                              player_gold, equipped_weapon, player_xp, player_level, xp_to_next_level, player_quests, player_keychain, current_room, equipped_misc_items, player_effects, sound_manager, 0, 0, equipped_helmet, player_class, player_unlocked_skills, player_skill_points)
-                            player_gold += gold_gained
-                            if player_hp <= 0:
-                                print("\n" + "=" * 40)
-                                print("Your health has fallen to zero! You collapse.")
-                                print("        G A M E    O V E R            ")
-                                print("=" * 40)
-                                if DEBUG: # Wrapped debug calls
-                                    debug.close_debug_log() # Close log on game over
-                                return 'lose' # Game over, return 'lose'
-                            if current_room.monster is None:
-                                display_room_content_summary(current_room, rooms_travelled, direction_history)
-                        else:
-                            print(f"A monster was supposed to spawn ('{fail_penalty['monster_name']}'), but its definition was not found. Please check game_data.json.") # More specific message
-                    elif fail_penalty['type'] == 'flavor':
-                        print(fail_penalty['message'])
-                else:
-                    print("Nothing seems to happen.")
+                            return 'lose' # Game over, return 'lose'
+                        if session.current_room.monster is None:
+                            display_room_content_summary(session.current_room, session.rooms_travelled, session.direction_history)
+                    else:
+                        print(f"A monster was supposed to spawn ('{fail_penalty['monster_name']}'), but its definition was not found. Please check game_data.json.") # More specific message
+                elif fail_penalty['type'] == 'flavor':
+                    print(fail_penalty['message'])
+            else:
+                print("Nothing seems to happen.")
 
-        elif verb == "give":
-            if current_room.monster:
-                print(f"You can't give items while the {current_room.monster['name']} is still here!")
-                continue
-            if not current_room.puzzle or current_room.puzzle.get('solved', True) or current_room.puzzle['type'] != 'item_delivery':
-                print("There's nothing here that wants an item.")
-                continue
+    def cmd_give():
+        if session.current_room.monster:
+            print(f"You can't give items while the {session.current_room.monster['name']} is still here!")
+            return
+        if not session.current_room.puzzle or session.current_room.puzzle.get('solved', True) or session.current_room.puzzle['type'] != 'item_delivery':
+            print("There's nothing here that wants an item.")
+            return
 
-            # NEW: Robust parsing for multi-word item and target names
-            try:
-                to_index = parts.index('to')
-            except ValueError:
-                print("Give what to whom? Usage: 'give [item name] to [target name]'")
-                continue
+        # NEW: Robust parsing for multi-word item and target names
+        try:
+            to_index = parts.index('to')
+        except ValueError:
+            print("Give what to whom? Usage: 'give [item name] to [target name]'")
+            return
 
-            if to_index < 2: # 'give [item] to [target]' means 'to' should be at least at index 2
-                print("Give what to whom? Usage: 'give [item name] to [target name]'")
-                continue
+        if to_index < 2: # 'give [item] to [target]' means 'to' should be at least at index 2
+            print("Give what to whom? Usage: 'give [item name] to [target name]'")
+            return
 
-            item_to_give_name_input = " ".join(parts[1:to_index]).lower().strip()
-            target_name_input = " ".join(parts[to_index+1:]).lower().strip()
+        item_to_give_name_input = " ".join(parts[1:to_index]).lower().strip()
+        target_name_input = " ".join(parts[to_index+1:]).lower().strip()
 
-            if not item_to_give_name_input or not target_name_input:
-                print("Give what to whom? Usage: 'give [item name] to [target name]'")
-                continue
-            # END NEW PARSING
+        if not item_to_give_name_input or not target_name_input:
+            print("Give what to whom? Usage: 'give [item name] to [target name]'")
+            return
+        # END NEW PARSING
 
-            required_item_name = current_room.puzzle['required_item'].lower().strip()
-            puzzle_target_name = current_room.puzzle.get('target_name', 'statue').lower()
+        required_item_name = session.current_room.puzzle['required_item'].lower().strip()
+        puzzle_target_name = session.current_room.puzzle.get('target_name', 'statue').lower()
 
-            # FIX: Corrected variable name from target_name_name_input to target_name_input
-            if target_name_input != puzzle_target_name:
-                print(f"That target doesn't seem to be {puzzle_target_name} here or doesn't want your item.")
-                continue
+        # FIX: Corrected variable name from target_name_name_input to target_name_input
+        if target_name_input != puzzle_target_name:
+            print(f"That target doesn't seem to be {puzzle_target_name} here or doesn't want your item.")
+            return
 
-            item_found_in_inventory = None
-            item_found_in_keychain = None # Check keychain too
+        item_found_in_inventory = None
+        item_found_in_keychain = None # Check keychain too
 
-            # First, check main inventory
-            for item_dict in player_inventory:
+        # First, check main inventory
+        for item_dict in session.player_inventory:
+            if item_dict['name'].lower() == item_to_give_name_input:
+                item_found_in_inventory = item_dict
+                break
+
+        # If not in main inventory, check keychain
+        if not item_found_in_inventory:
+            for item_dict in session.player_keychain:
                 if item_dict['name'].lower() == item_to_give_name_input:
-                    item_found_in_inventory = item_dict
+                    item_found_in_keychain = item_dict
                     break
 
-            # If not in main inventory, check keychain
-            if not item_found_in_inventory:
-                for item_dict in player_keychain:
-                    if item_dict['name'].lower() == item_to_give_name_input:
-                        item_found_in_keychain = item_dict
-                        break
-
-            if not item_found_in_inventory and not item_found_in_keychain:
-                print(f"You don't have {add_article(item_to_give_name_input)} in your inventory or keychain.")
-                continue
+        if not item_found_in_inventory and not item_found_in_keychain:
+            print(f"You don't have {add_article(item_to_give_name_input)} in your inventory or keychain.")
+            return
 
-            # Determine which item was found
-            found_item = item_found_in_inventory if item_found_in_inventory else item_found_in_keychain
+        # Determine which item was found
+        found_item = item_found_in_inventory if item_found_in_inventory else item_found_in_keychain
 
-            # Check if the required item is a generic 'healing item' and the given item is a specific healing potion
-            is_healing_item_puzzle = required_item_name == 'healing item'
-            is_given_item_healing_potion = (found_item.get('type') == 'consumable' and
-                                            found_item.get('effect_type') == 'heal')
+        # Check if the required item is a generic 'healing item' and the given item is a specific healing potion
+        is_healing_item_puzzle = required_item_name == 'healing item'
+        is_given_item_healing_potion = (found_item.get('type') == 'consumable' and
+                                        found_item.get('effect_type') == 'heal')
 
-            if item_to_give_name_input == required_item_name or (is_healing_item_puzzle and is_given_item_healing_potion):
-                print(f"You give {add_article(found_item['name'])} to the {puzzle_target_name}. It glows faintly!")
-                if found_item in player_inventory: # Remove from where it was found
-                    player_inventory.remove(found_item)
-                elif found_item in player_keychain:
-                    player_keychain.remove(found_item)
-                current_room.puzzle['solved'] = True
+        if item_to_give_name_input == required_item_name or (is_healing_item_puzzle and is_given_item_healing_potion):
+            print(f"You give {add_article(found_item['name'])} to the {puzzle_target_name}. It glows faintly!")
+            if found_item in session.player_inventory: # Remove from where it was found
+                session.player_inventory.remove(found_item)
+            elif found_item in session.player_keychain:
+                session.player_keychain.remove(found_item)
+            session.current_room.puzzle['solved'] = True
 
-                # NEW: Call the new reward handler function
-                player_inventory, current_max_inventory_slots, player_keychain, player_xp, player_gold, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points = process_puzzle_rewards(
-                    current_room.puzzle, player_inventory, current_max_inventory_slots, player_keychain, player_xp, player_gold, player_level, xp_to_next_level, player_hp, max_hp, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_skill_points
-                )
+            # NEW: Call the new reward handler function
+            process_puzzle_rewards(session.current_room.puzzle)
 
-                display_room_content_summary(current_room, rooms_travelled, direction_history)
-            else:
-                print(f"The {puzzle_target_name} rejects {add_article(found_item['name'])}. It seems to desire something else.")
-                fail_penalty = current_room.puzzle.get('fail_penalty')
-                if fail_penalty:
-                    print(fail_penalty['message'])
-                else:
-                    print("Nothing seems to happen.")
-
-        elif verb == "save":
-            # MODIFIED: Added equipped_cloak and player_attack_bonus to save_game parameters
-            save_game(player_hp, max_hp, player_inventory, current_room, current_max_inventory_slots, player_gold, player_shield_value, equipped_armor_value, equipped_cloak, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, equipped_weapon, player_xp, player_level, xp_to_next_level, player_quests, player_reputation, player_name, rooms_travelled, player_keychain, equipped_misc_items, player_effects, room_history, direction_history, stash, player_class, player_skill_points, player_unlocked_skills, equipped_helmet, has_hideout_key) # Pass keychain and bonus
-
-        elif verb == "ohvendor":
-            guvna_npc_def = next((n for n in NPCs if n.get('name') == 'Stranger' and n.get('type') == 'vendor'), None)
-            if guvna_npc_def:
-                temp_vendor_npc = dict(guvna_npc_def)
-                temp_vendor_npc['talked_to'] = True
-                print("\n" + "=" * 30)
-                print("\nA mysterious figure shimmers into existence from the shadows...")
-                print("You hear a gruff voice say: 'Heh heh heh... What're ya buyin'?'")
-                # MODIFIED: Added equipped_cloak and equipped_misc_items to handle_shop parameters
-                player_gold, player_inventory, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, player_keychain, equipped_misc_items = \
-                    handle_shop(player_gold, player_inventory, current_max_inventory_slots, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, temp_vendor_npc, player_keychain, player_level, sound_manager, equipped_misc_items) # Pass keychain and misc items
-                print("\n" + "=" * 30)
-                # After returning from handle_shop, display room summary
-                display_room_content_summary(current_room, rooms_travelled, direction_history, seed)
+            display_room_content_summary(session.current_room, session.rooms_travelled, session.direction_history)
+        else:
+            print(f"The {puzzle_target_name} rejects {add_article(found_item['name'])}. It seems to desire something else.")
+            fail_penalty = session.current_room.puzzle.get('fail_penalty')
+            if fail_penalty:
+                print(fail_penalty['message'])
             else:
-                print("You try to summon the vendor, but he doesn't seem to respond. Perhaps he's not in this realm?")
-
-        elif verb == "ohinn":
-            player_hp, max_hp, player_quests, player_inventory, player_gold, player_xp, xp_to_next_level, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_level, player_keychain, stash, has_hideout_key = \
-                handle_inn(player_hp, max_hp, player_quests, player_level, player_inventory, current_max_inventory_slots, player_gold, player_xp, xp_to_next_level, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_keychain, sound_manager, stash, has_hideout_key, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, player_reputation, equipped_misc_items, player_effects, equipped_helmet)
-            display_room_content_summary(current_room, rooms_travelled, direction_history, seed)
-
-        elif verb == "search":
-            if current_room.hazard and current_room.hazard.get('is_currently_hidden'):
-                print("You search the room carefully...")
-                time.sleep(1)
-                perception_chance = 0.5
-                if any(item.get('effect_type') == 'perception_boost' for item in player_effects):
-                    perception_chance = 0.9
-                if random.random() < perception_chance:
-                    current_room.hazard['is_currently_hidden'] = False
-                    print(f"You found a {current_room.hazard['name']}!")
-                else:
-                    print("You don't find anything unusual.")
+                print("Nothing seems to happen.")
+
+    def cmd_save():
+        if session.resume_code: # On a server: slots are named after adventurers anyone can type, and nothing there loads them
+            print(f"Saving isn't available here. Type 'suspend' to park your run, and resume it with your name and resume code {session.resume_code}.")
+            return
+        # MODIFIED: 'save [slot]' saves to (and from then on uses) a named slot
+        save_game(session, " ".join(parts[1:]))
+
+    def cmd_suspend():
+        try:
+            park_session(session)
+        except OSError as e:
+            print(f"Error: Could not suspend the game: {e}")
+            return
+        log_event(f"Player {session.player_name} suspended their run in Room #{session.rooms_travelled}.")
+        if session.resume_code:
+            print(f"Your adventure is suspended. Resume it as '{session.player_name}' with your resume code {session.resume_code} from the main menu.")
+        else:
+            print(f"Your adventure is suspended. Resume it as '{session.player_name}' from the main menu.")
+        return 'suspended'
+
+    def cmd_ohvendor():
+        guvna_npc_def = next((n for n in NPCs if n.get('name') == 'Stranger' and n.get('type') == 'vendor'), None)
+        if guvna_npc_def:
+            temp_vendor_npc = dict(guvna_npc_def)
+            temp_vendor_npc['talked_to'] = True
+            print("\n" + "=" * 30)
+            print("\nA mysterious figure shimmers into existence from the shadows...")
+            print("You hear a gruff voice say: 'Heh heh heh... What're ya buyin'?'")
+            # MODIFIED: Added equipped_cloak and equipped_misc_items to handle_shop parameters
+            handle_shop(session, temp_vendor_npc) # Pass keychain and misc items
+            print("\n" + "=" * 30)
+            # After returning from handle_shop, display room summary
+            display_room_content_summary(session.current_room, session.rooms_travelled, session.direction_history, session.seed)
+        else:
+            print("You try to summon the vendor, but he doesn't seem to respond. Perhaps he's not in this realm?")
+
+    def cmd_ohinn():
+        handle_inn(session)
+        display_room_content_summary(session.current_room, session.rooms_travelled, session.direction_history, session.seed)
+
+    def cmd_search():
+        if session.current_room.hazard and session.current_room.hazard.get('is_currently_hidden'):
+            print("You search the room carefully...")
+            pause()
+            perception_chance = 0.5
+            if any(item.get('effect_type') == 'perception_boost' for item in session.player_effects):
+                perception_chance = 0.9
+            if random.random() < perception_chance:
+                session.current_room.hazard['is_currently_hidden'] = False
+                print(f"You found a {session.current_room.hazard['name']}!")
             else:
-                print("You search the room, but find nothing of interest.")
-
-        elif verb == "disarm":
-            if current_room.hazard and not current_room.hazard.get('is_currently_hidden'):
-                if current_room.hazard.get('disarmable'):
-                    if not current_room.hazard.get('disarmed'):
-                        print(f"You attempt to disarm the {current_room.hazard['name']}...")
-                        time.sleep(1)
-                        disarm_chance = 0.5
-                        if any(item['name'] == 'Trap Disarming Kit' for item in player_inventory):
-                            disarm_chance = 0.9
-                        if random.random() < disarm_chance:
-                            current_room.hazard['disarmed'] = True
-                            print(f"You successfully disarmed the {current_room.hazard['name']}.")
-                        else:
-                            print(f"You failed to disarm the {current_room.hazard['name']} and triggered it!")
-                            # Trigger the trap
-                            player_hp -= current_room.hazard['damage']
-                            print(current_room.hazard['effect_message'].format(damage=current_room.hazard['damage']))
-                            print(f"Your health is now {player_hp}/{max_hp} HP.")
-                            if player_hp <= 0:
-                                return 'lose'
+                print("You don't find anything unusual.")
+        else:
+            print("You search the room, but find nothing of interest.")
+
+    def cmd_disarm():
+        if session.current_room.hazard and not session.current_room.hazard.get('is_currently_hidden'):
+            if session.current_room.hazard.get('disarmable'):
+                if not session.current_room.hazard.get('disarmed'):
+                    print(f"You attempt to disarm the {session.current_room.hazard['name']}...")
+                    pause()
+                    disarm_chance = 0.5
+                    if any(item['name'] == 'Trap Disarming Kit' for item in session.player_inventory):
+                        disarm_chance = 0.9
+                    if random.random() < disarm_chance:
+                        session.current_room.hazard['disarmed'] = True
+                        print(f"You successfully disarmed the {session.current_room.hazard['name']}.")
                     else:
-                        print("The trap is already disarmed.")
+                        print(f"You failed to disarm the {session.current_room.hazard['name']} and triggered it!")
+                        # Trigger the trap
+                        session.player_hp -= session.current_room.hazard['damage']
+                        print(session.current_room.hazard['effect_message'].format(damage=session.current_room.hazard['damage']))
+                        print(f"Your health is now {session.player_hp}/{session.max_hp} HP.")
+                        if session.player_hp <= 0:
+                            return 'lose'
                 else:
-                    print("This hazard cannot be disarmed.")
+                    print("The trap is already disarmed.")
             else:
-                print("There is no visible trap to disarm.")
+                print("This hazard cannot be disarmed.")
+        else:
+            print("There is no visible trap to disarm.")
 
-        elif verb == "map":
-            display_map(room_history, direction_history, current_room)
-            continue
+    def cmd_map():
+        display_map(session.room_history, session.direction_history, session.current_room)
 
-        elif verb == "credits":
-            print(CREDITS_TEXT)
-            input("Press Enter to continue...")
-            display_room_content_summary(current_room, rooms_travelled, direction_history, seed)
-
-        elif verb in ["pray", "drink"]:
-            if current_room.shrine:
-                if current_room.shrine.get('used'):
-                    print(f"The {current_room.shrine['name']} is dormant. Nothing happens.")
-                elif verb == current_room.shrine.get('interaction_verb'):
-                    print(f"You {verb} at the {current_room.shrine['name']}...")
-                    time.sleep(1)
-
-                    # Choose a random effect based on weights
-                    effects = current_room.shrine['effects']
-                    total_weight = sum(e['weight'] for e in effects)
-                    chosen_effect_list = random.choices(effects, weights=[e['weight'] for e in effects], k=1)
-                    if not chosen_effect_list:
-                         print("A strange feeling washes over you, but nothing seems to happen.")
-                         continue
-
-                    chosen_effect = chosen_effect_list[0]
-
-                    print(chosen_effect['message'])
-                    effect_type = chosen_effect['type']
-                    details = chosen_effect['details']
-
-                    if effect_type in ['buff', 'curse']:
-                        # Create a new, flattened dictionary for the active effect
-                        active_effect = {
-                            'stat': details.get('stat'),
-                            'modifier': details.get('modifier'),
-                            'duration': details.get('duration'),
-                            'message': chosen_effect.get('message')
-                        }
-                        player_effects.append(active_effect)
-                    elif effect_type == 'heal':
-                        if details['amount'] == 'full':
-                            player_hp = max_hp
-                        else:
-                            player_hp = min(max_hp, player_hp + details['amount'])
-                        print(f"Your health is now {player_hp}/{max_hp} HP.")
-                    elif effect_type == 'gold':
-                        player_gold += details['amount']
-                        print(f"You now have {player_gold} gold.")
-                    elif effect_type == 'damage':
-                        player_hp -= details['amount']
-                        print(f"Your health is now {player_hp}/{max_hp} HP.")
-                        if player_hp <= 0:
+    def cmd_autohorde():
+        session.auto_resolve_hordes = not session.auto_resolve_hordes
+        if session.auto_resolve_hordes:
+            print(f"Hordes will now be fought automatically (healing below {AUTO_BATTLE_POLICY['heal_below']*100:.0f}% HP).")
+        else:
+            print("Hordes will now be fought turn by turn.")
+
+    def cmd_pace():
+        if len(parts) == 1:
+            print(f"Pacing is '{PACING_MODE}'. Options: {', '.join(PACING_DELAYS)}.")
+        elif set_pacing_mode(parts[1]):
+            print(f"Pacing set to '{parts[1]}'.")
+        else:
+            print(f"Unknown pacing '{parts[1]}'. Options: {', '.join(PACING_DELAYS)}.")
+
+    def cmd_credits():
+        print(CREDITS_TEXT)
+        input("Press Enter to continue...")
+        display_room_content_summary(session.current_room, session.rooms_travelled, session.direction_history, session.seed)
+
+    def cmd_shrine():
+        nonlocal gold_gained
+        if session.current_room.shrine:
+            if session.current_room.shrine.get('used'):
+                print(f"The {session.current_room.shrine['name']} is dormant. Nothing happens.")
+            elif verb == session.current_room.shrine.get('interaction_verb'):
+                print(f"You {verb} at the {session.current_room.shrine['name']}...")
+                pause()
+
+                # Choose a random effect based on weights
+                effects = session.current_room.shrine['effects']
+                total_weight = sum(e['weight'] for e in effects)
+                chosen_effect_list = random.choices(effects, weights=[e['weight'] for e in effects], k=1)
+                if not chosen_effect_list:
+                     print("A strange feeling washes over you, but nothing seems to happen.")
+                     return
+
+                chosen_effect = chosen_effect_list[0]
+
+                print(chosen_effect['message'])
+                effect_type = chosen_effect['type']
+                details = chosen_effect['details']
+
+                if effect_type in ['buff', 'curse']:
+                    # Create a new, flattened dictionary for the active effect
+                    active_effect = {
+                        'stat': details.get('stat'),
+                        'modifier': details.get('modifier'),
+                        'duration': details.get('duration'),
+                        'message': chosen_effect.get('message')
+                    }
+                    session.player_effects.append(active_effect)
+                elif effect_type == 'heal':
+                    if details['amount'] == 'full':
+                        session.player_hp = session.max_hp
+                    else:
+                        session.player_hp = min(session.max_hp, session.player_hp + details['amount'])
+                    print(f"Your health is now {session.player_hp}/{session.max_hp} HP.")
+                elif effect_type == 'gold':
+                    session.player_gold += details['amount']
+                    print(f"You now have {session.player_gold} gold.")
+                elif effect_type == 'damage':
+                    session.player_hp -= details['amount']
+                    print(f"Your health is now {session.player_hp}/{session.max_hp} HP.")
+                    if session.player_hp <= 0:
+                        print("\n" + "=" * 40)
+                        print("The shrine delivers a fatal blow! You collapse.")
+                        print("        G A M E    O V E R            ")
+                        print("=" * 40)
+                        if DEBUG: debug.close_debug_log()
+                        return 'lose'
+                elif effect_type == 'spawn_monster':
+                    monster_def = next((m for m in MONSTERS if m['name'] == details['monster_name']), None)
+                    if monster_def:
+                        session.current_room.monster = dict(monster_def)
+                        # Initiate combat immediately
+                        session.current_room.monster, gold_gained, _ = handle_combat(session, session.current_room.monster, 0, 0)
+                        session.player_gold += gold_gained
+                        if session.player_hp <= 0:
                             print("\n" + "=" * 40)
-                            print("The shrine delivers a fatal blow! You collapse.")
+                            print("Your health has fallen to zero! You collapse.")
                             print("        G A M E    O V E R            ")
                             print("=" * 40)
                             if DEBUG: debug.close_debug_log()
-                            return 'lose', monsters_defeated_this_run, rooms_travelled
-                    elif effect_type == 'spawn_monster':
-                        monster_def = next((m for m in MONSTERS if m['name'] == details['monster_name']), None)
-                        if monster_def:
-                            current_room.monster = dict(monster_def)
-                            # Initiate combat immediately
-                            player_hp, max_hp, current_room.monster, gold_gained, player_xp, player_level, xp_to_next_level, player_quests, \
-                            player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, equipped_misc_items, player_skill_points = \
-                                handle_combat(player_hp, max_hp, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, \
-                                            current_room.monster, player_shield_value, equipped_armor_value, equipped_cloak, player_inventory, current_max_inventory_slots, \
-                                              player_gold, equipped_weapon, player_xp, player_level, xp_to_next_level, player_quests, player_keychain, current_room, equipped_misc_items, player_effects, sound_manager, 0, 0, equipped_helmet, player_class, player_unlocked_skills, player_skill_points)
-                            player_gold += gold_gained
-                            if player_hp <= 0:
-                                print("\n" + "=" * 40)
-                                print("Your health has fallen to zero! You collapse.")
-                                print("        G A M E    O V E R            ")
-                                print("=" * 40)
-                                if DEBUG: debug.close_debug_log()
-                                return 'lose'
-
-                    current_room.shrine['used'] = True
-                else:
-                    print(f"You can't '{verb}' at the {current_room.shrine['name']}. Try '{current_room.shrine['interaction_verb']}'.")
-            else:
-                print("There is nothing here to interact with in that way.")
+                            return 'lose'
 
+                session.current_room.shrine['used'] = True
+            else:
+                print(f"You can't '{verb}' at the {session.current_room.shrine['name']}. Try '{session.current_room.shrine['interaction_verb']}'.")
         else:
-            print("I don't understand that command. Type 'help' for a list of commands.")
-
-    return 'continue_adventure' # Default return if the loop somehow exits without explicit win/lose/quit
-
-# --- Main Game Execution ---
-
-def main():
-    """The main function to run the game."""
-    global DEBUG
-    if "debug" in sys.argv or "/debug" in sys.argv:
-        DEBUG = True
-
-    if DEBUG:
-        debug.initialize_debug_log(True)
-
-    meta_progress = load_meta_progress()
-    while True: # This loop keeps the main menu active
-        monsters_defeated_this_run = 0
-        print(MAIN_SCREEN_TEXT)
-        main_menu_choice = input("Enter your choice: ").strip()
-
-        if main_menu_choice == '1':
-            start_new_game(meta_progress, seed=time.time())
-
-        elif main_menu_choice == '2':
-            # Load Game
-            loaded_hp, loaded_max_hp, loaded_inventory, loaded_room, loaded_max_slots, loaded_gold, loaded_shield, loaded_armor, loaded_cloak, \
-            loaded_attack_power, loaded_attack_bonus, loaded_attack_variance, loaded_crit_chance, loaded_crit_multiplier, loaded_equipped_weapon, \
-            loaded_xp, loaded_level, loaded_xp_to_next_level, loaded_player_quests, loaded_player_reputation, loaded_player_name, loaded_rooms_travelled, loaded_player_keychain, loaded_misc_items, loaded_player_effects, loaded_room_history, loaded_direction_history, loaded_stash, loaded_player_class, loaded_player_skill_points, loaded_player_unlocked_skills, loaded_equipped_helmet, has_hideout_key = load_game()
-
-            print("=" * 40)
-            if loaded_hp is not None:
-                initial_rooms_travelled = loaded_rooms_travelled
-                monsters_defeated_this_run = 0
-                # Assign loaded values to game variables
-                player_hp = loaded_hp
-                max_hp = loaded_max_hp
-                player_inventory = loaded_inventory
-                current_room = loaded_room
-                current_max_inventory_slots = loaded_max_slots
-                player_gold = loaded_gold
-                player_shield_value = loaded_shield
-                equipped_armor_value = loaded_armor
-                equipped_cloak = loaded_cloak # NEW: Assign loaded equipped_cloak
-                player_attack_power = loaded_attack_power
-                player_attack_bonus = loaded_attack_bonus # NEW: Assign loaded attack bonus
-                player_attack_variance = loaded_attack_variance
-                player_crit_chance = loaded_crit_chance
-                player_crit_multiplier = loaded_crit_multiplier
-                equipped_weapon = loaded_equipped_weapon
-                player_xp = loaded_xp
-                player_level = loaded_level
-                xp_to_next_level = loaded_xp_to_next_level
-                player_quests = loaded_player_quests
-                player_name = loaded_player_name
-                rooms_travelled = loaded_rooms_travelled
-                player_keychain = loaded_player_keychain # Assign loaded keychain
-                equipped_misc_items = loaded_misc_items
-                player_effects = loaded_player_effects
-                room_history = loaded_room_history
-                direction_history = loaded_direction_history
-                stash = loaded_stash
-                player_class = loaded_player_class
-                player_skill_points = loaded_player_skill_points
-                player_unlocked_skills = loaded_player_unlocked_skills
-                player_reputation = loaded_player_reputation
-                equipped_helmet = loaded_equipped_helmet
-
-                # After loading, re-evaluate quest counts for 'fetch_item' quests to ensure consistency
-                for q_id, q_data in player_quests.items():
-                    quest_def = get_quest_by_id(q_id)
-                    if quest_def and q_data['status'] == 'active' and quest_def['type'] == 'fetch_item':
-                        # Check both inventory and keychain for quest items
-                        q_data['current_count'] = sum(1 for item in player_inventory if item['name'].lower() == quest_def['target_item'].lower()) + \
-                                                 sum(1 for item in player_keychain if item['name'].lower() == quest_def['target_item'].lower())
-
-                # After loading, recalculate player_attack_power with the correct additive logic
-                current_base_attack_after_load = BASE_PLAYER_ATTACK_POWER + (player_level - 1) * ATTACK_GAIN_PER_LEVEL
-                if equipped_weapon:
-                    player_attack_power = current_base_attack_after_load + equipped_weapon.get('damage', 0)
-                else:
-                    player_attack_power = current_base_attack_after_load
+            print("There is nothing here to interact with in that way.")
+
+    def cmd_unknown():
+        print("I don't understand that command. Type 'help' for a list of commands.")
+
+    # --- Command Handlers, by verb (see GAME_COMMANDS) ---
+    commands = GAME_COMMANDS.bind({
+        "/debug": cmd_debug,
+        "/timings": cmd_timings,
+        "quit": cmd_quit,
+        "help": cmd_help,
+        "skill": cmd_skill,
+        "craft": cmd_craft,
+        "enchant": cmd_enchant,
+        "look": cmd_look,
+        "inventory": cmd_inventory,
+        "equipped": cmd_equipped,
+        "misc": cmd_misc,
+        "go": cmd_go,
+        "north": cmd_go,
+        "south": cmd_go,
+        "east": cmd_go,
+        "west": cmd_go,
+        "get": cmd_get,
+        "drop": cmd_drop,
+        "use": cmd_use,
+        "equip": cmd_equip,
+        "unequip": cmd_unequip,
+        "attack": cmd_attack,
+        "combine": cmd_combine,
+        "unlock": cmd_unlock,
+        "talk": cmd_talk,
+        "rest": cmd_rest,
+        "quests": cmd_quests,
+        "answer": cmd_answer,
+        "press": cmd_press,
+        "pull": cmd_pull,
+        "give": cmd_give,
+        "save": cmd_save,
+        "suspend": cmd_suspend,
+        "ohvendor": cmd_ohvendor,
+        "ohinn": cmd_ohinn,
+        "search": cmd_search,
+        "disarm": cmd_disarm,
+        "map": cmd_map,
+        "autohorde": cmd_autohorde,
+        "pace": cmd_pace,
+        "credits": cmd_credits,
+        "pray": cmd_shrine,
+        "drink": cmd_shrine,
+    }, cmd_unknown)
 
+    while True:
+        # --- BUFF AND CURSE SYSTEM ---
+        # A turn passes each time the player enters a command.
+        # Apply effects and get modifiers for this turn.
+        effect_modifiers = apply_and_tick_effects(session.player_effects)
 
-                print(f"Welcome back, {player_name}!")
-                log_event(f"Game loaded for player: {player_name}.")
-                print(f"Your current health: {player_hp}/{max_hp} HP.")
-                print(f"Your current gold: {player_gold} gold.")
-                print(f"Your Level: {player_level} (XP: {player_xp}/{xp_to_next_level})")
-                if player_shield_value:
-                    print(f"You are currently protected by a {player_shield_value['name']} offering {player_shield_value.get('defense',0)} defense.")
-                else:
-                    print("You are currently not protected by a shield.")
-                if equipped_armor_value:
-                    print(f"You are currently wearing {equipped_armor_value['name']} offering {equipped_armor_value.get('defense',0)} defense.")
-                else:
-                    print("You are currently not wearing body armor.")
-                # NEW: Display equipped cloak on load
-                if equipped_cloak:
-                    print(f"You are currently wearing a {equipped_cloak['name']} offering {equipped_cloak.get('defense',0)} defense.")
-                else:
-                    print("You are currently not wearing a cloak.")
-                if equipped_weapon:
-                    print(f"You are currently wielding {equipped_weapon['name']}.")
-                else:
-                    print("You are fighting with your fists.")
+        # Recalculate base stats + permanent bonuses
+        base_attack_power = recalculate_attack_power(session.player_level, session.equipped_weapon, session.equipped_misc_items, session.player_attack_bonus)
 
-                # This inner loop also applies to loaded games
-                while True:
-                    sound_manager.stop_music()
-                    if getattr(current_room, 'is_inn', False):
-                        sound_manager.play_music('inn_music')
-                    else:
-                        sound_manager.play_music('ambient_music')
-
-                    # --- NEW: Handle if a loaded room is an inn ---
-                    while getattr(current_room, 'is_inn', False):
-                        print("You load your game and find yourself in a welcoming inn.")
-                        player_hp, max_hp, player_quests, player_inventory, player_gold, player_xp, xp_to_next_level, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_level, player_keychain, stash, has_hideout_key = \
-                            handle_inn(player_hp, max_hp, player_quests, player_level, player_inventory, current_max_inventory_slots, player_gold, player_xp, xp_to_next_level, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_keychain, sound_manager, stash, has_hideout_key, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, player_reputation, equipped_misc_items, player_effects, equipped_helmet)
-
-                        print("You leave the inn to continue your journey.")
-                        current_room = Room(player_level, player_quests) # Generate a new room
-                    # --- END NEW ---
-                    # MODIFIED: Added equipped_cloak to game_loop parameters
-                    game_result, monsters_defeated_this_run, rooms_travelled = game_loop(player_hp, max_hp, player_inventory, current_room, current_max_inventory_slots, player_gold, player_shield_value, equipped_armor_value, equipped_cloak, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, equipped_weapon, player_xp, player_level, xp_to_next_level, player_quests, player_reputation, player_name, rooms_travelled, player_keychain, equipped_misc_items, player_effects, room_history, direction_history, sound_manager, equipped_helmet, player_class, player_skill_points, player_unlocked_skills, monsters_defeated_this_run, stash, has_hideout_key, seed=None)
-
-                    rooms_explored_this_run = rooms_travelled - initial_rooms_travelled
-                    shards_earned = rooms_explored_this_run + (monsters_defeated_this_run * 5)
-                    if shards_earned > 0:
-                        print(f"\nYou earned {shards_earned} Soul Shards for your efforts.")
-                        meta_progress['soul_shards'] += shards_earned
-                        save_meta_progress(meta_progress)
-
-                    if game_result == 'continue_adventure':
-                        current_room = Room(player_level, player_quests) # Generate a new room to continue exploring
-                        rooms_travelled += 1
-                        player_hp = max_hp
-                        print("\nYour adventure in the Infinite Dungeon continues!")
-                        print("=" * 40)
-                        display_room_content_summary(current_room, rooms_travelled)
-                        continue
-                    elif game_result == 'return_to_menu':
-                        print("\nReturning to the main menu...")
-                        break # Break from the inner loop to go back to the main menu loop
-                    elif game_result == 'lose':
-                        print("\nWhat would you like to do next?")
-                        print("1. Try Again (Restart this adventure from the beginning)")
-                        print("2. Return to Main Menu")
-                        lose_choice = input("> ").strip()
-                        if lose_choice == '1':
-                            # For loaded games, 'Try Again' still restarts the *current session* from scratch
-                            # This means losing the loaded progress. A more complex system would save checkpoint.
-                            # For simplicity, we'll just break
-                            # to main menu which means they can then Load again.
-                            print("\n" + "=" * 40)
-                            print(f"You pick yourself up, {player_name}, and bravely begin anew!")
-                            print("=" * 40)
-                            break # Break from inner loop, effectively returning to main menu
-                        else:
-                            break # Break from the inner loop to return to the main menu
-                    else: # game_result == 'quit'
-                        return
+        # Apply temporary modifiers from effects to get final stats for this turn
+        current_attack_power = base_attack_power + effect_modifiers.get('attack_power', 0)
+        current_defense_bonus = effect_modifiers.get('defense', 0)
+        current_crit_chance_bonus = effect_modifiers.get('crit_chance', 0.0)
 
+        # Update the player's power for this turn (used for display and combat)
+        session.player_attack_power = current_attack_power
 
-            else:
-                continue # No save game found, stay in main menu
+        if session.player_hp < session.max_hp * LOW_HP_INTERRUPT:
+            interrupt_commands(session, "Your health is low")
+        autosave_if_due(session)
+        command_input = read_command(session, "> ").lower().strip()
+        parts = command_input.split()
 
-        elif main_menu_choice == '3':
-            today = datetime.now().strftime('%Y-%m-%d')
-            start_new_game(meta_progress, seed=today, is_daily_challenge=True)
+        direction = None # Initialize direction variable
 
-        elif main_menu_choice == '4':
-            seed = input("Enter the seed for your run: ").strip()
-            if not seed:
-                print("Seed cannot be empty.")
+        # Determine the verb and potential direction
+        # MODIFIED: Resolved through the command registry, so aliases and unambiguous abbreviations work
+        verb, handler, stats = commands.lookup(parts[0] if parts else "")
+        if verb in ["north", "south", "east", "west"]: # NEW: Allow just direction
+            direction = verb # Direction IS the verb
+        elif verb == "go":
+            if len(parts) == 1:
+                print("Where do you want to go? (e.g., 'go north' or just 'north')")
                 continue
-            start_new_game(meta_progress, seed=seed)
+            go_target = commands.lookup(parts[1])[0]
+            direction = go_target if go_target in ["north", "south", "east", "west"] else parts[1] # "go [direction]"
 
-        elif main_menu_choice == '5':
-            handle_adventurers_guild(meta_progress)
-            continue
-
-        elif main_menu_choice == '6':
-            print(CREDITS_TEXT)
-            input("Press Enter to continue...")
-            continue
+        # --- Process Commands ---
+        result = commands.dispatch(handler, stats)
+        if result is not None:
+            return result
 
-        elif main_menu_choice == '7':
-            print("Thanks for playing!")
-            if DEBUG: # Wrapped debug calls
-                debug.close_debug_log() # Close log before final exit from main menu
-            break # Exit the main menu loop, ending the program
+    return 'continue_adventure' # Default return if the loop somehow exits without explicit win/lose/quit
 
 def set_seed(seed):
     """Sets the seed for the random number generator."""
     random.seed(seed)
 
+def generate_seeded_room(room, run_seed, regen, player_quests):
+    """
+    Generates a room of a seeded run from the run's seed and the room's index
+    alone, leaving the game's own random sequence where it was. The same inputs
+    always give the same room, which is what lets delta saves leave rooms out.
+    """
+    index, player_level, entry_direction, special_event = regen
+    outer_state = random.getstate()
+    random.seed(f"{run_seed}/{index}")
+    try:
+        room.generate(player_level, player_quests, entry_direction, special_event)
+    finally:
+        random.setstate(outer_state)
+
 def handle_adventurers_guild(meta_progress):
     """Handles the Adventurer's Guild hub."""
     while True:
+        if STORAGE_BACKEND == 'sqlite':
+            meta_progress.update(load_meta_progress()) # Other processes may have earned or spent shards since
         print("\n--- Adventurer's Guild ---")
         print(f"You have {meta_progress['soul_shards']} Soul Shards.")
 
         # HP Upgrade
         hp_upgrade_level = meta_progress['upgrades'].get('max_hp', 0)
-        hp_upgrade_cost = 50 * (hp_upgrade_level + 1)
+        hp_upgrade_cost = meta_upgrade_cost(meta_progress, 'max_hp')
         print(f"\n1. Upgrade Max HP (+5 HP per level)")
         print(f"   Current Level: {hp_upgrade_level}")
         print(f"   Next Level Cost: {hp_upgrade_cost} Soul Shards")
@@ -4408,10 +6566,7 @@ def handle_adventurers_guild(meta_progress):
         choice = input("Enter your choice: ").lower().strip()
 
         if choice == '1':
-            if meta_progress['soul_shards'] >= hp_upgrade_cost:
-                meta_progress['soul_shards'] -= hp_upgrade_cost
-                meta_progress['upgrades']['max_hp'] += 1
-                save_meta_progress(meta_progress)
+            if buy_meta_upgrade(meta_progress, 'max_hp'):
                 print(f"You have successfully upgraded your Max HP. Current level: {meta_progress['upgrades']['max_hp']}")
             else:
                 print("You don't have enough Soul Shards for this upgrade.")
@@ -4421,9 +6576,23 @@ def handle_adventurers_guild(meta_progress):
         else:
             print("Invalid choice. Please try again.")
 
+def apply_character_class(session, class_name):
+    """Gives a new session the starting stats and equipment of a character class."""
+    class_data = GAME_DATA['character_classes'][class_name]
+    session.player_class = class_name
+    session.max_hp = class_data['starting_stats']['max_hp']
+    session.player_hp = session.max_hp
+    session.player_attack_power = class_data['starting_stats']['attack_power']
+    session.player_attack_variance = class_data['starting_stats']['attack_variance']
+    session.player_crit_chance = class_data['starting_stats']['crit_chance']
+    session.player_crit_multiplier = class_data['starting_stats']['crit_multiplier']
+    for item_name in class_data['starting_equipment']:
+        item_def = get_item_by_name(item_name)
+        if item_def:
+            session.player_inventory.append(copy.deepcopy(item_def))
+
 def start_new_game(meta_progress, seed, is_daily_challenge=False):
     """Sets up and runs a new game, handling all pre-game and post-game logic."""
-    monsters_defeated_this_run = 0
     if is_daily_challenge:
         print(f"Starting Daily Challenge for {seed}...")
         player_name_prompt = "Enter your adventurer's name for the leaderboard: "
@@ -4435,37 +6604,13 @@ def start_new_game(meta_progress, seed, is_daily_challenge=False):
 
     hp_upgrade_level = meta_progress['upgrades'].get('max_hp', 0)
     hp_bonus = hp_upgrade_level * 5
-    player_hp = 100 + hp_bonus
-    max_hp = 100 + hp_bonus
-    player_attack_power = BASE_PLAYER_ATTACK_POWER
-    player_attack_bonus = 0
-    player_attack_variance = BASE_PLAYER_ATTACK_VARIANCE
-    player_crit_chance = BASE_PLAYER_CRIT_CHANCE
-    player_crit_multiplier = BASE_PLAYER_CRIT_MULTIPLIER
-    current_max_inventory_slots = 5
-    player_gold = 500
-    player_shield_value = None
-    equipped_armor_value = None
-    equipped_cloak = None
-    equipped_helmet = None
-    equipped_weapon = None
-    player_xp = 0
-    player_level = 1
-    xp_to_next_level = calculate_xp_for_next_level(player_level)
-    player_inventory = []
-    player_keychain = []
-    player_quests = {}
-    player_reputation = {}
-    equipped_misc_items = []
-    player_effects = []
-    room_history = []
-    direction_history = []
-    stash = []
-    has_hideout_key = False
+    session = GameSession(max_hp=100 + hp_bonus, seed=seed if is_daily_challenge else None)
+    session.run_seed = seed
+    enable_autosave(session)
 
     player_name = input(player_name_prompt).strip()
-    if not player_name:
-        player_name = "Adventurer"
+    if player_name:
+        session.player_name = player_name
 
     character_classes = GAME_DATA.get('character_classes', {})
     class_choices = list(character_classes.keys())
@@ -4481,57 +6626,164 @@ def start_new_game(meta_progress, seed, is_daily_challenge=False):
                 print("Invalid choice. Please select a valid number.")
         except ValueError:
             print("Invalid input. Please enter a number.")
-    player_class = class_choices[class_choice_index]
-    print(f"You have chosen the path of the {player_class}.")
-    class_data = character_classes[player_class]
-    max_hp = class_data['starting_stats']['max_hp']
-    player_hp = max_hp
-    player_attack_power = class_data['starting_stats']['attack_power']
-    player_attack_variance = class_data['starting_stats']['attack_variance']
-    player_crit_chance = class_data['starting_stats']['crit_chance']
-    player_crit_multiplier = class_data['starting_stats']['crit_multiplier']
-    for item_name in class_data['starting_equipment']:
-        item_def = get_item_by_name(item_name)
-        if item_def:
-            player_inventory.append(copy.deepcopy(item_def))
-    player_skill_points = 0
-    player_unlocked_skills = []
+    apply_character_class(session, class_choices[class_choice_index])
+    print(f"You have chosen the path of the {session.player_class}.")
 
-    current_room = Room(player_level, player_quests)
-    rooms_travelled = 1
-    initial_rooms_travelled = 1
-    game_result, monsters_defeated_this_run, rooms_travelled = game_loop(player_hp, max_hp, player_inventory, current_room, current_max_inventory_slots, player_gold, player_shield_value, equipped_armor_value, equipped_cloak, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, equipped_weapon, player_xp, player_level, xp_to_next_level, player_quests, player_reputation, player_name, rooms_travelled, player_keychain, equipped_misc_items, player_effects, room_history, direction_history, sound_manager, equipped_helmet, player_class, player_skill_points, player_unlocked_skills, monsters_defeated_this_run, stash, has_hideout_key, seed=seed if is_daily_challenge else None)
+    session.current_room = Room(session.player_level, session.player_quests, session=session)
+    initial_rooms_travelled = session.rooms_travelled
+    game_result = game_loop(session)
+    save_writer.wait() # Let the last autosave reach the disk
+    rooms_travelled = session.rooms_travelled
+    monsters_defeated_this_run = session.monsters_defeated_this_run
+    player_name = session.player_name
 
     score = (rooms_travelled - initial_rooms_travelled) * 100 + monsters_defeated_this_run * 50
     shards_earned = (rooms_travelled - initial_rooms_travelled) + (monsters_defeated_this_run * 5)
     if shards_earned > 0:
         print(f"\nYou earned {shards_earned} Soul Shards for your efforts.")
-        meta_progress['soul_shards'] += shards_earned
-        save_meta_progress(meta_progress)
+        add_soul_shards(meta_progress, shards_earned)
 
-    if is_daily_challenge:
-        leaderboard = {}
-        try:
-            with open('leaderboard.json', 'r') as f:
-                leaderboard = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            leaderboard = {}
+    if game_result == 'suspended':
+        return game_result # Not finished yet, so it isn't scored
 
+    if is_daily_challenge:
         today = datetime.now().strftime('%Y-%m-%d')
-        if today not in leaderboard:
-            leaderboard[today] = []
+        standing = record_daily_score(today, player_name, score)
+        show_daily_leaderboard(today, standing)
 
-        leaderboard[today].append({"name": player_name, "score": score})
-        leaderboard[today] = sorted(leaderboard[today], key=lambda x: x['score'], reverse=True)
+    return game_result
 
-        with open('leaderboard.json', 'w') as f:
-            json.dump(leaderboard, f, indent=4)
+def play_loaded_session(meta_progress, session, resumed=False):
+    """
+    Plays a loaded or resumed session from the main menu until the player leaves it.
+    Returns the outcome that ended it ('quit' means quit the game).
+    """
+    initial_rooms_travelled = session.rooms_travelled
+    initial_monsters_defeated = session.monsters_defeated_this_run # Shards for earlier kills were paid out when it was suspended
+    enable_autosave(session)
+
+    # After loading, re-evaluate quest counts for 'fetch_item' quests to ensure consistency
+    for q_id, q_data in session.player_quests.items():
+        quest_def = get_quest_by_id(q_id)
+        if quest_def and q_data['status'] == 'active' and quest_def['type'] == 'fetch_item':
+            # Check both inventory and keychain for quest items
+            q_data['current_count'] = sum(1 for item in session.player_inventory if item['name'].lower() == quest_def['target_item'].lower()) + \
+                                     sum(1 for item in session.player_keychain if item['name'].lower() == quest_def['target_item'].lower())
+
+    # After loading, recalculate player_attack_power with the correct additive logic
+    # (a resumed session already has it exactly as it was)
+    if not resumed:
+        current_base_attack_after_load = BASE_PLAYER_ATTACK_POWER + (session.player_level - 1) * ATTACK_GAIN_PER_LEVEL
+        if session.equipped_weapon:
+            session.player_attack_power = current_base_attack_after_load + session.equipped_weapon.get('damage', 0)
+        else:
+            session.player_attack_power = current_base_attack_after_load
 
-        print("\n--- Daily Challenge Leaderboard ---")
-        for i, entry in enumerate(leaderboard[today]):
-            print(f"{i+1}. {entry['name']} - {entry['score']}")
-        input("\nPress Enter to continue...")
 
+    print(f"Welcome back, {session.player_name}!")
+    log_event(f"Game {'resumed' if resumed else 'loaded'} for player: {session.player_name}.")
+    print(f"Your current health: {session.player_hp}/{session.max_hp} HP.")
+    print(f"Your current gold: {session.player_gold} gold.")
+    print(f"Your Level: {session.player_level} (XP: {session.player_xp}/{session.xp_to_next_level})")
+    if session.player_shield_value:
+        print(f"You are currently protected by a {session.player_shield_value['name']} offering {session.player_shield_value.get('defense',0)} defense.")
+    else:
+        print("You are currently not protected by a shield.")
+    if session.equipped_armor_value:
+        print(f"You are currently wearing {session.equipped_armor_value['name']} offering {session.equipped_armor_value.get('defense',0)} defense.")
+    else:
+        print("You are currently not wearing body armor.")
+    # NEW: Display equipped cloak on load
+    if session.equipped_cloak:
+        print(f"You are currently wearing a {session.equipped_cloak['name']} offering {session.equipped_cloak.get('defense',0)} defense.")
+    else:
+        print("You are currently not wearing a cloak.")
+    if session.equipped_weapon:
+        print(f"You are currently wielding {session.equipped_weapon['name']}.")
+    else:
+        print("You are fighting with your fists.")
+
+    # This inner loop also applies to loaded games
+    while True:
+        if not resumed: # A resumed run's music never stopped, and picking a new track would use up a roll of its dice
+            session.sound_manager.stop_music()
+            if getattr(session.current_room, 'is_inn', False):
+                session.sound_manager.play_music('inn_music')
+            else:
+                session.sound_manager.play_music('ambient_music')
+
+        # --- NEW: Handle if a loaded room is an inn ---
+        while getattr(session.current_room, 'is_inn', False):
+            print("You load your game and find yourself in a welcoming inn.")
+            handle_inn(session)
+
+            print("You leave the inn to continue your journey.")
+            session.current_room = Room(session.player_level, session.player_quests, session=session) # Generate a new room
+        # --- END NEW ---
+        game_result = game_loop(session, resumed=resumed)
+        save_writer.wait() # Let the last autosave reach the disk
+        resumed = False
+        rooms_travelled = session.rooms_travelled
+        monsters_defeated_this_run = session.monsters_defeated_this_run - initial_monsters_defeated
+
+        rooms_explored_this_run = rooms_travelled - initial_rooms_travelled
+        shards_earned = rooms_explored_this_run + (monsters_defeated_this_run * 5)
+        if shards_earned > 0:
+            print(f"\nYou earned {shards_earned} Soul Shards for your efforts.")
+            add_soul_shards(meta_progress, shards_earned)
+
+        if game_result == 'continue_adventure':
+            session.current_room = Room(session.player_level, session.player_quests, session=session) # Generate a new room to continue exploring
+            session.rooms_travelled += 1
+            session.player_hp = session.max_hp
+            print("\nYour adventure in the Infinite Dungeon continues!")
+            print("=" * 40)
+            display_room_content_summary(session.current_room, session.rooms_travelled, session.direction_history, seed=None)
+            continue
+        elif game_result == 'return_to_menu':
+            print("\nReturning to the main menu...")
+            break # Break from the inner loop to go back to the main menu loop
+        elif game_result == 'lose':
+            checkpoints = session.checkpoints.labels()
+            print("\nWhat would you like to do next?")
+            if checkpoints:
+                print("1. Try Again (Go back to a recent checkpoint)")
+            else:
+                print("1. Try Again (Restart this adventure from the beginning)")
+            print("2. Return to Main Menu")
+            lose_choice = input("> ").strip()
+            if lose_choice == '1' and checkpoints:
+                print("\nRecent checkpoints (newest first):")
+                for number, label in enumerate(checkpoints, 1):
+                    print(f"{number}. {label}")
+                while True:
+                    checkpoint_choice = input("Go back to which checkpoint? (Enter for the newest) ").strip() or '1'
+                    if checkpoint_choice.isdigit() and 1 <= int(checkpoint_choice) <= len(checkpoints):
+                        break
+                    print("Invalid choice.")
+                # Shards for the ground covered before the loss were paid out already
+                initial_rooms_travelled = max(initial_rooms_travelled, session.rooms_travelled)
+                initial_monsters_defeated = max(initial_monsters_defeated, session.monsters_defeated_this_run)
+                session.checkpoints.restore(session, int(checkpoint_choice) - 1)
+                print("\n" + "=" * 40)
+                print(f"You pick yourself up, {session.player_name}, and try again from Room #{session.rooms_travelled}!")
+                print("=" * 40)
+                continue
+            elif lose_choice == '1':
+                # For loaded games, 'Try Again' without a checkpoint still restarts the *current session* from scratch
+                # This means losing the loaded progress.
+                # For simplicity, we'll just break
+                # to main menu which means they can then Load again.
+                print("\n" + "=" * 40)
+                print(f"You pick yourself up, {session.player_name}, and bravely begin anew!")
+                print("=" * 40)
+                break # Break from inner loop, effectively returning to main menu
+            else:
+                break # Break from the inner loop to return to the main menu
+        elif game_result == 'suspended':
+            break # Parked; it can be resumed from the main menu
+        else: # game_result == 'quit'
+            break
     return game_result
 
 # --- Main Game Execution ---
@@ -4541,13 +6793,59 @@ def main():
     global DEBUG
     if "debug" in sys.argv or "/debug" in sys.argv:
         DEBUG = True
+    output_flush = OUTPUT_FLUSH
+    save_slot = None # --slot=NAME, for --export-save and --import-save
+    for arg in sys.argv[1:]:
+        if arg.startswith("--pace=") and not set_pacing_mode(arg.split("=", 1)[1]):
+            print(f"Unknown pacing mode in '{arg}'. Options: {', '.join(PACING_DELAYS)}.")
+        elif arg.startswith("--flush="):
+            output_flush = arg.split("=", 1)[1]
+            if output_flush not in ('turn', 'line'):
+                print(f"Unknown flush mode in '{arg}'. Options: turn, line.")
+        elif arg.startswith("--autosave="):
+            if not set_autosave_triggers(arg.split("=", 1)[1]):
+                print(f"Unknown autosave trigger in '{arg}'. Options: off, {', '.join(AUTOSAVE_TRIGGER_NAMES)}.")
+        elif arg.startswith("--storage="):
+            if not set_storage_backend(arg.split("=", 1)[1]):
+                print(f"Unknown or unavailable storage backend in '{arg}'. Options: {', '.join(STORAGE_BACKENDS)} (sqlite needs Python's sqlite3 module).")
+        elif arg == "--export-json":
+            # Write the database's meta-progression and leaderboard out as JSON files, then exit
+            try:
+                export_storage_json()
+                print(f"Exported meta-progression to {META_PROGRESS_FILE} and the leaderboard to {LEADERBOARD_FILE}.")
+            except (IOError, TypeError) + STORAGE_ERRORS as e:
+                print(f"Error: Could not export: {e}")
+            return
+        elif arg.split("=", 1)[0] == "--verify-saves":
+            # Check saves against their checksums (every slot, or the given directory or file), then exit
+            if verify_saves(arg.partition("=")[2] or None):
+                sys.exit(1)
+            return
+        elif arg.startswith("--slot="):
+            save_slot = file_safe_name(arg.split("=", 1)[1])
+        elif arg.split("=", 1)[0] in ("--export-save", "--import-save"):
+            # Convert between a save slot and a JSON save, then exit
+            option, _, path = arg.partition("=")
+            path = path or LEGACY_SAVE_FILE
+            try:
+                if option == "--export-save":
+                    slot = save_slot or next(iter(list_save_slots()), (SINGLE_SAVE_SLOT, None))[0]
+                    export_save_json(path, slot)
+                    print(f"Exported save slot '{slot}' to {path}.")
+                else:
+                    slot = import_save_json(path, save_slot)
+                    print(f"Imported {path} as save slot '{slot}'.")
+            except (IOError, ValueError, TypeError) + STORAGE_ERRORS as e:
+                print(f"Error: Could not convert the save: {e}")
+            return
+    if not isinstance(sys.stdout, TurnOutputBuffer):
+        sys.stdout = TurnOutputBuffer(sys.stdout, line_flush=(output_flush == 'line'))
 
     if DEBUG:
         debug.initialize_debug_log(True)
 
     meta_progress = load_meta_progress()
     while True: # This loop keeps the main menu active
-        monsters_defeated_this_run = 0
         print(MAIN_SCREEN_TEXT)
         main_menu_choice = input("Enter your choice: ").strip()
 
@@ -4555,146 +6853,38 @@ def main():
             start_new_game(meta_progress, seed=time.time())
 
         elif main_menu_choice == '2':
-            # Load Game
-            loaded_hp, loaded_max_hp, loaded_inventory, loaded_room, loaded_max_slots, loaded_gold, loaded_shield, loaded_armor, loaded_cloak, \
-            loaded_attack_power, loaded_attack_bonus, loaded_attack_variance, loaded_crit_chance, loaded_crit_multiplier, loaded_equipped_weapon, \
-            loaded_xp, loaded_level, loaded_xp_to_next_level, loaded_player_quests, loaded_player_reputation, loaded_player_name, loaded_rooms_travelled, loaded_player_keychain, loaded_misc_items, loaded_player_effects, loaded_room_history, loaded_direction_history, loaded_stash, loaded_player_class, loaded_player_skill_points, loaded_player_unlocked_skills, loaded_equipped_helmet, has_hideout_key = load_game()
-
-            print("=" * 40)
-            if loaded_hp is not None:
-                initial_rooms_travelled = loaded_rooms_travelled
-                monsters_defeated_this_run = 0
-                # Assign loaded values to game variables
-                player_hp = loaded_hp
-                max_hp = loaded_max_hp
-                player_inventory = loaded_inventory
-                current_room = loaded_room
-                current_max_inventory_slots = loaded_max_slots
-                player_gold = loaded_gold
-                player_shield_value = loaded_shield
-                equipped_armor_value = loaded_armor
-                equipped_cloak = loaded_cloak # NEW: Assign loaded equipped_cloak
-                player_attack_power = loaded_attack_power
-                player_attack_bonus = loaded_attack_bonus # NEW: Assign loaded attack bonus
-                player_attack_variance = loaded_attack_variance
-                player_crit_chance = loaded_crit_chance
-                player_crit_multiplier = loaded_crit_multiplier
-                equipped_weapon = loaded_equipped_weapon
-                player_xp = loaded_xp
-                player_level = loaded_level
-                xp_to_next_level = loaded_xp_to_next_level
-                player_quests = loaded_player_quests
-                player_name = loaded_player_name
-                rooms_travelled = loaded_rooms_travelled
-                player_keychain = loaded_player_keychain # Assign loaded keychain
-                equipped_misc_items = loaded_misc_items
-                player_effects = loaded_player_effects
-                room_history = loaded_room_history
-                direction_history = loaded_direction_history
-                stash = loaded_stash
-                player_class = loaded_player_class
-                player_skill_points = loaded_player_skill_points
-                player_unlocked_skills = loaded_player_unlocked_skills
-                player_reputation = loaded_player_reputation
-                equipped_helmet = loaded_equipped_helmet
-
-                # After loading, re-evaluate quest counts for 'fetch_item' quests to ensure consistency
-                for q_id, q_data in player_quests.items():
-                    quest_def = get_quest_by_id(q_id)
-                    if quest_def and q_data['status'] == 'active' and quest_def['type'] == 'fetch_item':
-                        # Check both inventory and keychain for quest items
-                        q_data['current_count'] = sum(1 for item in player_inventory if item['name'].lower() == quest_def['target_item'].lower()) + \
-                                                 sum(1 for item in player_keychain if item['name'].lower() == quest_def['target_item'].lower())
-
-                # After loading, recalculate player_attack_power with the correct additive logic
-                current_base_attack_after_load = BASE_PLAYER_ATTACK_POWER + (player_level - 1) * ATTACK_GAIN_PER_LEVEL
-                if equipped_weapon:
-                    player_attack_power = current_base_attack_after_load + equipped_weapon.get('damage', 0)
-                else:
-                    player_attack_power = current_base_attack_after_load
-
-
-                print(f"Welcome back, {player_name}!")
-                log_event(f"Game loaded for player: {player_name}.")
-                print(f"Your current health: {player_hp}/{max_hp} HP.")
-                print(f"Your current gold: {player_gold} gold.")
-                print(f"Your Level: {player_level} (XP: {player_xp}/{xp_to_next_level})")
-                if player_shield_value:
-                    print(f"You are currently protected by a {player_shield_value['name']} offering {player_shield_value.get('defense',0)} defense.")
-                else:
-                    print("You are currently not protected by a shield.")
-                if equipped_armor_value:
-                    print(f"You are currently wearing {equipped_armor_value['name']} offering {equipped_armor_value.get('defense',0)} defense.")
-                else:
-                    print("You are currently not wearing body armor.")
-                # NEW: Display equipped cloak on load
-                if equipped_cloak:
-                    print(f"You are currently wearing a {equipped_cloak['name']} offering {equipped_cloak.get('defense',0)} defense.")
-                else:
-                    print("You are currently not wearing a cloak.")
-                if equipped_weapon:
-                    print(f"You are currently wielding {equipped_weapon['name']}.")
-                else:
-                    print("You are fighting with your fists.")
-
-                # This inner loop also applies to loaded games
-                while True:
-                    sound_manager.stop_music()
-                    if getattr(current_room, 'is_inn', False):
-                        sound_manager.play_music('inn_music')
-                    else:
-                        sound_manager.play_music('ambient_music')
-
-                    # --- NEW: Handle if a loaded room is an inn ---
-                    while getattr(current_room, 'is_inn', False):
-                        print("You load your game and find yourself in a welcoming inn.")
-                        player_hp, max_hp, player_quests, player_inventory, player_gold, player_xp, xp_to_next_level, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_level, player_keychain, stash, has_hideout_key = \
-                            handle_inn(player_hp, max_hp, player_quests, player_level, player_inventory, current_max_inventory_slots, player_gold, player_xp, xp_to_next_level, player_attack_power, player_attack_variance, player_crit_chance, player_crit_multiplier, player_keychain, sound_manager, stash, has_hideout_key, player_shield_value, equipped_armor_value, equipped_cloak, equipped_weapon, player_reputation)
-
-                        print("You leave the inn to continue your journey.")
-                        current_room = Room(player_level, player_quests) # Generate a new room
-                    # --- END NEW ---
-                    # MODIFIED: Added equipped_cloak to game_loop parameters
-                    game_result, monsters_defeated_this_run, rooms_travelled = game_loop(player_hp, max_hp, player_inventory, current_room, current_max_inventory_slots, player_gold, player_shield_value, equipped_armor_value, equipped_cloak, player_attack_power, player_attack_bonus, player_attack_variance, player_crit_chance, player_crit_multiplier, equipped_weapon, player_xp, player_level, xp_to_next_level, player_quests, player_reputation, player_name, rooms_travelled, player_keychain, equipped_misc_items, player_effects, room_history, direction_history, sound_manager, equipped_helmet, player_class, player_skill_points, player_unlocked_skills, monsters_defeated_this_run, stash, has_hideout_key, seed=None)
-
-                    rooms_explored_this_run = rooms_travelled - initial_rooms_travelled
-                    shards_earned = rooms_explored_this_run + (monsters_defeated_this_run * 5)
-                    if shards_earned > 0:
-                        print(f"\nYou earned {shards_earned} Soul Shards for your efforts.")
-                        meta_progress['soul_shards'] += shards_earned
-                        save_meta_progress(meta_progress)
-
-                    if game_result == 'continue_adventure':
-                        current_room = Room(player_level, player_quests) # Generate a new room to continue exploring
-                        rooms_travelled += 1
-                        player_hp = max_hp
-                        print("\nYour adventure in the Infinite Dungeon continues!")
-                        print("=" * 40)
-                        display_room_content_summary(current_room, rooms_travelled, direction_history, seed=None)
+            # Load Game (or resume a suspended run)
+            session = None
+            resumed = False
+            save_slots = list_save_slots() # From the save index; no save is opened until one is picked
+            suspended_names = list_suspended_sessions()
+            chosen_slot = save_slots[0][0] if save_slots else SINGLE_SAVE_SLOT
+            if len(save_slots) > 1 or suspended_names:
+                if save_slots:
+                    print("\nSaved games:")
+                    for i, (slot, summary) in enumerate(save_slots):
+                        print(f"  {i+1}. {describe_save_slot(slot, summary)}")
+                if suspended_names:
+                    print(f"\nSuspended runs: {', '.join(suspended_names)}")
+                load_choice = input("Enter a saved game's number or slot, or a suspended run's name (press Enter for the latest save): ").strip()
+                slot_names = [slot for slot, _ in save_slots]
+                if load_choice.isdigit() and 1 <= int(load_choice) <= len(save_slots):
+                    chosen_slot = slot_names[int(load_choice) - 1]
+                elif load_choice.lower() in slot_names:
+                    chosen_slot = load_choice.lower()
+                elif load_choice:
+                    session = unpark_session(load_choice)
+                    if session is None:
+                        print(f"No saved game or suspended run found for '{load_choice}'.")
                         continue
-                    elif game_result == 'return_to_menu':
-                        print("\nReturning to the main menu...")
-                        break # Break from the inner loop to go back to the main menu loop
-                    elif game_result == 'lose':
-                        print("\nWhat would you like to do next?")
-                        print("1. Try Again (Restart this adventure from the beginning)")
-                        print("2. Return to Main Menu")
-                        lose_choice = input("> ").strip()
-                        if lose_choice == '1':
-                            # For loaded games, 'Try Again' still restarts the *current session* from scratch
-                            # This means losing the loaded progress. A more complex system would save checkpoint.
-                            # For simplicity, we'll just break
-                            # to main menu which means they can then Load again.
-                            print("\n" + "=" * 40)
-                            print(f"You pick yourself up, {player_name}, and bravely begin anew!")
-                            print("=" * 40)
-                            break # Break from inner loop, effectively returning to main menu
-                        else:
-                            break # Break from the inner loop to return to the main menu
-                    else: # game_result == 'quit'
-                        return
-
+                    resumed = True
+            if session is None:
+                session = load_game(chosen_slot)
 
+            print("=" * 40)
+            if session is not None:
+                if play_loaded_session(meta_progress, session, resumed=resumed) == 'quit':
+                    return
             else:
                 continue # No save game found, stay in main menu
 
@@ -4730,4 +6920,5 @@ if __name__ == "__main__":
         main()
     finally:
         if DEBUG: # Ensure log is closed even if an unhandled error occurs, only if DEBUG is True
-            debug.close_debug_log()
\ No newline at end of file
+            debug.close_debug_log()
+        sys.stdout.flush()
\ No newline at end of file
@@ -0,0 +1,235 @@
+import asyncio
+import queue
+import random
+import re
+import secrets
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import infinitedungeon as game
+from sound import Sound
+
+# --- Text Server ---
+# Hosts The Infinite Dungeon for many players from one process, over plain TCP (telnet works).
+# The asyncio event loop owns the sockets. Each connection's game runs unchanged on a worker
+# thread, whose input() and print() are routed to that connection and whose random numbers
+# come from its own generator, so sessions never see each other's state or rolls.
+#
+# Run with: python server.py [--host=0.0.0.0] [--port=4000] [--max-connections=32] [--idle-timeout=600] [--storage=sqlite]
+
+# --- SERVER CONSTANTS ---
+HOST = '0.0.0.0'
+PORT = 4000
+MAX_CONNECTIONS = 32 # Players beyond this are turned away at the door
+IDLE_TIMEOUT = 600 # Seconds without a line from a player before they are disconnected
+COMMAND_PROMPT = "> " # The game's main prompt; a run left waiting here when its player goes is suspended, not lost
+TELNET_COMMAND = re.compile(rb"\xff(?:\xfa.*?\xff\xf0|[\xfb-\xfe].|[\xf0-\xf9])", re.S) # IAC negotiation to strip from input
+
+# --- SERVER MENU TEXT ---
+SERVER_MENU_TEXT = """
+=======================================
+=       THE INFINITE DUNGEON          =
+=======================================
+=       1. Start New Game             =
+=       2. Resume Suspended Run       =
+=       3. Daily Challenge            =
+=       4. Seeded Run                 =
+=       5. Credits                    =
+=       6. Leave                      =
+=======================================
+"""
+
+class Connection:
+    """
+    One player's link between the event loop and their game thread.
+    The event loop feeds typed lines into `lines`; the game thread is its
+    session channel, so its input(), print() and random rolls come through here.
+    """
+    def __init__(self, loop, writer):
+        self.loop = loop
+        self.writer = writer
+        self.lines = queue.Queue()
+        self.chunks = []
+        self.rng = random.Random()
+        self.last_text = ""
+        self.prompt = "" # The prompt the game thread is waiting at, if any
+        self.closed = False
+        self.resume_code = secrets.token_hex(3).upper() # Runs parked from this connection are filed under it, so other players can't resume them
+
+    def write(self, text):
+        self.chunks.append(text)
+        self.last_text = text
+        return len(text)
+
+    def flush(self):
+        """Sends everything written so far. Safe to call from the game thread."""
+        if not self.chunks:
+            return
+        data = "".join(self.chunks).replace("\n", "\r\n").encode('utf-8', 'replace')
+        self.chunks = []
+        if not self.closed:
+            self.loop.call_soon_threadsafe(self.send, data)
+
+    def send(self, data):
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+    def readline(self):
+        """
+        Blocks the game thread until the player sends a line. Once they are gone it
+        returns '' (EOF), after a 'suspend' if the run is waiting at the command prompt,
+        so it can be resumed later. That is decided here rather than when the line
+        reader notices the disconnect: input() has already flushed the prompt to the
+        player before it gets here, so they can leave before self.prompt is set.
+        """
+        self.prompt = self.last_text # input() writes its prompt last
+        self.flush() # The prompt and everything that led up to it
+        if self.closed:
+            return ""
+        line = self.lines.get()
+        if line is None:
+            self.closed = True
+            if self.prompt == COMMAND_PROMPT:
+                return "suspend\n" # Parked runs cost a small file, not a thread, until they are resumed
+            return ""
+        self.prompt = ""
+        return line + "\n"
+
+    def close(self):
+        """Wakes the game thread with EOF so it can finish."""
+        self.lines.put(None)
+
+    def hang_up(self):
+        """Ends the session. A run waiting at the command prompt is suspended first (see readline)."""
+        self.close()
+
+def run_session(connection):
+    """Runs one player's menu and games on a worker thread until they leave or disconnect."""
+    game.session_threads.channel = connection
+    try:
+        print(f"Your resume code for this visit is {connection.resume_code}. Keep it: a run you suspend, or leave by disconnecting, can only be resumed with it.")
+        while True:
+            print(SERVER_MENU_TEXT)
+            choice = input("Enter your choice: ").strip()
+            if choice == '1':
+                game.start_new_game(game.load_meta_progress(), seed=time.time())
+            elif choice == '2':
+                resume_name = input("Enter the name of the adventurer to resume: ").strip()
+                resume_code = input("Enter the resume code you were given when you suspended it: ").strip()
+                session = game.unpark_session(resume_name, resume_code) if resume_name and resume_code else None
+                if session is None:
+                    print("No suspended run found under that name and code.")
+                    continue
+                session.resume_code = connection.resume_code # If it is parked again, it is under this visit's code
+                game.play_loaded_session(game.load_meta_progress(), session, resumed=True)
+            elif choice == '3':
+                today = datetime.now().strftime('%Y-%m-%d')
+                game.start_new_game(game.load_meta_progress(), seed=today, is_daily_challenge=True)
+            elif choice == '4':
+                seed = input("Enter the seed for your run: ").strip()
+                if not seed:
+                    print("Seed cannot be empty.")
+                    continue
+                game.start_new_game(game.load_meta_progress(), seed=seed)
+            elif choice == '5':
+                print(game.CREDITS_TEXT)
+                input("Press Enter to continue...")
+            elif choice == '6':
+                print("Thanks for playing!")
+                break
+    except EOFError:
+        pass # Disconnected or timed out mid-game
+    finally:
+        connection.flush()
+        game.session_threads.channel = None
+
+def log_server_event(message):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
+
+class DungeonServer:
+    """Accepts connections and runs a game session for each, up to MAX_CONNECTIONS at a time."""
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=MAX_CONNECTIONS, thread_name_prefix='session')
+        self.connections = set()
+
+    async def read_lines(self, reader, connection):
+        """Feeds the player's lines to their game thread until they disconnect or go idle."""
+        try:
+            while True:
+                line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                if not line:
+                    break
+                line = TELNET_COMMAND.sub(b"", line)
+                connection.lines.put(line.decode('utf-8', 'replace').rstrip("\r\n"))
+        except asyncio.TimeoutError:
+            connection.send(b"\r\nYou have been idle for too long. Farewell, adventurer.\r\n")
+        except (ConnectionError, ValueError): # ValueError: line longer than the stream limit
+            pass
+        finally:
+            connection.hang_up()
+
+    async def handle_connection(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        if len(self.connections) >= MAX_CONNECTIONS:
+            writer.write(b"The dungeon is full right now. Please try again later.\r\n")
+            writer.close()
+            log_server_event(f"Turned away {peer}: server full.")
+            return
+
+        loop = asyncio.get_running_loop()
+        connection = Connection(loop, writer)
+        self.connections.add(connection)
+        log_server_event(f"{peer} connected ({len(self.connections)}/{MAX_CONNECTIONS}).")
+        reading = asyncio.create_task(self.read_lines(reader, connection))
+        try:
+            await loop.run_in_executor(self.executor, run_session, connection)
+        except asyncio.CancelledError:
+            pass # Server shutting down; the finally below lets the game thread finish
+        finally:
+            reading.cancel()
+            connection.hang_up() # In case the server itself is shutting down
+            self.connections.discard(connection)
+            writer.close()
+            log_server_event(f"{peer} disconnected ({len(self.connections)}/{MAX_CONNECTIONS}).")
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        log_server_event(f"Serving The Infinite Dungeon on {host}:{port} (up to {MAX_CONNECTIONS} players).")
+        async with server:
+            await server.serve_forever()
+
+def main():
+    global MAX_CONNECTIONS, IDLE_TIMEOUT
+    host, port = HOST, PORT
+    for arg in sys.argv[1:]:
+        name, _, value = arg.partition("=")
+        try:
+            if name == "--host":
+                host = value
+            elif name == "--port":
+                port = int(value)
+            elif name == "--max-connections":
+                MAX_CONNECTIONS = int(value)
+            elif name == "--idle-timeout":
+                IDLE_TIMEOUT = float(value)
+            elif name == "--pace" and not game.set_pacing_mode(value):
+                print(f"Unknown pacing mode in '{arg}'. Options: {', '.join(game.PACING_DELAYS)}.")
+            elif name == "--storage" and not game.set_storage_backend(value):
+                print(f"Unknown or unavailable storage backend in '{arg}'. Options: {', '.join(game.STORAGE_BACKENDS)}.")
+        except ValueError:
+            print(f"Invalid value in '{arg}'.")
+
+    game.sound_manager = Sound(sound_enabled=False) # Nobody is listening at the server end
+    game.set_autosave_triggers('off') # Nothing here loads saves (there is no Load Game on the server menu), and slots are named after adventurers anyone can type; 'save' is refused for the same reason, and runs left at the prompt are suspended instead
+    game.route_session_threads()
+    signal.signal(signal.SIGTERM, signal.default_int_handler) # Shut down (and suspend waiting runs) like Ctrl+C; the mixer's SDL handler would swallow it
+    try:
+        asyncio.run(DungeonServer().serve(host, port))
+    except KeyboardInterrupt:
+        log_server_event("Server stopped.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy') # No sound card needed
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT) # The game reads game_data.json from the working directory when it is imported
+
+import infinitedungeon
+
+@pytest.fixture
+def game(tmp_path, monkeypatch):
+    """The game module, working in an empty directory, so saves and snapshots land there."""
+    monkeypatch.chdir(tmp_path)
+    infinitedungeon.set_pacing_mode('zero')
+    infinitedungeon.set_autosave_triggers('off')
+    yield infinitedungeon
+    infinitedungeon.save_writer.wait()
+    infinitedungeon.set_storage_backend('files')
+
+def new_session(game, player_name="Tester", run_seed=None, rooms=0):
+    """A fresh session standing in its first room, moved `rooms` rooms on (north each time)."""
+    session = game.GameSession(player_name=player_name)
+    game.apply_character_class(session, next(iter(game.GAME_DATA['character_classes'])))
+    session.run_seed = run_seed
+    session.current_room = game.Room(session.player_level, session.player_quests, session=session)
+    for _ in range(rooms):
+        walk_on(game, session)
+    return session
+
+def walk_on(game, session, direction='north'):
+    """Moves into a new room the way cmd_go does, without the room's entry events."""
+    session.room_history.append(session.current_room)
+    session.direction_history.append(direction)
+    session.current_room = game.Room(session.player_level, session.player_quests, entry_direction=direction, session=session)
+    session.rooms_travelled += 1
+
+def saved_view(game, session):
+    """Everything a save holds about a session, as plain data, to compare a session with what loads back."""
+    rooms = [room.materialize() if isinstance(room, game.SavedRoom) else room for room in session.room_history]
+    return {
+        'fields': game.session_save_fields(session),
+        'current_room': game.room_save_data(session.current_room),
+        'rooms': [game.room_save_data(room) for room in rooms],
+        'directions': list(session.direction_history),
+    }
+
+def quiet_room(session):
+    """Empties the session's current room of anything that would stop the player leaving it."""
+    room = session.current_room
+    room.monster = room.hazard = room.puzzle = room.npc = room.item = room.shrine = None
+    room.is_horde_room = room.awaiting_winning_item_pickup = False
+    room.exits, room.locked_exits = dict.fromkeys(['north', 'south', 'east', 'west'], True), {}
+    return room
+
+def play(game, session, monkeypatch, lines):
+    """Runs game_loop on a session already in its room, typing `lines` at its prompts, then 'quit'. Returns what game_loop returned."""
+    typed = iter(list(lines) + ["quit"])
+    monkeypatch.setattr('builtins.input', lambda prompt="": next(typed))
+    return game.game_loop(session, resumed=True)
+
+class EventLog:
+    """A combat renderer that keeps the (event_type, kind) of every event it is sent."""
+    def __init__(self):
+        self.events = []
+
+    def render(self, event_type, kind, event):
+        self.events.append((event_type, kind))
+
+@pytest.fixture
+def combat_events(game):
+    """The combat events emitted on this thread during the test, as an EventLog."""
+    log = EventLog()
+    previous_renderer = game.set_combat_renderer(log)
+    yield log
+    game.set_combat_renderer(previous_renderer)
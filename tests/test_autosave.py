@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from conftest import new_session, saved_view, walk_on
+
+@pytest.fixture
+def clock(game, monkeypatch):
+    """A monotonic clock the test moves by hand, in seconds."""
+    now = [1000.0]
+    monkeypatch.setattr(game.time, 'monotonic', lambda: now[0])
+    return now
+
+@pytest.fixture
+def saves_taken(game, monkeypatch):
+    """The room number of each save taken."""
+    taken = []
+    take_save = game.take_save
+    monkeypatch.setattr(game, 'take_save', lambda session: taken.append(session.rooms_travelled) or take_save(session))
+    return taken
+
+def test_autosave_triggers_are_debounced(game, clock, saves_taken):
+    assert not game.set_autosave_triggers('rooms,naps')
+    assert game.set_autosave_triggers('rooms, inn')
+    session = new_session(game)
+    game.enable_autosave(session)
+    for _ in range(game.AUTOSAVE_EVERY_ROOMS):
+        walk_on(game, session)
+    clock[0] += game.AUTOSAVE_MIN_GAP - 1
+    game.autosave_if_due(session)
+    assert saves_taken == [] # Too soon after the last one
+    clock[0] += 1
+    game.autosave_if_due(session)
+    assert saves_taken == [11]
+    game.save_writer.wait()
+    assert saved_view(game, game.load_game(session.save_slot)) == saved_view(game, session)
+
+    game.request_autosave(session, 'level_up') # Not one of the triggers
+    clock[0] += game.AUTOSAVE_MIN_GAP
+    game.autosave_if_due(session)
+    assert saves_taken == [11]
+    game.request_autosave(session, 'inn')
+    game.request_autosave(session, 'inn')
+    walk_on(game, session)
+    game.autosave_if_due(session)
+    game.autosave_if_due(session)
+    assert saves_taken == [11, 12] # One save for the burst
+
+def test_timed_autosave(game, clock, saves_taken):
+    game.set_autosave_triggers('time')
+    session = new_session(game)
+    game.enable_autosave(session)
+    clock[0] += game.AUTOSAVE_INTERVAL - 1
+    game.autosave_if_due(session)
+    assert saves_taken == []
+    clock[0] += 1
+    game.autosave_if_due(session)
+    assert saves_taken == [1]
+
+def test_no_autosaves_when_off(game):
+    session = new_session(game)
+    game.enable_autosave(session) # The fixture turns them off
+    assert session.autosave is None
+
+def test_failed_atomic_write_keeps_the_old_file(game):
+    game.write_file_atomically('slot.sav', b"old save")
+    def pieces():
+        yield b"half a new "
+        raise OSError("disk full")
+    with pytest.raises(OSError):
+        game.write_file_atomically('slot.sav', pieces())
+    with open('slot.sav', 'rb') as f:
+        assert f.read() == b"old save"
+    assert os.listdir('.') == ['slot.sav'] # No temporary file left behind
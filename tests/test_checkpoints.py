@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from conftest import new_session, saved_view, walk_on
+
+OGRE = {'name': "Test Ogre", 'health': 10000, 'damage': 10000, 'xp_reward': 0}
+
+def enter(game, session, direction='north'):
+    """Moves on and checkpoints the new room the way cmd_go does. Returns the room's view and the first random draw made in it."""
+    walk_on(game, session, direction)
+    session.checkpoints.take(session)
+    return saved_view(game, session), random.random()
+
+def test_restore_puts_a_lost_run_back_at_a_checkpoint(game):
+    session = new_session(game, run_seed=4242)
+    session.checkpoints.take(session)
+    taken = [(saved_view(game, session), random.random())]
+    for number in range(5):
+        session.player_gold += 25
+        session.player_hp -= 1
+        taken.append(enter(game, session, 'east' if number == 2 else 'north'))
+    session.current_room = session.room_history.pop() # Back west, as cmd_go does it
+    session.direction_history.pop()
+    session.rooms_travelled -= 1
+    session.checkpoints.history_popped(session)
+    taken.append(enter(game, session))
+    game.save_game(session)
+    session.command_queue.append("north")
+
+    game.handle_combat(session, dict(OGRE), 0, 0, policy=game.AUTO_BATTLE_POLICY)
+    assert session.player_hp <= 0
+    labels = session.checkpoints.labels()
+    assert len(labels) == len(taken)
+
+    checkpoint = 3
+    session.checkpoints.restore(session, checkpoint)
+    view, draw = taken[-1 - checkpoint]
+    assert saved_view(game, session) == view
+    assert session.player_hp > 0
+    assert session.checkpoints.labels() == labels[checkpoint + 1:]
+    assert not session.command_queue
+    assert random.random() == draw
+    assert session.save_journal['rooms_kept'] <= len(session.room_history) # The save holds rooms the restore took away
+
+    walk_on(game, session, 'south')
+    game.save_game(session) # Only the rooms below the checkpoint still match the save's
+    assert saved_view(game, game.load_game(session.save_slot)) == saved_view(game, session)
+
+def test_try_again_goes_back_to_a_checkpoint(game):
+    env = pytest.importorskip("env")
+    dungeon = env.DungeonEnv()
+    try:
+        observation = dungeon.reset(seed=3)
+        rng = random.Random(3)
+        while len(dungeon.checkpoints()) < 3 or observation['prompt'] != 'main':
+            observation, _, done, _ = dungeon.step(rng.choice(observation['legal_actions'] or ["attack"]))
+            if done:
+                observation = dungeon.reset(seed=rng.randrange(1000))
+        labels = dungeon.checkpoints()
+        observation = dungeon.try_again(1)
+        assert labels[1].startswith(f"Room #{observation['room']['number']}")
+        assert dungeon.checkpoints() == labels[1:] # Entering the room again checkpoints it afresh
+        with pytest.raises(ValueError):
+            dungeon.try_again(len(dungeon.checkpoints()))
+    finally:
+        dungeon.close()
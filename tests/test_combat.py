@@ -0,0 +1,80 @@
+import io
+import json
+import random
+
+from conftest import new_session
+
+DUMMY = {'name': "Training Dummy", 'health': 200, 'damage': 1, 'xp_reward': 5}
+GOLEM = {'name': "Stone Golem", 'health': 100, 'damage': 0, 'defense': 10**6, 'xp_reward': 500, 'gold_drop': [50, 50]} # Can't hurt or be hurt
+
+def horde_room(game, session, monkeypatch, monster, size=3):
+    monkeypatch.setattr(game, 'MONSTERS', [monster])
+    room = session.current_room
+    room.is_horde_room = True
+    room.horde_data = {'name': "Test Horde", 'monsters': [monster['name']], 'size': [size, size]}
+
+def test_auto_fights_on_without_prompting_again(game, monkeypatch, capsys):
+    session = new_session(game)
+    typed = iter(["auto"])
+    monkeypatch.setattr('builtins.input', lambda prompt="": next(typed))
+    monster, _, outcome = game.handle_combat(session, dict(DUMMY), 0, 0)
+    assert outcome == 'won' and monster is None and session.player_hp > 0
+    output = capsys.readouterr().out
+    assert output.count("What do you do?") == 1
+    assert output.count("collapses, defeated") == 1
+
+def test_auto_resolved_horde_that_cant_be_beaten_is_fled(game, monkeypatch, capsys):
+    session = new_session(game)
+    horde_room(game, session, monkeypatch, GOLEM)
+    xp, gold = session.player_xp, session.player_gold
+    result, defeated = game.handle_horde_combat(session, auto_resolve=True)
+    assert (result, defeated) == ('continue', 0)
+    assert (session.player_xp, session.player_gold) == (xp, gold)
+    output = capsys.readouterr().out
+    assert "Battles fought: 1/3" in output and "fled from the Test Horde" in output
+    assert "Horde Defeated" not in output
+
+def test_auto_resolved_horde_pays_for_each_win(game, monkeypatch, capsys):
+    session = new_session(game)
+    horde_room(game, session, monkeypatch, dict(DUMMY, health=5, gold_drop=[7, 7]))
+    gold = session.player_gold
+    result, defeated = game.handle_horde_combat(session, auto_resolve=True)
+    assert (result, defeated) == ('continue', 3)
+    assert session.player_gold == gold + 3 * 7
+    output = capsys.readouterr().out
+    assert "Battles fought: 3/3" in output and "Horde Defeated" in output
+    assert "collapses" not in output # The battle log gives way to the summary
+
+def test_auto_battle_policy_picks_actions(game):
+    choose = game.choose_auto_combat_action
+    policy = dict(game.AUTO_BATTLE_POLICY, potion="Greater Potion", skills=["Power Strike", "attack", "Fireball"], flee_below=0.1, max_rounds=20)
+    potions = [{'name': "Healing Potion", 'type': 'consumable', 'effect_type': 'heal', 'effect_value': 20}]
+    both = potions + [{'name': "Greater Potion", 'type': 'consumable', 'effect_type': 'heal', 'effect_value': 50}]
+    skills = ["Power Strike"] # Fireball isn't unlocked, so the rotation skips it
+    assert choose(policy, 100, 100, [], skills, 0) == "skill power strike"
+    assert choose(policy, 100, 100, [], skills, 1) == "attack"
+    assert choose(policy, 100, 100, [], skills, 2) == "skill power strike"
+    assert choose(policy, 20, 100, both, skills, 0) == "use greater potion"
+    assert choose(policy, 20, 100, potions, skills, 0) == "heal"
+    assert choose(policy, 20, 100, [], skills, 0, can_stop=True) is None # Hands control back
+    assert choose(policy, 20, 100, [], skills, 0) == "skill power strike" # A horde fight can't stop
+    assert choose(policy, 5, 100, both, skills, 0) == "run"
+    assert choose(policy, 100, 100, [], skills, 20) == "run"
+
+def test_renderers_carry_the_same_fight(game, capsys):
+    fights = {}
+    for name, renderer in (('text', game.TextCombatRenderer()), ('null', game.NullCombatRenderer()), ('jsonl', game.JsonlCombatRenderer(io.StringIO()))):
+        random.seed(11)
+        session = new_session(game)
+        previous_renderer = game.set_combat_renderer(renderer)
+        try:
+            fights[name] = game.handle_combat(session, dict(DUMMY, health=30), 0, 0, policy=game.AUTO_BATTLE_POLICY), capsys.readouterr().out
+        finally:
+            game.set_combat_renderer(previous_renderer)
+        if name == 'jsonl':
+            events = [json.loads(line) for line in renderer.stream.getvalue().splitlines()]
+    assert fights['text'][0] == fights['null'][0] == fights['jsonl'][0] # The renderer only changes what is shown
+    assert "collapses, defeated" in fights['text'][1]
+    assert fights['null'][1] == fights['jsonl'][1] == ""
+    assert events[0]['event'] == 'combat_start' and events[0]['monster'] == "Training Dummy"
+    assert {'event': 'defeat', 'kind': 'monster', 'monster': "Training Dummy"} in events
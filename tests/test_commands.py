@@ -0,0 +1,80 @@
+import random
+
+from conftest import new_session, play, quiet_room
+
+def test_commands_route_by_alias_and_unambiguous_prefix(game):
+    lookup = game.GAME_COMMANDS.lookup
+    assert lookup("n") == "north"
+    assert lookup("i") == "inventory"
+    assert lookup("inv") == "inventory"
+    assert lookup("quip") == "equip"
+    assert lookup("equip") == "equip"
+    assert lookup("equipp") == "equipped"
+    assert lookup("equi") is None # equip or equipped
+    assert lookup("auto") is None # Toggles and other changes need their full name
+    assert lookup("autohorde") == "autohorde"
+    assert lookup("autoh") is None
+    assert lookup("att") is None
+    assert lookup("xyzzy") is None
+
+def test_registry_builds_its_table_once(game, monkeypatch):
+    registry = game.CommandRegistry()
+    builds = []
+    prefixes = registry.trie.prefixes
+    monkeypatch.setattr(registry.trie, 'prefixes', lambda: builds.append(1) or prefixes())
+    for verb in ("look", "loot", "listen"):
+        registry.register(verb, prefixes=True)
+    assert builds == []
+    assert registry.lookup("lis") == "listen"
+    assert registry.lookup("loo") is None
+    assert builds == [1]
+
+def test_bound_table_dispatches_to_handlers_and_falls_back(game):
+    table = game.GAME_COMMANDS.bind({"look": lambda: "looked"}, lambda: "unknown")
+    verb, handler, stats = table.lookup("lo")
+    assert verb == "look" and table.dispatch(handler, stats) == "looked"
+    verb, handler, stats = table.lookup("dance")
+    assert verb == "dance" and handler() == "unknown"
+
+def test_abbreviations_never_toggle_anything(game, monkeypatch):
+    session = new_session(game)
+    quiet_room(session)
+    hordes = session.auto_resolve_hordes
+    assert play(game, session, monkeypatch, ["auto"]) == 'quit'
+    assert session.auto_resolve_hordes == hordes
+
+def test_go_takes_the_same_directions_as_moving_directly(game, monkeypatch):
+    for line in ("go n", "go nor", "nor"):
+        random.seed(7)
+        session = new_session(game)
+        quiet_room(session)
+        assert play(game, session, monkeypatch, [line]) == 'quit'
+        assert session.direction_history == ['north'], line
+
+def test_command_lines_expand_into_steps(game, monkeypatch):
+    expand = game.expand_command_line
+    assert expand("north; search; get item") == ["north", "search", "get item"]
+    assert expand("attack x3") == ["attack"] * 3
+    assert expand("2 east; look") == ["east", "east", "look"]
+    assert expand("north;") == ["north"]
+    assert expand("") == [""] # Just Enter, which some prompts take as a default
+    assert expand("use x-ray goggles") == ["use x-ray goggles"] # Not a repeat count
+    monkeypatch.setattr(game, 'MAX_COMMAND_REPEAT', 4)
+    assert expand("search x1000") == ["search"] * 4
+
+def test_queued_steps_are_played_until_something_interrupts(game, monkeypatch, capsys):
+    session = new_session(game)
+    monkeypatch.setattr('builtins.input', lambda prompt="": "3 search; look")
+    assert game.read_command(session, "> ") == "search"
+    assert game.read_command(session, "> ") == "search"
+    assert "> search" in capsys.readouterr().out # Queued steps are echoed as if typed
+    game.interrupt_commands(session, "Combat started")
+    assert "(Combat started - 2 queued command(s) cancelled.)" in capsys.readouterr().out
+    monkeypatch.setattr('builtins.input', lambda prompt="": "look")
+    assert game.read_command(session, "> ") == "look"
+
+def test_chained_commands_run_at_the_main_prompt(game, monkeypatch):
+    session = new_session(game)
+    quiet_room(session)
+    assert play(game, session, monkeypatch, ["pace fast; pace zero; pace fast"]) == 'quit'
+    assert game.PACING_MODE == 'fast'
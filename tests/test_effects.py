@@ -0,0 +1,51 @@
+import copy
+
+def test_player_effects_expire_in_turn_order(game):
+    effects = game.EffectSchedule([
+        {'name': "Might", 'stat': 'attack_power', 'modifier': 5, 'duration': 3},
+        {'name': "Ward", 'stat': 'defense', 'modifier': 2, 'duration': 1},
+        {'name': "Focus", 'stat': 'crit_chance', 'modifier': 0.1, 'duration': 2},
+    ])
+    assert [(effect['name'], turns) for effect, turns in effects.remaining()] == [("Might", 3), ("Ward", 1), ("Focus", 2)]
+    in_force = [effects.tick() for _ in range(4)]
+    assert in_force[0] == {'attack_power': 5, 'defense': 2, 'crit_chance': 0.1} # Each lasts its whole duration
+    assert in_force[1] == {'attack_power': 5, 'defense': 0, 'crit_chance': 0.1}
+    assert in_force[2] == {'attack_power': 5, 'defense': 0, 'crit_chance': 0.0}
+    assert in_force[3] == {'attack_power': 0, 'defense': 0, 'crit_chance': 0.0}
+    assert len(effects) == 0
+
+def test_effect_schedule_saves_remaining_durations(game):
+    effects = game.EffectSchedule([{'name': "Might", 'stat': 'attack_power', 'modifier': 5, 'duration': 3}])
+    effects.tick()
+    effects.append({'name': "Ward", 'stat': 'defense', 'modifier': 2, 'duration': 4})
+    assert effects.to_list() == [
+        {'name': "Might", 'stat': 'attack_power', 'modifier': 5, 'duration': 2},
+        {'name': "Ward", 'stat': 'defense', 'modifier': 2, 'duration': 4},
+    ]
+    assert game.EffectSchedule(effects.to_list()).to_list() == effects.to_list()
+
+def test_status_effects_tick_and_wear_off_in_the_order_applied(game, combat_events):
+    statuses = game.StatusEffectSchedule()
+    for name in ("Poison", "Stun", "Blindness", "Curse"):
+        statuses.append({'name': name}) # Filled in from the game's definitions
+    hp, stunned = statuses.tick(100)
+    assert (hp, stunned) == (90, True)
+    assert statuses.modifiers == {'accuracy': -0.5, 'defense': -5}
+    assert statuses.tick(hp) == (80, False)
+    statuses.remove_named("Poison") # Cured: no more damage, and no wear-off message
+    assert statuses.tick(80) == (80, False)
+    assert statuses.modifiers == {'accuracy': 0, 'defense': -5}
+    assert [effect['name'] for effect in statuses] == ["Curse"] # Never wears off
+    assert combat_events.events == [
+        ('effect_tick', None), ('effect_expired', 'status'), # Poison, then Stun wearing off
+        ('effect_tick', None),
+        ('effect_expired', 'status'), # Blindness
+    ]
+
+def test_status_effect_definitions_are_not_changed(game):
+    definitions = copy.deepcopy(game.STATUS_EFFECTS_BY_NAME)
+    statuses = game.StatusEffectSchedule()
+    statuses.append({'name': "Blindness", 'chance': 1.0})
+    for _ in range(3):
+        statuses.tick(100)
+    assert game.STATUS_EFFECTS_BY_NAME == definitions
@@ -0,0 +1,99 @@
+import pytest
+
+env = pytest.importorskip("env")
+
+def test_puzzle_rooms_offer_their_puzzle_actions(game):
+    session = game.GameSession()
+    session.player_inventory = [{'name': 'Healing Potion', 'type': 'consumable'}]
+    puzzles = {puzzle['type']: dict(puzzle, solved=False) for puzzle in game.GAME_DATA['puzzles']}
+    assert "answer keyboard" in env.puzzle_actions(puzzles['riddle'], session.player_inventory)
+    assert env.puzzle_actions(puzzles['mechanism'], []) == ["pull gold", "pull silver", "pull bronze"]
+    assert env.puzzle_actions(puzzles['pressure_plate'], []) == ["press"]
+    assert env.puzzle_actions(puzzles['item_delivery'], session.player_inventory) == ["give healing potion to statue"]
+
+def test_random_legal_play_gets_past_puzzles(game):
+    import random
+    rng = random.Random(0)
+    dungeon = env.DungeonEnv()
+    try:
+        solved = 0
+        for seed in range(10):
+            observation = dungeon.reset(seed=seed)
+            for _ in range(300):
+                room = dungeon.session.current_room
+                if room.puzzle and room.puzzle.get('solved'):
+                    solved += 1
+                    break
+                observation, _, done, _ = dungeon.step(rng.choice(observation['legal_actions'] or ["attack"]))
+                if done:
+                    break
+        assert solved
+    finally:
+        dungeon.close()
+
+def play_vector(vector, steps):
+    """Steps a VectorDungeonEnv with a fixed pattern of legal-action indices. Returns the arrays it handed back, in order."""
+    np = pytest.importorskip("numpy")
+    history = [vector.reset()]
+    for step in range(steps):
+        actions = np.array([(step + game) % 3 for game in range(vector.num_envs)])
+        observations, rewards, dones, _ = vector.step(actions)
+        history += [observations, rewards, dones]
+    return history
+
+def test_vector_env_steps_games_in_lockstep(game):
+    pytest.importorskip("numpy")
+    vector = env.VectorDungeonEnv(3, seed=20)
+    try:
+        history = play_vector(vector, 40)
+    finally:
+        vector.close()
+    assert history[0].shape == (3, len(env.OBSERVATION_FEATURES))
+    observations, rewards, dones = history[-3:]
+    assert rewards.shape == dones.shape == (3,)
+
+    single = env.DungeonEnv() # Game 1 on its own, given the same actions
+    try:
+        observation = single.reset(seed=21)
+        assert list(env.observation_features(observation)) == list(history[0][1])
+        for step in range(40):
+            legal_actions = observation['legal_actions']
+            index = (step + 1) % 3
+            observation, reward, done, _ = single.step(legal_actions[index] if index < len(legal_actions) else "")
+            if done:
+                break
+            assert list(env.observation_features(observation)) == list(history[1 + 3 * step][1])
+            assert reward == history[2 + 3 * step][1]
+    finally:
+        single.close()
+
+def test_vector_env_restarts_finished_games_on_their_next_seed(game):
+    pytest.importorskip("numpy")
+    vector = env.VectorDungeonEnv(2, seed=30)
+    single = env.DungeonEnv()
+    try:
+        vector.reset()
+        assert vector.observations[0]['prompt'] == 'main'
+        observations, _, dones, infos = vector.step(["quit", 0])
+        assert list(dones) == [True, False]
+        assert infos[0]['final_observation']['prompt'] == 'done' and 'final_observation' not in infos[1]
+        assert list(observations[0]) == list(env.observation_features(single.reset(seed=32))) # 30, then 30 + num_envs
+    finally:
+        vector.close()
+        single.close()
+
+def test_forked_workers_play_the_same_games_as_serial(game):
+    pytest.importorskip("numpy")
+    if env.worker_context().get_start_method() != 'fork':
+        pytest.skip("Workers are only forked where fork() exists")
+    games = {}
+    for backend in ('serial', 'process'):
+        vector = env.VectorDungeonEnv(4, seed=40, backend=backend, num_workers=2)
+        try:
+            games[backend] = play_vector(vector, 25)
+            if backend == 'process':
+                assert len(vector.batches) == 2
+                assert env.gc.get_freeze_count() > 0 # The parent's game data was frozen before forking
+        finally:
+            vector.close()
+    assert all((serial == forked).all() for serial, forked in zip(games['serial'], games['process']))
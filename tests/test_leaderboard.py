@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+DAY = '2026-10-19'
+RUNS = [("Ann", 500), ("Bo", 900), ("Cy", 500), ("Di", 200), ("Ed", 700), ("Flo", 100)]
+
+@pytest.fixture(params=['files', 'sqlite'])
+def backend(request, game, monkeypatch):
+    """Runs a test once with each storage backend, keeping the top 3 of each day and pages of 2."""
+    monkeypatch.setattr(game, 'LEADERBOARD_TOP_K', 3)
+    monkeypatch.setattr(game, 'LEADERBOARD_PAGE_SIZE', 2)
+    if request.param == 'sqlite':
+        pytest.importorskip("sqlite3")
+        game.set_storage_backend('sqlite')
+        monkeypatch.setattr(game.storage_threads, 'db', None, raising=False)
+    return request.param
+
+def test_daily_scores_rank_and_page(game, backend):
+    standings = [game.record_daily_score(DAY, name, score) for name, score in RUNS]
+    assert standings[0] == {'rank': 1, 'total': 1, 'percentile': 0.0}
+    assert standings[2] == {'rank': 2, 'total': 3, 'percentile': 0.0} # Ties share the better rank
+    assert standings[-1] == {'rank': 6, 'total': 6, 'percentile': 0.0}
+    assert game.daily_score_standing(DAY, 500) == {'rank': 3, 'total': 6, 'percentile': pytest.approx(100 / 3)} # Every run still counts
+    assert game.daily_score_standing(DAY, 1000)['rank'] == 1
+    assert game.daily_score_standing('2026-10-20', 500) == {'rank': 1, 'total': 0, 'percentile': 0.0}
+
+    assert game.daily_leaderboard_page(DAY, 0) == ([{"name": "Bo", "score": 900}, {"name": "Ed", "score": 700}], True)
+    assert game.daily_leaderboard_page(DAY, 1) == ([{"name": "Ann", "score": 500}], False) # Only the top 3 are kept
+    assert game.daily_leaderboard_page('2026-10-20', 0) == ([], False)
+
+def test_days_from_before_partitions_still_read(game):
+    with open(game.LEADERBOARD_FILE, 'w') as f:
+        json.dump({DAY: [{"name": "Old", "score": 800}, {"name": "Timer", "score": 300}]}, f)
+    assert game.list_leaderboard_days() == [DAY]
+    assert game.record_daily_score(DAY, "New", 400) == {'rank': 2, 'total': 3, 'percentile': pytest.approx(100 / 3)}
+    entries, _ = game.daily_leaderboard_page(DAY, 0)
+    assert [entry['name'] for entry in entries] == ["Old", "New", "Timer"]
@@ -0,0 +1,79 @@
+import io
+import sys
+
+from conftest import new_session, play, quiet_room
+
+def waits(game, monkeypatch, select_works=True):
+    """Records the waits pause() makes, through select() (cut short by typing) or sleep()."""
+    made = []
+    def select(readers, writers, errors, timeout):
+        if not select_works:
+            raise ValueError("not a real file")
+        made.append(('select', timeout))
+        return [], [], []
+    monkeypatch.setattr(game.select, 'select', select)
+    monkeypatch.setattr(game.time, 'sleep', lambda seconds: made.append(('sleep', seconds)))
+    return made
+
+def test_pause_waits_by_the_pacing_mode(game, monkeypatch):
+    made = waits(game, monkeypatch)
+    game.pause()
+    assert made == [] # 'zero', as the fixture sets it
+    assert game.set_pacing_mode('fast')
+    game.pause(2)
+    assert made == [('select', 0.5)] # Ends early if a command is typed
+    assert not game.set_pacing_mode('slow')
+    assert game.PACING_MODE == 'fast'
+
+def test_pause_sleeps_when_stdin_cant_be_watched(game, monkeypatch):
+    made = waits(game, monkeypatch, select_works=False)
+    game.set_pacing_mode('interactive')
+    game.pause(0.5)
+    assert made[-1] == ('sleep', 0.5)
+
+def test_pace_command_switches_the_mode(game, monkeypatch, capsys):
+    session = new_session(game)
+    quiet_room(session)
+    play(game, session, monkeypatch, ["pace fast", "pace dreamy"])
+    assert game.PACING_MODE == 'fast'
+    output = capsys.readouterr().out
+    assert "Pacing set to 'fast'." in output and "Unknown pacing 'dreamy'" in output
+
+class RecordingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+def test_turn_output_is_written_in_one_go_when_flushed(game):
+    stream = RecordingStream()
+    buffer = game.TurnOutputBuffer(stream)
+    for line in ("You enter a room.\n", "A goblin attacks!\n", "> "):
+        buffer.write(line)
+    assert stream.getvalue() == ""
+    buffer.flush()
+    assert (stream.getvalue(), stream.writes) == ("You enter a room.\nA goblin attacks!\n> ", 1)
+    buffer.flush()
+    assert stream.writes == 1 # Nothing new to write
+    assert buffer.getvalue() == stream.getvalue() # Everything else goes to the stream
+
+def test_line_flush_writes_each_line(game):
+    stream = RecordingStream()
+    buffer = game.TurnOutputBuffer(stream, line_flush=True)
+    buffer.write("Half a line, ")
+    assert stream.getvalue() == ""
+    buffer.write("then the rest.\n")
+    assert (stream.getvalue(), stream.writes) == ("Half a line, then the rest.\n", 1)
+
+def test_pause_shows_the_turn_so_far_before_waiting(game, monkeypatch):
+    stream = RecordingStream()
+    monkeypatch.setattr(sys, 'stdout', game.TurnOutputBuffer(stream))
+    shown = []
+    monkeypatch.setattr(game.select, 'select', lambda *args: shown.append(stream.getvalue()) or ([], [], []))
+    game.set_pacing_mode('fast')
+    print("The floor gives way...")
+    game.pause()
+    assert shown == ["The floor gives way...\n"]
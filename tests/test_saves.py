@@ -0,0 +1,224 @@
+import json
+import os
+import pickle
+import pickletools
+import shutil
+import sqlite3
+import subprocess
+import sys
+import zlib
+
+import pytest
+
+from conftest import ROOT, new_session, saved_view, walk_on
+
+def test_save_after_torn_journal_line_survives_reload(game):
+    session = new_session(game, rooms=2)
+    game.save_game(session) # Base
+    session.player_gold = 111
+    game.save_game(session) # Journal entry
+    with open(game.save_slot_files(session.save_slot)[1], 'a') as f:
+        f.write('0badc0de {"save_id": "cut sho') # A save torn by a crash
+
+    loaded = game.load_game(session.save_slot)
+    assert loaded.player_gold == 111
+    loaded.player_gold = 999
+    walk_on(game, loaded)
+    game.save_game(loaded)
+    loaded.player_gold = 1234
+    game.save_game(loaded)
+
+    reloaded = game.load_game(session.save_slot)
+    assert reloaded.player_gold == 1234
+    assert saved_view(game, reloaded) == saved_view(game, loaded)
+
+def test_save_after_corrupted_journal_entry_survives_reload(game, capsys):
+    session = new_session(game, rooms=1)
+    game.save_game(session)
+    for gold in (100, 200, 300):
+        session.player_gold = gold
+        walk_on(game, session)
+        game.save_game(session)
+    journal_file = game.save_slot_files(session.save_slot)[1]
+    with open(journal_file) as f:
+        lines = f.readlines()
+    lines[1] = lines[1].replace('"player_gold": 200', '"player_gold": 201') # Fails its checksum
+    with open(journal_file, 'w') as f:
+        f.writelines(lines)
+
+    loaded = game.load_game(session.save_slot)
+    assert "Entry 2 of 3" in capsys.readouterr().out
+    assert loaded.player_gold == 100
+    loaded.player_gold = 555
+    game.save_game(loaded)
+
+    reloaded = game.load_game(session.save_slot)
+    assert reloaded.player_gold == 555
+    assert saved_view(game, reloaded) == saved_view(game, loaded)
+    version, problems = game.verify_save_file(*game.save_slot_files(session.save_slot))
+    assert not problems
+
+def test_snapshot_holds_no_references_to_game_classes(game):
+    session = new_session(game, rooms=3)
+    game.save_game(session)
+    session = game.load_game(session.save_slot) # History rooms come back as SavedRooms
+    walk_on(game, session)
+    payload = zlib.decompress(game.snapshot_session(session))
+    assert not [op for op, _, _ in pickletools.genops(payload) if 'GLOBAL' in op.name or op.name in ('REDUCE', 'BUILD', 'NEWOBJ')]
+
+def test_park_as_script_and_unpark_through_import(game, tmp_path):
+    # The game run as a script parks a loaded run; the server (which imports it) resumes it
+    script = f"""
+import os, runpy
+os.chdir({ROOT!r})
+script = runpy.run_path('infinitedungeon.py', run_name='dungeon_script')
+os.chdir({str(tmp_path)!r})
+session = script['GameSession'](player_name='Parked')
+script['apply_character_class'](session, next(iter(script['GAME_DATA']['character_classes'])))
+session.current_room = script['Room'](1, {{}}, session=session)
+for _ in range(3):
+    session.room_history.append(session.current_room)
+    session.direction_history.append('north')
+    session.current_room = script['Room'](1, {{}}, session=session)
+session.player_gold = 4321
+script['save_game'](session)
+script['park_session'](script['load_game'](session.save_slot))
+"""
+    subprocess.run([sys.executable, '-c', script], check=True, env=dict(os.environ, SDL_AUDIODRIVER='dummy'), capture_output=True)
+
+    unparked = game.unpark_session('Parked')
+    assert unparked is not None
+    assert unparked.player_gold == 4321
+    assert len(unparked.room_history) == 3
+    assert all(isinstance(room, game.SavedRoom) for room in unparked.room_history)
+    assert saved_view(game, unparked) == saved_view(game, game.load_game(unparked.save_slot))
+    assert game.list_suspended_sessions() == []
+
+def test_park_and_unpark_round_trip(game):
+    session = new_session(game, run_seed=7, rooms=4)
+    session.player_hp -= 5
+    session.player_effects.append({'stat': 'attack_power', 'modifier': 2, 'duration': 3, 'message': "Stronger!"})
+    before = saved_view(game, session)
+    game.park_session(session)
+    assert len(game.list_suspended_sessions()) == 1
+    unparked = game.unpark_session(session.player_name)
+    assert saved_view(game, unparked) == before
+
+def test_snapshot_that_fails_to_restore_is_kept(game, capsys):
+    session = new_session(game)
+    path = game.park_session(session)
+    with open(path, 'rb') as f:
+        blob = f.read()
+    version, state, rng_state = pickle.loads(zlib.decompress(blob))
+    with open(path, 'wb') as f:
+        f.write(zlib.compress(pickle.dumps((version + 1, state, rng_state)))) # From a newer game
+    assert game.unpark_session(session.player_name) is None
+    assert "Could not resume" in capsys.readouterr().out
+    assert os.path.exists(path)
+
+    with open(path, 'wb') as f:
+        f.write(blob)
+    assert game.unpark_session(session.player_name) is not None
+    assert not os.path.exists(path)
+
+def test_run_parked_with_a_resume_code_needs_it(game):
+    session = new_session(game)
+    session.resume_code = 'AB12CD'
+    game.park_session(session)
+    assert game.list_suspended_sessions() == []
+    assert game.unpark_session(session.player_name) is None
+    assert game.unpark_session(session.player_name, 'FFFFFF') is None
+    unparked = game.unpark_session(session.player_name, 'ab12cd')
+    assert unparked is not None and unparked.resume_code == 'AB12CD'
+
+def test_daily_leaderboard_survives_an_unusable_database(game, monkeypatch, capsys):
+    game.set_storage_backend('sqlite')
+    monkeypatch.setattr(game, 'STORAGE_BUSY_TIMEOUT', 0.1)
+    monkeypatch.setattr(game.storage_threads, 'db', None, raising=False)
+    game.storage_db() # Creates the database
+    other = sqlite3.connect(game.STORAGE_DB_FILE, isolation_level=None)
+    other.execute("BEGIN EXCLUSIVE") # Another process writing
+    monkeypatch.setattr(game.storage_threads, 'db', None)
+    monkeypatch.setattr('builtins.input', lambda prompt="": "")
+    assert game.record_daily_score('2026-10-19', "Tester", 1200) is None
+    assert "Could not record your score" in capsys.readouterr().out
+    other.rollback()
+    other.close()
+
+    monkeypatch.setattr(game, 'STORAGE_DB_FILE', 'not-a-database.db')
+    with open(game.STORAGE_DB_FILE, 'wb') as f:
+        f.write(b"garbage" * 1000)
+    monkeypatch.setattr(game.storage_threads, 'db', None)
+    assert game.daily_score_standing('2026-10-19', 1200) is None
+    game.show_daily_leaderboard('2026-10-19')
+    assert "leaderboard is unavailable" in capsys.readouterr().out
+
+def plain(view):
+    """A saved_view() as JSON would hand it back, to compare with the expected views in tests/data."""
+    return json.loads(json.dumps(view))
+
+def saved_run(game, session):
+    """Plays on from a saved session: a base, then journal entries that change fields and rooms and walk back."""
+    game.save_game(session)
+    session.player_gold += 77
+    session.current_room.monster = None
+    game.save_game(session)
+    walk_on(game, session, 'east')
+    walk_on(game, session, 'north')
+    game.save_game(session)
+    session.current_room = session.room_history.pop() # Back the way we came
+    session.direction_history.pop()
+    session.player_hp -= 1
+    game.save_game(session)
+
+# Saves written by the game at format 1 (before and after save slots) and format 2, with what each loaded as then
+@pytest.mark.parametrize('fixture', ['format1-single', 'format1', 'format2'])
+def test_older_save_formats_still_load(game, tmp_path, fixture):
+    shutil.copytree(os.path.join(ROOT, 'tests', 'data', fixture), tmp_path, dirs_exist_ok=True)
+    with open('expected.json') as f:
+        expected = json.load(f)
+    for slot, view in expected.items():
+        loaded = game.load_game(slot)
+        assert loaded is not None
+        loaded_view = plain(saved_view(game, loaded))
+        assert {key: loaded_view['fields'][key] for key in view['fields']} == view['fields']
+        assert [loaded_view[key] for key in ('current_room', 'rooms', 'directions')] == [view[key] for key in ('current_room', 'rooms', 'directions')]
+        saved_run(game, loaded) # Saved on at the current format
+        assert saved_view(game, game.load_game(slot)) == saved_view(game, loaded)
+
+@pytest.mark.parametrize('run_seed', [None, 4242])
+@pytest.mark.parametrize('compression', ['none', 'zlib', 'lzma'])
+def test_save_round_trip(game, monkeypatch, compression, run_seed):
+    monkeypatch.setattr(game, 'SAVE_COMPRESSION', compression)
+    monkeypatch.setattr(game, 'SAVE_COMPACT_EVERY', 2) # Crossed by saved_run()
+    session = new_session(game, run_seed=run_seed, rooms=3)
+    saved_run(game, session)
+    loaded = game.load_game(session.save_slot)
+    assert saved_view(game, loaded) == saved_view(game, session)
+    version, problems = game.verify_save_file(*game.save_slot_files(session.save_slot))
+    assert version == game.SAVE_FORMAT_VERSION and not problems
+
+@pytest.mark.parametrize('run_seed', [None, 4242])
+def test_json_export_and_import_round_trip(game, run_seed):
+    session = new_session(game, run_seed=run_seed, rooms=3)
+    saved_run(game, session)
+    game.export_save_json('exported.json', session.save_slot)
+    slot = game.import_save_json('exported.json', 'imported')
+    assert saved_view(game, game.load_game(slot)) == saved_view(game, session)
+    os.replace('exported.json', game.LEGACY_SAVE_FILE) # A save from before the binary format
+    assert saved_view(game, game.load_game(game.SINGLE_SAVE_SLOT)) == saved_view(game, session)
+
+def test_sqlite_backend_round_trip(game, tmp_path, monkeypatch):
+    shutil.copytree(os.path.join(ROOT, 'tests', 'data', 'format2'), tmp_path, dirs_exist_ok=True)
+    files_views = {slot: saved_view(game, game.load_game(slot)) for slot in ('plain', 'seeded')}
+    game.set_storage_backend('sqlite')
+    monkeypatch.setattr(game.storage_threads, 'db', None, raising=False)
+    monkeypatch.setattr(game, 'save_writer', game.SaveWriter()) # Its thread keeps a connection to the database it first opened
+    for slot, view in files_views.items(): # Copied in from the save files when the database is made
+        loaded = game.load_game(slot)
+        assert saved_view(game, loaded) == view
+        saved_run(game, loaded)
+        assert saved_view(game, game.load_game(slot)) == saved_view(game, loaded)
+    session = new_session(game, run_seed=4242, rooms=3)
+    saved_run(game, session)
+    assert saved_view(game, game.load_game(session.save_slot)) == saved_view(game, session)
@@ -0,0 +1,64 @@
+import asyncio
+import os
+import re
+
+import pytest
+
+from conftest import new_session, play, quiet_room
+
+def test_server_sessions_suspend_instead_of_saving(game, monkeypatch, capsys):
+    session = new_session(game)
+    session.resume_code = 'AB12CD' # Given by the server's connection
+    quiet_room(session)
+    assert play(game, session, monkeypatch, ["save", "save shared"]) == 'quit'
+    assert not os.path.exists(game.SAVE_DIR)
+    assert capsys.readouterr().out.count("resume code AB12CD") == 2
+
+async def read_until(reader, *prompts):
+    """Reads a connection's output until it ends with one of the prompts. Returns the text."""
+    text = b""
+    while not any(text.endswith(prompt.encode()) for prompt in prompts):
+        chunk = await asyncio.wait_for(reader.read(4096), 10)
+        assert chunk, text.decode()
+        text += chunk
+    return text.decode()
+
+async def visit(port, *lines):
+    """Connects, sends each line once the game is waiting for input, and returns the resume code and everything shown."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    shown = [await read_until(reader, "Enter your choice: ")]
+    for line in lines:
+        writer.write(line.encode() + b"\r\n")
+        shown.append(await read_until(reader, ": ", "> ", "Combat Action> "))
+    writer.close()
+    text = "".join(shown)
+    return re.search(r"resume code for this visit is (\w+)", text).group(1), text
+
+def test_runs_left_on_the_server_resume_only_with_their_code(game, monkeypatch):
+    server = pytest.importorskip("server")
+    monkeypatch.setattr(game, 'sound_manager', server.Sound(sound_enabled=False))
+    game.route_session_threads()
+
+    async def scenario():
+        dungeon = server.DungeonServer()
+        listener = await asyncio.start_server(dungeon.handle_connection, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+
+        async def left():
+            while dungeon.connections: # Until the game thread has wound up
+                await asyncio.sleep(0.01)
+
+        async with listener:
+            code, text = await visit(port, "4", "server test", "Alice", "1")
+            assert text.endswith("\n> ") # Left at the command prompt, so the run is parked when the player goes
+            await left()
+            assert os.listdir(game.SUSPEND_DIR) == [f"alice.{code.lower()}.snap"]
+            other_code, text = await visit(port, "2", "Alice", "WRONG1", "2", "Alice", code)
+            assert other_code != code
+            assert "No suspended run found under that name and code." in text
+            assert text.endswith("\n> ") and "Room: 1" in text
+            await left()
+            assert os.listdir(game.SUSPEND_DIR) == [f"alice.{other_code.lower()}.snap"] # Parked again, under the new visit's code
+        dungeon.executor.shutdown()
+
+    asyncio.run(scenario())